@@ -1,11 +1,13 @@
+import time
+_script_start = time.perf_counter()
+
 import streamlit as st
 import os
 from dotenv import load_dotenv
-from rag.rag_core import load_vector_store_with_cache, get_qa_chain, get_answer
-from etl.document_processor import load_and_process_documents
 from constant.constants import ProjectConstants
 import tempfile
 from log.logger import logger
+# 问答相关的重型依赖（LangChain、Chroma、嵌入模型等）在页面渲染之后才导入，首屏不等待它们
 # 加载环境变量 入口
 # 加载环境变量
 load_dotenv()
@@ -45,9 +47,33 @@ st.sidebar.markdown("""
 # 添加调试开关
 debug_mode = st.sidebar.checkbox("调试模式")
 
+logger.info(f"页面渲染耗时: {(time.perf_counter() - _script_start) * 1000:.0f} ms")
+
+
+@st.cache_resource
+def warm_up_backend():
+    """每个服务进程只执行一次：导入问答依赖并预热嵌入模型、向量库和重排序器"""
+    from rag.rag_core import warmup
+    return warmup()
+
+
+@st.cache_resource
+def start_answer_cache_warmup(_vector_store):
+    """每个服务进程只启动一次答案缓存预热"""
+    from rag.answer_warmup import start_warmup_thread
+    return start_warmup_thread(_vector_store)
+
+
 # 初始化会话状态
 if 'qa_chain' not in st.session_state:
     with st.spinner("正在初始化问答系统..."):
+        init_start = time.perf_counter()
+        try:
+            warm_up_backend()
+        except Exception as e:
+            logger.warning(f"问答系统预热失败，首个请求将按需加载: {e}")
+        from rag.rag_core import load_vector_store_with_cache, get_qa_chain
+        
         # 创建空的文档列表
         documents = []
         
@@ -60,6 +86,7 @@ if 'qa_chain' not in st.session_state:
                     f.write(uploaded_file.getbuffer())
             
             # 加载上传的文档
+            from etl.document_processor import load_and_process_documents
             uploaded_documents = load_and_process_documents(temp_dir)
             documents.extend(uploaded_documents)
         
@@ -73,7 +100,10 @@ if 'qa_chain' not in st.session_state:
             
         st.session_state.qa_chain = get_qa_chain(vector_store, top_k)
         
-        logger.info("系统初始化完成!")
+        # 后台预热高频问题的答案缓存
+        start_answer_cache_warmup(vector_store)
+        
+        logger.info(f"系统初始化完成! 耗时: {(time.perf_counter() - init_start) * 1000:.0f} ms")
 
 # 主界面 - 问题输入
 question = st.chat_input("请输入您的问题...")
@@ -82,10 +112,12 @@ question = st.chat_input("请输入您的问题...")
 if question:
     with st.spinner("正在生成答案..."):
         logger.info(f"收到问题: {question}")
+        from rag.rag_core import get_answer
+        answer_start = time.perf_counter()
             
         result = get_answer(question, st.session_state.qa_chain, top_k)
         
-        logger.info("答案生成完成")
+        logger.info(f"答案生成完成，耗时: {(time.perf_counter() - answer_start) * 1000:.0f} ms")
         
         # 显示问题
         st.subheader("问题")
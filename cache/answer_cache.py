@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+答案缓存模块
+进程内LRU + 磁盘SQLite(WAL)两级缓存，缓存键为 归一化问题 + 向量库版本 + 分组 + 重排序保留的文档数，
+重启后不丢失，同机多个工作进程共享磁盘层
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from log.logger import logger
+from util.tools import TextUtils
+from constant.constants import (
+    ANSWER_CACHE_DB_PATH,
+    ANSWER_CACHE_MEMORY_SIZE,
+    ANSWER_CACHE_MAX_DISK_BYTES,
+)
+
+
+class AnswerCache:
+    """两级答案缓存"""
+
+    # 每写入多少次检查一次磁盘容量
+    EVICTION_CHECK_INTERVAL = 64
+
+    def __init__(self, db_path: str = ANSWER_CACHE_DB_PATH,
+                 memory_size: int = ANSWER_CACHE_MEMORY_SIZE,
+                 max_disk_bytes: int = ANSWER_CACHE_MAX_DISK_BYTES):
+        """
+        初始化答案缓存
+
+        Args:
+            db_path (str): 磁盘缓存SQLite文件路径
+            memory_size (int): 进程内LRU最大条目数
+            max_disk_bytes (int): 磁盘缓存最大字节数（按缓存值大小计）
+        """
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # SQLite连接不能跨线程共享，每个线程持有自己的连接
+        self._local = threading.local()
+        self._initialized = False
+        self._puts_since_check = 0
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'puts': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'errors': 0,
+        }
+
+    @staticmethod
+    def make_key(question: str, version: str, arm: str, kind: str = "answer", top_n: int = None) -> str:
+        """
+        生成缓存键
+
+        Args:
+            question (str): 用户问题（内部做归一化）
+            version (str): 向量库版本号
+            arm (str): 分组名称，与分组无关的缓存传空字符串
+            kind (str): 缓存类型，answer 或 retrieval
+            top_n (int): 重排序后保留的文档数，检索结果和答案都随之变化
+
+        Returns:
+            str: 缓存键
+        """
+        raw = "\x1f".join([kind, version or "", arm or "", "" if top_n is None else str(top_n),
+                            TextUtils.normalize_question(question)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _get_connection(self):
+        """获取当前线程的数据库连接，首次使用时初始化表结构"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if not self._initialized:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS answer_cache (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    version TEXT,
+                    arm TEXT,
+                    question TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_accessed ON answer_cache (accessed_at)")
+            conn.commit()
+            self._initialized = True
+        self._local.conn = conn
+        return conn
+
+    def _record(self, field: str, count: int = 1):
+        with self._lock:
+            self._stats[field] += count
+
+    def _memory_put(self, key: str, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+                self._stats['memory_evictions'] += 1
+
+    def lookup(self, question: str, version: str, arm: str, kind: str = "answer", top_n: int = None):
+        """
+        查询缓存
+
+        Args:
+            question (str): 用户问题
+            version (str): 向量库版本号
+            arm (str): 分组名称
+            kind (str): 缓存类型
+            top_n (int): 重排序后保留的文档数
+
+        Returns:
+            tuple: (缓存值, 命中层级)，命中层级为 memory、disk 或 None（未命中）
+        """
+        key = self.make_key(question, version, arm, kind, top_n)
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return self._memory[key], "memory"
+
+        try:
+            conn = self._get_connection()
+            row = conn.execute("SELECT value FROM answer_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE answer_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+                value = json.loads(row[0])
+                self._memory_put(key, value)
+                self._record('disk_hits')
+                return value, "disk"
+        except Exception as e:
+            # 磁盘缓存不可用时不影响正常问答
+            logger.warning(f"读取磁盘答案缓存失败: {e}")
+            self._record('errors')
+
+        self._record('misses')
+        return None, None
+
+    def get(self, question: str, version: str, arm: str, kind: str = "answer", top_n: int = None):
+        """
+        查询缓存值，未命中返回None
+
+        Args:
+            question (str): 用户问题
+            version (str): 向量库版本号
+            arm (str): 分组名称
+            kind (str): 缓存类型
+            top_n (int): 重排序后保留的文档数
+
+        Returns:
+            缓存值或None
+        """
+        return self.lookup(question, version, arm, kind, top_n)[0]
+
+    def put(self, question: str, version: str, arm: str, value, kind: str = "answer", top_n: int = None):
+        """
+        写入缓存（同时写入内存层和磁盘层）
+
+        Args:
+            question (str): 用户问题
+            version (str): 向量库版本号
+            arm (str): 分组名称
+            value: 可JSON序列化的缓存值
+            kind (str): 缓存类型
+            top_n (int): 重排序后保留的文档数
+        """
+        key = self.make_key(question, version, arm, kind, top_n)
+        self._memory_put(key, value)
+        self._record('puts')
+
+        try:
+            payload = json.dumps(value, ensure_ascii=False)
+            now = time.time()
+            conn = self._get_connection()
+            conn.execute('''
+                INSERT OR REPLACE INTO answer_cache
+                    (key, kind, version, arm, question, value, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (key, kind, version, arm, TextUtils.normalize_question(question),
+                  payload, len(payload.encode("utf-8")), now, now))
+            conn.commit()
+        except Exception as e:
+            logger.warning(f"写入磁盘答案缓存失败: {e}")
+            self._record('errors')
+            return
+
+        with self._lock:
+            self._puts_since_check += 1
+            need_check = self._puts_since_check >= self.EVICTION_CHECK_INTERVAL
+            if need_check:
+                self._puts_since_check = 0
+        if need_check:
+            self.evict_disk()
+
+    def evict_disk(self) -> int:
+        """
+        磁盘缓存超出容量时按最近访问时间淘汰，淘汰到容量的90%
+
+        Returns:
+            int: 淘汰的条目数
+        """
+        try:
+            conn = self._get_connection()
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM answer_cache").fetchone()[0]
+            if total <= self.max_disk_bytes:
+                return 0
+
+            to_free = total - int(self.max_disk_bytes * 0.9)
+            freed = 0
+            cutoff = None
+            for size, accessed_at in conn.execute(
+                    "SELECT size, accessed_at FROM answer_cache ORDER BY accessed_at"):
+                freed += size
+                cutoff = accessed_at
+                if freed >= to_free:
+                    break
+
+            cursor = conn.execute("DELETE FROM answer_cache WHERE accessed_at <= ?", (cutoff,))
+            conn.commit()
+            evicted = cursor.rowcount
+            self._record('disk_evictions', evicted)
+            logger.info(f"磁盘答案缓存超出容量，已淘汰 {evicted} 条")
+            return evicted
+        except Exception as e:
+            logger.warning(f"淘汰磁盘答案缓存失败: {e}")
+            self._record('errors')
+            return 0
+
+    def clear(self):
+        """清空内存层和磁盘层"""
+        with self._lock:
+            self._memory.clear()
+        conn = self._get_connection()
+        conn.execute("DELETE FROM answer_cache")
+        conn.commit()
+        logger.info("答案缓存已清空")
+
+    def stats(self) -> dict:
+        """
+        获取各层命中统计
+
+        Returns:
+            dict: 统计信息，包含总命中率及内存层、磁盘层命中率
+        """
+        with self._lock:
+            info = dict(self._stats)
+            info['memory_size'] = len(self._memory)
+        lookups = info['memory_hits'] + info['disk_hits'] + info['misses']
+        info['lookups'] = lookups
+        info['memory_hit_rate'] = info['memory_hits'] / lookups if lookups else 0.0
+        # 磁盘层命中率按到达磁盘层的请求计算
+        disk_lookups = info['disk_hits'] + info['misses']
+        info['disk_hit_rate'] = info['disk_hits'] / disk_lookups if disk_lookups else 0.0
+        info['hit_rate'] = (info['memory_hits'] + info['disk_hits']) / lookups if lookups else 0.0
+        return info
+
+
+# 全局答案缓存实例（数据库连接在首次使用时创建）
+answer_cache = AnswerCache()
@@ -6,10 +6,67 @@
 """
 
 import time
+import asyncio
 import functools
+import threading
+from collections import OrderedDict
 from log.logger import logger
 
 
+class CacheStats:
+    """
+    缓存统计信息
+    同步与异步缓存装饰器共用，通过 wrapper.cache_info() 获取
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """重置所有计数"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.stale_hits = 0
+            self.load_errors = 0
+            self.evictions = 0
+
+    def record(self, field: str, count: int = 1):
+        """
+        累加指定计数
+
+        Args:
+            field (str): 计数名称，如 hits、misses
+            count (int): 累加值
+        """
+        with self._lock:
+            setattr(self, field, getattr(self, field) + count)
+
+    def snapshot(self, **extra) -> dict:
+        """
+        获取统计快照
+
+        Args:
+            **extra: 附加字段（如当前缓存条目数）
+
+        Returns:
+            dict: 统计信息，包含命中率
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            info = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'load_errors': self.load_errors,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+        info.update(extra)
+        return info
+
+
 def ttl_cache(expire_time=600):
     """
     TTL缓存装饰器
@@ -27,6 +84,7 @@ def ttl_cache(expire_time=600):
             'timestamp': 0,
             'lock': False  # 防止并发重复加载
         }
+        stats = CacheStats()
         
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
@@ -37,6 +95,7 @@ def ttl_cache(expire_time=600):
                 (current_time - cache_data['timestamp']) < expire_time and 
                 not cache_data['lock']):
                 logger.debug(f"使用 {func.__name__} 的缓存结果")
+                stats.record('hits')
                 return cache_data['value']
             
             # 防止并发重复加载
@@ -47,10 +106,12 @@ def ttl_cache(expire_time=600):
                 # 再次检查缓存
                 if (cache_data['value'] is not None and 
                     (time.time() - cache_data['timestamp']) < expire_time):
+                    stats.record('hits')
                     return cache_data['value']
             
             # 加锁并加载新数据
             cache_data['lock'] = True
+            stats.record('misses')
             try:
                 logger.info(f"缓存过期或不存在，调用 {func.__name__} 重新加载数据")
                 result = func(*args, **kwargs)
@@ -60,9 +121,11 @@ def ttl_cache(expire_time=600):
                 return result
             except Exception as e:
                 logger.error(f"执行 {func.__name__} 时出错: {e}")
+                stats.record('load_errors')
                 # 如果有缓存数据，即使过期也返回
                 if cache_data['value'] is not None:
                     logger.info(f"返回过期的缓存数据以保证服务可用性")
+                    stats.record('stale_hits')
                     return cache_data['value']
                 # 没有缓存数据且执行出错，抛出异常
                 raise
@@ -76,6 +139,113 @@ def ttl_cache(expire_time=600):
             cache_data['timestamp'] = 0
             logger.info(f"{func.__name__} 的缓存已被清除")
         
+        def cache_info():
+            return stats.snapshot(currsize=0 if cache_data['value'] is None else 1, maxsize=1)
+        
+        wrapper.clear_cache = clear_cache
+        wrapper.cache_info = cache_info
+        return wrapper
+    return decorator
+
+
+def async_ttl_cache(expire_time=600, maxsize=128):
+    """
+    异步TTL缓存装饰器，用于 async def 函数
+    
+    缓存 await 后的结果而非协程对象；按参数分别缓存，超过 maxsize 时按LRU淘汰；
+    同一参数的并发调用共享同一个加载任务，只执行一次实际加载，调用方被取消不影响其他等待者。
+    参数必须可哈希，不可哈希时直接调用原函数不做缓存。
+    
+    Args:
+        expire_time (int): 缓存过期时间（秒），默认10分钟(600秒)
+        maxsize (int): 最大缓存条目数，默认128
+        
+    Returns:
+        function: 装饰器函数
+    """
+    def decorator(func):
+        if not asyncio.iscoroutinefunction(func):
+            raise TypeError(f"async_ttl_cache 只能用于协程函数: {func.__name__}")
+        
+        # key -> (value, timestamp)，按访问顺序排列
+        entries = OrderedDict()
+        # key -> 正在加载的 Future
+        pending = {}
+        stats = CacheStats()
+        
+        def _make_key(args, kwargs):
+            key = args
+            if kwargs:
+                key += (object,) + tuple(sorted(kwargs.items()))
+            hash(key)
+            return key
+        
+        async def _load(key, args, kwargs):
+            try:
+                logger.info(f"缓存过期或不存在，调用 {func.__name__} 重新加载数据")
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"执行 {func.__name__} 时出错: {e}")
+                stats.record('load_errors')
+                stale = entries.get(key)
+                if stale is not None:
+                    # 有过期数据时返回过期数据以保证服务可用性
+                    logger.info(f"返回过期的缓存数据以保证服务可用性")
+                    stats.record('stale_hits')
+                    return stale[0]
+                raise
+            finally:
+                # 加载结束（成功或失败）后才移出进行中的加载，调用方被取消不影响
+                pending.pop(key, None)
+            
+            entries[key] = (result, time.time())
+            entries.move_to_end(key)
+            while len(entries) > maxsize:
+                entries.popitem(last=False)
+                stats.record('evictions')
+            return result
+        
+        def _retrieve_exception(task):
+            # 所有等待者都已取消时也获取异常，避免 "exception was never retrieved" 告警
+            if not task.cancelled():
+                task.exception()
+        
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                key = _make_key(args, kwargs)
+            except TypeError:
+                logger.debug(f"{func.__name__} 参数不可哈希，跳过缓存")
+                return await func(*args, **kwargs)
+            
+            entry = entries.get(key)
+            if entry is not None and (time.time() - entry[1]) < expire_time:
+                entries.move_to_end(key)
+                stats.record('hits')
+                logger.debug(f"使用 {func.__name__} 的缓存结果")
+                return entry[0]
+            
+            # 加载在独立的任务中执行，等待者通过 shield 等待：任一调用方被取消只取消它自己的等待，
+            # 不会取消共享的加载，也不影响其他等待者
+            task = pending.get(key)
+            if task is not None:
+                # 已有相同参数的加载在进行中，等待其结果
+                stats.record('hits')
+            else:
+                stats.record('misses')
+                task = asyncio.ensure_future(_load(key, args, kwargs))
+                task.add_done_callback(_retrieve_exception)
+                pending[key] = task
+            return await asyncio.shield(task)
+        
+        def clear_cache():
+            entries.clear()
+            logger.info(f"{func.__name__} 的缓存已被清除")
+        
+        def cache_info():
+            return stats.snapshot(currsize=len(entries), maxsize=maxsize)
+        
         wrapper.clear_cache = clear_cache
+        wrapper.cache_info = cache_info
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
@@ -32,6 +32,114 @@ class ProjectConstants:
     # 向量库构建批大小
     VECTOR_STORE_BATCH_SIZE = 100
     
+    # 嵌入模型
+    EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+    # 嵌入后端：torch 为PyTorch原始精度；onnx-int8 为ONNX Runtime int8量化（需先用 etl/onnx_embedding.py 导出）
+    # 切换后端后向量与已有索引不兼容，下一次ETL会全量构建新的索引版本
+    EMBEDDING_BACKEND = "torch"
+    ONNX_EMBEDDING_DIR = os.path.join(MODELS_DIR, "onnx", "all-MiniLM-L6-v2-int8")
+    
+    # ETL优先基于活动版本差量构建新版本（复制活动版本后只写入/删除变化的片段）
+    ETL_DELTA_BUILD = True
+    
+    # 片段向量持久化缓存目录（按 模型 + 片段内容 寻址）
+    EMBEDDING_STORE_ENABLED = True
+    EMBEDDING_STORE_DIR = os.path.join(PROJECT_ROOT, "embedding_store")
+    # 构建向量库的嵌入工作进程数，1表示在当前进程内串行计算
+    EMBEDDING_WORKERS = 1
+    # 每个嵌入工作进程的计算线程数，0表示按CPU核数平均分配给各进程
+    EMBEDDING_WORKER_THREADS = 0
+    # 构建向量库时已算好向量、等待写入的窗口数上限（计算与写入流水线并行），0表示串行
+    EMBEDDING_PIPELINE_DEPTH = 2
+    # 计算向量时在窗口内按长度分桶组批：每个窗口的片段数，以及每批填充后的token数上限
+    EMBEDDING_SORT_WINDOW = 1000
+    EMBEDDING_BATCH_TOKEN_BUDGET = 8192
+    
+    # 构建向量库前合并近重复片段（MinHash + LSH），只有代表片段写入向量库
+    DEDUP_ENABLED = True
+    # 判定为近重复的Jaccard相似度阈值（按字符k-gram估计）
+    DEDUP_THRESHOLD = 0.85
+    # MinHash签名长度、LSH分段数（须整除签名长度）和k-gram字符数，修改后需全量重建
+    DEDUP_NUM_PERM = 64
+    DEDUP_BANDS = 16
+    DEDUP_SHINGLE_SIZE = 5
+    
+    # 新版本使用的向量库引擎：chroma 为Chroma（SQLite + HNSW）；flat 为进程内NumPy平面索引（精确检索，适合中小规模语料）
+    VECTOR_ENGINE = "chroma"
+    # 版本验证通过后导出只读快照，在线检索的各工作进程内存映射同一份快照（float32存储模式的版本）。
+    # 快照检索是精确扫描，不使用HNSW：多进程共享内存、召回率为1，但检索耗时随片段数线性增长，
+    # ef_search 调优对快照不生效；默认关闭，中小规模语料且工作进程多、内存紧张时开启
+    INDEX_SNAPSHOT_ENABLED = False
+    # 新版本的向量存储模式：float32 只使用Chroma；float16 / pq 额外构建紧凑索引，
+    # 检索时压缩向量常驻内存粗排，再用磁盘上的float32原始向量精确重排
+    VECTOR_STORAGE = "float32"
+    # 紧凑索引粗排的候选数（不少于检索数量），以及PQ的子向量数（须整除向量维度）
+    VECTOR_RESCORE_CANDIDATES = 200
+    VECTOR_PQ_SUBVECTORS = 48
+    # Chroma引擎新版本的HNSW参数（每个节点的邻居数、构建和检索时的候选列表长度），记录在版本元数据中；
+    # 全量构建沿用活动版本经调优选定的参数，没有时使用以下默认值
+    HNSW_M = 16
+    HNSW_EF_CONSTRUCTION = 100
+    HNSW_EF_SEARCH = 100
+    # HNSW调优的目标 recall@k：在满足目标的参数组合中选择检索最快的
+    HNSW_TARGET_RECALL = 0.95
+    
+    # 版本切换前用黄金查询集同时回放候选版本和活动版本，延迟或检索结果退化超过阈值时拒绝切换
+    VERSION_GATE_ENABLED = True
+    # 黄金查询文件（JSONL，每行 {"query": ..., "expected_sources": [...]}，expected_sources可省略；
+    # 也可以每行一条纯文本查询）；文件不存在时使用问答历史中的高频问题
+    GOLDEN_QUERIES_PATH = os.path.join(PROJECT_ROOT, "golden_queries.jsonl")
+    VERSION_GATE_TOP_N = 100
+    # 每条查询比较的检索数量
+    VERSION_GATE_K = 5
+    # 候选版本的p50/p95延迟不得超过活动版本的倍数（差值在容差毫秒以内时不算退化）
+    VERSION_GATE_MAX_LATENCY_RATIO = 2.0
+    VERSION_GATE_LATENCY_SLACK_MS = 10.0
+    # 与活动版本检索结果的平均重合率下限（查询集没有标注时只记为警告）；标注查询的召回率最多允许下降的幅度
+    VERSION_GATE_MIN_OVERLAP = 0.5
+    VERSION_GATE_MAX_RECALL_DROP = 0.05
+    # 预热备用版本：切换前各服务进程加载候选版本并回放预热查询，全部就绪（或超时）后才切换活动版本，
+    # 上一个版本在服务进程中保持加载，回滚只需改回版本指针
+    VERSION_STANDBY_ENABLED = True
+    # 等待服务进程预热候选版本的最长时间（秒），超时后照常切换
+    VERSION_STANDBY_TIMEOUT = 120
+    # 服务进程检查备用版本和写入心跳的间隔（秒）；心跳超过该时长未更新的进程视为已退出
+    VERSION_STANDBY_POLL_INTERVAL = 2.0
+    VERSION_STANDBY_HEARTBEAT_TTL = 30
+    # 预热查询数（取黄金查询集的前若干条）
+    VERSION_STANDBY_WARM_QUERIES = 50
+    # 影子流量：按采样比例把线上检索请求异步镜像到候选版本，记录延迟和与活动版本检索结果的差异
+    SHADOW_TRAFFIC_SAMPLE_RATE = 0.05
+    SHADOW_TRAFFIC_DB_PATH = os.path.join(PROJECT_ROOT, "shadow_traffic.db")
+    # 待回放队列上限，超出后丢弃采样，不拖慢线上请求
+    SHADOW_TRAFFIC_MAX_QUEUE_SIZE = 100
+    
+    # 问答历史数据库
+    QA_HISTORY_DB_PATH = os.path.join(PROJECT_ROOT, "qa_history.db")
+    # 问答历史批量写入：单批最大条数与最长等待时间（秒）
+    QA_HISTORY_BATCH_SIZE = 100
+    QA_HISTORY_FLUSH_INTERVAL = 1.0
+    # 写入队列上限，超出后丢弃并记录错误，避免拖慢问答
+    QA_HISTORY_MAX_QUEUE_SIZE = 10000
+    # 问答历史归档目录，按月分区存放压缩的JSONL文件
+    QA_HISTORY_ARCHIVE_DIR = os.path.join(PROJECT_ROOT, "qa_history_archive")
+    # 热库保留最近几个自然月（含当月），更早的数据归档
+    QA_HISTORY_HOT_MONTHS = 3
+    # 归档文件保留月数，超出后删除
+    QA_HISTORY_ARCHIVE_RETENTION_MONTHS = 24
+    # 归档每批搬迁条数，单批一个短事务，不长时间阻塞在线写入
+    QA_HISTORY_ARCHIVE_BATCH_SIZE = 5000
+    
+    # 答案缓存（进程内LRU + 磁盘SQLite两级缓存）
+    ANSWER_CACHE_ENABLED = True
+    ANSWER_CACHE_DB_PATH = os.path.join(PROJECT_ROOT, "answer_cache.db")
+    # 进程内LRU最大条目数
+    ANSWER_CACHE_MEMORY_SIZE = 512
+    # 磁盘缓存最大字节数，超出后按最近访问时间淘汰
+    ANSWER_CACHE_MAX_DISK_BYTES = 256 * 1024 * 1024
+    # 缓存预热：从问答历史中取出现频次最高的问题数
+    ANSWER_WARMUP_TOP_N = 200
+    
     @classmethod
     def get_chroma_db_path(cls):
         """
@@ -79,4 +187,58 @@ CHROMA_DB_DIR = ProjectConstants.CHROMA_DB_DIR
 DATA_DIR = ProjectConstants.DATA_DIR
 PROCESSED_DATA_DIR = ProjectConstants.PROCESSED_DATA_DIR
 MODELS_DIR = ProjectConstants.MODELS_DIR
-VECTOR_STORE_BATCH_SIZE = ProjectConstants.VECTOR_STORE_BATCH_SIZE
\ No newline at end of file
+VECTOR_STORE_BATCH_SIZE = ProjectConstants.VECTOR_STORE_BATCH_SIZE
+EMBEDDING_MODEL_NAME = ProjectConstants.EMBEDDING_MODEL_NAME
+EMBEDDING_BACKEND = ProjectConstants.EMBEDDING_BACKEND
+ONNX_EMBEDDING_DIR = ProjectConstants.ONNX_EMBEDDING_DIR
+ETL_DELTA_BUILD = ProjectConstants.ETL_DELTA_BUILD
+EMBEDDING_STORE_ENABLED = ProjectConstants.EMBEDDING_STORE_ENABLED
+EMBEDDING_STORE_DIR = ProjectConstants.EMBEDDING_STORE_DIR
+EMBEDDING_WORKERS = ProjectConstants.EMBEDDING_WORKERS
+EMBEDDING_WORKER_THREADS = ProjectConstants.EMBEDDING_WORKER_THREADS
+EMBEDDING_PIPELINE_DEPTH = ProjectConstants.EMBEDDING_PIPELINE_DEPTH
+EMBEDDING_SORT_WINDOW = ProjectConstants.EMBEDDING_SORT_WINDOW
+EMBEDDING_BATCH_TOKEN_BUDGET = ProjectConstants.EMBEDDING_BATCH_TOKEN_BUDGET
+DEDUP_ENABLED = ProjectConstants.DEDUP_ENABLED
+DEDUP_THRESHOLD = ProjectConstants.DEDUP_THRESHOLD
+DEDUP_NUM_PERM = ProjectConstants.DEDUP_NUM_PERM
+DEDUP_BANDS = ProjectConstants.DEDUP_BANDS
+DEDUP_SHINGLE_SIZE = ProjectConstants.DEDUP_SHINGLE_SIZE
+VECTOR_ENGINE = ProjectConstants.VECTOR_ENGINE
+VECTOR_STORAGE = ProjectConstants.VECTOR_STORAGE
+INDEX_SNAPSHOT_ENABLED = ProjectConstants.INDEX_SNAPSHOT_ENABLED
+VECTOR_RESCORE_CANDIDATES = ProjectConstants.VECTOR_RESCORE_CANDIDATES
+VECTOR_PQ_SUBVECTORS = ProjectConstants.VECTOR_PQ_SUBVECTORS
+HNSW_M = ProjectConstants.HNSW_M
+HNSW_EF_CONSTRUCTION = ProjectConstants.HNSW_EF_CONSTRUCTION
+HNSW_EF_SEARCH = ProjectConstants.HNSW_EF_SEARCH
+HNSW_TARGET_RECALL = ProjectConstants.HNSW_TARGET_RECALL
+VERSION_GATE_ENABLED = ProjectConstants.VERSION_GATE_ENABLED
+GOLDEN_QUERIES_PATH = ProjectConstants.GOLDEN_QUERIES_PATH
+VERSION_GATE_TOP_N = ProjectConstants.VERSION_GATE_TOP_N
+VERSION_GATE_K = ProjectConstants.VERSION_GATE_K
+VERSION_GATE_MAX_LATENCY_RATIO = ProjectConstants.VERSION_GATE_MAX_LATENCY_RATIO
+VERSION_GATE_LATENCY_SLACK_MS = ProjectConstants.VERSION_GATE_LATENCY_SLACK_MS
+VERSION_GATE_MIN_OVERLAP = ProjectConstants.VERSION_GATE_MIN_OVERLAP
+VERSION_GATE_MAX_RECALL_DROP = ProjectConstants.VERSION_GATE_MAX_RECALL_DROP
+VERSION_STANDBY_ENABLED = ProjectConstants.VERSION_STANDBY_ENABLED
+VERSION_STANDBY_TIMEOUT = ProjectConstants.VERSION_STANDBY_TIMEOUT
+VERSION_STANDBY_POLL_INTERVAL = ProjectConstants.VERSION_STANDBY_POLL_INTERVAL
+VERSION_STANDBY_HEARTBEAT_TTL = ProjectConstants.VERSION_STANDBY_HEARTBEAT_TTL
+VERSION_STANDBY_WARM_QUERIES = ProjectConstants.VERSION_STANDBY_WARM_QUERIES
+SHADOW_TRAFFIC_SAMPLE_RATE = ProjectConstants.SHADOW_TRAFFIC_SAMPLE_RATE
+SHADOW_TRAFFIC_DB_PATH = ProjectConstants.SHADOW_TRAFFIC_DB_PATH
+SHADOW_TRAFFIC_MAX_QUEUE_SIZE = ProjectConstants.SHADOW_TRAFFIC_MAX_QUEUE_SIZE
+QA_HISTORY_DB_PATH = ProjectConstants.QA_HISTORY_DB_PATH
+QA_HISTORY_BATCH_SIZE = ProjectConstants.QA_HISTORY_BATCH_SIZE
+QA_HISTORY_FLUSH_INTERVAL = ProjectConstants.QA_HISTORY_FLUSH_INTERVAL
+QA_HISTORY_MAX_QUEUE_SIZE = ProjectConstants.QA_HISTORY_MAX_QUEUE_SIZE
+QA_HISTORY_ARCHIVE_DIR = ProjectConstants.QA_HISTORY_ARCHIVE_DIR
+QA_HISTORY_HOT_MONTHS = ProjectConstants.QA_HISTORY_HOT_MONTHS
+QA_HISTORY_ARCHIVE_RETENTION_MONTHS = ProjectConstants.QA_HISTORY_ARCHIVE_RETENTION_MONTHS
+QA_HISTORY_ARCHIVE_BATCH_SIZE = ProjectConstants.QA_HISTORY_ARCHIVE_BATCH_SIZE
+ANSWER_CACHE_ENABLED = ProjectConstants.ANSWER_CACHE_ENABLED
+ANSWER_CACHE_DB_PATH = ProjectConstants.ANSWER_CACHE_DB_PATH
+ANSWER_CACHE_MEMORY_SIZE = ProjectConstants.ANSWER_CACHE_MEMORY_SIZE
+ANSWER_CACHE_MAX_DISK_BYTES = ProjectConstants.ANSWER_CACHE_MAX_DISK_BYTES
+ANSWER_WARMUP_TOP_N = ProjectConstants.ANSWER_WARMUP_TOP_N
\ No newline at end of file
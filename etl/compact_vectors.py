@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+紧凑向量存储模块
+把版本中的向量压缩为float16或乘积量化（PQ）编码常驻内存，检索时先用压缩向量粗排出候选，
+再从磁盘上的float32原始向量（内存映射，只读取候选所在的页）精确重排，
+常驻内存的向量开销降为原来的1/2（float16）或1/32左右（PQ）
+
+紧凑索引保存在版本目录的 compact_vectors 子目录下，文档和元数据仍由Chroma保存
+"""
+
+import os
+import json
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from log.logger import logger
+
+# 紧凑索引子目录及文件
+COMPACT_DIRNAME = "compact_vectors"
+COMPACT_META_FILENAME = "compact_index.json"
+COMPACT_IDS_FILENAME = "ids.txt"
+COMPACT_CODES_FILENAME = "codes.npy"
+COMPACT_NORMS_FILENAME = "norms.npy"
+COMPACT_CODEBOOK_FILENAME = "codebook.npy"
+COMPACT_VECTORS_FILENAME = "vectors.f32"
+
+# 向量存储模式：float32 为只使用Chroma，float16 / pq 为额外构建紧凑索引
+STORAGE_MODES = ("float32", "float16", "pq")
+
+# 分块扫描的向量数，控制临时数组大小
+_SCAN_BLOCK = 16384
+
+
+def _kmeans(data: np.ndarray, num_centroids: int, iterations: int, rng) -> np.ndarray:
+    centroids = data[rng.choice(len(data), num_centroids, replace=len(data) < num_centroids)].copy()
+    for _ in range(iterations):
+        distances = (centroids ** 2).sum(axis=1)[None, :] - 2 * data @ centroids.T
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=num_centroids)
+        sums = np.stack([np.bincount(labels, weights=data[:, d], minlength=num_centroids)
+                         for d in range(data.shape[1])], axis=1)
+        # 空簇保留原质心
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class ProductQuantizer:
+    """乘积量化器：把向量切成若干子向量，每个子向量用所在子空间中最近质心的编号（1字节）表示"""
+
+    def __init__(self, codebook: np.ndarray):
+        """
+        Args:
+            codebook (np.ndarray): 质心 (子向量数, 质心数, 子向量维度)
+        """
+        self.codebook = codebook.astype(np.float32)
+        self.num_subvectors, self.num_centroids, self.subvector_dim = self.codebook.shape
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, num_subvectors: int, num_centroids: int = 256, sample_size: int = 20000,
+              iterations: int = 20, seed: int = 0):
+        """
+        在样本上训练各子空间的质心
+
+        Args:
+            vectors (np.ndarray): 训练向量 (数量, 维度)
+            num_subvectors (int): 子向量数，不能整除维度时取二者的最大公约数
+            num_centroids (int): 每个子空间的质心数，不超过256（编码为uint8）
+            sample_size (int): 训练样本数上限
+            iterations (int): k-means迭代次数
+            seed (int): 随机种子
+
+        Returns:
+            ProductQuantizer: 训练好的量化器
+        """
+        dim = vectors.shape[1]
+        num_subvectors = int(np.gcd(dim, num_subvectors))
+        rng = np.random.RandomState(seed)
+        if len(vectors) > sample_size:
+            vectors = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        num_centroids = min(num_centroids, 256)
+        subvector_dim = dim // num_subvectors
+        codebook = np.stack([
+            _kmeans(vectors[:, j * subvector_dim:(j + 1) * subvector_dim], num_centroids, iterations, rng)
+            for j in range(num_subvectors)
+        ])
+        return cls(codebook)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        编码向量
+
+        Returns:
+            np.ndarray: uint8编码 (数量, 子向量数)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((len(vectors), self.num_subvectors), dtype=np.uint8)
+        norms = (self.codebook ** 2).sum(axis=2)
+        for j in range(self.num_subvectors):
+            sub = vectors[:, j * self.subvector_dim:(j + 1) * self.subvector_dim]
+            codes[:, j] = (norms[j][None, :] - 2 * sub @ self.codebook[j].T).argmin(axis=1)
+        return codes
+
+    def inner_product_table(self, query: np.ndarray) -> np.ndarray:
+        """
+        查询向量各子向量与各质心的内积表，用于非对称距离计算
+
+        Returns:
+            np.ndarray: (子向量数, 质心数)
+        """
+        sub_queries = query.reshape(self.num_subvectors, self.subvector_dim)
+        return np.einsum("md,mkd->mk", sub_queries, self.codebook)
+
+
+class CompactVectorIndex:
+    """压缩向量粗排 + float32精确重排的只读向量索引"""
+
+    def __init__(self, directory: str):
+        """
+        加载紧凑索引
+
+        Args:
+            directory (str): 紧凑索引目录
+        """
+        with open(os.path.join(directory, COMPACT_META_FILENAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.mode = meta["mode"]
+        self.dim = meta["dim"]
+        with open(os.path.join(directory, COMPACT_IDS_FILENAME), "r", encoding="utf-8") as f:
+            self.ids = f.read().splitlines()
+        self.codes = np.load(os.path.join(directory, COMPACT_CODES_FILENAME))
+        self.norms = np.load(os.path.join(directory, COMPACT_NORMS_FILENAME))
+        self.quantizer = None
+        if self.mode == "pq" and self.ids:
+            self.quantizer = ProductQuantizer(np.load(os.path.join(directory, COMPACT_CODEBOOK_FILENAME)))
+        self.vectors = None
+        if self.ids:
+            self.vectors = np.memmap(os.path.join(directory, COMPACT_VECTORS_FILENAME), dtype=np.float32, mode="r",
+                                     shape=(len(self.ids), self.dim))
+
+    @classmethod
+    def build(cls, directory: str, ids: list, vectors: np.ndarray, mode: str, quantizer: ProductQuantizer = None,
+              pq_subvectors: int = 48):
+        """
+        构建并保存紧凑索引
+
+        Args:
+            directory (str): 紧凑索引目录
+            ids (list): 片段ID列表
+            vectors (np.ndarray): float32向量 (数量, 维度)
+            mode (str): float16 或 pq
+            quantizer (ProductQuantizer): 已训练的量化器（差量构建时沿用上一版本的），为None时重新训练
+            pq_subvectors (int): PQ子向量数
+
+        Returns:
+            CompactVectorIndex: 构建好的索引
+        """
+        if mode not in ("float16", "pq"):
+            raise ValueError(f"不支持的紧凑存储模式: {mode}")
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        vectors = vectors.reshape(len(ids), -1) if len(ids) else np.empty((0, 0), dtype=np.float32)
+        dim = vectors.shape[1]
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, COMPACT_META_FILENAME)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        if mode == "float16":
+            codes = vectors.astype(np.float16)
+        elif not len(ids):
+            codes = np.empty((0, 0), dtype=np.uint8)
+        else:
+            if quantizer is None or quantizer.num_subvectors * quantizer.subvector_dim != dim:
+                quantizer = ProductQuantizer.train(vectors, pq_subvectors)
+            codes = quantizer.encode(vectors)
+            np.save(os.path.join(directory, COMPACT_CODEBOOK_FILENAME), quantizer.codebook)
+        np.save(os.path.join(directory, COMPACT_CODES_FILENAME), codes)
+        np.save(os.path.join(directory, COMPACT_NORMS_FILENAME), (vectors ** 2).sum(axis=1).astype(np.float32))
+        vectors.tofile(os.path.join(directory, COMPACT_VECTORS_FILENAME))
+        with open(os.path.join(directory, COMPACT_IDS_FILENAME), "w", encoding="utf-8") as f:
+            f.write("\n".join(ids))
+        # 元数据最后写入，中途失败的目录不会被当作完整索引加载
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"mode": mode, "dim": dim, "count": len(ids)}, f)
+        return cls(directory)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def bytes_per_vector(self) -> float:
+        """常驻内存的每个向量字节数（压缩编码 + 范数），不含磁盘上的float32原始向量"""
+        if not self.ids:
+            return 0.0
+        return (self.codes.nbytes + self.norms.nbytes) / len(self.ids)
+
+    def _approximate_distances(self, query: np.ndarray, start: int, end: int) -> np.ndarray:
+        # 平方L2距离去掉与候选无关的 |q|^2 项：|v|^2 - 2 q·v
+        if self.mode == "pq":
+            table = self.quantizer.inner_product_table(query)
+            block = self.codes[start:end]
+            dots = table[np.arange(self.quantizer.num_subvectors)[None, :], block].sum(axis=1)
+        else:
+            dots = self.codes[start:end].astype(np.float32) @ query
+        return self.norms[start:end] - 2 * dots
+
+    def search(self, query, k: int, candidates: int = 200) -> list:
+        """
+        检索最近的向量
+
+        Args:
+            query: 查询向量
+            k (int): 返回数量
+            candidates (int): 粗排候选数，候选用float32原始向量精确重排
+
+        Returns:
+            list: [(行号, 平方L2距离), ...]，按距离升序
+        """
+        if not self.ids:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        candidates = min(max(candidates, k), len(self.ids))
+        best_rows = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0, dtype=np.float32)
+        for start in range(0, len(self.ids), _SCAN_BLOCK):
+            end = min(start + _SCAN_BLOCK, len(self.ids))
+            distances = np.concatenate([best_distances, self._approximate_distances(query, start, end)])
+            rows = np.concatenate([best_rows, np.arange(start, end)])
+            if len(distances) > candidates:
+                keep = np.argpartition(distances, candidates - 1)[:candidates]
+                distances, rows = distances[keep], rows[keep]
+            best_distances, best_rows = distances, rows
+
+        # 按行号顺序读取原始向量，减少内存映射的随机读
+        rows = np.sort(best_rows)
+        exact = ((self.vectors[rows] - query) ** 2).sum(axis=1)
+        order = np.argsort(exact)[:k]
+        return [(int(rows[i]), float(exact[i])) for i in order]
+
+    def get_vectors(self, rows) -> np.ndarray:
+        """读取指定行的float32原始向量"""
+        return np.asarray(self.vectors[list(rows)])
+
+
+def exact_search(vectors: np.ndarray, query, k: int) -> list:
+    """
+    float32暴力检索，作为召回率的基准
+
+    Returns:
+        list: 距离最近的k个行号
+    """
+    query = np.asarray(query, dtype=np.float32)
+    best_rows = np.empty(0, dtype=np.int64)
+    best_distances = np.empty(0, dtype=np.float32)
+    for start in range(0, len(vectors), _SCAN_BLOCK):
+        block = np.asarray(vectors[start:start + _SCAN_BLOCK])
+        distances = np.concatenate([best_distances, ((block - query) ** 2).sum(axis=1)])
+        rows = np.concatenate([best_rows, np.arange(start, start + len(block))])
+        keep = np.argsort(distances)[:k]
+        best_distances, best_rows = distances[keep], rows[keep]
+    return [int(row) for row in best_rows]
+
+
+def evaluate_recall(index: CompactVectorIndex, queries: np.ndarray, k: int = 10, candidates: int = 200) -> float:
+    """
+    计算紧凑索引相对float32暴力检索的 recall@k
+
+    Args:
+        index (CompactVectorIndex): 紧凑索引
+        queries (np.ndarray): 查询向量 (数量, 维度)
+        k (int): 检索数量
+        candidates (int): 粗排候选数
+
+    Returns:
+        float: 平均召回率
+    """
+    if not len(index) or not len(queries):
+        return 1.0
+    k = min(k, len(index))
+    hits = 0
+    for query in queries:
+        expected = set(exact_search(index.vectors, query, k))
+        hits += len(expected.intersection(row for row, _ in index.search(query, k, candidates)))
+    return hits / (k * len(queries))
+
+
+def export_compact_index(vector_store, persist_directory: str, mode: str, pq_subvectors: int = 48,
+                         candidates: int = 200, num_recall_queries: int = 100, batch_size: int = 1000) -> dict:
+    """
+    从版本的Chroma集合导出向量并构建紧凑索引
+
+    目录中已有PQ码本时（差量构建从上一版本复制而来）沿用，编码与上一版本一致
+
+    Args:
+        vector_store: Chroma向量库
+        persist_directory (str): 版本目录
+        mode (str): float16 或 pq
+        pq_subvectors (int): PQ子向量数
+        candidates (int): 评估召回率时的粗排候选数
+        num_recall_queries (int): 评估召回率的查询数（从库内向量中抽样，加微小扰动）
+        batch_size (int): 每次从Chroma读取的片段数
+
+    Returns:
+        dict: 紧凑索引统计，写入版本元数据
+    """
+    collection = vector_store._collection
+    total = collection.count()
+    ids = []
+    blocks = []
+    for offset in range(0, total, batch_size):
+        result = collection.get(limit=batch_size, offset=offset, include=["embeddings"])
+        ids.extend(result["ids"])
+        blocks.append(np.asarray(result["embeddings"], dtype=np.float32))
+    vectors = np.concatenate(blocks) if blocks else np.empty((0, 0), dtype=np.float32)
+
+    directory = os.path.join(persist_directory, COMPACT_DIRNAME)
+    quantizer = None
+    codebook_path = os.path.join(directory, COMPACT_CODEBOOK_FILENAME)
+    if mode == "pq" and os.path.exists(codebook_path):
+        quantizer = ProductQuantizer(np.load(codebook_path))
+    index = CompactVectorIndex.build(directory, ids, vectors, mode, quantizer, pq_subvectors)
+
+    rng = np.random.RandomState(0)
+    sample = vectors[rng.choice(len(vectors), min(num_recall_queries, len(vectors)), replace=False)] \
+        if len(vectors) else vectors
+    queries = sample + rng.normal(scale=0.01, size=sample.shape).astype(np.float32)
+    bytes_per_vector = index.bytes_per_vector()
+    stats = {
+        "mode": mode,
+        "count": len(index),
+        "bytes_per_vector": round(bytes_per_vector, 1),
+        "memory_mb_per_million": round(bytes_per_vector * 1e6 / 1024 / 1024, 1),
+        "float32_memory_mb_per_million": round(index.dim * 4 * 1e6 / 1024 / 1024, 1) if len(index) else 0.0,
+        "recall_at_10": round(evaluate_recall(index, queries, 10, candidates), 4),
+    }
+    logger.info(f"紧凑向量索引构建完成: {stats}")
+    return stats
+
+
+class CompactVectorStore(VectorStore):
+    """用紧凑索引检索、从Chroma读取文档和元数据的只读向量库"""
+
+    def __init__(self, chroma, index: CompactVectorIndex, candidates: int = 200):
+        """
+        Args:
+            chroma: 同一版本的Chroma向量库
+            index (CompactVectorIndex): 紧凑索引
+            candidates (int): 粗排候选数
+        """
+        self.chroma = chroma
+        self.index = index
+        self.candidates = candidates
+
+    @property
+    def embeddings(self):
+        return self.chroma.embeddings
+
+    @property
+    def _collection(self):
+        # 增量构建等直接读写集合的代码继续使用Chroma集合
+        return self.chroma._collection
+
+    def _select_relevance_score_fn(self):
+        return self.chroma._select_relevance_score_fn()
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise ValueError("紧凑存储版本只读，请通过ETL构建新版本")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise TypeError("紧凑存储版本只能由ETL构建")
+
+    def _documents(self, rows: list) -> list:
+        ids = [self.index.ids[row] for row in rows]
+        result = self.chroma._collection.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {chunk_id: Document(page_content=text, metadata=metadata or {})
+                 for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])}
+        return [by_id.get(chunk_id) for chunk_id in ids]
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4) -> list:
+        hits = self.index.search(embedding, k, self.candidates)
+        documents = self._documents([row for row, _ in hits])
+        return [(doc, distance) for doc, (_, distance) in zip(documents, hits) if doc is not None]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        if filter:
+            # 紧凑索引不含元数据，带过滤条件的检索交给Chroma
+            return self.chroma.similarity_search_with_score(query, k, filter=filter, **kwargs)
+        return self.similarity_search_by_vector_with_score(self.embeddings.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter, **kwargs)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def _similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs) -> list:
+        relevance = self._select_relevance_score_fn()
+        return [(doc, relevance(distance)) for doc, distance in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, **kwargs) -> list:
+        hits = self.index.search(embedding, fetch_k, max(self.candidates, fetch_k))
+        rows = [row for row, _ in hits]
+        if not rows:
+            return []
+        selected = maximal_marginal_relevance(np.asarray(embedding, dtype=np.float32),
+                                              self.index.get_vectors(rows), k=k, lambda_mult=lambda_mult)
+        return [doc for doc in self._documents([rows[i] for i in selected]) if doc is not None]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+                                      filter: dict = None, **kwargs) -> list:
+        if filter:
+            return self.chroma.max_marginal_relevance_search(query, k, fetch_k, lambda_mult, filter=filter, **kwargs)
+        return self.max_marginal_relevance_search_by_vector(self.embeddings.embed_query(query), k, fetch_k,
+                                                            lambda_mult)
+
+
+def load_compact_vector_store(chroma, persist_directory: str, candidates: int = 200):
+    """
+    加载版本的紧凑索引并包装Chroma向量库
+
+    Returns:
+        CompactVectorStore: 包装后的向量库，紧凑索引不存在时返回None
+    """
+    directory = os.path.join(persist_directory, COMPACT_DIRNAME)
+    if not os.path.exists(os.path.join(directory, COMPACT_META_FILENAME)):
+        return None
+    index = CompactVectorIndex(directory)
+    logger.info(f"紧凑向量索引加载完成: {index.mode}，{len(index)} 个向量，每个向量常驻 {index.bytes_per_vector():.1f} 字节")
+    return CompactVectorStore(chroma, index, candidates)
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+近重复片段去重模块
+用MinHash签名估计片段之间的Jaccard相似度，用LSH分桶只比较可能相似的片段，
+相似度达到阈值的片段只保留第一个（代表片段）写入向量库，其余片段作为重复记录在去重索引中，
+代表片段的元数据记录被合并片段的数量和来源
+
+去重索引按版本保存在版本目录下（SQLite），差量构建时随版本目录一起复制，只需处理变化的片段
+"""
+
+import os
+import re
+import sqlite3
+import hashlib
+import numpy as np
+from log.logger import logger
+from util.tools import ListUtils
+from constant.constants import DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_SHINGLE_SIZE
+
+# 去重索引文件名，保存在每个版本目录下
+DEDUP_INDEX_FILENAME = "dedup_index.db"
+# 代表片段元数据中记录合并来源的字段
+PROVENANCE_KEYS = ("duplicate_count", "duplicate_sources")
+
+# 多项式滚动哈希的底数（64位乘法自然溢出即取模）
+_SHINGLE_BASE = np.uint64(1099511628211)
+
+
+class MinHasher:
+    """基于字符k-gram的MinHash签名生成器"""
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, shingle_size: int = DEDUP_SHINGLE_SIZE, seed: int = 1):
+        """
+        初始化签名生成器
+
+        Args:
+            num_perm (int): 签名长度（哈希函数个数）
+            shingle_size (int): k-gram的字符数，中文按字切分
+            seed (int): 随机种子，同一索引内必须固定
+        """
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        # 乘移位哈希族：(a * x + b) mod 2^64 取高32位，a为奇数
+        self._a = rng.randint(0, 2 ** 62, size=num_perm, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.randint(0, 2 ** 62, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+    def _shingles(self, text: str) -> np.ndarray:
+        text = re.sub(r"\s+", " ", text.lower()).strip()
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        if len(codes) == 0:
+            return np.zeros(1, dtype=np.uint64)
+        width = min(self.shingle_size, len(codes))
+        count = len(codes) - width + 1
+        hashes = np.zeros(count, dtype=np.uint64)
+        for offset in range(width):
+            hashes = hashes * _SHINGLE_BASE + codes[offset:offset + count]
+        return np.unique(hashes)
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        计算文本的MinHash签名
+
+        Args:
+            text (str): 文本
+
+        Returns:
+            np.ndarray: uint32签名，长度为 num_perm
+        """
+        shingles = self._shingles(text)
+        hashed = (np.outer(self._a, shingles) + self._b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+
+def estimate_similarity(signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+    """
+    由MinHash签名估计Jaccard相似度
+
+    Returns:
+        float: 相似度估计值 [0, 1]
+    """
+    return float(np.mean(signature_a == signature_b))
+
+
+class DedupIndex:
+    """持久化的LSH去重索引"""
+
+    def __init__(self, path: str, num_perm: int = DEDUP_NUM_PERM, bands: int = DEDUP_BANDS,
+                 threshold: float = DEDUP_THRESHOLD):
+        """
+        打开或创建去重索引
+
+        Args:
+            path (str): 索引文件路径
+            num_perm (int): 签名长度
+            bands (int): LSH分段数，每段 num_perm // bands 个值；段数越多召回越高、候选越多
+            threshold (float): 判定为近重复的相似度阈值
+        """
+        if num_perm % bands:
+            raise ValueError(f"签名长度 {num_perm} 必须能被分段数 {bands} 整除")
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS signatures (chunk_id TEXT PRIMARY KEY, signature BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS bands (band_key INTEGER NOT NULL, chunk_id TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_bands_key ON bands (band_key);
+            CREATE INDEX IF NOT EXISTS idx_bands_chunk ON bands (chunk_id);
+            CREATE TABLE IF NOT EXISTS duplicates (
+                chunk_id TEXT PRIMARY KEY, representative_id TEXT NOT NULL, source TEXT);
+            CREATE INDEX IF NOT EXISTS idx_duplicates_representative ON duplicates (representative_id);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+        """)
+        meta = dict(self.conn.execute("SELECT name, value FROM meta").fetchall())
+        if not meta:
+            self.conn.executemany("INSERT INTO meta (name, value) VALUES (?, ?)",
+                                  [("num_perm", str(num_perm)), ("bands", str(bands))])
+            self.conn.commit()
+        elif (int(meta["num_perm"]), int(meta["bands"])) != (num_perm, bands):
+            raise ValueError(f"去重索引参数不一致: {meta}")
+
+    def _band_keys(self, signature: np.ndarray) -> list:
+        keys = []
+        for band in range(self.bands):
+            digest = hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(),
+                                     digest_size=8, salt=band.to_bytes(2, "little")).digest()
+            keys.append(int.from_bytes(digest, "little", signed=True))
+        return keys
+
+    def contains(self, chunk_id: str) -> bool:
+        """片段是否已作为代表片段在索引中"""
+        return self.conn.execute("SELECT 1 FROM signatures WHERE chunk_id = ?", (chunk_id,)).fetchone() is not None
+
+    def find_duplicate(self, signature: np.ndarray):
+        """
+        查找与签名近重复的代表片段
+
+        Args:
+            signature (np.ndarray): 签名
+
+        Returns:
+            str: 相似度最高且达到阈值的代表片段ID，没有时返回None
+        """
+        keys = self._band_keys(signature)
+        placeholders = ",".join("?" * len(keys))
+        rows = self.conn.execute(
+            f"SELECT chunk_id, signature FROM signatures WHERE chunk_id IN "
+            f"(SELECT DISTINCT chunk_id FROM bands WHERE band_key IN ({placeholders}))", keys).fetchall()
+        best_id, best_similarity = None, self.threshold
+        for chunk_id, blob in rows:
+            similarity = estimate_similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+            if similarity >= best_similarity:
+                best_id, best_similarity = chunk_id, similarity
+        return best_id
+
+    def add(self, chunk_id: str, signature: np.ndarray):
+        """加入代表片段"""
+        self.conn.execute("INSERT OR REPLACE INTO signatures (chunk_id, signature) VALUES (?, ?)",
+                          (chunk_id, signature.astype(np.uint32).tobytes()))
+        self.conn.executemany("INSERT INTO bands (band_key, chunk_id) VALUES (?, ?)",
+                              [(key, chunk_id) for key in self._band_keys(signature)])
+
+    def add_duplicate(self, chunk_id: str, representative_id: str, source: str = None):
+        """记录被合并的重复片段"""
+        self.conn.execute("INSERT OR REPLACE INTO duplicates (chunk_id, representative_id, source) VALUES (?, ?, ?)",
+                          (chunk_id, representative_id, source))
+
+    def members(self, representative_ids) -> dict:
+        """
+        查询代表片段合并的重复片段
+
+        Args:
+            representative_ids: 代表片段ID集合
+
+        Returns:
+            dict: {代表片段ID: [(重复片段ID, 来源), ...]}
+        """
+        result = {}
+        for batch_ids in ListUtils.chunk_list(list(representative_ids), 500):
+            placeholders = ",".join("?" * len(batch_ids))
+            for chunk_id, representative_id, source in self.conn.execute(
+                    f"SELECT chunk_id, representative_id, source FROM duplicates "
+                    f"WHERE representative_id IN ({placeholders})", batch_ids):
+                result.setdefault(representative_id, []).append((chunk_id, source))
+        return result
+
+    def duplicates_from_sources(self, sources) -> list:
+        """
+        查询来自指定来源的重复片段
+
+        Args:
+            sources: 来源集合
+
+        Returns:
+            list: 重复片段ID列表
+        """
+        chunk_ids = []
+        for batch_sources in ListUtils.chunk_list(list(sources), 500):
+            placeholders = ",".join("?" * len(batch_sources))
+            chunk_ids.extend(row[0] for row in self.conn.execute(
+                f"SELECT chunk_id FROM duplicates WHERE source IN ({placeholders})", batch_sources))
+        return chunk_ids
+
+    def remove(self, chunk_ids) -> tuple:
+        """
+        从索引中删除片段（代表片段或重复片段）
+
+        Args:
+            chunk_ids: 片段ID集合
+
+        Returns:
+            tuple: (合并成员有变化、仍在索引中的代表片段ID集合, 因代表片段被删除而失去归属的重复片段ID列表)
+        """
+        chunk_ids = set(chunk_ids)
+        affected = set()
+        orphans = []
+        for batch_ids in ListUtils.chunk_list(list(chunk_ids), 500):
+            placeholders = ",".join("?" * len(batch_ids))
+            affected.update(row[0] for row in self.conn.execute(
+                f"SELECT representative_id FROM duplicates WHERE chunk_id IN ({placeholders})", batch_ids))
+            self.conn.execute(f"DELETE FROM duplicates WHERE chunk_id IN ({placeholders})", batch_ids)
+            orphans.extend(row[0] for row in self.conn.execute(
+                f"SELECT chunk_id FROM duplicates WHERE representative_id IN ({placeholders})", batch_ids))
+            self.conn.execute(f"DELETE FROM duplicates WHERE representative_id IN ({placeholders})", batch_ids)
+            self.conn.execute(f"DELETE FROM signatures WHERE chunk_id IN ({placeholders})", batch_ids)
+            self.conn.execute(f"DELETE FROM bands WHERE chunk_id IN ({placeholders})", batch_ids)
+        return affected - chunk_ids, orphans
+
+    def count(self) -> tuple:
+        """
+        Returns:
+            tuple: (代表片段数, 重复片段数)
+        """
+        return (self.conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0],
+                self.conn.execute("SELECT COUNT(*) FROM duplicates").fetchone()[0])
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def provenance_metadata(members: list) -> dict:
+    """
+    由合并的重复片段生成代表片段的来源元数据
+
+    Args:
+        members (list): [(重复片段ID, 来源), ...]
+
+    Returns:
+        dict: 元数据字段，没有重复片段时为空
+    """
+    if not members:
+        return {}
+    sources = sorted({source for _, source in members if source})
+    return {"duplicate_count": len(members), "duplicate_sources": "|".join(sources)}
+
+
+def deduplicate_documents(documents, index: DedupIndex, hasher: MinHasher = None) -> tuple:
+    """
+    对文档片段去重：与索引中已有的代表片段或本批中更早的片段近重复的片段被合并
+
+    Args:
+        documents (list): 文档片段列表（带 metadata['chunk_id']），按顺序处理，先出现的作为代表片段
+        index (DedupIndex): 去重索引，处理后包含本批的代表片段和重复片段
+        hasher (MinHasher): 签名生成器
+
+    Returns:
+        tuple: (保留的片段列表（已写入来源元数据）, 合并成员有变化但不在本批中的代表片段ID集合)
+    """
+    hasher = hasher or MinHasher(index.num_perm)
+    kept = []
+    affected = set()
+    for doc in documents:
+        for key in PROVENANCE_KEYS:
+            doc.metadata.pop(key, None)
+        chunk_id = doc.metadata['chunk_id']
+        # 片段ID包含内容哈希，已是代表片段的ID内容不变，无需重新比较
+        if index.contains(chunk_id):
+            kept.append(doc)
+            continue
+        signature = hasher.signature(doc.page_content)
+        representative_id = index.find_duplicate(signature)
+        if representative_id is None:
+            index.add(chunk_id, signature)
+            kept.append(doc)
+        else:
+            index.add_duplicate(chunk_id, representative_id, doc.metadata.get('source'))
+            affected.add(representative_id)
+
+    members = index.members(doc.metadata['chunk_id'] for doc in kept)
+    for doc in kept:
+        doc.metadata.update(provenance_metadata(members.get(doc.metadata['chunk_id'])))
+    index.commit()
+    affected -= {doc.metadata['chunk_id'] for doc in kept}
+    logger.info(f"近重复去重: 输入 {len(documents)} 个片段，保留 {len(kept)} 个，合并 {len(documents) - len(kept)} 个")
+    return kept, affected
+
+
+def open_dedup_index(version_path: str) -> DedupIndex:
+    """
+    打开版本目录下的去重索引
+
+    Args:
+        version_path (str): 版本目录
+
+    Returns:
+        DedupIndex: 去重索引，不存在时返回None
+    """
+    path = os.path.join(version_path, DEDUP_INDEX_FILENAME)
+    if not os.path.exists(path):
+        return None
+    return DedupIndex(path)
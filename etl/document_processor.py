@@ -6,61 +6,118 @@
 """
 
 import os
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import hashlib
 import json
 from log.logger import logger
 
 
-def load_and_process_documents(data_path: str):
+# 支持的文件类型
+SUPPORTED_EXTENSIONS = {'.pdf', '.txt'}
+
+
+def list_supported_files(data_path: str) -> list:
     """
-    加载并处理指定路径下的所有文档
+    列出目录下所有支持的文档文件
     
     Args:
         data_path (str): 文档目录路径
         
     Returns:
-        list: 处理后的文档片段列表
+        list: 文件路径列表（已排序）
     """
-    logger.info(f"开始加载文档，路径: {data_path}")
+    file_paths = []
+    for root, dirs, files in os.walk(data_path):
+        for file in files:
+            if os.path.splitext(file)[1].lower() in SUPPORTED_EXTENSIONS:
+                file_paths.append(os.path.join(root, file))
+    return sorted(file_paths)
+
+
+def make_chunk_id(source: str, position: int, content: str) -> str:
+    """
+    生成确定性的文档片段ID：来源路径 + 片段序号 + 内容哈希
     
-    documents = []
+    Args:
+        source (str): 来源文件路径
+        position (int): 片段在来源文件中的序号
+        content (str): 片段内容
+        
+    Returns:
+        str: 片段ID
+    """
+    source_hash = hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+    content_hash = hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+    return f"{source_hash}-{position:06d}-{content_hash}"
+
+
+def assign_chunk_ids(documents) -> list:
+    """
+    为文档片段分配确定性ID，写入 metadata['chunk_id']；已有ID的片段保持不变
     
-    # 支持的文件类型
-    supported_extensions = {'.pdf', '.txt'}
+    Args:
+        documents (list): 文档片段列表（按来源内顺序排列）
+        
+    Returns:
+        list: 片段ID列表，与documents一一对应
+    """
+    positions = {}
+    ids = []
+    for doc in documents:
+        source = str(doc.metadata.get('source', ''))
+        position = positions.get(source, 0)
+        positions[source] = position + 1
+        if not doc.metadata.get('chunk_id'):
+            doc.metadata['chunk_id'] = make_chunk_id(source, position, doc.page_content)
+        ids.append(doc.metadata['chunk_id'])
+    return ids
+
+
+def load_and_process_files(file_paths: list):
+    """
+    加载并处理指定的文档文件
     
-    # 遍历目录中的所有文件
-    for root, dirs, files in os.walk(data_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            file_extension = os.path.splitext(file)[1].lower()
+    Args:
+        file_paths (list): 文件路径列表
+        
+    Returns:
+        tuple: (处理后的文档片段列表，每个片段带有 metadata['chunk_id'];
+                加载失败的文件路径列表，调用方不应把这些文件记为已处理)
+    """
+    # 文档加载器导入较慢，只在确实需要加载文件时导入（数据未变化的ETL任务不需要）
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    
+    documents = []
+    failed_files = []
+    
+    for file_path in file_paths:
+        file_extension = os.path.splitext(file_path)[1].lower()
+        
+        if file_extension not in SUPPORTED_EXTENSIONS:
+            continue
             
-            if file_extension not in supported_extensions:
-                continue
+        try:
+            if file_extension == '.pdf':
+                logger.info(f"加载PDF文件: {file_path}")
+                loader = PyPDFLoader(file_path)
+                pdf_docs = loader.load()
+                logger.info(f"已加载PDF文件: {file_path}, 文档数: {len(pdf_docs)}")
+                documents.extend(pdf_docs)
                 
-            try:
-                if file_extension == '.pdf':
-                    logger.info(f"加载PDF文件: {file_path}")
-                    loader = PyPDFLoader(file_path)
-                    pdf_docs = loader.load()
-                    logger.info(f"已加载PDF文件: {file_path}, 文档数: {len(pdf_docs)}")
-                    documents.extend(pdf_docs)
-                    
-                elif file_extension == '.txt':
-                    logger.info(f"加载TXT文件: {file_path}")
-                    loader = TextLoader(file_path, encoding='utf-8')
-                    txt_docs = loader.load()
-                    logger.info(f"已加载TXT文件: {file_path}, 文档数: {len(txt_docs)}")
-                    documents.extend(txt_docs)
-                    
-            except Exception as e:
-                logger.error(f"加载文件 {file_path} 时出错: {e}")
-                continue
+            elif file_extension == '.txt':
+                logger.info(f"加载TXT文件: {file_path}")
+                loader = TextLoader(file_path, encoding='utf-8')
+                txt_docs = loader.load()
+                logger.info(f"已加载TXT文件: {file_path}, 文档数: {len(txt_docs)}")
+                documents.extend(txt_docs)
+                
+        except Exception as e:
+            logger.error(f"加载文件 {file_path} 时出错: {e}")
+            failed_files.append(file_path)
+            continue
     
-    # 如果没有找到支持的文件
     if not documents:
-        logger.warning(f"在路径 {data_path} 中未找到支持的文档文件")
-        return []
+        return [], failed_files
     
     # 分割文档
     logger.info(f"开始分割文档，总文档数: {len(documents)}")
@@ -69,8 +126,31 @@ def load_and_process_documents(data_path: str):
         chunk_overlap=200
     )
     splits = text_splitter.split_documents(documents)
+    assign_chunk_ids(splits)
     logger.info(f"文档分割完成，总共 {len(splits)} 个片段")
     
+    return splits, failed_files
+
+
+def load_and_process_documents(data_path: str):
+    """
+    加载并处理指定路径下的所有文档
+    
+    Args:
+        data_path (str): 文档目录路径
+        
+    Returns:
+        list: 处理后的文档片段列表
+    """
+    logger.info(f"开始加载文档，路径: {data_path}")
+    
+    splits, _ = load_and_process_files(list_supported_files(data_path))
+    
+    # 如果没有找到支持的文件
+    if not splits:
+        logger.warning(f"在路径 {data_path} 中未找到支持的文档文件")
+        return []
+    
     return splits
 
 
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+片段向量持久化缓存模块
+以 (嵌入模型ID + 片段文本) 的哈希为键缓存float32向量，构建向量库时先查缓存，只为缓存中没有的片段调用模型
+
+存储格式（每个模型一个目录）：
+    vectors.<代>.f32  连续存放的float32向量（行数 x 维度），追加写入，读取时内存映射
+    index.db          SQLite索引：键 -> 行号，以及当前向量文件名
+"""
+
+import os
+import re
+import sqlite3
+import hashlib
+import numpy as np
+from log.logger import logger
+from util.tools import ListUtils
+from constant.constants import EMBEDDING_STORE_DIR
+
+# 每个版本目录下记录该版本引用的缓存键，用于垃圾回收
+EMBEDDING_REFS_FILENAME = "embedding_keys.txt"
+
+
+def get_model_id(embedding) -> str:
+    """
+    获取嵌入模型的标识，不同模型的向量互不复用
+
+    Args:
+        embedding: 嵌入模型实例
+
+    Returns:
+        str: 模型标识
+    """
+    model_name = getattr(embedding, "model_name", None) or type(embedding).__name__
+    encode_kwargs = getattr(embedding, "encode_kwargs", None) or {}
+    if encode_kwargs.get("normalize_embeddings"):
+        model_name += "#normalized"
+    return model_name
+
+
+class EmbeddingStore:
+    """按内容寻址的片段向量缓存"""
+
+    def __init__(self, model_id: str, directory: str = EMBEDDING_STORE_DIR):
+        """
+        初始化向量缓存
+
+        Args:
+            model_id (str): 嵌入模型标识
+            directory (str): 缓存根目录
+        """
+        self.model_id = model_id
+        self.path = os.path.join(directory, re.sub(r"[^0-9A-Za-z_.-]", "_", model_id))
+        self.vectors_path = os.path.join(self.path, "vectors.0.f32")
+        self.index_path = os.path.join(self.path, "index.db")
+        self._conn = None
+        self._matrix = None
+        self.dim = None
+
+    def make_key(self, text: str) -> str:
+        """
+        生成缓存键
+
+        Args:
+            text (str): 片段文本
+
+        Returns:
+            str: 缓存键
+        """
+        return hashlib.sha256(f"{self.model_id}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _get_connection(self):
+        if self._conn is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._conn = sqlite3.connect(self.index_path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            self._conn.commit()
+            meta = dict(self._conn.execute("SELECT name, value FROM meta").fetchall())
+            self.dim = int(meta["dim"]) if "dim" in meta else None
+            if "file" in meta:
+                self.vectors_path = os.path.join(self.path, meta["file"])
+        return self._conn
+
+    def _rows_on_disk(self) -> int:
+        if not self.dim or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dim)
+
+    def _get_matrix(self):
+        """内存映射向量文件，只有被访问的页才会读入内存"""
+        if self._matrix is None:
+            rows = self._rows_on_disk()
+            if rows == 0:
+                return None
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._matrix
+
+    def get_many(self, keys: list) -> dict:
+        """
+        批量查询向量
+
+        Args:
+            keys (list): 缓存键列表
+
+        Returns:
+            dict: {缓存键: 向量(list)}，未命中的键不在结果中
+        """
+        conn = self._get_connection()
+        found = {}
+        for batch_keys in ListUtils.chunk_list(list(keys), 500):
+            placeholders = ",".join("?" * len(batch_keys))
+            found.update(conn.execute(
+                f"SELECT key, row FROM vectors WHERE key IN ({placeholders})", batch_keys).fetchall())
+        matrix = self._get_matrix() if found else None
+        if matrix is None:
+            return {}
+        return {key: matrix[row].tolist() for key, row in found.items() if row < len(matrix)}
+
+    def put_many(self, keys: list, vectors: list):
+        """
+        批量写入向量，已存在的键跳过
+
+        Args:
+            keys (list): 缓存键列表
+            vectors (list): 向量列表
+        """
+        if not keys:
+            return
+        conn = self._get_connection()
+        existing = set(self.get_many(keys))
+        new_items = {}
+        for key, vector in zip(keys, vectors):
+            if key not in existing:
+                new_items[key] = vector
+        if not new_items:
+            return
+
+        array = np.asarray(list(new_items.values()), dtype=np.float32)
+        if self.dim is None:
+            self.dim = array.shape[1]
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+            conn.commit()
+        elif array.shape[1] != self.dim:
+            raise ValueError(f"向量维度 {array.shape[1]} 与缓存维度 {self.dim} 不一致")
+
+        # 先追加向量再提交索引：中途失败只会留下无索引的行，由垃圾回收清理
+        start_row = self._rows_on_disk()
+        with open(self.vectors_path, "ab") as f:
+            array.tofile(f)
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO vectors (key, row) VALUES (?, ?)",
+                             [(key, start_row + i) for i, key in enumerate(new_items)])
+        self._matrix = None
+
+    def count(self) -> int:
+        """
+        Returns:
+            int: 缓存的向量数
+        """
+        return self._get_connection().execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def gc(self, keep_keys: set) -> int:
+        """
+        垃圾回收：只保留仍被引用的向量，重写向量文件并压缩
+
+        Args:
+            keep_keys (set): 仍被引用的缓存键
+
+        Returns:
+            int: 回收的向量数
+        """
+        conn = self._get_connection()
+        matrix = self._get_matrix()
+        if matrix is None:
+            return 0
+        entries = conn.execute("SELECT key, row FROM vectors ORDER BY row").fetchall()
+        kept = [(key, row) for key, row in entries if key in keep_keys and row < len(matrix)]
+        removed = len(entries) - len(kept)
+        if removed == 0 and len(entries) == len(matrix):
+            return 0
+
+        # 写入新一代向量文件，与索引在同一事务中切换，任何时刻中断都不会出现索引与文件错位
+        generation = int(os.path.basename(self.vectors_path).split(".")[1]) + 1
+        new_file = f"vectors.{generation}.f32"
+        new_path = os.path.join(self.path, new_file)
+        with open(new_path, "wb") as f:
+            for batch in ListUtils.chunk_list(kept, 10000):
+                np.ascontiguousarray(matrix[[row for _, row in batch]]).tofile(f)
+        self._matrix = None
+        del matrix
+        with conn:
+            conn.execute("DELETE FROM vectors")
+            conn.executemany("INSERT INTO vectors (key, row) VALUES (?, ?)",
+                             [(key, i) for i, (key, _) in enumerate(kept)])
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('file', ?)", (new_file,))
+        old_path, self.vectors_path = self.vectors_path, new_path
+        os.remove(old_path)
+        conn.execute("VACUUM")
+        logger.info(f"向量缓存垃圾回收完成，回收 {removed} 个，保留 {len(kept)} 个")
+        return removed
+
+
+def write_embedding_refs(version_path: str, keys: list):
+    """
+    记录版本引用的缓存键
+
+    Args:
+        version_path (str): 版本目录
+        keys (list): 缓存键列表
+    """
+    with open(os.path.join(version_path, EMBEDDING_REFS_FILENAME), "w", encoding="utf-8") as f:
+        f.write("\n".join(keys))
+
+
+def collect_embedding_refs(version_paths: list) -> set:
+    """
+    收集若干版本引用的全部缓存键
+
+    Args:
+        version_paths (list): 版本目录列表
+
+    Returns:
+        set: 缓存键集合
+    """
+    keys = set()
+    for version_path in version_paths:
+        refs_path = os.path.join(version_path, EMBEDDING_REFS_FILENAME)
+        if os.path.exists(refs_path):
+            with open(refs_path, "r", encoding="utf-8") as f:
+                keys.update(line.strip() for line in f if line.strip())
+    return keys
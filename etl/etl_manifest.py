@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ETL清单模块
+记录每个向量库版本由哪些源文件构建（路径、大小、修改时间、内容哈希、片段ID），
+用于增量ETL判断文件的新增、修改和删除
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from log.logger import logger
+from etl.document_processor import list_supported_files
+
+# 清单文件名，保存在每个版本目录下
+MANIFEST_FILENAME = "etl_manifest.json"
+
+
+def file_sha256(file_path: str) -> str:
+    """
+    计算文件内容的SHA-256
+
+    Args:
+        file_path (str): 文件路径
+
+    Returns:
+        str: 十六进制哈希值
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ManifestDiff:
+    """清单差异"""
+
+    def __init__(self):
+        self.added = []
+        self.modified = []
+        self.deleted = []
+        self.unchanged = []
+        # 本次扫描得到的文件信息（不含chunk_ids）：{path: {size, mtime, sha256}}
+        self.files = {}
+
+    @property
+    def changed_files(self) -> list:
+        """需要重新加载的文件（新增 + 修改）"""
+        return self.added + self.modified
+
+    def has_changes(self) -> bool:
+        """是否有任何文件变化"""
+        return bool(self.added or self.modified or self.deleted)
+
+    def fingerprint(self) -> str:
+        """
+        数据目录的指纹：全部文件路径及内容哈希的SHA-256，与修改时间无关
+
+        Returns:
+            str: 十六进制哈希值
+        """
+        digest = hashlib.sha256()
+        for path in sorted(self.files):
+            digest.update(f"{path}\0{self.files[path]['sha256']}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def summary(self) -> str:
+        return (f"新增 {len(self.added)} 个, 修改 {len(self.modified)} 个, "
+                f"删除 {len(self.deleted)} 个, 未变 {len(self.unchanged)} 个")
+
+
+class ETLManifest:
+    """ETL清单"""
+
+    def __init__(self, files: dict = None, build_stats: dict = None):
+        """
+        初始化清单
+
+        Args:
+            files (dict): {文件路径: {size, mtime, sha256, chunk_ids}}
+            build_stats (dict): 构建统计（复用/新计算的片段数等）
+        """
+        self.files = files or {}
+        self.build_stats = build_stats or {}
+
+    @classmethod
+    def load(cls, version_path: str):
+        """
+        从版本目录加载清单
+
+        Args:
+            version_path (str): 版本目录
+
+        Returns:
+            ETLManifest: 清单，不存在或损坏时返回None
+        """
+        if not version_path:
+            return None
+        manifest_path = os.path.join(version_path, MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(data.get("files", {}), data.get("build_stats", {}))
+        except Exception as e:
+            logger.warning(f"读取ETL清单失败，按全量构建处理: {e}")
+            return None
+
+    def save(self, version_path: str):
+        """
+        保存清单到版本目录
+
+        Args:
+            version_path (str): 版本目录
+        """
+        manifest_path = os.path.join(version_path, MANIFEST_FILENAME)
+        data = {
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "files": self.files,
+            "build_stats": self.build_stats,
+        }
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def chunk_ids(self, file_paths: list = None) -> list:
+        """
+        获取指定文件（默认全部文件）的片段ID
+
+        Args:
+            file_paths (list): 文件路径列表
+
+        Returns:
+            list: 片段ID列表
+        """
+        file_paths = self.files.keys() if file_paths is None else file_paths
+        ids = []
+        for file_path in file_paths:
+            ids.extend(self.files.get(file_path, {}).get("chunk_ids", []))
+        return ids
+
+    def diff(self, data_path: str) -> ManifestDiff:
+        """
+        扫描数据目录并与清单比较
+
+        大小和修改时间都未变的文件直接视为未变，不重新计算哈希；
+        修改时间变化但内容哈希相同的文件也视为未变
+
+        Args:
+            data_path (str): 数据目录
+
+        Returns:
+            ManifestDiff: 差异
+        """
+        result = ManifestDiff()
+        for file_path in list_supported_files(data_path):
+            stat = os.stat(file_path)
+            old = self.files.get(file_path)
+            if old and old["size"] == stat.st_size and old["mtime"] == stat.st_mtime:
+                result.files[file_path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": old["sha256"]}
+                result.unchanged.append(file_path)
+                continue
+
+            sha256 = file_sha256(file_path)
+            result.files[file_path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+            if old is None:
+                result.added.append(file_path)
+            elif old["sha256"] == sha256:
+                result.unchanged.append(file_path)
+            else:
+                result.modified.append(file_path)
+
+        result.deleted = [path for path in self.files if path not in result.files]
+        return result
@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+进程内NumPy平面向量库
+全部向量常驻内存，检索时精确计算与每个向量的距离，不依赖Chroma服务和HNSW索引；
+适合中小规模语料，加载只需读入一个向量文件，检索结果与暴力检索完全一致
+
+集合接口（_collection）与构建流程使用的Chroma集合方法保持一致（upsert/add/get/update/delete/count），
+构建、差量更新、去重、紧凑索引导出等代码不区分引擎
+
+存储格式（版本目录下的 flat_index 子目录）：
+    vectors.<代>.f32  连续存放的float32向量，追加写入；替换和删除留下的空行在压缩时回收
+    records.db        SQLite：片段ID -> 行号、文本、元数据，以及当前向量文件名和维度
+"""
+
+import os
+import json
+import uuid
+import sqlite3
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from log.logger import logger
+from util.tools import ListUtils
+
+# 平面索引子目录
+FLAT_INDEX_DIRNAME = "flat_index"
+
+
+def match_where(metadata: dict, where: dict) -> bool:
+    """按Chroma的where语法（$and/$or/$eq/$ne/$in/$nin）判断元数据是否匹配"""
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(match_where(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(match_where(metadata, sub) for sub in condition):
+                return False
+        else:
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            value = metadata.get(key)
+            for operator, expected in condition.items():
+                if operator == "$eq":
+                    matched = value == expected
+                elif operator == "$ne":
+                    matched = value != expected
+                elif operator == "$in":
+                    matched = value in expected
+                elif operator == "$nin":
+                    matched = value not in expected
+                else:
+                    raise ValueError(f"平面向量库不支持的过滤条件: {operator}")
+                if not matched:
+                    return False
+    return True
+
+
+class FlatCollection:
+    """平面向量库的集合，方法与构建流程用到的Chroma集合方法一致"""
+
+    def __init__(self, directory: str):
+        """
+        打开或创建集合
+
+        Args:
+            directory (str): 集合目录
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._conn = sqlite3.connect(os.path.join(directory, "records.db"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records (id TEXT PRIMARY KEY, row INTEGER NOT NULL, document TEXT, metadata TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        meta = dict(self._conn.execute("SELECT name, value FROM meta").fetchall())
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self.vectors_path = os.path.join(directory, meta.get("file", "vectors.0.f32"))
+        self._load()
+
+    def _load(self):
+        """把向量文件读入内存，并由记录重建 行号 -> 片段ID"""
+        rows = dict((row, chunk_id) for chunk_id, row in self._conn.execute("SELECT id, row FROM records"))
+        size = max(rows) + 1 if rows else 0
+        capacity = max(size, 1024)
+        if self.dim:
+            vectors = np.fromfile(self.vectors_path, dtype=np.float32, count=size * self.dim) \
+                if size else np.empty(0, dtype=np.float32)
+            self._vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            self._vectors[:size] = vectors.reshape(size, self.dim)
+            self._norms = np.zeros(capacity, dtype=np.float32)
+            self._norms[:size] = (self._vectors[:size] ** 2).sum(axis=1)
+        else:
+            self._vectors = None
+            self._norms = None
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._row_ids = [None] * size
+        for row, chunk_id in rows.items():
+            self._alive[row] = True
+            self._row_ids[row] = chunk_id
+        # 向量文件中可能有提交前中断留下的行，从已提交的行之后继续追加
+        self._size = size
+
+    def _reserve(self, rows: int):
+        if self._size + rows <= len(self._alive):
+            return
+        capacity = max(len(self._alive) * 2, self._size + rows)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[:self._size] = self._norms[:self._size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._vectors, self._norms, self._alive = vectors, norms, alive
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def _fetch(self, ids: list) -> dict:
+        found = {}
+        for batch_ids in ListUtils.chunk_list(list(ids), 500):
+            placeholders = ",".join("?" * len(batch_ids))
+            for chunk_id, row, document, metadata in self._conn.execute(
+                    f"SELECT id, row, document, metadata FROM records WHERE id IN ({placeholders})", batch_ids):
+                found[chunk_id] = (row, document, json.loads(metadata) if metadata else None)
+        return found
+
+    def upsert(self, ids: list, embeddings, documents: list = None, metadatas: list = None):
+        """
+        写入片段，已存在的片段被整体替换（新向量追加到文件末尾，原行在压缩时回收）
+        """
+        if not ids:
+            return
+        array = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        if self.dim is None:
+            self.dim = array.shape[1]
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+            self._conn.commit()
+            self._load()
+        elif array.shape[1] != self.dim:
+            raise ValueError(f"向量维度 {array.shape[1]} 与集合维度 {self.dim} 不一致")
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [None] * len(ids)
+
+        # 先追加向量再提交记录：中途失败只会留下没有记录指向的行
+        existing = self._fetch(ids)
+        start_row = self._size
+        with open(self.vectors_path, "r+b" if os.path.exists(self.vectors_path) else "wb") as f:
+            f.seek(start_row * self.dim * 4)
+            array.tofile(f)
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO records (id, row, document, metadata) VALUES (?, ?, ?, ?)",
+                [(chunk_id, start_row + i, document, json.dumps(metadata, ensure_ascii=False) if metadata else None)
+                 for i, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas))])
+
+        self._reserve(len(ids))
+        for row, _, _ in existing.values():
+            self._alive[row] = False
+            self._row_ids[row] = None
+        end_row = start_row + len(ids)
+        self._vectors[start_row:end_row] = array
+        self._norms[start_row:end_row] = (array ** 2).sum(axis=1)
+        self._alive[start_row:end_row] = True
+        self._row_ids.extend(ids)
+        self._size = end_row
+        self._maybe_compact()
+
+    add = upsert
+
+    def get(self, ids: list = None, where: dict = None, limit: int = None, offset: int = None,
+            include: list = ("metadatas", "documents")) -> dict:
+        """
+        按ID或元数据条件读取片段
+
+        Returns:
+            dict: {"ids", "documents", "metadatas", "embeddings"}，未请求的字段为None
+        """
+        if ids is not None:
+            found = self._fetch(ids)
+            entries = [(chunk_id,) + found[chunk_id] for chunk_id in ids if chunk_id in found]
+        else:
+            # 没有过滤条件时分页在SQL中完成，按页导出全部片段的耗时与总量成正比
+            page = "" if where or limit is None else f" LIMIT {int(limit)} OFFSET {int(offset or 0)}"
+            entries = [(chunk_id, row, document, json.loads(metadata) if metadata else None)
+                       for chunk_id, row, document, metadata in
+                       self._conn.execute(f"SELECT id, row, document, metadata FROM records ORDER BY row{page}")]
+            if page:
+                limit = offset = None
+        if where:
+            entries = [entry for entry in entries if match_where(entry[3], where)]
+        entries = entries[offset or 0:(offset or 0) + limit if limit is not None else None]
+        return {
+            "ids": [entry[0] for entry in entries],
+            "documents": [entry[2] for entry in entries] if "documents" in include else None,
+            "metadatas": [entry[3] for entry in entries] if "metadatas" in include else None,
+            "embeddings": self._vectors[[entry[1] for entry in entries]].copy()
+            if "embeddings" in include and self.dim else None,
+        }
+
+    def update(self, ids: list, embeddings=None, documents: list = None, metadatas: list = None):
+        """
+        更新已有片段：元数据按字段合并，值为None的字段被删除（与Chroma一致）
+        """
+        found = self._fetch(ids)
+        ids = [chunk_id for chunk_id in ids if chunk_id in found]
+        if not ids:
+            return
+        merged = []
+        for i, chunk_id in enumerate(ids):
+            row, document, metadata = found[chunk_id]
+            if metadatas is not None:
+                metadata = dict(metadata or {})
+                for key, value in metadatas[i].items():
+                    if value is None:
+                        metadata.pop(key, None)
+                    else:
+                        metadata[key] = value
+            merged.append((document if documents is None else documents[i], metadata or None))
+        if embeddings is not None:
+            self.upsert(ids, embeddings, [d for d, _ in merged], [m for _, m in merged])
+            return
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE records SET document = ?, metadata = ? WHERE id = ?",
+                [(document, json.dumps(metadata, ensure_ascii=False) if metadata else None, chunk_id)
+                 for chunk_id, (document, metadata) in zip(ids, merged)])
+
+    def delete(self, ids: list = None, where: dict = None):
+        """按ID或元数据条件删除片段，不存在的ID被忽略"""
+        if ids is None and where is None:
+            return
+        if where is not None:
+            ids = self.get(ids=ids, where=where, include=[])["ids"]
+        found = self._fetch(ids)
+        with self._conn:
+            for batch_ids in ListUtils.chunk_list(list(found), 500):
+                self._conn.execute(f"DELETE FROM records WHERE id IN ({','.join('?' * len(batch_ids))})", batch_ids)
+        for row, _, _ in found.values():
+            self._alive[row] = False
+            self._row_ids[row] = None
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        live = int(self._alive[:self._size].sum())
+        if self._size - live > max(live, 1024):
+            self.compact()
+
+    def compact(self):
+        """
+        回收替换和删除留下的空行：写入新一代向量文件，与记录在同一事务中切换
+        """
+        rows = np.flatnonzero(self._alive[:self._size])
+        generation = int(os.path.basename(self.vectors_path).split(".")[1]) + 1
+        new_file = f"vectors.{generation}.f32"
+        new_path = os.path.join(self.directory, new_file)
+        np.ascontiguousarray(self._vectors[rows]).tofile(new_path)
+        ids = [self._row_ids[row] for row in rows]
+        with self._conn:
+            self._conn.executemany("UPDATE records SET row = ? WHERE id = ?",
+                                   [(i, chunk_id) for i, chunk_id in enumerate(ids)])
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('file', ?)", (new_file,))
+        old_path, self.vectors_path = self.vectors_path, new_path
+        if os.path.exists(old_path):
+            os.remove(old_path)
+        logger.info(f"平面向量库压缩完成，回收 {self._size - len(rows)} 行，保留 {len(rows)} 行")
+        self._load()
+
+    def search(self, query, k: int, where: dict = None) -> list:
+        """
+        精确检索最近的片段
+
+        Args:
+            query: 查询向量
+            k (int): 返回数量
+            where (dict): 元数据过滤条件
+
+        Returns:
+            list: [(行号, 平方L2距离), ...]，按距离升序
+        """
+        if not self.dim or not self._size:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        distances = self._norms[:self._size] - 2 * (self._vectors[:self._size] @ query)
+        valid = self._alive[:self._size].copy()
+        if where:
+            allowed = np.zeros(self._size, dtype=bool)
+            allowed[self._filtered_rows(where)] = True
+            valid &= allowed
+        distances[~valid] = np.inf
+        k = min(k, int(valid.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        query_norm = float(query @ query)
+        return [(int(row), max(float(distances[row]) + query_norm, 0.0)) for row in top]
+
+    def _filtered_rows(self, where: dict) -> list:
+        return [row for row, metadata in self._conn.execute("SELECT row, metadata FROM records")
+                if match_where(json.loads(metadata) if metadata else None, where)]
+
+    def row_ids(self, rows: list) -> list:
+        return [self._row_ids[row] for row in rows]
+
+    def row_vectors(self, rows: list) -> np.ndarray:
+        return self._vectors[list(rows)]
+
+
+class FlatVectorStore(VectorStore):
+    """进程内NumPy平面向量库，构造参数与Chroma相同"""
+
+    def __init__(self, persist_directory: str, embedding_function=None, **kwargs):
+        """
+        Args:
+            persist_directory (str): 版本目录，数据保存在其下的 flat_index 子目录
+            embedding_function: 嵌入模型
+        """
+        self.persist_directory = persist_directory
+        self._embedding_function = embedding_function
+        self._collection = FlatCollection(os.path.join(persist_directory, FLAT_INDEX_DIRNAME))
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def _select_relevance_score_fn(self):
+        # 与Chroma默认的L2距离一致
+        return self._euclidean_relevance_score_fn
+
+    def add_texts(self, texts, metadatas: list = None, ids: list = None, **kwargs) -> list:
+        texts = list(texts)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        self._collection.upsert(ids, self._embedding_function.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def delete(self, ids: list = None, **kwargs):
+        self._collection.delete(ids=ids)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas: list = None, persist_directory: str = None, ids: list = None,
+                   **kwargs):
+        store = cls(persist_directory, embedding)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+    def _documents(self, rows: list) -> list:
+        ids = self._collection.row_ids(rows)
+        result = self._collection.get(ids=ids)
+        by_id = {chunk_id: Document(page_content=text, metadata=metadata or {})
+                 for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])}
+        return [by_id[chunk_id] for chunk_id in ids]
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: dict = None) -> list:
+        hits = self._collection.search(embedding, k, filter)
+        documents = self._documents([row for row, _ in hits])
+        return [(doc, distance) for doc, (_, distance) in zip(documents, hits)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return self.similarity_search_by_vector_with_score(self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def _similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs) -> list:
+        relevance = self._select_relevance_score_fn()
+        return [(doc, relevance(distance)) for doc, distance in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, filter: dict = None, **kwargs) -> list:
+        rows = [row for row, _ in self._collection.search(embedding, fetch_k, filter)]
+        if not rows:
+            return []
+        selected = maximal_marginal_relevance(np.asarray(embedding, dtype=np.float32),
+                                              self._collection.row_vectors(rows), k=k, lambda_mult=lambda_mult)
+        return self._documents([rows[i] for i in selected])
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+                                      filter: dict = None, **kwargs) -> list:
+        return self.max_marginal_relevance_search_by_vector(self._embedding_function.embed_query(query), k, fetch_k,
+                                                            lambda_mult, filter)
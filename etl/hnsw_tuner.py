@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+HNSW参数调优模块
+取版本中的向量，按参数网格在临时目录中构建HNSW索引，以float32暴力检索的结果为标准答案，
+评估每组参数的 recall@k 和单条查询延迟，选出满足目标召回率的参数中检索最快的一组，记录到版本元数据。
+选定的 M / ef_construction 在下一次全量构建时使用；ef_search 可以修改已有集合，
+调优时按版本当前的 M / ef_construction 选出满足目标的最小 ef_search 直接应用，
+已加载该版本的进程重新加载后生效
+
+查询集可以是标注的查询文本（每行一条），也可以从版本的向量中抽样加噪声自动生成
+
+用法:
+    python etl/hnsw_tuner.py --version chroma_v003 --target 0.95 --k 10
+    python etl/hnsw_tuner.py --version chroma_v003 --queries data/golden_queries.txt --no-apply
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log.logger import logger
+from constant.constants import CHROMA_DB_DIR, HNSW_TARGET_RECALL
+from etl.version_meta import load_version_meta, update_version_meta
+from etl.index_snapshot import snapshot_exists
+
+# 默认的参数网格
+DEFAULT_GRID = {
+    "M": (8, 16, 32),
+    "ef_construction": (64, 128, 256),
+    "ef_search": (10, 20, 40, 80, 160, 320),
+}
+
+
+def load_version_vectors(vector_store, batch_size: int = 1000) -> np.ndarray:
+    """
+    读取向量库中的全部向量
+
+    Returns:
+        np.ndarray: float32向量 (片段数, 维度)
+    """
+    collection = vector_store._collection
+    blocks = []
+    for offset in range(0, collection.count(), batch_size):
+        result = collection.get(limit=batch_size, offset=offset, include=["embeddings"])
+        if len(result["ids"]):
+            blocks.append(np.asarray(result["embeddings"], dtype=np.float32))
+    return np.concatenate(blocks) if blocks else np.empty((0, 0), dtype=np.float32)
+
+
+def generate_queries(vectors: np.ndarray, num_queries: int = 200, noise: float = 0.05, seed: int = 0) -> np.ndarray:
+    """
+    从已有向量中抽样并加入高斯噪声，生成查询向量
+
+    Args:
+        vectors (np.ndarray): 版本中的向量
+        num_queries (int): 查询数
+        noise (float): 噪声相对向量长度的比例
+        seed (int): 随机种子
+
+    Returns:
+        np.ndarray: 查询向量
+    """
+    rng = np.random.RandomState(seed)
+    rows = rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False)
+    queries = vectors[rows]
+    scale = noise * np.linalg.norm(queries, axis=1, keepdims=True) / np.sqrt(vectors.shape[1])
+    return (queries + rng.normal(size=queries.shape) * scale).astype(np.float32)
+
+
+def exact_neighbors(vectors: np.ndarray, queries: np.ndarray, k: int, block_size: int = 256) -> list:
+    """
+    float32暴力检索每个查询的k个最近邻，作为召回率的标准答案
+
+    Returns:
+        list: 每个查询的最近邻行号集合
+    """
+    norms = (vectors ** 2).sum(axis=1)
+    k = min(k, len(vectors))
+    result = []
+    for start in range(0, len(queries), block_size):
+        block = queries[start:start + block_size]
+        distances = norms[None, :] - 2 * (block @ vectors.T)
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        result.extend(set(int(row) for row in rows) for rows in top)
+    return result
+
+
+def _open_client(directory: str):
+    """
+    重新打开目录上的Chroma客户端
+
+    已加载的HNSW索引不会因修改 ef_search 而改变，清除进程内缓存的客户端后重新打开才按新参数加载
+    """
+    import chromadb
+    from chromadb.api.client import SharedSystemClient
+
+    SharedSystemClient.clear_system_cache()
+    return chromadb.PersistentClient(directory)
+
+
+def evaluate_hnsw(directory: str, vectors: np.ndarray, queries: np.ndarray, truth: list, k: int, m: int,
+                  ef_construction: int, ef_search_values, batch_size: int = 5000) -> list:
+    """
+    用一组 M / ef_construction 构建临时集合，依次评估各个 ef_search
+
+    Args:
+        directory (str): 临时集合的目录
+        vectors (np.ndarray): 建索引的向量
+        queries (np.ndarray): 查询向量
+        truth (list): 每个查询的标准答案行号集合
+        k (int): 检索数量
+        m (int): 每个节点的邻居数
+        ef_construction (int): 构建时的候选列表长度
+        ef_search_values: 按从小到大评估的 ef_search
+        batch_size (int): 每批写入的向量数
+
+    Returns:
+        list: 每个 ef_search 的 {M, ef_construction, ef_search, build_s, recall, p50_ms, p95_ms}
+    """
+    name = "hnsw-tune"
+    collection = _open_client(directory).create_collection(
+        name, metadata={"hnsw:space": "l2", "hnsw:M": m, "hnsw:construction_ef": ef_construction})
+    start_time = time.time()
+    for start in range(0, len(vectors), batch_size):
+        rows = range(start, min(start + batch_size, len(vectors)))
+        collection.add(ids=[str(row) for row in rows], embeddings=vectors[start:start + batch_size])
+    build_seconds = time.time() - start_time
+
+    results = []
+    for ef_search in sorted(ef_search_values):
+        collection.modify(configuration={"hnsw": {"ef_search": int(ef_search)}})
+        collection = _open_client(directory).get_collection(name)
+        # 第一次查询加载索引，不计入延迟
+        collection.query(query_embeddings=[queries[0]], n_results=k, include=[])
+        latencies = []
+        hits = 0
+        for query, expected in zip(queries, truth):
+            start_time = time.time()
+            found = collection.query(query_embeddings=[query], n_results=k, include=[])["ids"][0]
+            latencies.append((time.time() - start_time) * 1000)
+            hits += len(expected.intersection(int(row) for row in found))
+        results.append({
+            "M": m,
+            "ef_construction": ef_construction,
+            "ef_search": int(ef_search),
+            "build_s": round(build_seconds, 3),
+            "recall": round(hits / max(1, sum(len(expected) for expected in truth)), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        })
+        logger.info(f"HNSW M={m} ef_construction={ef_construction} ef_search={ef_search}: "
+                    f"recall@{k}={results[-1]['recall']:.4f}, p50={results[-1]['p50_ms']:.2f}ms")
+        # ef_search再增大只会更慢，召回率已达1时不必继续
+        if results[-1]["recall"] >= 1.0:
+            break
+    return results
+
+
+def _cheapest(results: list, target_recall: float) -> dict:
+    """满足目标召回率的结果中延迟最低的一个（延迟相同时邻居数少、内存小的优先）；都不满足时取召回率最高的"""
+    passed = [result for result in results if result["recall"] >= target_recall]
+    if passed:
+        return min(passed, key=lambda r: (r["p50_ms"], r["M"], r["ef_construction"], r["ef_search"]))
+    return max(results, key=lambda r: (r["recall"], -r["p50_ms"]))
+
+
+def tune_hnsw(vectors: np.ndarray, queries: np.ndarray, k: int = 10, target_recall: float = HNSW_TARGET_RECALL,
+              grid: dict = None, current: dict = None) -> dict:
+    """
+    按参数网格评估HNSW参数，选出满足目标 recall@k 的参数中检索最快的一组
+
+    Args:
+        vectors (np.ndarray): 建索引的向量
+        queries (np.ndarray): 查询向量
+        k (int): 检索数量
+        target_recall (float): 目标召回率
+        grid (dict): 参数网格 {M: [...], ef_construction: [...], ef_search: [...]}
+        current (dict): 版本当前的HNSW参数，其 M / ef_construction 组合一定参与评估
+
+    Returns:
+        dict: {chosen, current_ef_search, target_met, candidates}
+    """
+    grid = dict(DEFAULT_GRID, **(grid or {}))
+    combinations = [(m, ef_construction) for m in grid["M"] for ef_construction in grid["ef_construction"]]
+    if current and (current["M"], current["ef_construction"]) not in combinations:
+        combinations.append((current["M"], current["ef_construction"]))
+    truth = exact_neighbors(vectors, queries, k)
+
+    candidates = []
+    for m, ef_construction in combinations:
+        directory = tempfile.mkdtemp(prefix="hnsw_tune_")
+        try:
+            candidates.extend(evaluate_hnsw(directory, vectors, queries, truth, k, m, ef_construction,
+                                            grid["ef_search"]))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    chosen = _cheapest(candidates, target_recall)
+    report = {
+        "chosen": {key: chosen[key] for key in ("M", "ef_construction", "ef_search")},
+        "recall": chosen["recall"],
+        "p50_ms": chosen["p50_ms"],
+        "p95_ms": chosen["p95_ms"],
+        "target_met": chosen["recall"] >= target_recall,
+        "current_ef_search": None,
+        "candidates": candidates,
+    }
+    if current:
+        # 已有集合不能修改 M / ef_construction，只在相同组合的结果中为其选 ef_search
+        same = [result for result in candidates
+                if (result["M"], result["ef_construction"]) == (current["M"], current["ef_construction"])]
+        report["current_ef_search"] = _cheapest(same, target_recall)["ef_search"]
+    if not report["target_met"]:
+        logger.warning(f"参数网格中没有满足 recall@{k} >= {target_recall} 的组合，选用召回率最高的 {report['chosen']}")
+    return report
+
+
+def recommended_hnsw_params(version_path: str) -> dict:
+    """
+    版本调优选定的HNSW参数，未调优时为构建该版本所用的参数；供下一次全量构建沿用
+
+    Returns:
+        dict: {M, ef_construction, ef_search}，版本不存在或非chroma引擎时为None
+    """
+    meta = load_version_meta(version_path)
+    return (meta.get("hnsw_tuning") or {}).get("chosen") or meta.get("hnsw")
+
+
+def tune_version(version_path: str, query_texts: list = None, k: int = 10,
+                 target_recall: float = HNSW_TARGET_RECALL, grid: dict = None, num_queries: int = 200,
+                 apply: bool = True) -> dict:
+    """
+    调优版本的HNSW参数并记录到版本元数据（hnsw_tuning）
+
+    Args:
+        version_path (str): 版本目录
+        query_texts (list): 标注的查询文本，为空时从版本向量中自动生成查询
+        k (int): 检索数量
+        target_recall (float): 目标召回率
+        grid (dict): 参数网格
+        num_queries (int): 自动生成的查询数
+        apply (bool): 是否把满足目标的最小 ef_search 应用到版本的Chroma集合（版本已有只读快照时不应用）
+
+    Returns:
+        dict: 调优报告
+    """
+    from etl.vector_builder import init_version_embedding, open_vector_store
+
+    meta = load_version_meta(version_path)
+    embedding = init_version_embedding(version_path)
+    vector_store = open_vector_store(version_path, embedding)
+    vectors = load_version_vectors(vector_store)
+    if not len(vectors):
+        raise ValueError(f"版本 {version_path} 中没有向量")
+    if query_texts:
+        queries = np.asarray(embedding.embed_documents(list(query_texts)), dtype=np.float32)
+    else:
+        queries = generate_queries(vectors, num_queries)
+    logger.info(f"开始调优HNSW参数: {len(vectors)} 个向量，{len(queries)} 个查询，目标 recall@{k} >= {target_recall}")
+
+    current = meta.get("hnsw") if meta.get("vector_engine", "chroma") == "chroma" else None
+    report = tune_hnsw(vectors, queries, k, target_recall, grid, current)
+    report.update({
+        "k": k,
+        "target_recall": target_recall,
+        "query_source": "labelled" if query_texts else "generated",
+        "num_queries": len(queries),
+        "num_vectors": len(vectors),
+        "tune_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    fields = {"hnsw_tuning": report}
+    if apply and current and report["current_ef_search"] is not None and snapshot_exists(version_path):
+        # 在线检索使用快照的精确扫描，不经过HNSW，调整 ef_search 不会生效
+        logger.warning(f"版本 {os.path.basename(version_path)} 已导出只读快照，在线检索不使用HNSW，"
+                       f"不调整 ef_search；调优结果仍供下次全量构建使用")
+    elif apply and current and report["current_ef_search"] is not None:
+        vector_store._collection.modify(configuration={"hnsw": {"ef_search": report["current_ef_search"]}})
+        fields["hnsw"] = dict(current, ef_search=report["current_ef_search"])
+        logger.info(f"版本 {os.path.basename(version_path)} 的 ef_search 已调整为 {report['current_ef_search']}")
+    update_version_meta(version_path, **fields)
+    logger.info(f"HNSW调优完成，下次全量构建使用 {report['chosen']}（recall@{k}={report['recall']:.4f}，"
+                f"p50={report['p50_ms']:.2f}ms）")
+    return report
+
+
+if __name__ == "__main__":
+    from etl.vector_version_manager import vector_version_manager
+
+    parser = argparse.ArgumentParser(description="HNSW参数调优")
+    parser.add_argument("--version", help="版本号，默认为活动版本")
+    parser.add_argument("--queries", help="标注查询文件（每行一条），不指定时自动生成查询")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 的k")
+    parser.add_argument("--target", type=float, default=HNSW_TARGET_RECALL, help="目标召回率")
+    parser.add_argument("--num-queries", type=int, default=200, help="自动生成的查询数")
+    parser.add_argument("--no-apply", action="store_true", help="只记录结果，不修改版本的 ef_search")
+    args = parser.parse_args()
+
+    path = (os.path.join(CHROMA_DB_DIR, args.version) if args.version
+            else vector_version_manager.get_active_version_path())
+    texts = None
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    result = tune_version(path, texts, args.k, args.target, num_queries=args.num_queries, apply=not args.no_apply)
+    print(f"选定参数: {result['chosen']}  recall@{args.k}={result['recall']:.4f}  "
+          f"p50={result['p50_ms']:.2f}ms  p95={result['p95_ms']:.2f}ms")
+    if result["current_ef_search"] is not None:
+        print(f"当前版本的 ef_search: {result['current_ef_search']}")
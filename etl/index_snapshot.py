@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+只读索引快照模块
+版本验证通过后导出为不可变快照，各个Web/API工作进程以只读方式内存映射同一组文件，
+向量页由操作系统页缓存在进程之间共享，N个进程不再占用N份内存；
+打开快照只需映射文件，加载耗时与索引规模基本无关
+
+快照检索是对全部向量的精确扫描（O(片段数 x 维度)），不使用HNSW，版本的 ef_search 调优对快照不生效。
+中小规模语料下扫描耗时与HNSW相当且召回率为1；语料规模大时扫描耗时线性增长，应关闭
+INDEX_SNAPSHOT_ENABLED 由各进程按引擎加载HNSW索引
+
+快照格式（版本目录下的 snapshot 子目录，文件只读）：
+    vectors.f32    float32向量 (片段数 x 维度)
+    norms.f32      各向量的平方范数
+    payloads.bin   依次存放每个片段的 JSON {"id", "document", "metadata"}（UTF-8）
+    offsets.u64    各片段在 payloads.bin 中的起始偏移 (片段数 + 1)
+    snapshot.json  片段数、维度、导出时间
+"""
+
+import os
+import json
+import mmap
+import stat
+import shutil
+import numpy as np
+from datetime import datetime
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from log.logger import logger
+from etl.flat_vector_store import match_where
+
+# 快照子目录
+SNAPSHOT_DIRNAME = "snapshot"
+SNAPSHOT_META_FILENAME = "snapshot.json"
+
+# 分块扫描的向量数
+_SCAN_BLOCK = 65536
+
+
+def snapshot_exists(version_path: str) -> bool:
+    """版本是否已有完整的快照"""
+    return os.path.exists(os.path.join(version_path, SNAPSHOT_DIRNAME, SNAPSHOT_META_FILENAME))
+
+
+def export_snapshot(vector_store, version_path: str, batch_size: int = 1000) -> dict:
+    """
+    把版本导出为只读快照
+
+    先写入临时目录，全部写完后改名为 snapshot，读取方不会看到不完整的快照；
+    已有旧快照时先改名移开，新快照就位后再删除
+
+    Args:
+        vector_store: 版本的向量库（提供 _collection.get）
+        version_path (str): 版本目录
+        batch_size (int): 每次从集合读取的片段数
+
+    Returns:
+        dict: 快照元数据
+    """
+    snapshot_path = os.path.join(version_path, SNAPSHOT_DIRNAME)
+    tmp_path = snapshot_path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    collection = vector_store._collection
+    total = collection.count()
+    count = 0
+    dim = 0
+    offsets = [0]
+    with open(os.path.join(tmp_path, "vectors.f32"), "wb") as vectors_file, \
+            open(os.path.join(tmp_path, "norms.f32"), "wb") as norms_file, \
+            open(os.path.join(tmp_path, "payloads.bin"), "wb") as payloads_file:
+        for offset in range(0, total, batch_size):
+            result = collection.get(limit=batch_size, offset=offset,
+                                    include=["documents", "metadatas", "embeddings"])
+            if not len(result["ids"]):
+                continue
+            vectors = np.asarray(result["embeddings"], dtype=np.float32)
+            dim = vectors.shape[1]
+            vectors.tofile(vectors_file)
+            (vectors ** 2).sum(axis=1).astype(np.float32).tofile(norms_file)
+            for chunk_id, document, metadata in zip(result["ids"], result["documents"], result["metadatas"]):
+                payload = json.dumps({"id": chunk_id, "document": document, "metadata": metadata or {}},
+                                     ensure_ascii=False).encode("utf-8")
+                payloads_file.write(payload)
+                offsets.append(offsets[-1] + len(payload))
+            count += len(result["ids"])
+    np.asarray(offsets, dtype=np.uint64).tofile(os.path.join(tmp_path, "offsets.u64"))
+
+    meta = {"count": count, "dim": dim, "export_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    with open(os.path.join(tmp_path, SNAPSHOT_META_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    for name in os.listdir(tmp_path):
+        os.chmod(os.path.join(tmp_path, name), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+    # 先把旧快照改名移开再换入新快照，两次改名之间不做删除，已映射旧快照的进程继续使用已打开的文件
+    old_path = snapshot_path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(snapshot_path):
+        os.rename(snapshot_path, old_path)
+    os.rename(tmp_path, snapshot_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    logger.info(f"版本 {os.path.basename(version_path)} 快照导出完成: {count} 个片段，维度 {dim}")
+    return meta
+
+
+class SnapshotCollection:
+    """快照的只读集合，提供构建流程读取数据用到的 get/count"""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        self._rows_by_id = None
+
+    def count(self) -> int:
+        return self._snapshot.count
+
+    def get(self, ids: list = None, where: dict = None, limit: int = None, offset: int = None,
+            include: list = ("metadatas", "documents")) -> dict:
+        if ids is not None:
+            if self._rows_by_id is None:
+                # 按ID读取需要遍历一次全部载荷，只在首次使用时建立
+                self._rows_by_id = {self._snapshot.payload(row)["id"]: row for row in range(self._snapshot.count)}
+            rows = [self._rows_by_id[chunk_id] for chunk_id in ids if chunk_id in self._rows_by_id]
+        else:
+            rows = list(range(self._snapshot.count))
+        payloads = [self._snapshot.payload(row) for row in rows]
+        if where:
+            matched = [(row, payload) for row, payload in zip(rows, payloads)
+                       if match_where(payload["metadata"], where)]
+            rows, payloads = [row for row, _ in matched], [payload for _, payload in matched]
+        start = offset or 0
+        end = start + limit if limit is not None else None
+        rows, payloads = rows[start:end], payloads[start:end]
+        return {
+            "ids": [payload["id"] for payload in payloads],
+            "documents": [payload["document"] for payload in payloads] if "documents" in include else None,
+            "metadatas": [payload["metadata"] or None for payload in payloads] if "metadatas" in include else None,
+            "embeddings": np.asarray(self._snapshot.vectors[rows]) if "embeddings" in include and rows else None,
+        }
+
+
+class IndexSnapshot:
+    """内存映射的只读快照"""
+
+    def __init__(self, version_path: str):
+        """
+        打开快照
+
+        Args:
+            version_path (str): 版本目录
+        """
+        self.path = os.path.join(version_path, SNAPSHOT_DIRNAME)
+        with open(os.path.join(self.path, SNAPSHOT_META_FILENAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.count = meta["count"]
+        self.dim = meta["dim"]
+        self.vectors = None
+        self.norms = None
+        self._payloads = None
+        self.offsets = np.memmap(os.path.join(self.path, "offsets.u64"), dtype=np.uint64, mode="r")
+        if self.count:
+            self.vectors = np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode="r",
+                                     shape=(self.count, self.dim))
+            self.norms = np.memmap(os.path.join(self.path, "norms.f32"), dtype=np.float32, mode="r",
+                                   shape=(self.count,))
+            with open(os.path.join(self.path, "payloads.bin"), "rb") as f:
+                self._payloads = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def payload(self, row: int) -> dict:
+        """读取一个片段的ID、文本和元数据"""
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._payloads[start:end].decode("utf-8"))
+
+    def distances(self, query: np.ndarray) -> np.ndarray:
+        """查询向量到全部向量的平方L2距离"""
+        result = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, _SCAN_BLOCK):
+            end = min(start + _SCAN_BLOCK, self.count)
+            result[start:end] = self.norms[start:end] - 2 * (self.vectors[start:end] @ query)
+        return np.maximum(result + float(query @ query), 0.0)
+
+    def search(self, query, k: int, where: dict = None) -> list:
+        """
+        精确检索最近的片段（分块扫描全部向量）
+
+        Returns:
+            list: [(行号, 平方L2距离, 载荷), ...]，按距离升序
+        """
+        if not self.count or k <= 0:
+            return []
+        distances = self.distances(np.asarray(query, dtype=np.float32))
+        if not where:
+            k = min(k, self.count)
+            top = np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top])]
+            return [(int(row), float(distances[row]), self.payload(row)) for row in top]
+        # 带过滤条件时按距离顺序逐个检查元数据，直到凑满k个
+        hits = []
+        for row in np.argsort(distances):
+            payload = self.payload(row)
+            if match_where(payload["metadata"], where):
+                hits.append((int(row), float(distances[row]), payload))
+                if len(hits) >= k:
+                    break
+        return hits
+
+
+class SnapshotVectorStore(VectorStore):
+    """基于只读快照的向量库，供在线检索使用"""
+
+    def __init__(self, version_path: str, embedding_function):
+        """
+        Args:
+            version_path (str): 版本目录
+            embedding_function: 查询使用的嵌入模型
+        """
+        self.version_path = version_path
+        self.snapshot = IndexSnapshot(version_path)
+        self._embedding_function = embedding_function
+        self._collection = SnapshotCollection(self.snapshot)
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise ValueError("快照只读，请通过ETL构建新版本")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise TypeError("快照只能由版本管理器导出")
+
+    @staticmethod
+    def _to_document(payload: dict) -> Document:
+        return Document(page_content=payload["document"], metadata=payload["metadata"] or {})
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: dict = None) -> list:
+        return [(self._to_document(payload), distance)
+                for _, distance, payload in self.snapshot.search(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return self.similarity_search_by_vector_with_score(self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def _similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs) -> list:
+        relevance = self._select_relevance_score_fn()
+        return [(doc, relevance(distance)) for doc, distance in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, filter: dict = None, **kwargs) -> list:
+        hits = self.snapshot.search(embedding, fetch_k, filter)
+        if not hits:
+            return []
+        selected = maximal_marginal_relevance(np.asarray(embedding, dtype=np.float32),
+                                              np.asarray(self.snapshot.vectors[[row for row, _, _ in hits]]),
+                                              k=k, lambda_mult=lambda_mult)
+        return [self._to_document(hits[i][2]) for i in selected]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+                                      filter: dict = None, **kwargs) -> list:
+        return self.max_marginal_relevance_search_by_vector(self._embedding_function.embed_query(query), k, fetch_k,
+                                                            lambda_mult, filter)
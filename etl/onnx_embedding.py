@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime int8嵌入模块
+把sentence-transformers模型导出为ONNX并做动态int8量化，推理时只依赖onnxruntime和tokenizers，
+不加载PyTorch。量化后的向量与原模型接近但不完全一致，模型标识带有 @onnx-int8 后缀，
+与PyTorch后端构建的索引版本、片段向量缓存互不混用
+
+导出（需要在装有torch和sentence-transformers的环境中执行一次）:
+    python etl/onnx_embedding.py --model sentence-transformers/all-MiniLM-L6-v2 --output models/onnx/all-MiniLM-L6-v2-int8
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log.logger import logger
+
+# 导出目录中的文件
+ONNX_MODEL_FILENAME = "model_int8.onnx"
+ONNX_CONFIG_FILENAME = "onnx_config.json"
+TOKENIZER_FILENAME = "tokenizer.json"
+
+
+def pool_embeddings(hidden_states, attention_mask, pooling_mode: str = "mean", normalize: bool = True):
+    """
+    把token向量汇聚为句向量，与sentence-transformers的Pooling层一致
+
+    Args:
+        hidden_states: 模型输出 (批大小, 序列长度, 维度)
+        attention_mask: 注意力掩码 (批大小, 序列长度)
+        pooling_mode (str): mean 或 cls
+        normalize (bool): 是否做L2归一化
+
+    Returns:
+        np.ndarray: 句向量 (批大小, 维度)
+    """
+    if pooling_mode == "cls":
+        pooled = hidden_states[:, 0]
+    else:
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden_states * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    if normalize:
+        pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+    return pooled.astype(np.float32)
+
+
+class OnnxEmbeddings(Embeddings):
+    """基于ONNX Runtime的int8量化嵌入模型"""
+
+    def __init__(self, model_dir: str, batch_size: int = 32, num_threads: int = 0):
+        """
+        加载导出的量化模型
+
+        Args:
+            model_dir (str): 导出目录
+            batch_size (int): 每次推理的文本数
+            num_threads (int): 推理线程数，0表示由onnxruntime决定
+        """
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILENAME), "r", encoding="utf-8") as f:
+            config = json.load(f)
+        self.model_name = f"{config['model_name']}@onnx-int8"
+        self.max_seq_length = config["max_seq_length"]
+        self.pooling_mode = config.get("pooling_mode", "mean")
+        self.encode_kwargs = {"normalize_embeddings": config.get("normalize", True)}
+        self.batch_size = batch_size
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILENAME), options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILENAME))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding()
+
+    def _encode(self, texts: list) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden_states = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        return pool_embeddings(hidden_states, feeds["attention_mask"], self.pooling_mode,
+                               self.encode_kwargs["normalize_embeddings"])
+
+    def embed_documents(self, texts: list, batch_size: int = None) -> list:
+        """
+        计算文本向量
+
+        Args:
+            texts (list): 文本列表
+            batch_size (int): 每次推理的文本数，为None时使用初始化时的批大小
+
+        Returns:
+            list: 向量列表
+        """
+        batch_size = batch_size or self.batch_size
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            vectors.extend(self._encode(texts[i:i + batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> list:
+        return self._encode([text])[0].tolist()
+
+
+def export_onnx_int8(model_name: str, output_dir: str, opset_version: int = 14):
+    """
+    导出sentence-transformers模型为ONNX并做动态int8量化
+
+    Args:
+        model_name (str): 模型名称或路径
+        output_dir (str): 导出目录
+        opset_version (int): ONNX算子集版本
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    sample = model.tokenizer(["导出示例文本"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = os.path.join(output_dir, "model_fp32.onnx")
+    with torch.no_grad():
+        torch.onnx.export(transformer, tuple(sample[name] for name in input_names), fp32_path,
+                          input_names=input_names, output_names=["last_hidden_state"],
+                          dynamic_axes=dynamic_axes, opset_version=opset_version)
+    quantize_dynamic(fp32_path, os.path.join(output_dir, ONNX_MODEL_FILENAME), weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    model.tokenizer.backend_tokenizer.save(os.path.join(output_dir, TOKENIZER_FILENAME))
+    pooling = model[1].get_pooling_mode_str() if len(model) > 1 else "mean"
+    config = {
+        "model_name": model_name,
+        "max_seq_length": model.max_seq_length,
+        "pooling_mode": "cls" if pooling == "cls" else "mean",
+        "normalize": True,
+    }
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    logger.info(f"ONNX int8模型导出完成: {output_dir}")
+
+
+if __name__ == "__main__":
+    from constant.constants import EMBEDDING_MODEL_NAME, ONNX_EMBEDDING_DIR
+
+    parser = argparse.ArgumentParser(description="导出ONNX int8嵌入模型")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME, help="sentence-transformers模型名称或路径")
+    parser.add_argument("--output", default=ONNX_EMBEDDING_DIR, help="导出目录")
+    args = parser.parse_args()
+    export_onnx_int8(args.model, args.output)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多进程并行嵌入模块
+构建向量库时把片段分批交给多个嵌入工作进程计算，每个进程持有独立的模型实例，
+并限制每个进程的torch/BLAS线程数，避免 进程数 x 线程数 超过CPU核数造成争抢；
+计算结果按提交顺序取回，由主进程单线程写入Chroma
+"""
+
+import os
+import inspect
+import multiprocessing
+from collections import deque
+from log.logger import logger
+
+# 工作进程内的嵌入模型
+_worker_embedding = None
+
+
+def get_default_threads(num_workers: int) -> int:
+    """
+    计算每个工作进程的线程数：CPU核数平均分给各进程
+
+    Args:
+        num_workers (int): 工作进程数
+
+    Returns:
+        int: 每个进程的线程数
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, num_workers))
+
+
+def _default_embedding_factory():
+    from etl.vector_builder import init_embedding
+    return init_embedding()
+
+
+def _init_worker(num_threads: int, embedding_factory):
+    """
+    工作进程初始化：限制线程数后加载模型
+
+    Args:
+        num_threads (int): 进程内计算线程数
+        embedding_factory: 创建嵌入模型的函数
+    """
+    global _worker_embedding
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(num_threads)
+    # 多进程下由进程并行，关闭tokenizers自身的线程池
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+    except ImportError:
+        pass
+    _worker_embedding = embedding_factory()
+
+
+def embed_batch(embedding, texts: list) -> list:
+    """
+    把一组文本作为一个模型批次计算向量
+
+    调用方已按token预算组好批次，这里不再让模型按默认批大小（32）重新切分：
+    HuggingFaceEmbeddings 直接调用 sentence-transformers 的 encode 并传入 batch_size，
+    OnnxEmbeddings 通过 batch_size 参数指定，其他模型按其自身的 embed_documents 计算
+
+    Args:
+        embedding: 嵌入模型
+        texts (list): 文本列表
+
+    Returns:
+        list: 向量列表，顺序与输入一致
+    """
+    if not texts:
+        return []
+    client = getattr(embedding, "client", None)
+    encode_kwargs = getattr(embedding, "encode_kwargs", None)
+    if hasattr(client, "encode") and isinstance(encode_kwargs, dict) and not getattr(embedding, "multi_process", False):
+        # 与 HuggingFaceEmbeddings.embed_documents 相同的预处理
+        texts = [text.replace("\n", " ") for text in texts]
+        vectors = client.encode(texts, show_progress_bar=getattr(embedding, "show_progress", False),
+                                **{**encode_kwargs, "batch_size": len(texts)})
+        return vectors.tolist()
+    if "batch_size" in inspect.signature(embedding.embed_documents).parameters:
+        return embedding.embed_documents(texts, batch_size=len(texts))
+    return embedding.embed_documents(texts)
+
+
+def _embed_texts(texts: list) -> list:
+    return embed_batch(_worker_embedding, texts)
+
+
+class EmbeddingWorkerPool:
+    """嵌入工作进程池"""
+
+    def __init__(self, num_workers: int, threads_per_worker: int = 0, embedding_factory=None,
+                 start_method: str = "spawn"):
+        """
+        初始化工作进程池
+
+        Args:
+            num_workers (int): 工作进程数
+            threads_per_worker (int): 每个进程的计算线程数，0表示按CPU核数平均分配
+            embedding_factory: 在工作进程中创建嵌入模型的函数（需可被pickle），默认 init_embedding
+            start_method (str): 进程启动方式，默认spawn，避免fork继承父进程的torch线程状态
+        """
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or get_default_threads(num_workers)
+        self.embedding_factory = embedding_factory or _default_embedding_factory
+        self.start_method = start_method
+        self._pool = None
+
+    def start(self):
+        """启动工作进程，每个进程加载一份模型"""
+        if self._pool is None:
+            context = multiprocessing.get_context(self.start_method)
+            self._pool = context.Pool(self.num_workers, initializer=_init_worker,
+                                      initargs=(self.threads_per_worker, self.embedding_factory))
+            logger.info(f"嵌入工作进程池已启动，进程数: {self.num_workers}, 每进程线程数: {self.threads_per_worker}")
+        return self
+
+    def close(self):
+        """关闭工作进程"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self._pool is not None:
+            self._pool.terminate()
+        self.close()
+
+    def imap(self, items, get_texts, max_in_flight: int = 0):
+        """
+        按顺序并行计算一组批次的向量
+
+        同时在途的批次数有上限，主进程写入慢于计算时不会在内存中堆积全部结果
+
+        Args:
+            items: 批次的可迭代对象
+            get_texts: 从批次中取出需要计算的文本列表的函数
+            max_in_flight (int): 最多同时在途的批次数，0表示进程数的2倍
+
+        Yields:
+            tuple: (批次, 向量列表)，顺序与输入一致
+        """
+        self.start()
+        max_in_flight = max_in_flight or 2 * self.num_workers
+        pending = deque()
+        for item in items:
+            pending.append((item, self._pool.apply_async(_embed_texts, (get_texts(item),))))
+            if len(pending) >= max_in_flight:
+                item, result = pending.popleft()
+                yield item, result.get()
+        while pending:
+            item, result = pending.popleft()
+            yield item, result.get()
+
+    def embed_documents(self, texts: list, batch_size: int = 32) -> list:
+        """
+        并行计算文本向量
+
+        Args:
+            texts (list): 文本列表
+            batch_size (int): 每个任务的文本数
+
+        Returns:
+            list: 向量列表，顺序与输入一致
+        """
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        vectors = []
+        for _, batch_vectors in self.imap(batches, lambda batch: batch):
+            vectors.extend(batch_vectors)
+        return vectors
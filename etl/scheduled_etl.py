@@ -9,15 +9,189 @@ import schedule
 import time
 import os
 import sys
+from dotenv import load_dotenv
 # 添加项目根目录到Python路径
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
-from etl.document_processor import load_and_process_documents, extract_and_save_content
-from etl.vector_builder import build_vector_store
+from etl.document_processor import load_and_process_documents, load_and_process_files, extract_and_save_content
+from etl.vector_builder import (
+    build_vector_store,
+    load_vector_store,
+    get_documents_with_embeddings,
+    check_embedding_compatible,
+)
+from etl.etl_manifest import ETLManifest
 from etl.vector_version_manager import vector_version_manager
+from etl.deduplicator import open_dedup_index
+from rag.qa_history_archiver import archive_job
+from rag.answer_warmup import warm_answer_cache
 from log.logger import logger
-from constant.constants import ProjectConstants
+from constant.constants import ProjectConstants, ETL_DELTA_BUILD
+
+
+def prepare_incremental_build(data_path: str):
+    """
+    对比当前活动版本的ETL清单，准备增量构建所需的文档和可复用向量
+    
+    新增和修改的文件重新加载切分；未变文件的片段及其向量直接从活动版本中取出，不再调用嵌入模型。
+    加载失败的文件不写入新清单，下次运行时作为新增文件重新加载
+    
+    Args:
+        data_path (str): 数据目录
+        
+    Returns:
+        tuple: (文档片段列表, 可复用向量 {片段ID: 向量}, 新清单)；
+               没有任何变化，或数据与上次被门禁拒绝的构建相同时返回None
+    """
+    active_path = vector_version_manager.get_active_version_path()
+    old_manifest = ETLManifest.load(active_path)
+    if old_manifest is not None and not check_embedding_compatible(active_path):
+        # 嵌入后端或模型变化：活动版本的向量不能复用，全量构建新的索引版本
+        old_manifest = None
+    diff = (old_manifest or ETLManifest()).diff(data_path)
+    
+    if old_manifest is not None and not diff.has_changes():
+        return None
+    if vector_version_manager.is_rejected_build(diff.fingerprint()):
+        logger.info("数据目录与上次被门禁拒绝的构建相同，跳过本次向量库构建")
+        return None
+    logger.info(f"数据目录变化: {diff.summary()}")
+    
+    reused_documents = []
+    known_embeddings = {}
+    reload_files = list(diff.changed_files)
+    if old_manifest is not None and diff.unchanged:
+        try:
+            active_store = load_vector_store(active_path)
+            reused_documents, known_embeddings = get_documents_with_embeddings(
+                active_store, old_manifest.chunk_ids(diff.unchanged))
+        except Exception as e:
+            logger.warning(f"读取活动版本向量失败，未变文件将重新计算: {e}")
+        # 活动版本中缺少片段的文件（如旧版本未使用确定性ID、片段作为近重复被合并）需要重新加载，
+        # 被合并的片段重新参与去重，来源信息才能记入新版本
+        found = set(known_embeddings)
+        for file_path in diff.unchanged:
+            if not all(chunk_id in found for chunk_id in old_manifest.chunk_ids([file_path])):
+                reload_files.append(file_path)
+        reload_set = set(reload_files)
+        reused_documents = [doc for doc in reused_documents if doc.metadata.get('source') not in reload_set]
+    else:
+        reload_files.extend(diff.unchanged)
+    
+    new_documents, failed_files = load_and_process_files(reload_files)
+    documents = reused_documents + new_documents
+    
+    # 生成新清单：记录每个文件对应的片段ID
+    files = {path: dict(info, chunk_ids=[]) for path, info in diff.files.items() if path not in failed_files}
+    for doc in documents:
+        source = doc.metadata.get('source')
+        if source in files:
+            files[source]["chunk_ids"].append(doc.metadata['chunk_id'])
+    reused = sum(1 for doc in documents if doc.metadata['chunk_id'] in known_embeddings)
+    manifest = ETLManifest(files, {
+        "chunks_total": len(documents),
+        "chunks_reused": reused,
+        "chunks_embedded": len(documents) - reused,
+        "files_added": len(diff.added),
+        "files_modified": len(diff.modified),
+        "files_deleted": len(diff.deleted),
+        "files_failed": len(failed_files),
+        "data_fingerprint": diff.fingerprint(),
+    })
+    logger.info(f"增量构建计划: 复用片段 {reused} 个，需重新计算 {len(documents) - reused} 个")
+    return documents, known_embeddings, manifest
+
+
+def find_orphaned_duplicate_files(version_path: str, removed_ids: list, manifest: ETLManifest, unchanged: list) -> list:
+    """
+    找出包含孤立重复片段的未变文件：这些重复片段被合并到的代表片段将被删除
+    
+    Args:
+        version_path (str): 活动版本目录
+        removed_ids (list): 将被删除的片段ID
+        manifest (ETLManifest): 活动版本的清单
+        unchanged (list): 未变文件列表
+        
+    Returns:
+        list: 需要重新加载的未变文件
+    """
+    dedup_index = open_dedup_index(version_path) if removed_ids else None
+    if dedup_index is None:
+        return []
+    try:
+        members = dedup_index.members(removed_ids)
+    finally:
+        dedup_index.close()
+    orphan_ids = {chunk_id for group in members.values() for chunk_id, _ in group}
+    return [path for path in unchanged if orphan_ids.intersection(manifest.chunk_ids([path]))]
+
+
+def prepare_delta_build(data_path: str):
+    """
+    对比当前活动版本的ETL清单，准备基于活动版本的差量构建
+    
+    只加载新增和修改的文件；修改和删除的文件中不再存在的片段需要从新版本中删除。
+    加载失败的文件保留旧片段和旧清单记录（新增文件不记录），下次运行时仍视为有变化并重新加载
+    
+    Args:
+        data_path (str): 数据目录
+        
+    Returns:
+        tuple: (需要写入的片段列表, 需要删除的片段ID列表, 新清单)；
+               活动版本不能作为差量基础（没有清单或嵌入模型已变化）时返回None；
+               数据与上次被门禁拒绝的构建相同时与没有变化一样返回空的写入和删除列表
+    """
+    active_path = vector_version_manager.get_active_version_path()
+    old_manifest = ETLManifest.load(active_path)
+    if old_manifest is None or not check_embedding_compatible(active_path):
+        return None
+    
+    diff = old_manifest.diff(data_path)
+    if not diff.has_changes():
+        return [], [], old_manifest
+    if vector_version_manager.is_rejected_build(diff.fingerprint()):
+        logger.info("数据目录与上次被门禁拒绝的构建相同，跳过本次向量库构建")
+        return [], [], old_manifest
+    logger.info(f"数据目录变化: {diff.summary()}")
+    
+    # 被删除的代表片段合并过未变文件中的重复片段时，这些文件需要重新加载，重复片段重新参与去重
+    removed_ids = old_manifest.chunk_ids(diff.modified + diff.deleted)
+    orphan_files = find_orphaned_duplicate_files(active_path, removed_ids, old_manifest, diff.unchanged)
+    
+    upsert_documents, failed_files = load_and_process_files(diff.changed_files + orphan_files)
+    new_ids = {doc.metadata['chunk_id'] for doc in upsert_documents}
+    kept_ids = set(old_manifest.chunk_ids(failed_files))
+    delete_ids = [chunk_id for chunk_id in removed_ids if chunk_id not in new_ids and chunk_id not in kept_ids]
+    
+    # 新清单：未变文件沿用旧的片段ID，变化的和重新加载的文件使用重新切分后的片段ID，
+    # 加载失败的文件沿用旧记录（哈希仍是旧内容的，下次运行重新加载）
+    reloaded = set(orphan_files)
+    files = {}
+    for path, info in diff.files.items():
+        if path in failed_files:
+            if path in old_manifest.files:
+                files[path] = dict(old_manifest.files[path])
+            continue
+        chunk_ids = old_manifest.files[path]["chunk_ids"] if path in diff.unchanged and path not in reloaded else []
+        files[path] = dict(info, chunk_ids=list(chunk_ids))
+    for doc in upsert_documents:
+        source = doc.metadata.get('source')
+        if source in files:
+            files[source]["chunk_ids"].append(doc.metadata['chunk_id'])
+    manifest = ETLManifest(files, {
+        "chunks_total": sum(len(info["chunk_ids"]) for info in files.values()),
+        "chunks_upserted": len(upsert_documents),
+        "chunks_deleted": len(delete_ids),
+        "files_added": len(diff.added),
+        "files_modified": len(diff.modified),
+        "files_deleted": len(diff.deleted),
+        "files_reloaded_for_duplicates": len(orphan_files),
+        "files_failed": len(failed_files),
+        "data_fingerprint": diff.fingerprint(),
+    })
+    logger.info(f"差量构建计划: 写入片段 {len(upsert_documents)} 个，删除片段 {len(delete_ids)} 个")
+    return upsert_documents, delete_ids, manifest
 
 
 def etl_job():
@@ -35,17 +209,41 @@ def etl_job():
         os.makedirs(data_path, exist_ok=True)
         os.makedirs(processed_data_path, exist_ok=True)
         
-        # 加载和处理文档
-        documents = load_and_process_documents(data_path)
+        # 优先基于活动版本差量构建：复制活动版本，只写入变化的片段
+        if ETL_DELTA_BUILD:
+            delta = prepare_delta_build(data_path)
+            if delta is not None:
+                upsert_documents, delete_ids, manifest = delta
+                if not upsert_documents and not delete_ids:
+                    logger.info("数据目录没有变化，跳过本次向量库构建")
+                    return
+                if vector_version_manager.switch_to_delta_version(upsert_documents, delete_ids, manifest=manifest):
+                    logger.info(f"ETL任务执行完成，向量库版本已差量更新，写入 {len(upsert_documents)} 个片段，"
+                                f"删除 {len(delete_ids)} 个片段")
+                    warm_answer_cache()
+                    return
+                logger.warning("差量构建失败，改为构建完整的新版本")
+        
+        # 根据ETL清单增量加载和处理文档
+        plan = prepare_incremental_build(data_path)
+        if plan is None:
+            logger.info("数据目录没有变化，跳过本次向量库构建")
+            return
+        documents, known_embeddings, manifest = plan
         
         # 提取内容并存储
         # extracted_content = extract_and_save_content(documents, processed_data_path)
         
         # 使用版本管理器创建新版本并向量库
         if documents:
-            success = vector_version_manager.switch_to_new_version(documents)
+            success = vector_version_manager.switch_to_new_version(
+                documents, known_embeddings=known_embeddings, manifest=manifest)
             if success:
-                logger.info(f"ETL任务执行完成，共处理 {len(documents)} 个文档片段，向量库版本已更新")
+                logger.info(f"ETL任务执行完成，共处理 {len(documents)} 个文档片段，向量库版本已更新，"
+                            f"复用 {manifest.build_stats['chunks_reused']} 个，"
+                            f"重新计算 {manifest.build_stats['chunks_embedded']} 个")
+                # 新版本的答案缓存为空，预热高频问题
+                warm_answer_cache()
             else:
                 logger.error("向量库版本更新失败")
         else:
@@ -65,12 +263,16 @@ def run_scheduler():
     # 每天凌晨5点执行一次
     schedule.every().day.at("05:00").do(etl_job)
     
+    # 每天凌晨4点归档过期问答历史
+    schedule.every().day.at("04:00").do(archive_job)
+    
     # 立即执行一次
     etl_job()
     
     logger.info("定时任务已启动:")
     logger.info("  - 每30分钟执行一次")
     logger.info("  - 每天凌晨5点执行一次")
+    logger.info("  - 每天凌晨4点归档问答历史")
     
     while True:
         schedule.run_pending()
@@ -78,4 +280,6 @@ def run_scheduler():
 
 
 if __name__ == "__main__":
+    # 加载环境变量（缓存预热需要调用LLM）
+    load_dotenv()
     run_scheduler()
\ No newline at end of file
@@ -2,152 +2,852 @@
 # -*- coding: utf-8 -*-
 """
 向量库构建模块
-负责构建和更新Chroma向量库
+负责构建和更新向量库（默认Chroma，可按版本选择其他引擎）
 """
 
 import os
-from functools import lru_cache
+import time
+import hashlib
+import contextlib
+import queue
+import threading
+from functools import lru_cache, partial
 
 from langchain_community.vectorstores import Chroma
 from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.documents import Document
 from log.logger import logger
-from constant.constants import VECTOR_STORE_BATCH_SIZE
+from constant.constants import (
+    VECTOR_STORE_BATCH_SIZE,
+    EMBEDDING_STORE_ENABLED,
+    EMBEDDING_WORKERS,
+    EMBEDDING_WORKER_THREADS,
+    EMBEDDING_PIPELINE_DEPTH,
+    EMBEDDING_BATCH_TOKEN_BUDGET,
+    EMBEDDING_SORT_WINDOW,
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL_NAME,
+    ONNX_EMBEDDING_DIR,
+    DEDUP_ENABLED,
+    VECTOR_ENGINE,
+    VECTOR_STORAGE,
+    VECTOR_RESCORE_CANDIDATES,
+    VECTOR_PQ_SUBVECTORS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+)
 from util.tools import ListUtils
+from etl.document_processor import assign_chunk_ids
+from etl.embedding_store import EmbeddingStore, get_model_id, write_embedding_refs, collect_embedding_refs
+from etl.parallel_embedding import EmbeddingWorkerPool, embed_batch
+from etl.deduplicator import (
+    DedupIndex, MinHasher, DEDUP_INDEX_FILENAME, PROVENANCE_KEYS, deduplicate_documents, provenance_metadata,
+    open_dedup_index
+)
+from etl.version_meta import load_version_meta, update_version_meta
+from etl.flat_vector_store import FlatVectorStore
+from etl.index_snapshot import SnapshotVectorStore, export_snapshot, snapshot_exists
+from etl.compact_vectors import STORAGE_MODES, export_compact_index, load_compact_vector_store
+
+
+# 向量库引擎：名称 -> 构造函数 (persist_directory, embedding_function)，版本使用的引擎记录在版本元数据中
+VECTOR_ENGINES = {
+    "chroma": Chroma,
+    "flat": FlatVectorStore,
+}
+
+
+# 未指定时新版本使用的HNSW参数（只对chroma引擎有效）
+DEFAULT_HNSW_PARAMS = {"M": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION, "ef_search": HNSW_EF_SEARCH}
+
+
+def hnsw_collection_metadata(hnsw_params: dict) -> dict:
+    """
+    把HNSW参数转换为Chroma的集合元数据，M 和 ef_construction 只在创建集合时生效
+    """
+    return {
+        "hnsw:space": "l2",
+        "hnsw:M": int(hnsw_params["M"]),
+        "hnsw:construction_ef": int(hnsw_params["ef_construction"]),
+        "hnsw:search_ef": int(hnsw_params["ef_search"]),
+    }
+
+
+def open_vector_store(persist_directory: str, embedding, engine: str = None, hnsw_params: dict = None):
+    """
+    按引擎打开版本目录中的向量库
+    
+    Args:
+        persist_directory (str): 版本目录
+        embedding: 嵌入模型
+        engine (str): 引擎名称，为None时使用版本元数据中记录的引擎（未记录时为chroma）
+        hnsw_params (dict): 新建Chroma集合使用的HNSW参数 {M, ef_construction, ef_search}，已有集合沿用原参数
+        
+    Returns:
+        VectorStore: 向量库实例，提供 _collection（upsert/get/update/delete/count）和检索接口
+    """
+    engine = engine or load_version_meta(persist_directory).get("vector_engine", "chroma")
+    if engine not in VECTOR_ENGINES:
+        raise ValueError(f"不支持的向量库引擎: {engine}，可选: {list(VECTOR_ENGINES)}")
+    kwargs = {}
+    if engine == "chroma" and hnsw_params:
+        kwargs["collection_metadata"] = hnsw_collection_metadata(hnsw_params)
+    return VECTOR_ENGINES[engine](persist_directory=persist_directory, embedding_function=embedding, **kwargs)
 
 
 @lru_cache(maxsize=1)
-def init_embedding():
+def init_embedding(backend: str = EMBEDDING_BACKEND):
     """
     初始化向量嵌入模型
     
+    Args:
+        backend (str): 嵌入后端，torch 为PyTorch原始精度，onnx-int8 为ONNX Runtime int8量化
+    
     Returns:
         embedding model: 初始化的嵌入模型
     """
-    try:
-        # 使用本地模型路径
-        # model_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models", "bge-large-zh-v1.5")
-        # embedding = SentenceTransformerEmbeddings(model_name=model_path)
-        embedding = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
-        logger.info("BGE嵌入模型初始化成功")
+    if backend == "onnx-int8":
+        try:
+            from etl.onnx_embedding import OnnxEmbeddings
+            embedding = OnnxEmbeddings(ONNX_EMBEDDING_DIR)
+            logger.info(f"ONNX int8嵌入模型初始化成功: {embedding.model_name}")
+            return embedding
+        except Exception as e:
+            # 量化模型未导出或onnxruntime不可用时回退到PyTorch后端，模型标识不同，不会与int8向量混用
+            logger.warning(f"ONNX int8嵌入模型加载失败，使用PyTorch后端: {e}")
+    
+    # 使用本地模型路径
+    # model_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models", "bge-large-zh-v1.5")
+    # embedding = SentenceTransformerEmbeddings(model_name=model_path)
+    embedding = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+    logger.info(f"嵌入模型初始化成功: {EMBEDDING_MODEL_NAME}")
+    return embedding
+
+
+def check_embedding_compatible(version_path: str, embedding=None) -> bool:
+    """
+    检查版本的向量是否由当前嵌入模型生成
+    
+    Args:
+        version_path (str): 版本目录
+        embedding: 嵌入模型，为None时使用 init_embedding()
+        
+    Returns:
+        bool: 兼容返回True；版本未记录模型（旧版本）时视为兼容
+    """
+    built_with = load_version_meta(version_path).get("embedding_model")
+    current = get_model_id(embedding or init_embedding())
+    if built_with is None or built_with == current:
+        return True
+    logger.warning(f"版本 {os.path.basename(version_path)} 由嵌入模型 {built_with} 构建，"
+                   f"与当前嵌入模型 {current} 不兼容，需要构建新的索引版本")
+    return False
+
+
+def _embedding_backend(model_id: str) -> str:
+    """由模型标识判断嵌入后端（init_embedding 的 backend 参数）"""
+    return "onnx-int8" if "@onnx-int8" in model_id else "torch"
+
+
+def init_version_embedding(version_path: str, embedding=None):
+    """
+    初始化与版本向量匹配的嵌入模型
+    
+    当前后端与版本构建时的模型不一致时（如切换了嵌入后端，或ONNX模型加载失败回退到PyTorch），
+    按版本元数据记录的模型标识加载对应后端；仍不一致时拒绝加载，避免用不同模型的查询向量检索
+    
+    Args:
+        version_path (str): 版本目录
+        embedding: 当前嵌入模型，为None时使用 init_embedding()
+        
+    Returns:
+        embedding model: 与版本匹配的嵌入模型；版本未记录模型（旧版本）时返回当前嵌入模型
+        
+    Raises:
+        ValueError: 没有与版本匹配的嵌入模型
+    """
+    embedding = embedding or init_embedding()
+    built_with = load_version_meta(version_path).get("embedding_model")
+    current = get_model_id(embedding)
+    if built_with is None or built_with == current:
         return embedding
-    except Exception as e:
-        # 如果BGE模型加载失败，使用替代方案
-        logger.warning(f"BGE模型加载失败，使用替代方案: {e}")
-        embedding = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
+    backend = _embedding_backend(built_with)
+    if backend != _embedding_backend(current):
+        matched = init_embedding(backend)
+        if get_model_id(matched) == built_with:
+            logger.warning(f"版本 {os.path.basename(version_path)} 由嵌入模型 {built_with} 构建，"
+                           f"使用其构建时的 {backend} 后端加载")
+            return matched
+    raise ValueError(f"版本 {os.path.basename(version_path)} 由嵌入模型 {built_with} 构建，"
+                     f"与当前嵌入模型 {current} 不兼容，拒绝加载")
+
+
+def get_embedding_store(embedding=None):
+    """
+    获取当前嵌入模型对应的片段向量缓存
+    
+    Args:
+        embedding: 嵌入模型，为None时使用 init_embedding()
+        
+    Returns:
+        EmbeddingStore: 向量缓存，未启用时返回None
+    """
+    if not EMBEDDING_STORE_ENABLED:
+        return None
+    embedding = embedding or init_embedding()
+    return EmbeddingStore(get_model_id(embedding))
+
+
+def _lookup_batch(batch_documents, batch_ids, known_embeddings: dict, embedding_store=None):
+    """
+    查找一批文档中已有的向量：先复用已知向量，再查片段向量缓存
+    
+    Args:
+        batch_documents (list): 文档列表
+        batch_ids (list): 片段ID列表
+        known_embeddings (dict): {片段ID: 向量}
+        embedding_store (EmbeddingStore): 片段向量缓存
+        
+    Returns:
+        tuple: (向量列表（未找到的为None）, 需要计算的下标列表, {下标: 缓存键})
+    """
+    vectors = [known_embeddings.get(chunk_id) for chunk_id in batch_ids]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    
+    keys = {}
+    if missing and embedding_store is not None:
+        keys = {i: embedding_store.make_key(batch_documents[i].page_content) for i in missing}
+        cached = embedding_store.get_many(list(keys.values()))
+        for i in missing:
+            vectors[i] = cached.get(keys[i])
+        missing = [i for i in missing if vectors[i] is None]
+    return vectors, missing, keys
+
+
+def _fill_batch(vectors: list, missing: list, keys: dict, computed: list, embedding_store=None):
+    """
+    填入新计算的向量并写入片段向量缓存
+    """
+    for i, vector in zip(missing, computed):
+        vectors[i] = vector
+    if missing and embedding_store is not None:
+        embedding_store.put_many([keys[i] for i in missing], computed)
+
+
+def _get_max_tokens(embedding) -> int:
+    """
+    获取模型的最大输入长度，超出部分会被截断，不参与填充
+    
+    Args:
+        embedding: 嵌入模型
+        
+    Returns:
+        int: 最大token数，未知时返回None
+    """
+    max_seq_length = getattr(embedding, "max_seq_length", None)
+    return max_seq_length or getattr(getattr(embedding, "client", None), "max_seq_length", None)
+
+
+def _plan_token_batches(lengths: list, token_budget: int, max_batch_size: int = 256) -> list:
+    """
+    按长度分桶规划嵌入批次
+    
+    片段按长度从长到短排序后依次装批，每批的填充后token数（批内最大长度 x 片段数）不超过预算，
+    同一批内长度相近，填充浪费小；短片段的批次更大，长片段的批次更小，峰值内存更平稳
+    
+    Args:
+        lengths (list): 各片段的token长度（估计值）
+        token_budget (int): 每批填充后的token数上限
+        max_batch_size (int): 每批片段数上限
+        
+    Returns:
+        list: [[片段下标, ...], ...]
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    plan = []
+    group = []
+    for i in order:
+        # 按降序装批，批内最大长度就是第一个片段的长度
+        group_max = lengths[group[0]] if group else max(lengths[i], 1)
+        if group and ((len(group) + 1) * group_max > token_budget or len(group) >= max_batch_size):
+            plan.append(group)
+            group = []
+        group.append(i)
+    if group:
+        plan.append(group)
+    return plan
+
+
+def _iter_embedded_batches(embedding, batches, known_embeddings: dict, embedding_store=None, num_workers: int = 1,
+                           token_budget: int = EMBEDDING_BATCH_TOKEN_BUDGET,
+                           window_size: int = EMBEDDING_SORT_WINDOW, embedding_factory=None):
+    """
+    按窗口依次产出写入批次及其向量
+    
+    每个窗口包含若干连续的写入批次：先复用已知向量和缓存，需要计算的片段在窗口内按长度分桶、
+    按token预算重新组批计算，再按原始顺序填回各写入批次，写入顺序与文档顺序一致。
+    num_workers 大于1时分桶后的批次由工作进程池并行计算
+    
+    Args:
+        embedding: 主进程的嵌入模型（串行模式使用）
+        batches (list): [(文档列表, 片段ID列表), ...]
+        known_embeddings (dict): {片段ID: 向量}
+        embedding_store (EmbeddingStore): 片段向量缓存
+        num_workers (int): 嵌入工作进程数
+        token_budget (int): 每个嵌入批次填充后的token数上限
+        window_size (int): 每个窗口的片段数
+        embedding_factory: 工作进程中创建嵌入模型的函数（需可被pickle），须与 embedding 为同一模型，
+                           默认 init_embedding
+        
+    Yields:
+        list: 一个窗口的 [(文档列表, 片段ID列表, 向量列表, 新计算的片段数), ...]
+    """
+    max_tokens = _get_max_tokens(embedding)
+    batches_per_window = max(1, window_size // max(1, max(len(docs) for docs, _ in batches))) if batches else 1
+    
+    with contextlib.ExitStack() as stack:
+        if num_workers > 1:
+            pool = stack.enter_context(EmbeddingWorkerPool(num_workers, EMBEDDING_WORKER_THREADS,
+                                                                embedding_factory))
+            embed_groups = lambda groups: [vectors for _, vectors in pool.imap(groups, lambda group: group)]
+        else:
+            embed_groups = lambda groups: [embed_batch(embedding, group) for group in groups]
+        
+        for start in range(0, len(batches), batches_per_window):
+            window = batches[start:start + batches_per_window]
+            lookups = [_lookup_batch(docs, ids, known_embeddings, embedding_store) for docs, ids in window]
+            texts = [docs[i].page_content for (docs, _), (_, missing, _) in zip(window, lookups) for i in missing]
+            
+            # 字符数近似token数（中文基本一字一token），超过模型上限的部分会被截断
+            lengths = [min(len(text), max_tokens) if max_tokens else len(text) for text in texts]
+            plan = _plan_token_batches(lengths, token_budget)
+            computed = [None] * len(texts)
+            for group, vectors in zip(plan, embed_groups([[texts[i] for i in group] for group in plan])):
+                for i, vector in zip(group, vectors):
+                    computed[i] = vector
+            if plan:
+                padded = sum(max(lengths[i] for i in group) * len(group) for group in plan)
+                logger.info(f"计算 {len(texts)} 个片段，分 {len(plan)} 批，"
+                            f"填充率 {1 - sum(lengths) / max(padded, 1):.1%}")
+            
+            results = []
+            offset = 0
+            for (docs, ids), (vectors, missing, keys) in zip(window, lookups):
+                _fill_batch(vectors, missing, keys, computed[offset:offset + len(missing)], embedding_store)
+                offset += len(missing)
+                results.append((docs, ids, vectors, len(missing)))
+            yield results
+
+
+def _prefetch(items, depth: int):
+    """
+    在后台线程中提前迭代 items，经有界队列交给调用方
+    
+    调用方处理第N项（写入Chroma）时，后台线程已在生成第N+1项（计算向量），
+    队列满时后台线程阻塞，内存中最多积压 depth 项
+    
+    Args:
+        items: 可迭代对象
+        depth (int): 队列容量，0表示不使用后台线程
+        
+    Yields:
+        items 中的元素，顺序不变；后台线程中的异常在调用方重新抛出
+    """
+    if depth <= 0:
+        yield from items
+        return
+    
+    buffer = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+    done = object()
+    
+    def put(entry) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((done, e))
+        finally:
+            # 调用方提前退出时关闭生成器，释放其持有的资源（如工作进程池）
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+    
+    producer = threading.Thread(target=produce, name="embedding-producer", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+
+def _write_documents(vector_store, embedding, embedding_store, documents, ids, batch_size: int,
+                     known_embeddings: dict, num_workers: int = 1, pipeline_depth: int = EMBEDDING_PIPELINE_DEPTH,
+                     tag: str = "", start_batch: int = 0, on_batch_written=None, embedding_factory=None):
+    """
+    计算向量并分批写入向量库
+    
+    Args:
+        start_batch (int): 跳过的批次数（续建时已写入的批次）
+        on_batch_written: 每批写入后的回调，参数为已完成的批次数
+        embedding_factory: 工作进程中创建嵌入模型的函数，默认 init_embedding
+    
+    Returns:
+        tuple: (新计算的片段数, 向量维度)
+    """
+    batches = [(documents[i:i + batch_size], ids[i:i + batch_size]) for i in range(0, len(documents), batch_size)]
+    total_batches = len(batches)
+    batches = batches[start_batch:]
+    # 文档太少时启动进程池、每个进程加载模型的开销大于并行收益
+    if num_workers > 1 and len(batches) < num_workers:
+        num_workers = 1
+    logger.info(f"{tag}嵌入工作进程数: {num_workers}")
+    
+    embedded = 0
+    dim = None
+    write_seconds = 0.0
+    start_time = time.time()
+    # 计算向量与写入Chroma流水线并行：后台线程计算下一个窗口时，当前线程写入上一个窗口
+    embedded_windows = _prefetch(
+        _iter_embedded_batches(embedding, batches, known_embeddings, embedding_store, num_workers,
+                               embedding_factory=embedding_factory), pipeline_depth)
+    embedded_batches = (batch for window in embedded_windows for batch in window)
+    for batch_num, (batch_documents, batch_ids, vectors, batch_embedded) in enumerate(embedded_batches,
+                                                                                       start_batch + 1):
+        logger.info(f"{tag}处理批次 {batch_num}/{total_batches}, 文档数: {len(batch_documents)}")
+        embedded += batch_embedded
+        dim = len(vectors[0])
+        
+        # 直接写入预先计算好的向量；片段ID确定，重复写入同一片段是幂等的
+        write_start = time.time()
+        vector_store._collection.upsert(
+            ids=batch_ids,
+            embeddings=vectors,
+            documents=[doc.page_content for doc in batch_documents],
+            metadatas=[doc.metadata for doc in batch_documents]
         )
-        logger.info("使用替代方案初始化嵌入模型成功")
-        return embedding
+        write_seconds += time.time() - write_start
+        if on_batch_written is not None:
+            on_batch_written(batch_num)
+        logger.info(f"{tag}第 {batch_num} 批文档写入完成")
+    
+    elapsed = time.time() - start_time
+    written = sum(len(batch_documents) for batch_documents, _ in batches)
+    logger.info(f"{tag}所有批次处理完成，复用向量 {written - embedded} 个，新计算 {embedded} 个，"
+                f"耗时 {elapsed:.1f} 秒（其中写入 {write_seconds:.1f} 秒），{written / max(elapsed, 1e-6):.1f} 文档/秒")
+    return embedded, dim
+
+
+def _record_dedup_stats(persist_directory: str, dedup_index: DedupIndex, dim: int, tag: str = ""):
+    """
+    记录去重效果：代表片段数、合并的重复片段数，以及因此少存的向量字节数
+    """
+    indexed, merged = dedup_index.count()
+    total = indexed + merged
+    stats = {
+        "input_chunks": total,
+        "indexed_chunks": indexed,
+        "merged_chunks": merged,
+        "reduction": round(merged / total, 4) if total else 0.0,
+        "saved_vector_bytes": merged * (dim or 0) * 4,
+    }
+    update_version_meta(persist_directory, dedup=stats)
+    logger.info(f"{tag}近重复去重后索引片段 {indexed}/{total} 个，索引规模减少 {stats['reduction']:.1%}，"
+                f"少存向量约 {stats['saved_vector_bytes'] / 1024 / 1024:.1f} MB")
+    return stats
+
+
+def _record_vector_storage(vector_store, persist_directory: str, vector_storage: str):
+    """
+    按存储模式构建紧凑索引，并在版本元数据中记录存储模式、每百万向量内存和 recall@10
+    """
+    if vector_storage not in STORAGE_MODES:
+        raise ValueError(f"不支持的向量存储模式: {vector_storage}，可选: {STORAGE_MODES}")
+    fields = {"vector_storage": vector_storage}
+    if vector_storage != "float32":
+        fields["compact_index"] = export_compact_index(vector_store, persist_directory, vector_storage,
+                                                       VECTOR_PQ_SUBVECTORS, VECTOR_RESCORE_CANDIDATES)
+    update_version_meta(persist_directory, **fields)
+
+
+def _build_fingerprint(ids: list, embedding, vector_engine: str, vector_storage: str, batch_size: int) -> str:
+    """
+    构建输入的指纹：片段ID序列（含内容哈希）、嵌入模型、引擎、存储模式和批大小都相同时才能续建
+    """
+    digest = hashlib.sha1()
+    for value in (get_model_id(embedding), vector_engine, vector_storage, str(batch_size)):
+        digest.update(value.encode("utf-8") + b"\0")
+    for chunk_id in ids:
+        digest.update(chunk_id.encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+def _discard_stale_build(vector_store, persist_directory: str, fingerprint: str, tag: str = "",
+                         batch_size: int = 500):
+    """
+    目录中未完成的构建属于另一份输入时清空已写入的片段和去重索引，重新开始构建
+    
+    通过集合接口删除而不是删除目录：同一进程中引擎缓存的客户端仍指向原来的数据库文件
+    """
+    checkpoint = load_version_meta(persist_directory).get("build_checkpoint")
+    if not checkpoint or checkpoint.get("fingerprint") == fingerprint:
+        return
+    logger.warning(f"{tag}目录 {persist_directory} 中未完成的构建与本次输入不一致，清空后重新构建")
+    while True:
+        stale_ids = vector_store._collection.get(limit=batch_size, include=[])["ids"]
+        if not stale_ids:
+            break
+        vector_store._collection.delete(ids=stale_ids)
+    index_path = os.path.join(persist_directory, DEDUP_INDEX_FILENAME)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    update_version_meta(persist_directory, build_checkpoint=None)
+
+
+def _resume_batch(vector_store, persist_directory: str, fingerprint: str, ids: list, batch_size: int,
+                  tag: str = "") -> int:
+    """
+    读取检查点，确认已完成批次的片段都在向量库中
+    
+    Returns:
+        int: 可以跳过的批次数，没有检查点或校验失败时为0（片段ID确定，从头upsert不会产生重复）
+    """
+    checkpoint = load_version_meta(persist_directory).get("build_checkpoint")
+    if not checkpoint or checkpoint.get("fingerprint") != fingerprint:
+        return 0
+    completed = checkpoint.get("completed_batches", 0)
+    written = ids[:completed * batch_size]
+    found = 0
+    for batch_ids in ListUtils.chunk_list(written, 500):
+        found += len(vector_store._collection.get(ids=batch_ids, include=[])["ids"])
+    if found != len(written):
+        logger.warning(f"{tag}检查点记录已写入 {len(written)} 个片段，向量库中只有 {found} 个，从头写入")
+        return 0
+    logger.info(f"{tag}从检查点续建：跳过已完成的 {completed} 个批次（{found} 个片段）")
+    return completed
 
 
-def build_vector_store(documents, persist_directory: str, batch_size: int = 50):
+def _build(documents, persist_directory: str, batch_size: int, known_embeddings: dict, tag: str = "",
+           num_workers: int = 1, pipeline_depth: int = EMBEDDING_PIPELINE_DEPTH, vector_storage: str = VECTOR_STORAGE,
+           vector_engine: str = VECTOR_ENGINE, hnsw_params: dict = None):
+    embedding = init_embedding()
+    embedding_store = get_embedding_store(embedding)
+    # 片段ID与片段在文件中的位置有关，必须在去重之前对完整的片段序列分配
+    ids = assign_chunk_ids(documents)
+    fingerprint = _build_fingerprint(ids, embedding, vector_engine, vector_storage, batch_size)
+    hnsw_params = dict(DEFAULT_HNSW_PARAMS, **(hnsw_params or {})) if vector_engine == "chroma" else None
+    vector_store = open_vector_store(persist_directory, embedding, vector_engine, hnsw_params)
+    _discard_stale_build(vector_store, persist_directory, fingerprint, tag)
+    update_version_meta(persist_directory, vector_engine=vector_engine, hnsw=hnsw_params)
+    dedup_index = None
+    if DEDUP_ENABLED:
+        # 续建时去重索引中已有上次的代表片段，代表片段按ID直接保留，保留的片段序列与上次相同
+        dedup_index = DedupIndex(os.path.join(persist_directory, DEDUP_INDEX_FILENAME))
+        documents, _ = deduplicate_documents(documents, dedup_index)
+        ids = [doc.metadata['chunk_id'] for doc in documents]
+    try:
+        # 每写完一批记录检查点，进程中断后下次构建从最后完成的批次之后继续
+        start_batch = _resume_batch(vector_store, persist_directory, fingerprint, ids, batch_size, tag)
+        checkpoint = {"fingerprint": fingerprint, "batch_size": batch_size, "chunk_count": len(ids),
+                      "total_batches": (len(ids) + batch_size - 1) // batch_size, "completed_batches": start_batch}
+        update_version_meta(persist_directory, build_checkpoint=checkpoint)
+        
+        def on_batch_written(completed_batches: int):
+            checkpoint["completed_batches"] = completed_batches
+            update_version_meta(persist_directory, build_checkpoint=checkpoint)
+        
+        _, dim = _write_documents(vector_store, embedding, embedding_store, documents, ids, batch_size,
+                                  known_embeddings, num_workers, pipeline_depth, tag, start_batch, on_batch_written)
+        
+        # 记录构建所用的嵌入模型，查询和增量构建时据此判断向量是否兼容
+        if dim is None and ids:
+            dim = len(vector_store._collection.get(ids=ids[:1], include=["embeddings"])["embeddings"][0])
+        update_version_meta(persist_directory, embedding_model=get_model_id(embedding), embedding_dim=dim)
+        if dedup_index is not None:
+            _record_dedup_stats(persist_directory, dedup_index, dim, tag)
+        _record_vector_storage(vector_store, persist_directory, vector_storage)
+    finally:
+        if dedup_index is not None:
+            dedup_index.close()
+    
+    # 记录本版本引用的缓存键，供垃圾回收判断哪些向量仍在使用
+    if embedding_store is not None:
+        write_embedding_refs(persist_directory, [embedding_store.make_key(doc.page_content) for doc in documents])
+    
+    update_version_meta(persist_directory, build_checkpoint=None)
+    logger.info(f"{tag}向量库构建完成")
+    return vector_store
+
+
+def build_vector_store(documents, persist_directory: str, batch_size: int = 50, known_embeddings: dict = None,
+                       num_workers: int = EMBEDDING_WORKERS, vector_storage: str = VECTOR_STORAGE,
+                       vector_engine: str = VECTOR_ENGINE, hnsw_params: dict = None):
     """
-    分批构建Chroma向量库
+    分批构建向量库
     
     Args:
         documents (list): 文档列表
         persist_directory (str): 向量库存储目录
-        batch_size (int): 每批处理的文档数量，默认使用常量VECTOR_STORE_BATCH_SIZE
+        batch_size (int): 每批写入的文档数量（计算向量时按长度和token预算另行组批）
+        known_embeddings (dict): 已知的片段向量 {片段ID: 向量}，命中的片段不再调用嵌入模型
+        num_workers (int): 嵌入工作进程数，1表示在当前进程内串行计算
+        vector_storage (str): 向量存储模式 float32 / float16 / pq，记录在版本元数据中，差量构建沿用
+        vector_engine (str): 向量库引擎（VECTOR_ENGINES中的名称），记录在版本元数据中，差量构建和加载时沿用
+        hnsw_params (dict): HNSW参数 {M, ef_construction, ef_search}，缺省的项使用常量中的默认值，记录在版本元数据中
         
     Returns:
-        Chroma: 构建好的向量库实例
+        VectorStore: 构建好的向量库实例
     """
     logger.info(f"开始分批构建向量库，总文档数: {len(documents)}, 批大小: {batch_size}")
+    known_embeddings = known_embeddings or {}
+    return _build(documents, persist_directory, batch_size, known_embeddings, num_workers=num_workers,
+                  vector_storage=vector_storage, vector_engine=vector_engine, hnsw_params=hnsw_params)
+
+
+def _open_delta_dedup_index(vector_store, persist_directory: str, batch_size: int = 500):
+    """
+    打开差量构建使用的去重索引（随版本目录复制而来）
+    
+    上一版本未启用去重时索引不存在，用向量库中已有的片段建立索引，已有片段全部作为代表片段
+    
+    Returns:
+        DedupIndex: 去重索引，未启用去重时返回None
+    """
+    index_path = os.path.join(persist_directory, DEDUP_INDEX_FILENAME)
+    if not DEDUP_ENABLED:
+        # 不再维护的索引会与向量库不一致，删除后重新启用时重建
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        return None
+    
+    exists = os.path.exists(index_path)
+    dedup_index = DedupIndex(index_path)
+    if not exists:
+        hasher = MinHasher(dedup_index.num_perm)
+        total = vector_store._collection.count()
+        for offset in range(0, total, batch_size):
+            result = vector_store._collection.get(limit=batch_size, offset=offset, include=["documents"])
+            for chunk_id, text in zip(result["ids"], result["documents"]):
+                dedup_index.add(chunk_id, hasher.signature(text))
+        dedup_index.commit()
+        logger.info(f"上一版本没有去重索引，已由向量库中的 {total} 个片段建立")
+    return dedup_index
+
+
+def _refresh_provenance(vector_store, dedup_index: DedupIndex, representative_ids, batch_size: int = 500):
+    """
+    按去重索引重写代表片段的来源元数据（合并成员有变化的、以及本次重新写入的代表片段）
+    """
+    for batch_ids in ListUtils.chunk_list(sorted(representative_ids), batch_size):
+        members = dedup_index.members(batch_ids)
+        # Chroma按字段合并更新元数据，值为None的字段被删除
+        metadatas = [dict(dict.fromkeys(PROVENANCE_KEYS), **provenance_metadata(members.get(chunk_id)))
+                     for chunk_id in batch_ids]
+        vector_store._collection.update(ids=batch_ids, metadatas=metadatas)
+
+
+def apply_vector_store_delta(persist_directory: str, upsert_documents, delete_ids: list, batch_size: int = 50,
+                             num_workers: int = EMBEDDING_WORKERS, embedding=None):
+    """
+    在已有向量库上只应用变化：删除指定片段，写入新增和修改的片段
+    
+    用于从活动版本复制出的新版本目录，耗时与变化量成正比，而不是与语料总量成正比。
+    启用去重时，写入的片段先与去重索引比较，近重复的片段只记入索引，不写入向量库
+    
+    Args:
+        persist_directory (str): 向量库存储目录（已包含上一版本的数据）
+        upsert_documents (list): 需要写入的文档片段（带 metadata['chunk_id']）
+        delete_ids (list): 需要删除的片段ID
+        batch_size (int): 每批写入/删除的片段数
+        num_workers (int): 嵌入工作进程数
+        embedding: 嵌入模型，为None时使用与版本向量匹配的模型（init_version_embedding）
+        
+    Returns:
+        Chroma: 更新后的向量库实例
+    """
+    logger.info(f"开始增量更新向量库 {persist_directory}，写入 {len(upsert_documents)} 个片段，删除 {len(delete_ids)} 个片段")
+    # 新片段必须与版本中已有的向量由同一模型计算，不能使用当前配置的后端
+    embedding = embedding or init_version_embedding(persist_directory)
+    embedding_store = get_embedding_store(embedding)
+    vector_store = open_vector_store(persist_directory, embedding)
+    dedup_index = _open_delta_dedup_index(vector_store, persist_directory)
+    
     try:
-        embedding = init_embedding()
-        vector_store = None
-        # 使用enumerate和切片更优雅地处理批次
-        total_batches = (len(documents) + batch_size - 1) // batch_size
-        for batch_num, i in enumerate(range(0, len(documents), batch_size), 1):
-            batch_documents = documents[i:i + batch_size]
-            
-            logger.info(f"处理批次 {batch_num}/{total_batches}, 文档数: {len(batch_documents)}")
-            
-            if vector_store is None:
-                # 第一批创建新的向量库
-                vector_store = Chroma.from_documents(
-                    documents=batch_documents,
-                    embedding=embedding,
-                    persist_directory=persist_directory
-                )
-                logger.info(f"第 {batch_num} 批向量库创建完成")
-            else:
-                # 后续批次添加到现有向量库
-                vector_store.add_documents(batch_documents)
-                logger.info(f"第 {batch_num} 批文档添加完成")
-        
-        logger.info("所有批次处理完成，向量库构建完成")
-        return vector_store
+        refs = collect_embedding_refs([persist_directory])
+        for batch_ids in ListUtils.chunk_list(list(delete_ids), batch_size):
+            if embedding_store is not None:
+                # 被删除片段的缓存键不再由本版本引用；与其内容相同的保留片段因此失去引用时，
+                # 最坏只是缓存被回收后重新计算，不影响正确性
+                removed = vector_store._collection.get(ids=batch_ids, include=["documents"])
+                refs.difference_update(embedding_store.make_key(text) for text in removed["documents"])
+            vector_store._collection.delete(ids=batch_ids)
         
-    except Exception as e:
-        # 如果BGE模型加载失败，使用替代方案
-        logger.warning(f"BGE模型加载失败，使用替代方案: {e}")
-        embedding = init_embedding()
-        vector_store = None
-        
-        # 使用enumerate和切片更优雅地处理批次
-        total_batches = (len(documents) + batch_size - 1) // batch_size
-        for batch_num, batch_documents in enumerate(ListUtils.chunk_list(documents,batch_size), 1):
-            logger.info(f"[备用方案] 处理批次 {batch_num}/{total_batches}, 文档数: {len(batch_documents)}")
-            
-            if vector_store is None:
-                # 第一批创建新的向量库
-                vector_store = Chroma.from_documents(
-                    documents=batch_documents,
-                    embedding=embedding,
-                    persist_directory=persist_directory
-                )
-                logger.info(f"[备用方案] 第 {batch_num} 批向量库创建完成")
-            else:
-                # 后续批次添加到现有向量库
-                vector_store.add_documents(batch_documents)
-                logger.info(f"[备用方案] 第 {batch_num} 批文档添加完成")
-        
-        logger.info("[备用方案] 所有批次处理完成，向量库构建完成")
-        return vector_store
+        affected = set()
+        if dedup_index is not None:
+            affected, orphans = dedup_index.remove(delete_ids)
+            upsert_ids = {doc.metadata['chunk_id'] for doc in upsert_documents}
+            lost = [chunk_id for chunk_id in orphans if chunk_id not in upsert_ids]
+            if lost:
+                logger.warning(f"{len(lost)} 个重复片段的代表片段被删除且未随本次写入，已从去重索引中移除")
+            upsert_documents, merged_into = deduplicate_documents(upsert_documents, dedup_index)
+            affected |= merged_into
+        
+        ids = [doc.metadata['chunk_id'] for doc in upsert_documents]
+        _, dim = _write_documents(vector_store, embedding, embedding_store, upsert_documents, ids, batch_size, {},
+                                  num_workers, embedding_factory=partial(
+                                      init_embedding, _embedding_backend(get_model_id(embedding))))
+        
+        if dim is not None:
+            update_version_meta(persist_directory, embedding_model=get_model_id(embedding), embedding_dim=dim)
+        if dedup_index is not None:
+            # upsert同样按字段合并元数据，重新写入的代表片段也要清除已失效的来源字段
+            _refresh_provenance(vector_store, dedup_index, affected | set(ids))
+            _record_dedup_stats(persist_directory, dedup_index,
+                                dim or load_version_meta(persist_directory).get("embedding_dim"))
+        # 紧凑索引按上一版本的存储模式重新导出（PQ沿用上一版本的码本）
+        _record_vector_storage(vector_store, persist_directory,
+                               load_version_meta(persist_directory).get("vector_storage", "float32"))
+    finally:
+        if dedup_index is not None:
+            dedup_index.close()
+    
+    if embedding_store is not None:
+        refs.update(embedding_store.make_key(doc.page_content) for doc in upsert_documents)
+        write_embedding_refs(persist_directory, sorted(refs))
+    
+    logger.info(f"向量库增量更新完成，当前片段数: {vector_store._collection.count()}")
+    return vector_store
 
 
-def update_vector_store(documents, persist_directory: str, batch_size: int = VECTOR_STORE_BATCH_SIZE):
+def get_documents_with_embeddings(vector_store, ids: list, batch_size: int = 500):
     """
-    分批更新现有的Chroma向量库
+    按片段ID从向量库取出文档及其向量，用于增量构建时复用
     
     Args:
-        documents (list): 要添加到向量库的新文档
+        vector_store: 向量存储实例
+        ids (list): 片段ID列表
+        batch_size (int): 每次查询的ID数量
+        
+    Returns:
+        tuple: (文档列表, {片段ID: 向量})，向量库中不存在的ID被忽略
+    """
+    documents = []
+    embeddings = {}
+    for batch_ids in ListUtils.chunk_list(list(ids), batch_size):
+        result = vector_store._collection.get(ids=batch_ids, include=["documents", "metadatas", "embeddings"])
+        for chunk_id, text, metadata, vector in zip(
+                result["ids"], result["documents"], result["metadatas"], result["embeddings"]):
+            metadata = dict(metadata or {})
+            metadata["chunk_id"] = chunk_id
+            documents.append(Document(page_content=text, metadata=metadata))
+            embeddings[chunk_id] = list(vector)
+    return documents, embeddings
+
+
+def _stale_chunk_ids(vector_store, persist_directory: str, sources: set, keep_ids: set, batch_size: int) -> list:
+    """
+    查询指定来源下不在 keep_ids 中的片段ID，包括向量库中的片段和去重索引中记录的重复片段
+    
+    Returns:
+        list: 需要删除的片段ID
+    """
+    stale = []
+    for batch_sources in ListUtils.chunk_list(sorted(sources), batch_size):
+        result = vector_store._collection.get(where={"source": {"$in": batch_sources}}, include=[])
+        stale.extend(chunk_id for chunk_id in result["ids"] if chunk_id not in keep_ids)
+    dedup_index = open_dedup_index(persist_directory) if DEDUP_ENABLED else None
+    if dedup_index is not None:
+        try:
+            stale.extend(chunk_id for chunk_id in dedup_index.duplicates_from_sources(sources)
+                         if chunk_id not in keep_ids)
+        finally:
+            dedup_index.close()
+    return stale
+
+
+def update_vector_store(documents, persist_directory: str, batch_size: int = VECTOR_STORE_BATCH_SIZE,
+                        removed_sources: list = None):
+    """
+    把文档幂等地更新到现有向量库
+    
+    片段ID由来源路径、片段序号和内容哈希确定，重复运行同一批文件不会产生重复向量：
+    已存在的片段直接跳过，新增和修改的片段分批upsert，documents中出现的来源下不再存在的旧片段、
+    以及 removed_sources 中来源的全部片段被删除
+    
+    Args:
+        documents (list): 要写入的文档片段（同一来源的片段须完整且按顺序给出）
         persist_directory (str): 向量库存储目录
         batch_size (int): 每批处理的文档数量，默认使用常量VECTOR_STORE_BATCH_SIZE
+        removed_sources (list): 已被删除的来源，其片段全部从向量库中删除
         
     Returns:
-        Chroma: 更新后的向量库实例
+        VectorStore: 更新后的向量库实例
+        
+    Raises:
+        ValueError: 目录是版本管理器管理的版本（需通过 create_delta_version 创建新版本）
     """
-    if not documents:
+    # 延迟导入，避免与版本管理器循环依赖
+    from etl.vector_version_manager import vector_version_manager
+    if vector_version_manager.is_version_path(persist_directory):
+        # 原地更新会绕过版本门禁，直接改变在线使用或用于回滚的版本
+        raise ValueError(f"{persist_directory} 是版本管理器管理的版本，不能原地更新，"
+                         f"请通过 create_delta_version 创建新版本")
+    removed_sources = set(removed_sources or [])
+    if not documents and not removed_sources:
         logger.info("没有新文档需要添加到向量库")
         return load_vector_store(persist_directory)
+    if not os.path.exists(persist_directory) or not os.listdir(persist_directory):
+        raise FileNotFoundError(f"向量库目录 {persist_directory} 不存在或为空")
     
-    logger.info(f"开始分批更新向量库，新增文档数: {len(documents)}, 批大小: {batch_size}")
-    
+    logger.info(f"开始分批更新向量库，文档数: {len(documents)}, 删除来源数: {len(removed_sources)}, 批大小: {batch_size}")
     try:
-        # 加载现有向量库
-        vector_store = load_vector_store(persist_directory)
+        ids = assign_chunk_ids(documents)
+        keep_ids = set(ids)
+        embedding = init_version_embedding(persist_directory)
+        vector_store = open_vector_store(persist_directory, embedding)
+        sources = {doc.metadata['source'] for doc in documents if doc.metadata.get('source')} | removed_sources
+        delete_ids = _stale_chunk_ids(vector_store, persist_directory, sources, keep_ids, batch_size)
         
-        # 使用enumerate和切片更优雅地处理批次
-        total_batches = (len(documents) + batch_size - 1) // batch_size
-        for batch_num, batch_documents in enumerate(ListUtils.chunk_list(documents,batch_size), 1):
-            logger.info(f"添加批次 {batch_num}/{total_batches}, 文档数: {len(batch_documents)}")
-            vector_store.add_documents(batch_documents)
-            logger.info(f"批次 {batch_num} 文档添加完成")
+        # ID包含内容哈希，已在向量库中的片段内容不变，不再重新计算和写入
+        existing = set()
+        for batch_ids in ListUtils.chunk_list(ids, batch_size):
+            existing.update(vector_store._collection.get(ids=batch_ids, include=[])["ids"])
+        upsert_documents = [doc for doc in documents if doc.metadata['chunk_id'] not in existing]
+        logger.info(f"已存在 {len(existing)} 个片段，写入 {len(upsert_documents)} 个，删除 {len(delete_ids)} 个")
         
-        logger.info("向量库更新完成")
+        vector_store = apply_vector_store_delta(persist_directory, upsert_documents, delete_ids, batch_size,
+                                                embedding=embedding)
+        # 原地更新后已有的只读快照过期，重新导出
+        if snapshot_exists(persist_directory):
+            export_snapshot(vector_store, persist_directory)
         return vector_store
     except Exception as e:
         logger.error(f"更新向量库时出错: {e}")
-        # 如果更新失败，重新构建向量库
-        return build_vector_store(documents, persist_directory, batch_size)
+        raise
 
 
 def load_vector_store(persist_directory: str):
@@ -159,20 +859,66 @@ def load_vector_store(persist_directory: str):
         
     Returns:
         Chroma: 加载的向量库实例
+        
+    Raises:
+        ValueError: 没有与版本匹配的嵌入模型
     """
     logger.info("加载现有向量库...")
     
     if not os.path.exists(persist_directory) or not os.listdir(persist_directory):
         raise FileNotFoundError(f"向量库目录 {persist_directory} 不存在或为空")
     
-    try:
-        embedding = init_embedding()
-        vector_store = Chroma(persist_directory=persist_directory, embedding_function=embedding)
-        logger.info("现有向量库加载完成")
-    except Exception as e:
-        # 如果BGE模型加载失败，使用替代方案
-        logger.warning(f"BGE模型加载失败，使用替代方案: {e}")
-        embedding = init_embedding()
-        vector_store = Chroma(persist_directory=persist_directory, embedding_function=embedding)
+    embedding = init_version_embedding(persist_directory)
+    vector_store = open_vector_store(persist_directory, embedding)
+    if load_version_meta(persist_directory).get("vector_storage", "float32") != "float32":
+        try:
+            vector_store = load_compact_vector_store(vector_store, persist_directory,
+                                                     VECTOR_RESCORE_CANDIDATES) or vector_store
+        except Exception as e:
+            logger.warning(f"紧凑向量索引加载失败，使用Chroma检索: {e}")
+    logger.info("现有向量库加载完成")
+    
+    return vector_store
+
+
+def load_serving_vector_store(persist_directory: str):
+    """
+    加载在线检索使用的向量库：版本有只读快照时直接内存映射快照，否则按版本的引擎加载
+    
+    多个工作进程映射同一份快照时共享页缓存，加载耗时与索引规模基本无关
     
-    return vector_store
\ No newline at end of file
+    Args:
+        persist_directory (str): 版本目录
+        
+    Returns:
+        VectorStore: 向量库实例
+        
+    Raises:
+        ValueError: 没有与版本匹配的嵌入模型
+    """
+    if snapshot_exists(persist_directory):
+        # 嵌入模型不兼容时直接报错，不再按引擎加载
+        embedding = init_version_embedding(persist_directory)
+        try:
+            vector_store = SnapshotVectorStore(persist_directory, embedding)
+            logger.info(f"已映射只读快照: {persist_directory}，{vector_store.snapshot.count} 个片段")
+            return vector_store
+        except Exception as e:
+            logger.warning(f"映射只读快照失败，按引擎加载向量库: {e}")
+    return load_vector_store(persist_directory)
+
+
+def gc_embedding_store(version_paths: list) -> int:
+    """
+    回收片段向量缓存中不再被任何保留版本引用的向量
+    
+    Args:
+        version_paths (list): 保留的版本目录列表
+        
+    Returns:
+        int: 回收的向量数
+    """
+    embedding_store = get_embedding_store()
+    if embedding_store is None:
+        return 0
+    return embedding_store.gc(collect_embedding_refs(version_paths))
@@ -2,15 +2,51 @@
 # -*- coding: utf-8 -*-
 """
 Chroma向量库版本管理模块
-实现双缓冲版本管理，保留5个历史版本，并在切换前验证功能
+实现双缓冲版本管理，保留5个历史版本，并在切换前验证功能；
+切换前等待服务进程预热候选版本，切换后上一个版本保持加载，可以立即回滚
 """
 
 import os
+import json
+import time
+import fcntl
 import shutil
 from datetime import datetime
 from log.logger import logger
-from etl.vector_builder import build_vector_store, load_vector_store
-from constant.constants import CHROMA_DB_DIR
+from etl.vector_builder import build_vector_store, load_vector_store, load_serving_vector_store, gc_embedding_store, \
+    apply_vector_store_delta
+from etl.version_meta import load_version_meta, update_version_meta
+from etl.etl_manifest import ETLManifest
+from etl.index_snapshot import SNAPSHOT_DIRNAME, export_snapshot, snapshot_exists
+from etl.hnsw_tuner import recommended_hnsw_params
+from etl.version_gate import load_golden_queries, run_version_gate
+from constant.constants import (
+    CHROMA_DB_DIR,
+    INDEX_SNAPSHOT_ENABLED,
+    VERSION_GATE_ENABLED,
+    VERSION_STANDBY_ENABLED,
+    VERSION_STANDBY_TIMEOUT,
+    VERSION_STANDBY_POLL_INTERVAL,
+    VERSION_STANDBY_HEARTBEAT_TTL,
+)
+
+
+# Linux FICLONE ioctl：在支持写时复制的文件系统（btrfs、XFS等）上克隆文件，不复制数据块
+FICLONE = 0x40049409
+
+
+def _clone_file(src: str, dst: str):
+    """
+    克隆文件：优先使用写时复制（reflink），文件系统不支持时退化为普通复制
+
+    不能使用硬链接：Chroma的SQLite和HNSW文件会被原地修改，硬链接会把新版本的写入带进旧版本
+    """
+    try:
+        with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        shutil.copystat(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
 
 
 class VectorVersionManager:
@@ -25,7 +61,31 @@ class VectorVersionManager:
         """
         self.base_directory = base_directory
         self.active_version_file = os.path.join(base_directory, "active_version.txt")
+        # 正在预热、即将切换的候选版本，以及切换前的活动版本（回滚目标）
+        self.standby_version_file = os.path.join(base_directory, "standby_version.txt")
+        self.previous_version_file = os.path.join(base_directory, "previous_version.txt")
+        # 接收影子流量的候选版本：服务进程按比例把检索请求异步镜像到该版本，与活动版本比较
+        self.shadow_version_file = os.path.join(base_directory, "shadow_version.txt")
+        # 服务进程的心跳文件目录，每个进程一个文件，记录已加载（预热）的版本
+        self.serving_directory = os.path.join(base_directory, "serving")
+        # 最近一次被门禁拒绝的构建：数据目录和活动版本都没有变化时不再重复构建
+        self.rejected_build_file = os.path.join(base_directory, "rejected_build.json")
         self.version_prefix = "chroma_v"
+    
+    @staticmethod
+    def _read_version_file(path: str) -> str:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    
+    @staticmethod
+    def _write_version_file(path: str, version: str):
+        # 服务进程每个请求都读取版本指针，先写临时文件再原子替换，读方不会读到写了一半的内容
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(tmp_path, path)
         
     def _get_current_version(self) -> str:
         """
@@ -34,11 +94,7 @@ class VectorVersionManager:
         Returns:
             str: 当前版本号，如果不存在则返回None
         """
-        if not os.path.exists(self.active_version_file):
-            return None
-            
-        with open(self.active_version_file, 'r', encoding='utf-8') as f:
-            return f.read().strip()
+        return self._read_version_file(self.active_version_file)
     
     def _set_current_version(self, version: str):
         """
@@ -47,44 +103,81 @@ class VectorVersionManager:
         Args:
             version (str): 版本号
         """
-        with open(self.active_version_file, 'w', encoding='utf-8') as f:
-            f.write(version)
+        self._write_version_file(self.active_version_file, version)
+    
+    def _version_number(self, version: str) -> int:
+        """
+        版本号的数字部分
+        
+        Args:
+            version (str): 版本号
+            
+        Returns:
+            int: 数字部分，不是合法版本号时返回None
+        """
+        suffix = version[len(self.version_prefix):]
+        return int(suffix) if version.startswith(self.version_prefix) and suffix.isdigit() else None
     
     def _get_all_versions(self) -> list:
         """
         获取所有版本目录
         
+        按版本号排序而不是按目录的ctime：打开Chroma目录、更新版本元数据都会改变ctime
+        
         Returns:
-            list: 版本目录列表，按创建时间排序（新到旧）
+            list: 版本目录列表，按创建顺序排序（新到旧）
         """
         version_dirs = []
         for item in os.listdir(self.base_directory):
-            if item.startswith(self.version_prefix):
-                version_path = os.path.join(self.base_directory, item)
-                if os.path.isdir(version_path):
-                    version_dirs.append((item, os.path.getctime(version_path)))
+            number = self._version_number(item)
+            if number is not None and os.path.isdir(os.path.join(self.base_directory, item)):
+                version_dirs.append((item, number))
         
-        # 按创建时间排序，新的在前
+        # 版本号递增分配，号大的更新
         version_dirs.sort(key=lambda x: x[1], reverse=True)
         return [version[0] for version in version_dirs]
     
     def _get_next_version(self) -> str:
         """
-        获取下一个版本号
+        获取下一个版本号：已有版本号的最大值加1
         
         Returns:
             str: 下一个版本号
         """
         versions = self._get_all_versions()
-        if not versions:
-            return f"{self.version_prefix}001"
-        
-        # 获取最新版本号并加1
-        latest_version = versions[0]
-        version_num = int(latest_version.replace(self.version_prefix, ""))
-        next_version_num = version_num + 1
+        next_version_num = self._version_number(versions[0]) + 1 if versions else 1
         return f"{self.version_prefix}{next_version_num:03d}"
     
+    def _create_version_directory(self) -> tuple:
+        """
+        以独占方式创建下一个版本目录，目录已存在时顺延版本号，不会复用已有版本的目录
+        
+        Returns:
+            tuple: (版本号, 版本路径)
+        """
+        while True:
+            version = self._get_next_version()
+            version_path = os.path.join(self.base_directory, version)
+            try:
+                os.makedirs(version_path)
+                return version, version_path
+            except FileExistsError:
+                logger.warning(f"版本目录 {version} 已存在，顺延版本号")
+    
+    def _get_resumable_version(self) -> str:
+        """
+        获取可以续建的版本：最新的版本目录不是活动版本、且留有未完成构建的检查点
+        
+        Returns:
+            str: 版本号，没有时返回None
+        """
+        versions = self._get_all_versions()
+        if not versions or versions[0] == self._get_current_version():
+            return None
+        if load_version_meta(os.path.join(self.base_directory, versions[0])).get("build_checkpoint"):
+            return versions[0]
+        return None
+    
     def _cleanup_old_versions(self):
         """
         清理多余的旧版本，只保留最新的5个版本
@@ -93,18 +186,32 @@ class VectorVersionManager:
         if len(versions) <= 5:
             return
         
-        # 删除多余的旧版本
+        # 删除多余的旧版本（活动版本和回滚目标始终保留）
+        retained = {self._get_current_version(), self.get_previous_version(), self.get_standby_version(),
+                    self.get_shadow_version()}
         for old_version in versions[5:]:
+            if old_version in retained:
+                continue
             old_version_path = os.path.join(self.base_directory, old_version)
             try:
                 shutil.rmtree(old_version_path)
                 logger.info(f"已删除旧版本: {old_version}")
             except Exception as e:
                 logger.error(f"删除旧版本 {old_version} 失败: {e}")
+        
+        # 回收只被已删除版本引用的片段向量
+        try:
+            retained_paths = [os.path.join(self.base_directory, v) for v in self._get_all_versions()]
+            gc_embedding_store(retained_paths)
+        except Exception as e:
+            logger.error(f"片段向量缓存垃圾回收失败: {e}")
     
     def _validate_version(self, version_path: str) -> bool:
         """
-        验证版本功能是否正常
+        验证版本功能是否正常，并用黄金查询与活动版本比较延迟和检索结果
+        
+        门禁报告保存在版本元数据中（validation），延迟或检索质量退化超过阈值时验证不通过；
+        两个版本都按在线检索的方式加载（有快照时使用快照），比较的是切换后实际使用的检索路径
         
         Args:
             version_path (str): 版本路径
@@ -113,50 +220,153 @@ class VectorVersionManager:
             bool: 验证是否通过
         """
         try:
-            vector_store = load_vector_store(version_path)
-            # 简单测试向量库是否可以正常加载和查询
-            # 这里可以添加更复杂的验证逻辑
+            vector_store = load_serving_vector_store(version_path)
+            # 基本检查：向量库可以正常加载和查询
             vector_store.similarity_search("测试", k=1)
+        except Exception as e:
+            logger.error(f"版本 {version_path} 功能验证失败: {e}")
+            return False
+        
+        active_path = self.get_active_version_path()
+        if not VERSION_GATE_ENABLED or not active_path or not os.path.exists(active_path) \
+                or os.path.samefile(active_path, version_path):
             logger.info(f"版本 {version_path} 功能验证通过")
             return True
+        
+        try:
+            active_store = load_serving_vector_store(active_path)
+            golden = load_golden_queries()
         except Exception as e:
-            logger.error(f"版本 {version_path} 功能验证失败: {e}")
+            # 活动版本或查询集不可用时无从比较，不因此阻止切换
+            logger.warning(f"无法与活动版本比较，跳过黄金查询门禁: {e}")
+            return True
+        try:
+            report = run_version_gate(vector_store, active_store, golden)
+        except Exception as e:
+            logger.error(f"版本 {version_path} 黄金查询回放失败: {e}")
             return False
+        report["active_version"] = os.path.basename(active_path)
+        update_version_meta(version_path, validation=report)
+        if not report["passed"]:
+            logger.error(f"版本 {version_path} 相对活动版本退化，拒绝切换: {'; '.join(report['reasons'])}")
+            return False
+        for warning in report.get("warnings", []):
+            logger.warning(f"版本 {version_path} 门禁警告: {warning}")
+        logger.info(f"版本 {version_path} 功能验证通过（{report['queries']} 条黄金查询，"
+                    f"重合率 {report.get('overlap', 1.0):.2f}）")
+        return True
+    
+    def _export_snapshot(self, version_path: str):
+        """
+        为验证通过的版本导出只读快照，已有快照时跳过
+        
+        紧凑存储模式（float16/pq）的版本不导出：其float32向量已在磁盘上内存映射，常驻的只有压缩编码
+        
+        Args:
+            version_path (str): 版本路径
+        """
+        if not INDEX_SNAPSHOT_ENABLED or snapshot_exists(version_path):
+            return
+        if load_version_meta(version_path).get("vector_storage", "float32") != "float32":
+            return
+        try:
+            export_snapshot(load_vector_store(version_path), version_path)
+        except Exception as e:
+            # 没有快照时在线检索按引擎加载向量库，不影响切换
+            logger.error(f"版本 {os.path.basename(version_path)} 导出快照失败: {e}")
     
-    def create_new_version(self, documents, batch_size: int = 50) -> str:
+    def create_new_version(self, documents, batch_size: int = 50, known_embeddings: dict = None,
+                           manifest=None) -> str:
         """
         创建新版本向量库
         
         Args:
             documents: 文档列表
             batch_size (int): 批处理大小
+            known_embeddings (dict): 可复用的片段向量 {片段ID: 向量}
+            manifest (ETLManifest): 本版本的ETL清单，构建完成后保存到版本目录
             
         Returns:
             str: 新版本号
         """
-        next_version = self._get_next_version()
-        version_path = os.path.join(self.base_directory, next_version)
+        # 上次构建中断时在原目录上续建，构建根据检查点跳过已完成的批次
+        next_version = self._get_resumable_version()
+        created = next_version is None
+        if next_version:
+            logger.info(f"发现未完成的版本 {next_version}，从检查点继续构建")
+            version_path = os.path.join(self.base_directory, next_version)
+        else:
+            next_version, version_path = self._create_version_directory()
         
         logger.info(f"开始创建新版本: {next_version}")
         
         try:
-            # 构建新版本向量库
-            build_vector_store(documents, version_path, batch_size)
+            # 构建新版本向量库，HNSW参数沿用活动版本调优选定的参数
+            build_vector_store(documents, version_path, batch_size, known_embeddings=known_embeddings,
+                               hnsw_params=recommended_hnsw_params(self.get_active_version_path()))
+            update_version_meta(version_path, base_version=None, build_mode="full")
+            if manifest is not None:
+                manifest.save(version_path)
             logger.info(f"新版本 {next_version} 创建完成")
             return next_version
         except Exception as e:
             logger.error(f"创建新版本 {next_version} 失败: {e}")
-            # 清理失败的版本目录
+            # 已写入的批次保留给下次续建；本次新建、还没有检查点的目录没有可复用的内容，直接清理
+            checkpoint = load_version_meta(version_path).get("build_checkpoint")
+            if checkpoint and checkpoint.get("completed_batches"):
+                logger.info(f"保留未完成的版本 {next_version}（已完成 {checkpoint['completed_batches']}/"
+                            f"{checkpoint['total_batches']} 批），下次构建从检查点继续")
+            elif created and os.path.exists(version_path):
+                shutil.rmtree(version_path)
+            raise
+    
+    def create_delta_version(self, upsert_documents, delete_ids: list, batch_size: int = 50,
+                             manifest=None) -> str:
+        """
+        以当前活动版本为基础创建新版本：复制活动版本目录后只应用变化的片段
+        
+        Args:
+            upsert_documents: 新增和修改的文档片段（带 metadata['chunk_id']）
+            delete_ids (list): 需要删除的片段ID
+            batch_size (int): 批处理大小
+            manifest (ETLManifest): 新版本的ETL清单
+            
+        Returns:
+            str: 新版本号
+        """
+        base_version = self._get_current_version()
+        base_path = self.get_active_version_path()
+        if not base_path or not os.path.exists(base_path):
+            raise FileNotFoundError("没有可作为基础的活动版本")
+        
+        # 独占创建目录：失败时删除的只会是本次创建的目录
+        next_version, version_path = self._create_version_directory()
+        logger.info(f"开始基于 {base_version} 增量创建新版本: {next_version}")
+        
+        try:
+            # 快照对应基础版本的数据，不随版本目录复制，新版本验证通过后重新导出
+            shutil.copytree(base_path, version_path, copy_function=_clone_file, dirs_exist_ok=True,
+                            ignore=shutil.ignore_patterns(SNAPSHOT_DIRNAME, SNAPSHOT_DIRNAME + ".tmp",
+                                                          SNAPSHOT_DIRNAME + ".old"))
+            apply_vector_store_delta(version_path, upsert_documents, delete_ids, batch_size)
+            update_version_meta(version_path, base_version=base_version, build_mode="delta")
+            if manifest is not None:
+                manifest.save(version_path)
+            logger.info(f"新版本 {next_version} 增量创建完成")
+            return next_version
+        except Exception as e:
+            logger.error(f"增量创建新版本 {next_version} 失败: {e}")
             if os.path.exists(version_path):
                 shutil.rmtree(version_path)
             raise
     
-    def switch_to_version(self, version: str) -> bool:
+    def switch_to_version(self, version: str, standby_timeout: float = VERSION_STANDBY_TIMEOUT) -> bool:
         """
         切换到指定版本
         
         Args:
             version (str): 目标版本号
+            standby_timeout (float): 等待服务进程预热目标版本的最长时间（秒），为0时不等待
             
         Returns:
             bool: 切换是否成功
@@ -168,57 +378,261 @@ class VectorVersionManager:
             logger.error(f"版本 {version} 不存在")
             return False
         
+        # 先导出快照，门禁按在线检索实际使用的快照验证
+        self._export_snapshot(version_path)
+        
         # 验证版本功能是否正常
         if not self._validate_version(version_path):
             logger.error(f"版本 {version} 功能验证失败，取消切换")
             return False
         
-        # 执行切换
         try:
+            # 服务进程先加载并预热候选版本，切换后第一批请求不再访问冷的索引页
+            if VERSION_STANDBY_ENABLED and standby_timeout:
+                self._wait_for_standby(version, standby_timeout)
+            
+            # 执行切换
+            previous_version = self._get_current_version()
             self._set_current_version(version)
+            if previous_version and previous_version != version:
+                self._write_version_file(self.previous_version_file, previous_version)
+            # 候选版本已上线，不再接收影子流量
+            if self.get_shadow_version() == version:
+                os.remove(self.shadow_version_file)
             logger.info(f"成功切换到版本: {version}")
             return True
         except Exception as e:
             logger.error(f"切换到版本 {version} 失败: {e}")
             return False
+        finally:
+            if os.path.exists(self.standby_version_file):
+                os.remove(self.standby_version_file)
     
-    def switch_to_new_version(self, documents, batch_size: int = 50) -> bool:
+    def _serving_processes(self) -> list:
+        """
+        读取仍在运行的服务进程的心跳
+
+        Returns:
+            list: 心跳 [{"process", "active_version", "warm_versions", "updated"}, ...]
+        """
+        if not os.path.isdir(self.serving_directory):
+            return []
+        processes = []
+        now = time.time()
+        for name in os.listdir(self.serving_directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.serving_directory, name), 'r', encoding='utf-8') as f:
+                    heartbeat = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if now - heartbeat.get("updated", 0) <= VERSION_STANDBY_HEARTBEAT_TTL:
+                processes.append(heartbeat)
+        return processes
+    
+    def _wait_for_standby(self, version: str, timeout: float) -> bool:
+        """
+        发布备用版本，等待所有服务进程加载并预热该版本
+
+        服务进程的后台线程发现备用版本后加载、回放预热查询，并在心跳中报告；
+        没有服务进程在运行时立即返回，超时后记录未就绪的进程并照常切换（这些进程在切换后按需加载）
+
+        Args:
+            version (str): 候选版本号
+            timeout (float): 最长等待时间（秒）
+
+        Returns:
+            bool: 是否所有服务进程都已就绪
+        """
+        self._write_version_file(self.standby_version_file, version)
+        start_time = time.time()
+        while True:
+            pending = [p["process"] for p in self._serving_processes() if version not in p.get("warm_versions", [])]
+            if not pending:
+                logger.info(f"服务进程已预热版本 {version}，耗时 {time.time() - start_time:.1f} 秒")
+                return True
+            if time.time() - start_time >= timeout:
+                logger.warning(f"等待预热版本 {version} 超时，未就绪的服务进程: {pending}")
+                return False
+            time.sleep(min(VERSION_STANDBY_POLL_INTERVAL, timeout))
+    
+    def start_shadow(self, version: str) -> bool:
+        """
+        开始向候选版本镜像影子流量
+
+        服务进程按采样比例把线上检索请求异步回放到该版本，记录延迟和与活动版本检索结果的差异，
+        不影响用户响应；候选版本上线或调用 stop_shadow 后停止
+
+        Args:
+            version (str): 候选版本号
+
+        Returns:
+            bool: 是否设置成功
+        """
+        if not os.path.exists(os.path.join(self.base_directory, version)):
+            logger.error(f"版本 {version} 不存在")
+            return False
+        if version == self._get_current_version():
+            logger.error(f"版本 {version} 是活动版本，无需镜像影子流量")
+            return False
+        self._write_version_file(self.shadow_version_file, version)
+        logger.info(f"开始向版本 {version} 镜像影子流量")
+        return True
+    
+    def stop_shadow(self):
+        """停止镜像影子流量"""
+        if os.path.exists(self.shadow_version_file):
+            os.remove(self.shadow_version_file)
+            logger.info("已停止镜像影子流量")
+    
+    def rollback(self) -> bool:
+        """
+        回滚到切换前的活动版本
+
+        上一个版本在服务进程中保持加载，回滚只改写版本指针，不重新验证；再次回滚会回到回滚前的版本
+
+        Returns:
+            bool: 回滚是否成功
+        """
+        previous_version = self.get_previous_version()
+        if not previous_version or not os.path.exists(os.path.join(self.base_directory, previous_version)):
+            logger.error("没有可回滚的版本")
+            return False
+        start_time = time.perf_counter()
+        current_version = self._get_current_version()
+        self._set_current_version(previous_version)
+        if current_version:
+            self._write_version_file(self.previous_version_file, current_version)
+        logger.info(f"已从版本 {current_version} 回滚到 {previous_version}，"
+                    f"耗时 {(time.perf_counter() - start_time) * 1000:.2f} ms")
+        return True
+    
+    def switch_to_new_version(self, documents, batch_size: int = 50, known_embeddings: dict = None,
+                              manifest=None) -> bool:
         """
         创建新版本并切换到新版本
         
         Args:
             documents: 文档列表
             batch_size (int): 批处理大小
+            known_embeddings (dict): 可复用的片段向量 {片段ID: 向量}
+            manifest (ETLManifest): 本版本的ETL清单
             
         Returns:
             bool: 是否成功创建并切换到新版本
         """
         try:
             # 创建新版本
-            new_version = self.create_new_version(documents, batch_size)
-            
-            # 验证新版本功能
-            version_path = os.path.join(self.base_directory, new_version)
-            if not self._validate_version(version_path):
-                logger.error(f"新版本 {new_version} 功能验证失败，取消切换")
-                # 清理验证失败的版本
-                shutil.rmtree(version_path)
-                return False
-            
-            # 切换到新版本
-            if self.switch_to_version(new_version):
-                # 清理旧版本
-                self._cleanup_old_versions()
-                return True
-            else:
-                # 切换失败，清理新版本
-                shutil.rmtree(version_path)
-                return False
-                
+            new_version = self.create_new_version(documents, batch_size, known_embeddings, manifest)
+            return self._activate_new_version(new_version)
         except Exception as e:
             logger.error(f"创建并切换到新版本失败: {e}")
             return False
     
+    def switch_to_delta_version(self, upsert_documents, delete_ids: list, batch_size: int = 50,
+                                manifest=None) -> bool:
+        """
+        基于活动版本增量创建新版本并切换到新版本
+        
+        Args:
+            upsert_documents: 新增和修改的文档片段
+            delete_ids (list): 需要删除的片段ID
+            batch_size (int): 批处理大小
+            manifest (ETLManifest): 新版本的ETL清单
+            
+        Returns:
+            bool: 是否成功创建并切换到新版本
+        """
+        try:
+            new_version = self.create_delta_version(upsert_documents, delete_ids, batch_size, manifest)
+            return self._activate_new_version(new_version)
+        except Exception as e:
+            logger.error(f"增量创建并切换到新版本失败: {e}")
+            return False
+    
+    def _activate_new_version(self, new_version: str) -> bool:
+        """
+        验证并切换到新创建的版本，失败时删除该版本（被黄金查询门禁拒绝的版本保留）
+        
+        Args:
+            new_version (str): 新版本号
+            
+        Returns:
+            bool: 是否切换成功
+        """
+        # 切换前验证新版本功能（在 switch_to_version 中执行）
+        version_path = os.path.join(self.base_directory, new_version)
+        if self.switch_to_version(new_version):
+            if os.path.exists(self.rejected_build_file):
+                os.remove(self.rejected_build_file)
+            # 清理旧版本
+            self._cleanup_old_versions()
+            return True
+        # 被黄金查询门禁拒绝的版本连同报告保留，供排查退化原因，由旧版本清理回收；其他失败直接删除
+        report = load_version_meta(version_path).get("validation")
+        if report and not report.get("passed", True):
+            logger.info(f"保留被门禁拒绝的版本 {new_version}，报告见其版本元数据")
+            self._record_rejected_build(new_version, report)
+            self._cleanup_old_versions()
+        else:
+            shutil.rmtree(version_path)
+        return False
+    
+    def _record_rejected_build(self, version: str, report: dict):
+        """
+        记录被门禁拒绝的构建所用的数据目录指纹，数据和活动版本不变时下次ETL不再重复构建
+        
+        Args:
+            version (str): 被拒绝的版本号
+            report (dict): 门禁报告
+        """
+        manifest = ETLManifest.load(os.path.join(self.base_directory, version))
+        fingerprint = manifest.build_stats.get("data_fingerprint") if manifest else None
+        if not fingerprint:
+            return
+        rejected = {
+            "version": version,
+            "active_version": report.get("active_version"),
+            "data_fingerprint": fingerprint,
+            "reasons": report.get("reasons", []),
+            "rejected_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        tmp_path = f"{self.rejected_build_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(rejected, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.rejected_build_file)
+    
+    def is_rejected_build(self, data_fingerprint: str) -> bool:
+        """
+        数据目录是否与最近一次被门禁拒绝的构建相同，且活动版本没有变化
+        
+        Args:
+            data_fingerprint (str): 当前数据目录的指纹
+            
+        Returns:
+            bool: 相同时返回True，重新构建只会再次被拒绝
+        """
+        if not os.path.exists(self.rejected_build_file):
+            return False
+        try:
+            with open(self.rejected_build_file, "r", encoding="utf-8") as f:
+                rejected = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取被拒绝构建记录失败: {e}")
+            return False
+        return rejected.get("data_fingerprint") == data_fingerprint and \
+            rejected.get("active_version") == self.get_active_version()
+    
+    def get_active_version(self) -> str:
+        """
+        获取当前活动版本号
+        
+        Returns:
+            str: 当前活动版本号，如果不存在则返回None
+        """
+        return self._get_current_version()
+    
     def get_active_version_path(self) -> str:
         """
         获取当前活动版本的路径
@@ -231,6 +645,49 @@ class VectorVersionManager:
             return None
         return os.path.join(self.base_directory, current_version)
     
+    def get_standby_version(self) -> str:
+        """
+        获取正在预热、即将切换的候选版本号
+
+        Returns:
+            str: 版本号，没有时返回None
+        """
+        return self._read_version_file(self.standby_version_file)
+    
+    def get_shadow_version(self) -> str:
+        """
+        获取接收影子流量的候选版本号
+
+        Returns:
+            str: 版本号，没有时返回None
+        """
+        return self._read_version_file(self.shadow_version_file)
+    
+    def get_previous_version(self) -> str:
+        """
+        获取切换前的活动版本号（回滚目标）
+
+        Returns:
+            str: 版本号，没有时返回None
+        """
+        return self._read_version_file(self.previous_version_file)
+    
+    def is_version_path(self, path: str) -> bool:
+        """
+        目录是否为本管理器管理的版本目录
+
+        版本目录在构建完成后只通过版本门禁发布，不能原地修改
+        
+        Args:
+            path (str): 目录路径
+            
+        Returns:
+            bool: 是否为基础目录下的版本目录
+        """
+        path = os.path.realpath(path)
+        return os.path.basename(path).startswith(self.version_prefix) and \
+            os.path.dirname(path) == os.path.realpath(self.base_directory)
+    
     def list_versions(self) -> list:
         """
         列出所有版本信息
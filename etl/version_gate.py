@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+版本切换门禁模块
+切换前用同一组黄金查询回放候选版本和活动版本，比较检索延迟（p50/p95）、两个版本检索结果的重合率，
+以及标注查询的召回率（期望来源出现在前k个结果中的比例），退化超过阈值时拒绝切换。
+重合率低只说明结果变了，不一定变差：只有查询集带标注时才据此拒绝，否则只记为警告。
+报告保存在候选版本的元数据中（validation）
+"""
+
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from datetime import datetime
+from log.logger import logger
+from constant.constants import (
+    GOLDEN_QUERIES_PATH,
+    VERSION_GATE_TOP_N,
+    VERSION_GATE_K,
+    VERSION_GATE_MAX_LATENCY_RATIO,
+    VERSION_GATE_LATENCY_SLACK_MS,
+    VERSION_GATE_MIN_OVERLAP,
+    VERSION_GATE_MAX_RECALL_DROP,
+)
+
+
+def load_golden_queries(path: str = GOLDEN_QUERIES_PATH, top_n: int = VERSION_GATE_TOP_N) -> list:
+    """
+    读取黄金查询集，文件不存在时使用问答历史中的高频问题（没有期望来源）
+
+    Args:
+        path (str): 黄金查询文件
+        top_n (int): 从问答历史中取的问题数
+
+    Returns:
+        list: [{"query": 查询文本, "expected_sources": [来源, ...]}, ...]
+    """
+    queries = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    item = line
+                if isinstance(item, dict):
+                    queries.append({"query": item["query"], "expected_sources": list(item.get("expected_sources") or [])})
+                else:
+                    queries.append({"query": str(item), "expected_sources": []})
+        return queries
+
+    # 延迟导入，ETL只在没有黄金查询文件时才需要问答历史
+    from rag.qa_history_query import QAHistoryQuery
+    query = QAHistoryQuery()
+    try:
+        return [{"query": row["sample_question"], "expected_sources": []} for row in query.top_questions(top_n)]
+    finally:
+        query.close()
+
+
+def result_key(doc) -> str:
+    """
+    检索结果在不同版本间可比较的标识：来源加文本哈希
+
+    不使用片段ID：旧版本没有片段ID，片段ID的生成方式也可能随版本变化，
+    同一来源的同一段文本在任何版本中都得到同一个标识
+    """
+    digest = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:16]
+    return f"{doc.metadata.get('source', '')}#{digest}"
+
+
+def replay_queries(vector_store, golden: list, k: int = VERSION_GATE_K) -> list:
+    """
+    在一个版本上回放黄金查询
+
+    查询向量在计时之外计算，延迟只包含检索；先完整回放一遍使索引页载入内存，再计时回放一遍
+
+    Returns:
+        list: 每条查询的 {"keys": [结果标识], "sources": [来源], "latency_ms": 检索耗时}
+    """
+    vectors = [vector_store.embeddings.embed_query(item["query"]) for item in golden]
+    for vector in vectors:
+        vector_store.similarity_search_by_vector(vector, k=k)
+    results = []
+    for vector in vectors:
+        start_time = time.time()
+        docs = vector_store.similarity_search_by_vector(vector, k=k)
+        latency_ms = (time.time() - start_time) * 1000
+        results.append({
+            "keys": [result_key(doc) for doc in docs],
+            "sources": [str(doc.metadata.get("source", "")) for doc in docs],
+            "latency_ms": latency_ms,
+        })
+    return results
+
+
+def _recall(golden: list, results: list):
+    """标注查询的期望来源出现在检索结果中的比例，没有标注查询时为None"""
+    expected_total = 0
+    found = 0
+    for item, result in zip(golden, results):
+        for expected in item["expected_sources"]:
+            expected_total += 1
+            found += any(expected in source for source in result["sources"])
+    return round(found / expected_total, 4) if expected_total else None
+
+
+def _summarize(golden: list, results: list) -> dict:
+    latencies = [result["latency_ms"] for result in results]
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "empty_results": sum(1 for result in results if not result["keys"]),
+        "recall": _recall(golden, results),
+    }
+
+
+def _latency_regressed(candidate_ms: float, active_ms: float, max_ratio: float, slack_ms: float) -> bool:
+    return candidate_ms > active_ms * max_ratio and candidate_ms - active_ms > slack_ms
+
+
+def run_version_gate(candidate_store, active_store, golden: list, k: int = VERSION_GATE_K,
+                     max_latency_ratio: float = VERSION_GATE_MAX_LATENCY_RATIO,
+                     latency_slack_ms: float = VERSION_GATE_LATENCY_SLACK_MS,
+                     min_overlap: float = VERSION_GATE_MIN_OVERLAP,
+                     max_recall_drop: float = VERSION_GATE_MAX_RECALL_DROP) -> dict:
+    """
+    用黄金查询比较候选版本与活动版本
+
+    Args:
+        candidate_store: 候选版本的向量库
+        active_store: 活动版本的向量库
+        golden (list): 黄金查询 [{"query", "expected_sources"}, ...]
+        k (int): 每条查询的检索数量
+        max_latency_ratio (float): 候选版本p50/p95延迟相对活动版本的最大倍数
+        latency_slack_ms (float): 延迟差值不超过该毫秒数时不算退化
+        min_overlap (float): 与活动版本检索结果的最低平均重合率（没有标注查询时只记为警告）
+        max_recall_drop (float): 标注查询召回率的最大下降幅度
+
+    Returns:
+        dict: 报告，passed 为是否允许切换，reasons 为拒绝原因，warnings 为不阻止切换的退化
+    """
+    if not golden:
+        return {"queries": 0, "passed": True, "reasons": [], "warnings": [],
+                "check_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+
+    candidate_results = replay_queries(candidate_store, golden, k)
+    active_results = replay_queries(active_store, golden, k)
+    candidate = _summarize(golden, candidate_results)
+    active = _summarize(golden, active_results)
+
+    overlaps = []
+    for candidate_result, active_result in zip(candidate_results, active_results):
+        expected = set(active_result["keys"])
+        overlaps.append(len(expected.intersection(candidate_result["keys"])) / len(expected) if expected else 1.0)
+    overlap = round(float(np.mean(overlaps)), 4)
+
+    labelled_queries = sum(1 for item in golden if item["expected_sources"])
+    reasons = []
+    warnings = []
+    for name in ("p50_ms", "p95_ms"):
+        if _latency_regressed(candidate[name], active[name], max_latency_ratio, latency_slack_ms):
+            reasons.append(f"{name[:3]}延迟 {candidate[name]:.2f}ms，活动版本 {active[name]:.2f}ms")
+    if candidate["empty_results"] > active["empty_results"]:
+        reasons.append(f"{candidate['empty_results']} 条查询没有检索结果，活动版本 {active['empty_results']} 条")
+    if overlap < min_overlap:
+        (reasons if labelled_queries else warnings).append(
+            f"与活动版本的检索结果平均重合率 {overlap:.2f}，低于 {min_overlap}")
+    if candidate["recall"] is not None and active["recall"] is not None \
+            and candidate["recall"] < active["recall"] - max_recall_drop:
+        reasons.append(f"标注查询召回率 {candidate['recall']:.2f}，活动版本 {active['recall']:.2f}")
+
+    worst = sorted(range(len(golden)), key=lambda i: overlaps[i])[:5]
+    return {
+        "queries": len(golden),
+        "labelled_queries": labelled_queries,
+        "k": k,
+        "candidate": candidate,
+        "active": active,
+        "overlap": overlap,
+        "lowest_overlap_queries": [{"query": golden[i]["query"], "overlap": round(overlaps[i], 4)}
+                                   for i in worst if overlaps[i] < 1.0],
+        "thresholds": {
+            "max_latency_ratio": max_latency_ratio,
+            "latency_slack_ms": latency_slack_ms,
+            "min_overlap": min_overlap,
+            "max_recall_drop": max_recall_drop,
+        },
+        "passed": not reasons,
+        "reasons": reasons,
+        "warnings": warnings,
+        "check_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
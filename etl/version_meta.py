@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+向量库版本元数据模块
+每个版本目录下保存一个JSON文件，记录构建该版本所用的嵌入模型、向量维度等信息，
+用于判断版本之间、版本与当前查询模型之间的向量是否兼容
+"""
+
+import os
+import json
+from log.logger import logger
+
+# 元数据文件名，保存在每个版本目录下
+VERSION_META_FILENAME = "version_meta.json"
+
+
+def load_version_meta(version_path: str) -> dict:
+    """
+    读取版本元数据
+
+    Args:
+        version_path (str): 版本目录
+
+    Returns:
+        dict: 元数据，不存在或损坏时返回空字典
+    """
+    if not version_path:
+        return {}
+    meta_path = os.path.join(version_path, VERSION_META_FILENAME)
+    if not os.path.exists(meta_path):
+        return {}
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"读取版本元数据失败: {e}")
+        return {}
+
+
+def update_version_meta(version_path: str, **fields) -> dict:
+    """
+    合并更新版本元数据，先写临时文件再替换，读取方不会看到写了一半的文件
+
+    Args:
+        version_path (str): 版本目录
+        **fields: 要更新的字段
+
+    Returns:
+        dict: 更新后的元数据
+    """
+    meta = load_version_meta(version_path)
+    meta.update(fields)
+    os.makedirs(version_path, exist_ok=True)
+    meta_path = os.path.join(version_path, VERSION_META_FILENAME)
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, meta_path)
+    return meta
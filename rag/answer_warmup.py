@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+答案缓存预热模块
+从问答历史中取出现频次最高的问题，针对当前活动向量库版本预先计算检索结果和答案并写入答案缓存，
+在应用启动和向量库版本切换后执行，使上线初期的头部流量直接命中缓存
+"""
+
+import threading
+from log.logger import logger
+from cache.answer_cache import answer_cache
+from rag.qa_history_query import QAHistoryQuery
+from constant.constants import ANSWER_WARMUP_TOP_N
+
+
+def warm_answer_cache(vector_store=None, top_n: int = ANSWER_WARMUP_TOP_N, num_groups: int = 2,
+                      top_k: int = 4) -> dict:
+    """
+    预热答案缓存
+
+    每个分组各生成一次答案（不同分组的回退策略不同）；检索结果与分组无关，第二个分组起直接命中检索缓存。
+    已在缓存中的问题跳过，重复执行只补齐缺失部分
+
+    Args:
+        vector_store: 向量存储实例，为None时加载当前活动版本
+        top_n (int): 预热的高频问题数
+        num_groups (int): 分组数量
+        top_k (int): 问答链的检索文档数量（与页面默认值一致）
+
+    Returns:
+        dict: 预热统计 {version, questions, computed, skipped, failed}
+    """
+    # 延迟导入，避免与 rag_core 循环依赖
+    from rag.rag_core import get_qa_chain, rerank_top_n
+    from etl.vector_builder import load_vector_store
+    from etl.vector_version_manager import vector_version_manager
+
+    version = vector_version_manager.get_active_version()
+    summary = {'version': version, 'questions': 0, 'computed': 0, 'skipped': 0, 'failed': 0}
+    if not version:
+        logger.info("没有活动向量库版本，跳过答案缓存预热")
+        return summary
+
+    query = QAHistoryQuery()
+    try:
+        questions = [row['sample_question'] for row in query.top_questions(top_n)]
+    finally:
+        query.close()
+    summary['questions'] = len(questions)
+    if not questions:
+        logger.info("问答历史为空，跳过答案缓存预热")
+        return summary
+
+    logger.info(f"开始预热答案缓存，版本: {version}, 高频问题数: {len(questions)}")
+    if vector_store is None:
+        # 直接加载活动版本，不使用TTL缓存，避免切换后仍拿到旧版本
+        vector_store = load_vector_store(vector_version_manager.get_active_version_path())
+
+    for group_num in range(num_groups):
+        group_name = f"group_{group_num}"
+        # 预热问题不是线上流量，不镜像到影子版本，以免影响影子流量的比较统计
+        qa_chain = get_qa_chain(vector_store, top_k, group_name=group_name, mirror_traffic=False)
+        for question in questions:
+            if answer_cache.get(question, version, group_name, top_n=rerank_top_n(top_k)) is not None:
+                summary['skipped'] += 1
+                continue
+            try:
+                result = qa_chain.invoke({"question": question})
+                answer_cache.put(question, version, group_name, result, top_n=rerank_top_n(top_k))
+                summary['computed'] += 1
+            except Exception as e:
+                logger.warning(f"预热问题失败 [{group_name}] {question}: {e}")
+                summary['failed'] += 1
+
+    logger.info(f"答案缓存预热完成: {summary}")
+    return summary
+
+
+def start_warmup_thread(vector_store=None, top_n: int = ANSWER_WARMUP_TOP_N) -> threading.Thread:
+    """
+    在后台线程中预热答案缓存，不阻塞启动
+
+    Args:
+        vector_store: 向量存储实例
+        top_n (int): 预热的高频问题数
+
+    Returns:
+        threading.Thread: 预热线程
+    """
+    def run():
+        try:
+            warm_answer_cache(vector_store, top_n)
+        except Exception as e:
+            logger.error(f"答案缓存预热出错: {e}")
+
+    thread = threading.Thread(target=run, name="answer-cache-warmup", daemon=True)
+    thread.start()
+    return thread
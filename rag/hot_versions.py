@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+服务进程的向量库版本池
+每个服务进程同时保持活动版本和上一个版本加载在内存中，检索时按版本指针取当前活动版本：
+- 版本管理器发布备用版本后，后台线程加载该版本并回放预热查询，使索引页和SQLite页进入内存，
+  再在心跳中报告就绪，版本管理器等所有服务进程就绪后才切换活动版本
+- 回滚只改写版本指针，上一个版本仍在池中，下一个请求即使用回滚后的版本
+代价是切换前后内存中同时有两到三个版本
+"""
+
+import os
+import json
+import time
+import atexit
+import socket
+import threading
+from langchain_core.vectorstores import VectorStore
+from log.logger import logger
+from etl.vector_builder import load_serving_vector_store
+from etl.vector_version_manager import vector_version_manager
+from etl.version_gate import load_golden_queries
+from constant.constants import (
+    CHROMA_DB_DIR,
+    VERSION_GATE_K,
+    VERSION_STANDBY_POLL_INTERVAL,
+    VERSION_STANDBY_WARM_QUERIES,
+)
+
+
+def warm_vector_store(vector_store, queries: list, k: int = VERSION_GATE_K) -> dict:
+    """
+    回放预热查询，使向量库的索引页和文档存储进入内存
+
+    同时执行相似度检索和MMR检索（在线检索使用MMR），查询失败不影响其余查询
+
+    Args:
+        vector_store: 向量库实例
+        queries (list): 查询文本
+        k (int): 每条查询的检索数量
+
+    Returns:
+        dict: {"queries": 查询数, "failed": 失败数, "elapsed_ms": 总耗时}
+    """
+    start_time = time.perf_counter()
+    failed = 0
+    for query in queries:
+        try:
+            vector_store.similarity_search(query, k=k)
+            vector_store.max_marginal_relevance_search(query, k=k)
+        except Exception as e:
+            failed += 1
+            logger.debug(f"预热查询失败 {query}: {e}")
+    return {"queries": len(queries), "failed": failed,
+            "elapsed_ms": round((time.perf_counter() - start_time) * 1000, 1)}
+
+
+def _warm_queries(top_n: int = VERSION_STANDBY_WARM_QUERIES) -> list:
+    """预热查询：黄金查询集的前若干条，不可用时只用一条固定查询"""
+    try:
+        queries = [item["query"] for item in load_golden_queries(top_n=top_n)][:top_n]
+    except Exception as e:
+        logger.warning(f"读取预热查询失败: {e}")
+        queries = []
+    return queries or ["预热"]
+
+
+class HotVersionPool:
+    """服务进程内已加载的向量库版本"""
+
+    def __init__(self, manager=vector_version_manager, fallback_directory: str = CHROMA_DB_DIR,
+                 loader=load_serving_vector_store, warm_queries=_warm_queries,
+                 poll_interval: float = VERSION_STANDBY_POLL_INTERVAL):
+        """
+        初始化版本池
+
+        Args:
+            manager (VectorVersionManager): 版本管理器
+            fallback_directory (str): 没有活动版本时加载的向量库目录
+            loader: 按版本目录加载向量库的函数
+            warm_queries: 返回预热查询列表的函数
+            poll_interval (float): 后台线程检查备用版本的间隔（秒）
+        """
+        self.manager = manager
+        self.fallback_directory = fallback_directory
+        self.loader = loader
+        self.warm_queries = warm_queries
+        self.poll_interval = poll_interval
+        self.process_name = f"{socket.gethostname()}-{os.getpid()}"
+        self.heartbeat_file = os.path.join(manager.serving_directory, f"{self.process_name}.json")
+        # 版本号 -> 向量库；没有活动版本时回退目录的向量库以None为键
+        self._stores = {}
+        self._warm_versions = set()
+        # 缓存的活动版本：(版本指针文件的inode和修改时间, 版本号, 向量库)，指针文件被替换后重新读取
+        self._active = None
+        self._load_lock = threading.Lock()
+        self._watcher = None
+        self._stop_event = threading.Event()
+
+    def _path(self, version: str) -> str:
+        return os.path.join(self.manager.base_directory, version) if version else self.fallback_directory
+
+    def load(self, version: str, warm: bool = False):
+        """
+        加载版本（已加载时直接返回），可选回放预热查询
+
+        Args:
+            version (str): 版本号，为None时加载回退目录
+            warm (bool): 是否回放预热查询
+
+        Returns:
+            VectorStore: 向量库实例
+        """
+        store = self._stores.get(version)
+        if store is not None and (not warm or version in self._warm_versions):
+            return store
+        with self._load_lock:
+            store = self._stores.get(version)
+            if store is None:
+                start_time = time.perf_counter()
+                store = self.loader(self._path(version))
+                logger.info(f"已加载向量库版本 {version}，耗时 {(time.perf_counter() - start_time) * 1000:.0f} ms")
+            if warm and version not in self._warm_versions:
+                stats = warm_vector_store(store, self.warm_queries())
+                self._warm_versions.add(version)
+                logger.info(f"已预热向量库版本 {version}: {stats}")
+            self._stores[version] = store
+        return store
+
+    def _pointer_stamp(self):
+        """活动版本指针文件的 (inode, 修改时间)，版本管理器原子替换指针文件后一定变化"""
+        try:
+            stat = os.stat(self.manager.active_version_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def current(self) -> tuple:
+        """
+        当前活动版本及其向量库，版本不在池中时同步加载
+
+        活动版本缓存在池中，每次只检查一次指针文件的状态，指针文件被替换（切换、回滚）后才重新读取
+
+        Returns:
+            tuple: (版本号, 向量库)
+        """
+        stamp = self._pointer_stamp()
+        cached = self._active
+        if cached is not None and cached[0] == stamp:
+            return cached[1], cached[2]
+        version = self.manager.get_active_version()
+        if version and not os.path.exists(self._path(version)):
+            version = None
+        store = self.load(version)
+        self._active = (stamp, version, store)
+        return version, store
+
+    def invalidate(self):
+        """丢弃缓存的活动版本，下次检索时重新读取版本指针"""
+        self._active = None
+
+    def rollback(self) -> bool:
+        """
+        回滚到上一个版本并立即在本进程生效
+
+        Returns:
+            bool: 是否回滚成功
+        """
+        rolled_back = self.manager.rollback()
+        self.invalidate()
+        return rolled_back
+
+    def versions(self) -> list:
+        """池中已加载的版本号"""
+        return [version for version in self._stores if version]
+
+    def refresh(self):
+        """
+        根据版本指针同步版本池：预热备用版本，释放活动版本、回滚目标、备用版本和影子版本以外的版本，并写入心跳
+        """
+        standby = self.manager.get_standby_version()
+        if standby and os.path.exists(self._path(standby)):
+            try:
+                self.load(standby, warm=True)
+            except Exception as e:
+                logger.error(f"预热备用版本 {standby} 失败: {e}")
+
+        active = self.manager.get_active_version()
+        retained = {active, self.manager.get_previous_version(), standby, self.manager.get_shadow_version()}
+        if active:
+            retained.discard(None)
+        with self._load_lock:
+            for version in list(self._stores):
+                if version not in retained:
+                    self._stores.pop(version)
+                    self._warm_versions.discard(version)
+                    logger.info(f"已释放向量库版本 {version}")
+        # 释放的版本不再被缓存引用；回退目录或版本目录的变化也在此时重新检查
+        self.invalidate()
+        self._write_heartbeat(active)
+
+    def _write_heartbeat(self, active: str):
+        os.makedirs(self.manager.serving_directory, exist_ok=True)
+        heartbeat = {
+            "process": self.process_name,
+            "active_version": active,
+            "warm_versions": sorted(v for v in self._stores if v and (v in self._warm_versions or v == active)),
+            "updated": time.time(),
+        }
+        tmp_path = f"{self.heartbeat_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(heartbeat, f, ensure_ascii=False)
+        os.replace(tmp_path, self.heartbeat_file)
+
+    def _remove_heartbeat(self):
+        if os.path.exists(self.heartbeat_file):
+            os.remove(self.heartbeat_file)
+
+    def start(self) -> threading.Thread:
+        """
+        启动后台线程定期同步版本池（每个进程只启动一次）
+
+        Returns:
+            threading.Thread: 后台线程
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return self._watcher
+
+        def watch():
+            while not self._stop_event.is_set():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"同步向量库版本池失败: {e}")
+                self._stop_event.wait(self.poll_interval)
+
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=watch, name="hot-version-pool", daemon=True)
+        self._watcher.start()
+        atexit.register(self.stop)
+        return self._watcher
+
+    def stop(self):
+        """停止后台线程并删除心跳文件，版本管理器不再等待本进程"""
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.poll_interval + 1)
+        try:
+            self._remove_heartbeat()
+        except OSError as e:
+            logger.warning(f"删除心跳文件失败: {e}")
+
+
+class ActiveVectorStore(VectorStore):
+    """
+    始终指向当前活动版本的向量库
+
+    问答链创建一次后长期使用，每次检索都从版本池取当前活动版本，版本切换和回滚对已创建的问答链立即生效
+    """
+
+    def __init__(self, pool: HotVersionPool):
+        self.pool = pool
+        # 立即加载活动版本，加载错误在创建时暴露
+        pool.current()
+
+    @property
+    def store(self):
+        """当前活动版本的向量库"""
+        return self.pool.current()[1]
+
+    @property
+    def embeddings(self):
+        return self.store.embeddings
+
+    def __getattr__(self, name):
+        # 其他属性（如 _collection）转发给当前活动版本
+        if name == "pool":
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        return self.store.add_texts(texts, metadatas, **kwargs)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise TypeError("ActiveVectorStore 只能由版本池创建")
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> list:
+        return self.store.similarity_search(query, k=k, **kwargs)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> list:
+        return self.store.similarity_search_with_score(query, k=k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs) -> list:
+        return self.store.similarity_search_by_vector(embedding, k=k, **kwargs)
+
+    def _similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs) -> list:
+        return self.store._similarity_search_with_relevance_scores(query, k=k, **kwargs)
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+                                      **kwargs) -> list:
+        return self.store.max_marginal_relevance_search(query, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult,
+                                                        **kwargs)
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, **kwargs) -> list:
+        return self.store.max_marginal_relevance_search_by_vector(embedding, k=k, fetch_k=fetch_k,
+                                                                  lambda_mult=lambda_mult, **kwargs)
+
+
+# 全局版本池实例
+hot_version_pool = HotVersionPool()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+问答历史归档模块
+将热库中超出保留期的问答历史按月分区搬迁到压缩JSONL文件，并按保留策略删除过期归档
+
+归档按主键顺序小批量进行：每批先写归档文件（文件名由月份和起始id确定，重试时覆盖同名文件，
+保证幂等），再在一个短事务中删除对应行，WAL模式下不阻塞在线写入
+"""
+
+import os
+import gzip
+import json
+import time
+import shutil
+from datetime import datetime, timezone
+from log.logger import logger
+from rag.qa_history_manager import connect_database, _create_schema
+from constant.constants import (
+    QA_HISTORY_DB_PATH,
+    QA_HISTORY_ARCHIVE_DIR,
+    QA_HISTORY_HOT_MONTHS,
+    QA_HISTORY_ARCHIVE_RETENTION_MONTHS,
+    QA_HISTORY_ARCHIVE_BATCH_SIZE,
+)
+
+
+def _month_start(now: datetime, months_back: int) -> datetime:
+    """
+    计算 now 所在月往前推 months_back 个月的月初
+
+    Args:
+        now (datetime): 参考时间
+        months_back (int): 往前推的月数
+
+    Returns:
+        datetime: 月初时间
+    """
+    month_index = now.year * 12 + (now.month - 1) - months_back
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+class QAHistoryArchiver:
+    """问答历史归档器"""
+
+    def __init__(self, db_path: str = QA_HISTORY_DB_PATH,
+                 archive_dir: str = QA_HISTORY_ARCHIVE_DIR,
+                 hot_months: int = QA_HISTORY_HOT_MONTHS,
+                 retention_months: int = QA_HISTORY_ARCHIVE_RETENTION_MONTHS,
+                 batch_size: int = QA_HISTORY_ARCHIVE_BATCH_SIZE):
+        """
+        初始化归档器
+
+        Args:
+            db_path (str): 热库文件路径
+            archive_dir (str): 归档目录
+            hot_months (int): 热库保留的自然月数（含当月）
+            retention_months (int): 归档文件保留月数
+            batch_size (int): 每批搬迁条数
+        """
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.hot_months = hot_months
+        self.retention_months = retention_months
+        self.batch_size = batch_size
+
+    def get_cutoff(self, now: datetime = None) -> str:
+        """
+        获取热库保留的起始时间，早于该时间的记录需要归档
+
+        Args:
+            now (datetime): 参考时间，默认当前UTC时间
+
+        Returns:
+            str: 截止时间，格式 YYYY-MM-DD HH:MM:SS
+        """
+        now = now or datetime.now(timezone.utc)
+        return _month_start(now, self.hot_months - 1).strftime("%Y-%m-%d %H:%M:%S")
+
+    def _write_part(self, month: str, rows: list):
+        """
+        将一批记录写入月份分区下的归档文件
+
+        Args:
+            month (str): 月份分区，格式 YYYY-MM
+            rows (list): 记录字典列表（按id升序）
+        """
+        partition_dir = os.path.join(self.archive_dir, month)
+        os.makedirs(partition_dir, exist_ok=True)
+        # 文件名只取起始id：中断后重试的同一批会覆盖上次写了一半的结果
+        filename = f"part-{rows[0]['id']:012d}.jsonl.gz"
+        file_path = os.path.join(partition_dir, filename)
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                for row in rows:
+                    f.write((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8"))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, file_path)
+
+    def archive(self, now: datetime = None, max_batches: int = None, pause: float = 0.05) -> int:
+        """
+        增量归档超出热库保留期的记录
+
+        Args:
+            now (datetime): 参考时间，默认当前UTC时间
+            max_batches (int): 本次最多处理的批数，None表示处理完为止
+            pause (float): 批次之间的间隔（秒），给在线写入让出锁
+
+        Returns:
+            int: 本次归档的记录数
+        """
+        cutoff = self.get_cutoff(now)
+        logger.info(f"开始归档问答历史，截止时间: {cutoff}")
+        conn = connect_database(self.db_path)
+        _create_schema(conn)
+        archived = 0
+        batches = 0
+        try:
+            while max_batches is None or batches < max_batches:
+                cursor = conn.execute("SELECT * FROM qa_history ORDER BY id LIMIT ?", (self.batch_size,))
+                columns = [c[0] for c in cursor.description]
+                rows = []
+                for values in cursor.fetchall():
+                    row = dict(zip(columns, values))
+                    # 按主键顺序取连续的过期记录，遇到未过期记录即停止
+                    if row['timestamp'] >= cutoff:
+                        break
+                    rows.append(row)
+                if not rows:
+                    break
+
+                by_month = {}
+                for row in rows:
+                    by_month.setdefault(row['timestamp'][:7], []).append(row)
+                for month, month_rows in by_month.items():
+                    self._write_part(month, month_rows)
+
+                with conn:
+                    conn.execute("DELETE FROM qa_history WHERE id <= ?", (rows[-1]['id'],))
+                archived += len(rows)
+                batches += 1
+                logger.info(f"已归档 {len(rows)} 条问答历史，id <= {rows[-1]['id']}")
+                if pause:
+                    time.sleep(pause)
+
+            if archived:
+                # 截断WAL文件；删除后的空闲页由后续写入复用，热库文件不再持续增长
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+
+        logger.info(f"问答历史归档完成，共归档 {archived} 条")
+        return archived
+
+    def apply_retention(self, now: datetime = None) -> list:
+        """
+        删除超出保留期的归档月份分区
+
+        Args:
+            now (datetime): 参考时间，默认当前UTC时间
+
+        Returns:
+            list: 被删除的月份分区
+        """
+        if not os.path.exists(self.archive_dir):
+            return []
+        now = now or datetime.now(timezone.utc)
+        oldest_kept = _month_start(now, self.retention_months - 1).strftime("%Y-%m")
+        removed = []
+        for month in sorted(os.listdir(self.archive_dir)):
+            if len(month) == 7 and month < oldest_kept:
+                shutil.rmtree(os.path.join(self.archive_dir, month))
+                removed.append(month)
+                logger.info(f"已删除过期归档分区: {month}")
+        return removed
+
+    def list_partitions(self) -> list:
+        """
+        列出所有归档月份分区
+
+        Returns:
+            list: 月份分区列表（旧到新）
+        """
+        if not os.path.exists(self.archive_dir):
+            return []
+        return sorted(m for m in os.listdir(self.archive_dir)
+                      if os.path.isdir(os.path.join(self.archive_dir, m)))
+
+    def iter_partition(self, month: str):
+        """
+        逐条读取某个月份分区的归档记录
+
+        Args:
+            month (str): 月份分区，格式 YYYY-MM
+
+        Yields:
+            dict: 问答历史记录
+        """
+        partition_dir = os.path.join(self.archive_dir, month)
+        for filename in sorted(os.listdir(partition_dir)):
+            if not filename.endswith(".jsonl.gz"):
+                continue
+            with gzip.open(os.path.join(partition_dir, filename), "rt", encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line)
+
+
+def archive_job():
+    """
+    归档定时任务：归档过期热数据并清理过期归档
+    """
+    try:
+        archiver = QAHistoryArchiver()
+        archiver.archive()
+        archiver.apply_retention()
+    except Exception as e:
+        logger.error(f"问答历史归档任务执行出错: {e}")
@@ -3,23 +3,69 @@
 """
 问答历史管理模块
 负责管理问答历史的保存、查询等功能
+
+问答历史通过常驻后台线程批量写入：单个WAL模式连接，表结构只初始化一次，
+记录先进入队列，再按条数/时间上限分批 executemany 写入，进程退出时刷盘。
+建表与数据迁移在服务启动预热或 --migrate 时同步执行，不占用写入线程
 """
 
 import os
+import sys
+import time
+import argparse
+import queue
+import atexit
 import sqlite3
 import asyncio
-import aiosqlite
+import threading
+from datetime import datetime, timezone
+# 添加项目根目录到Python路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
 from log.logger import logger
+from util.tools import TextUtils
+from constant.constants import (
+    QA_HISTORY_DB_PATH,
+    QA_HISTORY_BATCH_SIZE,
+    QA_HISTORY_FLUSH_INTERVAL,
+    QA_HISTORY_MAX_QUEUE_SIZE,
+)
 
 
-def _initialize_database():
-    """初始化SQLite数据库和表"""
-    db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "qa_history.db")
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # 创建表来存储问答历史
-    cursor.execute('''
+# 每次请求的耗时与结果指标列：(列名, 类型)
+METRIC_COLUMNS = [
+    ("vector_version", "TEXT"),
+    # 请求路径：rag（检索到文档）、fallback（未检索到文档走回退链）、cache（答案缓存命中）
+    ("route", "TEXT"),
+    # 答案缓存状态：memory、disk、miss
+    ("cache_status", "TEXT"),
+    ("latency_ms", "REAL"),
+    ("retrieval_ms", "REAL"),
+    ("prompt_tokens", "INTEGER"),
+    ("completion_tokens", "INTEGER"),
+]
+
+# 写入队列中记录元组的列顺序，与 qa_history 的插入列一致
+RECORD_COLUMNS = ["group_name", "user_id", "device_id", "question", "answer", "timestamp"] + \
+    [column for column, _ in METRIC_COLUMNS]
+RECORD_INDEX = {column: i for i, column in enumerate(RECORD_COLUMNS)}
+
+# 超过该耗时（毫秒）的请求计为慢请求
+SLOW_REQUEST_MS = 5000
+
+# 数据迁移版本（记录在 PRAGMA user_version 中）：1 为从历史表回填问题频次统计表
+SCHEMA_VERSION = 1
+
+
+def _create_schema(conn: sqlite3.Connection):
+    """
+    创建问答历史表、查询索引及问题频次统计表
+
+    Args:
+        conn (sqlite3.Connection): 数据库连接
+    """
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS qa_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             group_name TEXT NOT NULL,
@@ -30,89 +76,457 @@ def _initialize_database():
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    # 索引末尾隐含rowid(id)，可直接支持按 (timestamp, id) 的键集分页
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_qa_history_user_time ON qa_history (user_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_qa_history_device_time ON qa_history (device_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_qa_history_group_time ON qa_history (group_name, timestamp)")
     
+    # 按归一化问题累计的频次，写入时增量维护，避免在大表上 GROUP BY
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS qa_question_stats (
+            question_norm TEXT PRIMARY KEY,
+            sample_question TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            first_seen DATETIME NOT NULL,
+            last_seen DATETIME NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_qa_question_stats_count ON qa_question_stats (count DESC)")
+    
+    # 旧库升级：补充请求耗时与结果相关的列
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(qa_history)")}
+    for column, column_type in METRIC_COLUMNS:
+        if column not in existing:
+            try:
+                conn.execute(f"ALTER TABLE qa_history ADD COLUMN {column} {column_type}")
+            except sqlite3.OperationalError as e:
+                # 其他进程已同时完成升级
+                logger.debug(f"添加列 {column} 跳过: {e}")
+    
+    # 按 分组 + 小时 增量汇总的指标，看板只查询该表
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS qa_group_hourly (
+            group_name TEXT NOT NULL,
+            hour TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            rag_requests INTEGER NOT NULL DEFAULT 0,
+            fallback_requests INTEGER NOT NULL DEFAULT 0,
+            cache_hits INTEGER NOT NULL DEFAULT 0,
+            slow_requests INTEGER NOT NULL DEFAULT 0,
+            total_latency_ms REAL NOT NULL DEFAULT 0,
+            max_latency_ms REAL NOT NULL DEFAULT 0,
+            total_retrieval_ms REAL NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (group_name, hour)
+        )
+    ''')
     conn.commit()
-    conn.close()
-    return db_path
-
-
-async def _initialize_database_async():
-    """异步初始化SQLite数据库和表"""
-    db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "qa_history.db")
-    async with aiosqlite.connect(db_path) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS qa_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_name TEXT NOT NULL,
-                user_id TEXT,
-                device_id TEXT,
-                question TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        await db.commit()
-    return db_path
+    migrate_database(conn)
+
+
+def migrate_database(conn: sqlite3.Connection) -> bool:
+    """
+    执行尚未执行的数据迁移，每个数据库只执行一次
 
+    迁移版本记录在 PRAGMA user_version 中，已是最新版本时只读取一次版本号；
+    检查和迁移在同一个 BEGIN IMMEDIATE 事务中，多个进程同时启动时只有一个执行迁移
 
-def save_qa_history(group_name: str, user_id: str, device_id: str, question: str, answer: str):
+    Args:
+        conn (sqlite3.Connection): 数据库连接
+
+    Returns:
+        bool: 本次是否执行了迁移
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return False
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            conn.rollback()
+            return False
+        _backfill_question_stats(conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+def _backfill_question_stats(conn: sqlite3.Connection):
+    """
+    频次统计表为空而历史表有数据时（旧库升级），从历史表回填一次；在调用方的事务中执行
+
+    Args:
+        conn (sqlite3.Connection): 数据库连接
     """
-    保存问答历史到SQLite数据库
+    if conn.execute("SELECT 1 FROM qa_question_stats LIMIT 1").fetchone():
+        return
+    if not conn.execute("SELECT 1 FROM qa_history LIMIT 1").fetchone():
+        return
     
+    logger.info("开始回填问题频次统计表")
+    conn.create_function("normalize_question", 1, TextUtils.normalize_question, deterministic=True)
+    conn.execute('''
+        INSERT OR IGNORE INTO qa_question_stats (question_norm, sample_question, count, first_seen, last_seen)
+        SELECT normalize_question(question), MAX(question), COUNT(*), MIN(timestamp), MAX(timestamp)
+        FROM qa_history
+        GROUP BY normalize_question(question)
+    ''')
+    logger.info("问题频次统计表回填完成")
+
+
+def _aggregate_hourly(records: list) -> list:
+    """
+    将一批记录按 (分组, 小时) 预聚合，减少汇总表的更新次数
+
+    Args:
+        records (list): 写入队列中的记录元组
+
+    Returns:
+        list: qa_group_hourly 的插入参数列表
+    """
+    rollup = {}
+    for r in records:
+        key = (r[RECORD_INDEX["group_name"]], r[RECORD_INDEX["timestamp"]][:13] + ":00:00")
+        row = rollup.setdefault(key, [0, 0, 0, 0, 0, 0.0, 0.0, 0.0, 0, 0])
+        route = r[RECORD_INDEX["route"]]
+        latency = r[RECORD_INDEX["latency_ms"]] or 0.0
+        row[0] += 1
+        row[1] += 1 if route == "rag" else 0
+        row[2] += 1 if route == "fallback" else 0
+        row[3] += 1 if r[RECORD_INDEX["cache_status"]] in ("memory", "disk") else 0
+        row[4] += 1 if latency >= SLOW_REQUEST_MS else 0
+        row[5] += latency
+        row[6] = max(row[6], latency)
+        row[7] += r[RECORD_INDEX["retrieval_ms"]] or 0.0
+        row[8] += r[RECORD_INDEX["prompt_tokens"]] or 0
+        row[9] += r[RECORD_INDEX["completion_tokens"]] or 0
+    return [key + tuple(values) for key, values in rollup.items()]
+
+
+def connect_database(db_path: str = QA_HISTORY_DB_PATH) -> sqlite3.Connection:
+    """
+    打开问答历史数据库连接（WAL模式，读写互不阻塞）
+
+    Args:
+        db_path (str): 数据库文件路径
+
+    Returns:
+        sqlite3.Connection: 数据库连接
+    """
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class QAHistoryWriter:
+    """问答历史后台批量写入器"""
+
+    # 队列中的停止信号
+    _STOP = object()
+
+    def __init__(self, db_path: str = QA_HISTORY_DB_PATH,
+                 batch_size: int = QA_HISTORY_BATCH_SIZE,
+                 flush_interval: float = QA_HISTORY_FLUSH_INTERVAL,
+                 max_queue_size: int = QA_HISTORY_MAX_QUEUE_SIZE):
+        """
+        初始化写入器
+
+        Args:
+            db_path (str): 数据库文件路径
+            batch_size (int): 单批最大写入条数
+            flush_interval (float): 单批最长等待时间（秒）
+            max_queue_size (int): 写入队列上限
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._schema_ready = False
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'written': 0,
+            'batches': 0,
+            'dropped': 0,
+            'failed': 0,
+            'write_seconds': 0.0,
+            'last_batch_size': 0,
+            'last_batch_ms': 0.0,
+        }
+
+    def init_schema(self) -> bool:
+        """
+        同步建表并执行尚未执行的数据迁移，每个写入器只执行一次
+
+        服务启动预热时调用，写入线程启动前完成，写入线程只负责写入
+
+        Returns:
+            bool: 表结构是否已就绪
+        """
+        if self._schema_ready:
+            return True
+        with self._start_lock:
+            if self._schema_ready:
+                return True
+            try:
+                conn = connect_database(self.db_path)
+                try:
+                    _create_schema(conn)
+                finally:
+                    conn.close()
+            except Exception as e:
+                # 初始化失败时写入照常进行（写入失败计入统计），下次启动写入线程时重试
+                logger.error(f"初始化问答历史表失败: {e}")
+                return False
+            self._schema_ready = True
+            return True
+
+    def _ensure_started(self):
+        """首次提交时启动后台线程；fork出的子进程中重新启动"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        # 未经启动预热时（脚本、测试等），在启动写入线程前补做一次
+        self.init_schema()
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="qa-history-writer", daemon=True)
+            self._thread.start()
+            logger.info(f"问答历史写入线程已启动: {self.db_path}")
+
+    def _record(self, field: str, value=1):
+        with self._stats_lock:
+            self._stats[field] += value
+
+    def submit(self, group_name: str, user_id: str, device_id: str, question: str, answer: str,
+               metrics: dict = None) -> bool:
+        """
+        提交一条问答记录，立即返回，由后台线程写入；队列已满时直接丢弃，不阻塞请求线程
+
+        Args:
+            group_name (str): 分组名称
+            user_id (str): 用户ID
+            device_id (str): 设备ID
+            question (str): 用户问题
+            answer (str): 回答内容
+            metrics (dict): 请求指标，键为 METRIC_COLUMNS 中的列名，缺失的列写入NULL
+
+        Returns:
+            bool: 是否成功进入写入队列
+        """
+        self._ensure_started()
+        # 时间戳在提交时确定，与 CURRENT_TIMESTAMP 一致使用UTC
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        fields = dict(metrics or {}, group_name=group_name, user_id=user_id, device_id=device_id,
+                      question=question, answer=answer, timestamp=timestamp)
+        record = tuple(fields.get(column) for column in RECORD_COLUMNS)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            logger.error("问答历史写入队列已满，丢弃本条记录")
+            self._record('dropped')
+            return False
+        self._record('submitted')
+        return True
+
+    def _write_batch(self, conn: sqlite3.Connection, records: list):
+        """
+        在一个事务中写入一批记录
+
+        Args:
+            conn (sqlite3.Connection): 数据库连接
+            records (list): 记录列表
+        """
+        question, timestamp = RECORD_INDEX["question"], RECORD_INDEX["timestamp"]
+        with conn:
+            conn.executemany(
+                f"INSERT INTO qa_history ({', '.join(RECORD_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(RECORD_COLUMNS))})",
+                records
+            )
+            conn.executemany('''
+                INSERT INTO qa_question_stats (question_norm, sample_question, count, first_seen, last_seen)
+                VALUES (?, ?, 1, ?, ?)
+                ON CONFLICT(question_norm) DO UPDATE SET
+                    count = count + 1,
+                    last_seen = MAX(last_seen, excluded.last_seen)
+            ''', [(TextUtils.normalize_question(r[question]), r[question], r[timestamp], r[timestamp])
+                  for r in records])
+            conn.executemany('''
+                INSERT INTO qa_group_hourly (group_name, hour, requests, rag_requests, fallback_requests,
+                    cache_hits, slow_requests, total_latency_ms, max_latency_ms, total_retrieval_ms,
+                    prompt_tokens, completion_tokens)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(group_name, hour) DO UPDATE SET
+                    requests = requests + excluded.requests,
+                    rag_requests = rag_requests + excluded.rag_requests,
+                    fallback_requests = fallback_requests + excluded.fallback_requests,
+                    cache_hits = cache_hits + excluded.cache_hits,
+                    slow_requests = slow_requests + excluded.slow_requests,
+                    total_latency_ms = total_latency_ms + excluded.total_latency_ms,
+                    max_latency_ms = MAX(max_latency_ms, excluded.max_latency_ms),
+                    total_retrieval_ms = total_retrieval_ms + excluded.total_retrieval_ms,
+                    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                    completion_tokens = completion_tokens + excluded.completion_tokens
+            ''', _aggregate_hourly(records))
+
+    def _flush(self, conn: sqlite3.Connection, records: list):
+        start = time.perf_counter()
+        try:
+            self._write_batch(conn, records)
+        except Exception as e:
+            logger.error(f"批量保存问答历史时出错: {e}")
+            self._record('failed', len(records))
+            return
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._stats['written'] += len(records)
+            self._stats['batches'] += 1
+            self._stats['write_seconds'] += elapsed
+            self._stats['last_batch_size'] = len(records)
+            self._stats['last_batch_ms'] = elapsed * 1000
+        logger.debug(f"问答历史批量写入 {len(records)} 条，耗时 {elapsed * 1000:.1f}ms")
+
+    def _run(self):
+        """后台线程主循环：按条数或时间上限聚合一批后写入"""
+        conn = connect_database(self.db_path)
+        stopping = False
+        try:
+            while not stopping:
+                item = self._queue.get()
+                if item is self._STOP:
+                    self._queue.task_done()
+                    break
+                records = [item]
+                deadline = time.monotonic() + self.flush_interval
+                while len(records) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is self._STOP:
+                        stopping = True
+                        break
+                    records.append(item)
+                self._flush(conn, records)
+                for _ in range(len(records) + (1 if stopping else 0)):
+                    self._queue.task_done()
+            # 将WAL内容检查点写回主库，保证退出后数据落盘
+            conn.execute("PRAGMA wal_checkpoint(FULL)")
+        finally:
+            conn.close()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        等待队列中已提交的记录全部写入
+
+        Args:
+            timeout (float): 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            bool: 是否在超时前写完
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.unfinished_tasks == 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10):
+        """
+        停止后台线程，写完队列中剩余记录并刷盘
+
+        Args:
+            timeout (float): 最长等待时间（秒）
+        """
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"问答历史写入线程未在 {timeout} 秒内退出，剩余 {self._queue.qsize()} 条")
+        else:
+            logger.info("问答历史写入线程已停止，数据已刷盘")
+
+    def stats(self) -> dict:
+        """
+        获取写入统计
+
+        Returns:
+            dict: 包含队列深度、已写入条数、批次数、写入吞吐（条/秒）等
+        """
+        with self._stats_lock:
+            info = dict(self._stats)
+        info['queue_depth'] = self._queue.qsize()
+        info['rows_per_second'] = info['written'] / info['write_seconds'] if info['write_seconds'] else 0.0
+        info['avg_batch_size'] = info['written'] / info['batches'] if info['batches'] else 0.0
+        return info
+
+
+# 全局写入器实例，进程退出时刷盘
+qa_history_writer = QAHistoryWriter()
+atexit.register(qa_history_writer.close)
+
+
+def save_qa_history(group_name: str, user_id: str, device_id: str, question: str, answer: str,
+                    metrics: dict = None):
+    """
+    保存问答历史到SQLite数据库（进入后台写入队列，不阻塞调用方）
+
     Args:
         group_name (str): 分组名称
         user_id (str): 用户ID
         device_id (str): 设备ID
         question (str): 用户问题
         answer (str): 回答内容
+        metrics (dict): 请求指标（耗时、路径、token数、缓存状态等）
     """
     try:
-        db_path = _initialize_database()
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO qa_history (group_name, user_id, device_id, question, answer)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (group_name, user_id, device_id, question, answer))
-        
-        conn.commit()
-        conn.close()
-        logger.info("问答历史保存成功")
+        if qa_history_writer.submit(group_name, user_id, device_id, question, answer, metrics):
+            logger.info("问答历史已加入写入队列")
     except Exception as e:
         logger.error(f"保存问答历史时出错: {e}")
 
 
-async def save_qa_history_async(group_name: str, user_id: str, device_id: str, question: str, answer: str):
+async def save_qa_history_async(group_name: str, user_id: str, device_id: str, question: str, answer: str,
+                                metrics: dict = None):
     """
     异步保存问答历史到SQLite数据库
-    
+
+    入队操作不涉及IO，直接复用同步写入队列
+
     Args:
         group_name (str): 分组名称
         user_id (str): 用户ID
         device_id (str): 设备ID
         question (str): 用户问题
         answer (str): 回答内容
+        metrics (dict): 请求指标（耗时、路径、token数、缓存状态等）
     """
-    try:
-        db_path = await _initialize_database_async()
-        async with aiosqlite.connect(db_path) as db:
-            await db.execute('''
-                INSERT INTO qa_history (group_name, user_id, device_id, question, answer)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (group_name, user_id, device_id, question, answer))
-            await db.commit()
-        logger.info("问答历史异步保存成功")
-    except Exception as e:
-        logger.error(f"异步保存问答历史时出错: {e}")
-        # 异常时尝试同步保存作为兜底方案
-        save_qa_history(group_name, user_id, device_id, question, answer)
+    save_qa_history(group_name, user_id, device_id, question, answer, metrics)
 
 
 def handle_task_exception(task_name: str, task: asyncio.Task):
     """
     处理异步任务异常的回调函数
-    
+
     Args:
         task_name (str): 任务名称
         task (asyncio.Task): 异步任务对象
@@ -122,4 +536,19 @@ def handle_task_exception(task_name: str, task: asyncio.Task):
         task.result()
     except Exception as e:
         logger.error(f"异步任务 {task_name} 执行出错: {e}")
-        # 可以在这里添加额外的错误处理逻辑
\ No newline at end of file
+        # 可以在这里添加额外的错误处理逻辑
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="问答历史数据库维护")
+    parser.add_argument("--migrate", action="store_true", help="建表并执行尚未执行的数据迁移（升级部署前运行）")
+    parser.add_argument("--db", default=QA_HISTORY_DB_PATH, help="数据库文件路径")
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate_conn = connect_database(args.db)
+        try:
+            _create_schema(migrate_conn)
+        finally:
+            migrate_conn.close()
+        logger.info(f"问答历史数据库已是最新版本: {args.db}")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+问答历史查询模块
+基于索引的键集分页查询，避免 OFFSET 分页和全表扫描，千万级数据量下保持稳定耗时
+
+分页游标为上一页最后一条记录的 (timestamp, id)，按时间倒序翻页。
+查询器以只读方式打开数据库，不建表也不执行迁移（由写入器负责），库或表不存在时查询返回空结果
+"""
+
+import os
+import sqlite3
+from log.logger import logger
+from util.tools import TextUtils
+from constant.constants import QA_HISTORY_DB_PATH
+
+
+class QAHistoryQuery:
+    """问答历史查询器"""
+
+    COLUMNS = ("id, group_name, user_id, device_id, question, answer, timestamp, vector_version, route, "
+               "cache_status, latency_ms, retrieval_ms, prompt_tokens, completion_tokens")
+
+    def __init__(self, db_path: str = QA_HISTORY_DB_PATH):
+        """
+        初始化查询器，以只读方式打开数据库
+
+        Args:
+            db_path (str): 数据库文件路径，不存在时不创建
+        """
+        self.db_path = db_path
+        if os.path.exists(db_path):
+            self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+        else:
+            # 还没有任何问答记录（如ETL主机），所有查询返回空结果
+            self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # 按时间窗口统计高频问题时在查询中归一化问题
+        self.conn.create_function("normalize_question", 1, TextUtils.normalize_question, deterministic=True)
+
+    def _fetch(self, sql: str, params: list) -> list:
+        """执行查询，表或列尚未创建（写入器还没有初始化或升级数据库）时返回空结果"""
+        try:
+            return self.conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            if "no such" not in str(e):
+                raise
+            logger.debug(f"问答历史表尚未创建，返回空结果: {e}")
+            return []
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
+
+    def _page(self, where: str, params: list, limit: int, cursor: tuple = None):
+        """
+        执行键集分页查询
+
+        Args:
+            where (str): 过滤条件（需能命中 (字段, timestamp) 索引）
+            params (list): 过滤条件参数
+            limit (int): 每页条数
+            cursor (tuple): 上一页返回的游标 (timestamp, id)，None表示第一页
+
+        Returns:
+            tuple: (记录列表, 下一页游标)，没有下一页时游标为None
+        """
+        params = list(params)
+        if cursor is not None:
+            where += " AND (timestamp, id) < (?, ?)"
+            params.extend(cursor)
+        rows = self._fetch(
+            f"SELECT {self.COLUMNS} FROM qa_history WHERE {where} "
+            f"ORDER BY timestamp DESC, id DESC LIMIT ?",
+            params + [limit]
+        )
+        records = [dict(row) for row in rows]
+        next_cursor = None
+        if len(records) == limit:
+            next_cursor = (records[-1]['timestamp'], records[-1]['id'])
+        return records, next_cursor
+
+    def get_user_history(self, user_id: str, limit: int = 20, cursor: tuple = None):
+        """
+        分页查询某个用户的问答历史（新到旧）
+
+        Args:
+            user_id (str): 用户ID
+            limit (int): 每页条数
+            cursor (tuple): 分页游标
+
+        Returns:
+            tuple: (记录列表, 下一页游标)
+        """
+        return self._page("user_id = ?", [user_id], limit, cursor)
+
+    def get_device_history(self, device_id: str, limit: int = 20, cursor: tuple = None):
+        """
+        分页查询某个设备的问答历史（新到旧）
+
+        Args:
+            device_id (str): 设备ID
+            limit (int): 每页条数
+            cursor (tuple): 分页游标
+
+        Returns:
+            tuple: (记录列表, 下一页游标)
+        """
+        return self._page("device_id = ?", [device_id], limit, cursor)
+
+    def get_group_history(self, group_name: str, start: str = None, end: str = None,
+                          limit: int = 100, cursor: tuple = None):
+        """
+        分页查询某个分组在时间范围内的问答历史（新到旧）
+
+        Args:
+            group_name (str): 分组名称
+            start (str): 起始时间（含），格式 YYYY-MM-DD HH:MM:SS，UTC
+            end (str): 结束时间（不含），格式同上
+            limit (int): 每页条数
+            cursor (tuple): 分页游标
+
+        Returns:
+            tuple: (记录列表, 下一页游标)
+        """
+        where = "group_name = ?"
+        params = [group_name]
+        if start:
+            where += " AND timestamp >= ?"
+            params.append(start)
+        if end:
+            where += " AND timestamp < ?"
+            params.append(end)
+        return self._page(where, params, limit, cursor)
+
+    def top_questions(self, n: int = 10, since: str = None) -> list:
+        """
+        查询出现频次最高的问题（按归一化问题合并）
+
+        不限时间时读取增量维护的频次统计表，沿 count 索引扫描前N条；
+        指定起始时间时频次统计表只有累计值，改为从历史表按归一化问题聚合窗口内的记录
+
+        Args:
+            n (int): 返回条数
+            since (str): 只统计该时间（含）之后的提问，格式 YYYY-MM-DD HH:MM:SS，UTC；
+                         count、first_seen、last_seen 均为窗口内的值
+
+        Returns:
+            list: [{question_norm, sample_question, count, first_seen, last_seen}, ...]
+        """
+        if since:
+            sql = ("SELECT normalize_question(question) AS question_norm, MAX(question) AS sample_question, "
+                   "COUNT(*) AS count, MIN(timestamp) AS first_seen, MAX(timestamp) AS last_seen "
+                   "FROM qa_history WHERE timestamp >= ? GROUP BY question_norm ORDER BY count DESC LIMIT ?")
+            params = [since, n]
+        else:
+            sql = ("SELECT question_norm, sample_question, count, first_seen, last_seen FROM qa_question_stats "
+                   "ORDER BY count DESC LIMIT ?")
+            params = [n]
+        rows = self._fetch(sql, params)
+        logger.debug(f"查询高频问题 top {n}，返回 {len(rows)} 条")
+        return [dict(row) for row in rows]
+
+    def get_group_hourly(self, start: str = None, end: str = None, group_name: str = None) -> list:
+        """
+        查询按 分组 + 小时 汇总的指标，用于分组对比看板
+
+        Args:
+            start (str): 起始小时（含），格式 YYYY-MM-DD HH:00:00，UTC
+            end (str): 结束小时（不含），格式同上
+            group_name (str): 只查询指定分组，None表示全部分组
+
+        Returns:
+            list: 每个 (分组, 小时) 一条记录，附带平均耗时、回退率、缓存命中率
+        """
+        sql = "SELECT * FROM qa_group_hourly WHERE 1 = 1"
+        params = []
+        if group_name:
+            sql += " AND group_name = ?"
+            params.append(group_name)
+        if start:
+            sql += " AND hour >= ?"
+            params.append(start)
+        if end:
+            sql += " AND hour < ?"
+            params.append(end)
+        sql += " ORDER BY hour, group_name"
+        records = []
+        for row in self._fetch(sql, params):
+            record = dict(row)
+            requests = record['requests'] or 1
+            record['avg_latency_ms'] = record['total_latency_ms'] / requests
+            record['fallback_rate'] = record['fallback_requests'] / requests
+            record['cache_hit_rate'] = record['cache_hits'] / requests
+            records.append(record)
+        return records
@@ -1,48 +1,55 @@
 import os
+import time
 import hashlib
-import sqlite3
+import contextvars
 import asyncio
-import aiosqlite
 import functools
-from langchain_community.vectorstores import Chroma
-from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain_cohere import CohereRerank
 from langchain.retrievers import ContextualCompressionRetriever
 from langchain_core.runnables import RunnableBranch, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.documents import Document
+from langchain_community.callbacks import get_openai_callback
 from log.logger import logger
 from cache.cache import ttl_cache
+from cache.answer_cache import answer_cache
+from constant.constants import ANSWER_CACHE_ENABLED, CHROMA_DB_DIR
 
 # 导入向量库加载函数
-from etl.vector_builder import load_vector_store, init_embedding
+from etl.vector_builder import init_embedding
 # 导入版本管理器
 from etl.vector_version_manager import vector_version_manager
+# 导入服务进程的向量库版本池
+from rag.hot_versions import hot_version_pool, ActiveVectorStore
+# 导入影子流量镜像器
+from rag.shadow_traffic import shadow_traffic
 # 导入问答历史管理模块
-from rag.qa_history_manager import save_qa_history, save_qa_history_async, handle_task_exception
+from rag.qa_history_manager import qa_history_writer, save_qa_history, save_qa_history_async, handle_task_exception
+
+
+# 当前请求的检索指标，由检索步骤写入、get_answer读取（LangChain线程池会复制上下文）
+_request_trace = contextvars.ContextVar("request_trace", default=None)
 
 
 @ttl_cache(expire_time=600)  # 10分钟缓存
 def load_vector_store_with_cache(documents, persist_directory: str):
     """
-    从持久化目录加载Chroma向量库，使用缓存机制。
+    加载指向当前活动版本的向量库，使用缓存机制。
+    
+    返回的向量库每次检索都从本进程的版本池取当前活动版本（有只读快照时映射快照），
+    版本切换和回滚不必等缓存过期；版本池的后台线程在切换前预热候选版本
     
     Args:
         documents: 文档列表（此参数仅为保持接口兼容性，实际不使用）
-        persist_directory (str): 向量库存储目录
+        persist_directory (str): 没有活动版本时使用的向量库存储目录
         
     Returns:
-        Chroma: 加载的向量库实例
+        ActiveVectorStore: 向量库实例
     """
-    # 使用版本管理器获取当前活动版本路径
-    active_version_path = vector_version_manager.get_active_version_path()
-    if active_version_path and os.path.exists(active_version_path):
-        return load_vector_store(active_version_path)
-    else:
-        # 如果没有活动版本或路径不存在，回退到原来的persist_directory
-        return load_vector_store(persist_directory)
+    hot_version_pool.fallback_directory = persist_directory
+    hot_version_pool.start()
+    return ActiveVectorStore(hot_version_pool)
 
 
 def _create_prompt_template():
@@ -148,7 +155,94 @@ def _get_group_name(user_id: str, device_id: str, num_groups: int = 2) -> str:
         return "group_0"  # 匿名用户默认分到组0
 
 
-def get_qa_chain(vector_store, top_k: int = 4, user_id: str = None, device_id: str = None):
+@functools.lru_cache(maxsize=4)
+def _create_compressor(top_n: int, cohere_api_key: str = None):
+    """
+    创建重排序器，同一配置只创建一次（交叉编码器模型加载较慢，不应在每个会话创建问答链时重复加载）
+    
+    Args:
+        top_n (int): 重排序后保留的文档数
+        cohere_api_key (str): Cohere API密钥，为空时使用本地交叉编码器
+        
+    Returns:
+        重排序器
+    """
+    # 创建Cohere重排序器
+    if cohere_api_key:
+        from langchain_cohere import CohereRerank
+        # CohereRerank的top_n不应超过base_retriever的k值
+        compressor = CohereRerank(top_n=top_n, cohere_api_key=cohere_api_key)
+        logger.info("使用Cohere重排序器")
+    else:
+        # 如果没有Cohere API密钥，则创建一个基于Cross-Encoder的重排序器作为备用方案
+        try:
+            from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+            from langchain.retrievers.document_compressors import CrossEncoderReranker
+            
+            # 使用交叉编码器作为备用重排序器
+            model = HuggingFaceCrossEncoder(model_name="cross-encoder/ms-marco-MiniLM-L-6-v2")
+            compressor = CrossEncoderReranker(model=model, top_n=top_n)
+            logger.info("使用Cross-Encoder重排序器作为备用方案")
+        except Exception as e:
+            # 如果交叉编码器加载失败，则回退到冗余过滤器
+            logger.warning(f"Cross-Encoder重排序器加载失败，使用冗余过滤器作为备用方案: {e}")
+            from langchain.retrievers.document_compressors import DocumentCompressorPipeline
+            from langchain_community.document_transformers import EmbeddingsRedundantFilter
+            embedding = init_embedding()
+            redundant_filter = EmbeddingsRedundantFilter(embeddings=embedding)
+            compressor = DocumentCompressorPipeline(transformers=[redundant_filter])
+            logger.info("使用冗余过滤器作为备用方案")
+    return compressor
+
+
+def rerank_top_n(top_k: int) -> int:
+    """
+    重排序后保留的文档数，检索结果和答案缓存都按它区分
+    
+    Args:
+        top_k (int): 检索的文档数量
+        
+    Returns:
+        int: 保留的文档数
+    """
+    return min(3, top_k)
+
+
+def warmup(vector_store=None) -> dict:
+    """
+    预热问答路径上的重型依赖：LLM客户端库、嵌入模型（含首次推理）、向量库、重排序器，
+    并同步完成问答历史表的建表与迁移
+    
+    服务进程启动后调用一次，第一个用户请求不再承担这些加载开销
+    
+    Args:
+        vector_store: 已加载的向量库，为None时加载当前活动版本
+        
+    Returns:
+        dict: 各阶段耗时（毫秒）
+    """
+    timings = {}
+    
+    def timed(name, func):
+        start = time.perf_counter()
+        result = func()
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+    
+    timed("qa_history_schema", qa_history_writer.init_schema)
+    timed("import_llm", lambda: __import__("langchain_openai"))
+    embedding = timed("load_embedding", init_embedding)
+    timed("first_embedding", lambda: embedding.embed_query("预热"))
+    if vector_store is None:
+        vector_store = timed("load_vector_store", lambda: load_vector_store_with_cache(None, CHROMA_DB_DIR))
+    timed("first_search", lambda: vector_store.similarity_search("预热", k=1))
+    timed("load_reranker", lambda: _create_compressor(3, os.getenv("COHERE_API_KEY")))
+    logger.info(f"问答系统预热完成，各阶段耗时(ms): {timings}")
+    return timings
+
+
+def get_qa_chain(vector_store, top_k: int = 4, user_id: str = None, device_id: str = None,
+                 group_name: str = None, mirror_traffic: bool = True):
     """
     初始化DeepSeek LLM，创建并返回一个配置好的RetrievalQA链。
     
@@ -157,6 +251,8 @@ def get_qa_chain(vector_store, top_k: int = 4, user_id: str = None, device_id: s
         top_k (int): 检索的文档数量
         user_id (str): 用户ID
         device_id (str): 设备ID
+        group_name (str): 指定分组（用于缓存预热等离线场景），为None时根据用户ID或设备ID计算
+        mirror_traffic (bool): 是否把检索镜像为影子流量，缓存预热等离线调用须传False
         
     Returns:
         RetrievalQA: 配置好的问答链
@@ -169,6 +265,7 @@ def get_qa_chain(vector_store, top_k: int = 4, user_id: str = None, device_id: s
         logger.error("DEEPSEEK_API_KEY 环境变量未设置")
         raise ValueError("DEEPSEEK_API_KEY 环境变量未设置")
         
+    from langchain_openai import ChatOpenAI
     llm = ChatOpenAI(
         model="deepseek-chat",
         temperature=0.7,
@@ -182,35 +279,9 @@ def get_qa_chain(vector_store, top_k: int = 4, user_id: str = None, device_id: s
     base_retriever = vector_store.as_retriever(search_kwargs={"k": 10}, search_type="mmr")
     logger.info("基础检索器创建完成")
     
-    # 创建Cohere重排序器
-    cohere_api_key = os.getenv("COHERE_API_KEY")
-    if cohere_api_key:
-        # CohereRerank的top_n不应超过base_retriever的k值
-        compressor = CohereRerank(top_n=min(3, top_k), cohere_api_key=cohere_api_key)
-        logger.info("使用Cohere重排序器")
-    else:
-        # 如果没有Cohere API密钥，则创建一个基于Cross-Encoder的重排序器作为备用方案
-        try:
-            from langchain.retrievers.document_compressors import DocumentCompressorPipeline
-            from langchain_community.document_transformers import EmbeddingsRedundantFilter
-            from langchain_community.cross_encoders import HuggingFaceCrossEncoder
-            from langchain.retrievers.document_compressors import CrossEncoderReranker
-            
-            # 初始化embedding用于备用重排序器
-            embedding = init_embedding()
-            # 使用交叉编码器作为备用重排序器
-            model = HuggingFaceCrossEncoder(model_name="cross-encoder/ms-marco-MiniLM-L-6-v2")
-            compressor = CrossEncoderReranker(model=model, top_n=min(3, top_k))
-            logger.info("使用Cross-Encoder重排序器作为备用方案")
-        except Exception as e:
-            # 如果交叉编码器加载失败，则回退到冗余过滤器
-            logger.warning(f"Cross-Encoder重排序器加载失败，使用冗余过滤器作为备用方案: {e}")
-            from langchain.retrievers.document_compressors import DocumentCompressorPipeline
-            from langchain_community.document_transformers import EmbeddingsRedundantFilter
-            embedding = init_embedding()
-            redundant_filter = EmbeddingsRedundantFilter(embeddings=embedding)
-            compressor = DocumentCompressorPipeline(transformers=[redundant_filter])
-            logger.info("使用冗余过滤器作为备用方案")
+    # 创建重排序器（同一配置在进程内复用）
+    top_n = rerank_top_n(top_k)
+    compressor = _create_compressor(top_n, os.getenv("COHERE_API_KEY"))
     
     # 创建压缩检索器
     compression_retriever = ContextualCompressionRetriever(
@@ -252,7 +323,8 @@ def get_qa_chain(vector_store, top_k: int = 4, user_id: str = None, device_id: s
     logger.info("回退链B创建完成")
     
     # 根据用户ID确定分组并选择回退链
-    group_name = _get_group_name(user_id, device_id, num_groups=2)
+    if group_name is None:
+        group_name = _get_group_name(user_id, device_id, num_groups=2)
     
     # 如果是A组，使用fallback_chain_a，否则使用fallback_chain_b
     if group_name == "group_0":
@@ -262,9 +334,39 @@ def get_qa_chain(vector_store, top_k: int = 4, user_id: str = None, device_id: s
         selected_fallback_chain = fallback_chain_b
         logger.info("选择回退链B（说不知道）")
     
+    # 检索结果与分组无关，按 问题 + 向量库版本 + 保留文档数 缓存
+    def cached_retrieve(question):
+        if not ANSWER_CACHE_ENABLED:
+            return compression_retriever.get_relevant_documents(question)
+        version = vector_version_manager.get_active_version()
+        cached = answer_cache.get(question, version, "", kind="retrieval", top_n=top_n)
+        if cached is not None:
+            logger.info("检索结果命中缓存")
+            return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in cached]
+        docs = compression_retriever.get_relevant_documents(question)
+        answer_cache.put(question, version, "", [
+            {"page_content": d.page_content, "metadata": d.metadata} for d in docs
+        ], kind="retrieval", top_n=top_n)
+        return docs
+    
+    # 只镜像线上用户请求的检索（向量库跟随活动版本）；缓存预热等离线调用由调用方关闭，不产生影子流量
+    mirror_traffic = mirror_traffic and isinstance(vector_store, ActiveVectorStore)
+    
+    def retrieve_docs(question):
+        start = time.perf_counter()
+        docs = cached_retrieve(question)
+        trace = _request_trace.get()
+        if trace is not None:
+            trace["retrieval_ms"] = (time.perf_counter() - start) * 1000
+            trace["route"] = "rag" if docs else "fallback"
+        if mirror_traffic:
+            # 按采样比例异步回放到候选版本，不影响本次响应
+            shadow_traffic.mirror(question, base_retriever.search_type, base_retriever.search_kwargs)
+        return docs
+    
     # 创建检索步骤
     retrieval_step = RunnablePassthrough.assign(
-        docs=lambda x: compression_retriever.get_relevant_documents(x["question"])
+        docs=lambda x: retrieve_docs(x["question"])
     )
     logger.info("检索步骤创建完成")
 
@@ -279,7 +381,9 @@ def get_qa_chain(vector_store, top_k: int = 4, user_id: str = None, device_id: s
     full_chain = full_chain.with_config({
         "metadata": {
             "user_id": user_id,
-            "device_id": device_id
+            "device_id": device_id,
+            "group_name": group_name,
+            "top_n": top_n
         }
     })
     logger.info("元数据添加完成")
@@ -296,24 +400,52 @@ def get_answer(question, qa_chain, top_k: int = 4):
     # 更新 retriever 的 k 值
     # 注意：由于当前实现中top_k在链创建时已经固定，这里无法动态修改
     # 在新的LCEL实现中，top_k参数在get_qa_chain时已经设置
-    logger.info("开始调用问答链")
-    try:
-        result = qa_chain.invoke({"question": question})
-        logger.info("问题处理完成")
-        logger.info(f"问答链返回结果: {result}")
-    except Exception as e:
-        logger.error(f"问答链调用失败: {e}", exc_info=True)
-        raise
     
     # 获取用户ID和设备ID
     metadata = qa_chain.config.get("metadata", {}) if hasattr(qa_chain, 'config') else {}
     user_id = metadata.get('user_id', None)
     device_id = metadata.get('device_id', hashlib.md5(os.urandom(16)).hexdigest())
     
-    # 获取分组名称
-    group_name = _get_group_name(user_id, device_id)
+    # 获取分组名称（优先使用创建问答链时确定的分组）
+    group_name = metadata.get('group_name') or _get_group_name(user_id, device_id)
+    # 答案随重排序保留的文档数变化，以创建问答链时的配置为准
+    top_n = metadata.get('top_n') or rerank_top_n(top_k)
     logger.info(f"用户分组: {group_name}, 用户ID: {user_id}, 设备ID: {device_id}")
     
+    start = time.perf_counter()
+    version = vector_version_manager.get_active_version()
+    metrics = {"vector_version": version, "cache_status": "miss", "prompt_tokens": 0, "completion_tokens": 0}
+    
+    # 先查答案缓存，命中则不再调用问答链
+    result = None
+    if ANSWER_CACHE_ENABLED:
+        result, tier = answer_cache.lookup(question, version, group_name, top_n=top_n)
+        if result is not None:
+            logger.info(f"答案命中{tier}缓存")
+            metrics.update(route="cache", cache_status=tier)
+    
+    if result is None:
+        logger.info("开始调用问答链")
+        trace = {}
+        token = _request_trace.set(trace)
+        try:
+            with get_openai_callback() as token_usage:
+                result = qa_chain.invoke({"question": question})
+            logger.info("问题处理完成")
+            logger.info(f"问答链返回结果: {result}")
+        except Exception as e:
+            logger.error(f"问答链调用失败: {e}", exc_info=True)
+            raise
+        finally:
+            _request_trace.reset(token)
+        metrics.update(trace)
+        metrics.update(prompt_tokens=token_usage.prompt_tokens, completion_tokens=token_usage.completion_tokens)
+        if ANSWER_CACHE_ENABLED:
+            answer_cache.put(question, version, group_name, result, top_n=top_n)
+    
+    metrics["latency_ms"] = (time.perf_counter() - start) * 1000
+    logger.info(f"请求指标: {metrics}")
+    
     # 异步保存问答历史
     try:
         # 检查是否存在事件循环
@@ -325,19 +457,19 @@ def get_answer(question, qa_chain, top_k: int = 4):
         if loop and loop.is_running():
             # 如果事件循环正在运行，则创建异步任务
             task = loop.create_task(
-                save_qa_history_async(group_name, user_id, device_id, question, result)
+                save_qa_history_async(group_name, user_id, device_id, question, result, metrics)
             )
             # 添加任务完成回调，用于处理异常
             task.add_done_callback(functools.partial(handle_task_exception, "保存问答历史"))
             logger.info("异步保存问答历史任务已创建")
         else:
             # 如果没有运行中的事件循环，则使用同步方法
-            save_qa_history(group_name, user_id, device_id, question, result)
+            save_qa_history(group_name, user_id, device_id, question, result, metrics)
             logger.info("同步保存问答历史完成")
     except Exception as e:
         # 如果异步保存失败，回退到同步方法
         logger.warning(f"异步保存问答历史失败，回退到同步方法: {e}")
-        save_qa_history(group_name, user_id, device_id, question, result)
+        save_qa_history(group_name, user_id, device_id, question, result, metrics)
         logger.info("同步保存问答历史完成")
     
     # 返回结果，保持与之前相同的格式
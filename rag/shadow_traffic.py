@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+影子流量模块
+按采样比例把线上检索请求镜像到候选版本：问答链的检索步骤只把问题放入队列，
+后台线程在候选版本和活动版本上执行同样的向量检索，记录两者的检索延迟和结果差异，
+为上线前的候选版本提供真实流量下的性能证据。回放在后台进行，队列满时丢弃采样，不影响用户响应
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import random
+import sqlite3
+import argparse
+import threading
+import numpy as np
+# 添加项目根目录到Python路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from log.logger import logger
+from etl.version_gate import result_key
+from etl.version_meta import update_version_meta
+from constant.constants import (
+    SHADOW_TRAFFIC_SAMPLE_RATE,
+    SHADOW_TRAFFIC_DB_PATH,
+    SHADOW_TRAFFIC_MAX_QUEUE_SIZE,
+)
+
+
+def connect_database(db_path: str = SHADOW_TRAFFIC_DB_PATH) -> sqlite3.Connection:
+    """
+    连接影子流量数据库并初始化表结构
+
+    Args:
+        db_path (str): 数据库文件路径
+
+    Returns:
+        sqlite3.Connection: 数据库连接
+    """
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS shadow_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            question TEXT NOT NULL,
+            active_version TEXT,
+            candidate_version TEXT NOT NULL,
+            active_ms REAL,
+            candidate_ms REAL,
+            overlap REAL,
+            top1_match INTEGER,
+            active_keys TEXT,
+            candidate_keys TEXT,
+            error TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_shadow_candidate ON shadow_results (candidate_version)")
+    conn.commit()
+    return conn
+
+
+def _search(vector_store, vector, search_type: str, search_kwargs: dict) -> tuple:
+    """按问答链检索器的检索方式执行一次向量检索，返回 (结果标识列表, 耗时毫秒)"""
+    start_time = time.perf_counter()
+    if search_type == "mmr":
+        docs = vector_store.max_marginal_relevance_search_by_vector(vector, **search_kwargs)
+    else:
+        docs = vector_store.similarity_search_by_vector(vector, **search_kwargs)
+    return [result_key(doc) for doc in docs], (time.perf_counter() - start_time) * 1000
+
+
+class ShadowTraffic:
+    """影子流量镜像器"""
+
+    # 队列中的停止信号
+    _STOP = object()
+
+    def __init__(self, pool=None, db_path: str = SHADOW_TRAFFIC_DB_PATH,
+                 sample_rate: float = SHADOW_TRAFFIC_SAMPLE_RATE,
+                 max_queue_size: int = SHADOW_TRAFFIC_MAX_QUEUE_SIZE):
+        """
+        初始化镜像器
+
+        Args:
+            pool (HotVersionPool): 服务进程的向量库版本池，为None时使用全局版本池
+            db_path (str): 影子流量数据库路径
+            sample_rate (float): 镜像的请求比例
+            max_queue_size (int): 待回放队列上限
+        """
+        self._pool = pool
+        self.db_path = db_path
+        self.sample_rate = sample_rate
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'mirrored': 0, 'recorded': 0, 'dropped': 0, 'failed': 0}
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            # 延迟导入，避免与 rag_core 循环依赖
+            from rag.hot_versions import hot_version_pool
+            self._pool = hot_version_pool
+        return self._pool
+
+    def _record(self, field: str, value=1):
+        with self._stats_lock:
+            self._stats[field] += value
+
+    def _ensure_started(self):
+        """首次镜像时启动后台线程；fork出的子进程中重新启动"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="shadow-traffic", daemon=True)
+            self._thread.start()
+            logger.info(f"影子流量回放线程已启动: {self.db_path}")
+
+    def candidate_version(self) -> str:
+        """
+        当前接收影子流量的候选版本：显式设置的影子版本，没有时为正在预热的备用版本
+
+        Returns:
+            str: 版本号，没有候选版本或候选版本就是活动版本时返回None
+        """
+        manager = self.pool.manager
+        candidate = manager.get_shadow_version() or manager.get_standby_version()
+        if not candidate or candidate == manager.get_active_version():
+            return None
+        return candidate
+
+    def mirror(self, question: str, search_type: str = "mmr", search_kwargs: dict = None) -> bool:
+        """
+        按采样比例把一次检索镜像到候选版本，立即返回，任何错误都不向调用方抛出
+
+        Args:
+            question (str): 用户问题
+            search_type (str): 问答链检索器的检索方式
+            search_kwargs (dict): 问答链检索器的检索参数
+
+        Returns:
+            bool: 是否进入回放队列
+        """
+        try:
+            if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+                return False
+            candidate = self.candidate_version()
+            if candidate is None:
+                return False
+            self._ensure_started()
+            self._queue.put_nowait((question, candidate, search_type, dict(search_kwargs or {"k": 4})))
+        except queue.Full:
+            self._record('dropped')
+            return False
+        except Exception as e:
+            logger.debug(f"镜像影子流量失败: {e}")
+            return False
+        self._record('mirrored')
+        return True
+
+    def replay(self, question: str, candidate: str, search_type: str, search_kwargs: dict) -> dict:
+        """
+        在候选版本和活动版本上执行同样的检索并比较
+
+        两个版本使用同一个查询向量（嵌入模型不同时各自计算），嵌入计算不计入检索耗时
+
+        Returns:
+            dict: 一条影子流量记录
+        """
+        active_version, active_store = self.pool.current()
+        candidate_store = self.pool.load(candidate)
+        active_vector = active_store.embeddings.embed_query(question)
+        candidate_vector = active_vector if candidate_store.embeddings is active_store.embeddings \
+            else candidate_store.embeddings.embed_query(question)
+
+        candidate_keys, candidate_ms = _search(candidate_store, candidate_vector, search_type, search_kwargs)
+        active_keys, active_ms = _search(active_store, active_vector, search_type, search_kwargs)
+        expected = set(active_keys)
+        return {
+            "created_at": time.time(),
+            "question": question,
+            "active_version": active_version,
+            "candidate_version": candidate,
+            "active_ms": active_ms,
+            "candidate_ms": candidate_ms,
+            "overlap": len(expected.intersection(candidate_keys)) / len(expected) if expected else 1.0,
+            "top1_match": int(active_keys[:1] == candidate_keys[:1]),
+            "active_keys": json.dumps(active_keys, ensure_ascii=False),
+            "candidate_keys": json.dumps(candidate_keys, ensure_ascii=False),
+            "error": None,
+        }
+
+    def _save(self, conn: sqlite3.Connection, record: dict):
+        columns = list(record)
+        with conn:
+            conn.execute(f"INSERT INTO shadow_results ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                         [record[column] for column in columns])
+
+    def _run(self):
+        """后台线程主循环：逐条回放并写入结果"""
+        conn = connect_database(self.db_path)
+        try:
+            while True:
+                item = self._queue.get()
+                try:
+                    if item is self._STOP:
+                        break
+                    question, candidate = item[0], item[1]
+                    try:
+                        record = self.replay(*item)
+                    except Exception as e:
+                        # 候选版本检索出错本身是上线前需要发现的问题，同样记录
+                        logger.warning(f"影子流量回放失败 [{candidate}] {question}: {e}")
+                        self._record('failed')
+                        record = {"created_at": time.time(), "question": question,
+                                  "candidate_version": candidate, "error": str(e)}
+                    try:
+                        self._save(conn, record)
+                        self._record('recorded')
+                    except Exception as e:
+                        logger.error(f"保存影子流量记录失败: {e}")
+                finally:
+                    self._queue.task_done()
+        finally:
+            conn.close()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        等待队列中的采样全部回放完成
+
+        Args:
+            timeout (float): 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            bool: 是否在超时前完成
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10):
+        """停止后台线程，队列中已有的采样回放完后退出"""
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """
+        获取镜像统计
+
+        Returns:
+            dict: 镜像、记录、丢弃、失败的次数及队列深度
+        """
+        with self._stats_lock:
+            info = dict(self._stats)
+        info['queue_depth'] = self._queue.qsize()
+        return info
+
+
+def shadow_report(version: str, db_path: str = SHADOW_TRAFFIC_DB_PATH) -> dict:
+    """
+    汇总候选版本的影子流量结果
+
+    Args:
+        version (str): 候选版本号
+        db_path (str): 影子流量数据库路径
+
+    Returns:
+        dict: 请求数、失败数、两个版本的p50/p95检索延迟、平均重合率、首条结果一致率和重合率最低的问题
+    """
+    conn = connect_database(db_path)
+    try:
+        rows = conn.execute('''
+            SELECT question, active_version, active_ms, candidate_ms, overlap, top1_match, error
+            FROM shadow_results WHERE candidate_version = ? ORDER BY id
+        ''', (version,)).fetchall()
+    finally:
+        conn.close()
+
+    succeeded = [row for row in rows if row[6] is None]
+    report = {"candidate_version": version, "requests": len(rows), "errors": len(rows) - len(succeeded)}
+    if not succeeded:
+        return report
+
+    def latency(values):
+        return {"p50_ms": round(float(np.percentile(values, 50)), 3),
+                "p95_ms": round(float(np.percentile(values, 95)), 3)}
+
+    worst = sorted(succeeded, key=lambda row: row[4])[:5]
+    report.update({
+        "active_versions": sorted({row[1] for row in succeeded if row[1]}),
+        "active": latency([row[2] for row in succeeded]),
+        "candidate": latency([row[3] for row in succeeded]),
+        "overlap": round(float(np.mean([row[4] for row in succeeded])), 4),
+        "top1_match_rate": round(float(np.mean([row[5] for row in succeeded])), 4),
+        "lowest_overlap_questions": [{"question": row[0], "overlap": round(row[4], 4)}
+                                     for row in worst if row[4] < 1.0],
+    })
+    return report
+
+
+# 全局镜像器实例
+shadow_traffic = ShadowTraffic()
+
+
+if __name__ == "__main__":
+    from etl.vector_version_manager import vector_version_manager
+
+    parser = argparse.ArgumentParser(description="管理候选向量库版本的影子流量")
+    parser.add_argument("--start", metavar="VERSION", help="开始向该版本镜像影子流量")
+    parser.add_argument("--stop", action="store_true", help="停止镜像影子流量")
+    parser.add_argument("--report", metavar="VERSION", help="汇总该版本的影子流量结果并写入版本元数据")
+    args = parser.parse_args()
+
+    if args.start:
+        sys.exit(0 if vector_version_manager.start_shadow(args.start) else 1)
+    if args.stop:
+        vector_version_manager.stop_shadow()
+    if args.report:
+        result = shadow_report(args.report)
+        version_path = os.path.join(vector_version_manager.base_directory, args.report)
+        if os.path.exists(version_path):
+            update_version_meta(version_path, shadow_traffic=result)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
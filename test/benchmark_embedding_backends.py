@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+嵌入后端对比基准测试
+对同一批片段分别用 PyTorch 原始精度和 ONNX int8 量化后端计算向量，输出：
+    - 吞吐量（文档/秒）
+    - 检索召回率 recall@k：以PyTorch向量的精确近邻为基准，int8向量检索结果的重合比例
+    - 同一文本两种向量的平均余弦相似度
+
+用法:
+    python test/benchmark_embedding_backends.py --limit 2000 --queries 200
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.vector_builder import init_embedding
+from etl.document_processor import load_and_process_documents
+from constant.constants import DATA_DIR
+
+
+def encode(embedding, texts, queries):
+    """
+    计算片段和查询的向量
+
+    Returns:
+        tuple: (片段向量矩阵, 查询向量矩阵, 文档/秒)
+    """
+    start_time = time.time()
+    doc_vectors = np.asarray(embedding.embed_documents(texts), dtype=np.float32)
+    docs_per_second = len(texts) / (time.time() - start_time)
+    query_vectors = np.asarray([embedding.embed_query(query) for query in queries], dtype=np.float32)
+    return doc_vectors, query_vectors, docs_per_second
+
+
+def top_k(doc_vectors, query_vectors, k):
+    """精确内积检索（向量已归一化，等价于余弦相似度）"""
+    scores = query_vectors @ doc_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入后端对比基准测试")
+    parser.add_argument("--data-path", default=DATA_DIR, help="文档目录")
+    parser.add_argument("--limit", type=int, default=2000, help="最多使用的片段数")
+    parser.add_argument("--queries", type=int, default=200, help="查询数（从片段中抽样截取开头作为查询）")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 的 k")
+    args = parser.parse_args()
+
+    texts = [doc.page_content for doc in load_and_process_documents(args.data_path)[:args.limit]]
+    random.seed(0)
+    queries = [text[:64] for text in random.sample(texts, min(args.queries, len(texts)))]
+
+    results = {}
+    for backend in ("torch", "onnx-int8"):
+        embedding = init_embedding(backend)
+        results[backend] = encode(embedding, texts, queries)
+        print(f"{backend:>10}: 模型 {getattr(embedding, 'model_name', type(embedding).__name__)}, "
+              f"{results[backend][2]:.1f} 文档/秒")
+
+    baseline_docs, baseline_queries, baseline_speed = results["torch"]
+    int8_docs, int8_queries, int8_speed = results["onnx-int8"]
+    if baseline_docs.shape[1] != int8_docs.shape[1]:
+        print("两种后端向量维度不同（ONNX后端可能未加载成功），无法比较召回率")
+        return
+
+    expected = top_k(baseline_docs, baseline_queries, args.k)
+    actual = top_k(int8_docs, int8_queries, args.k)
+    recall = np.mean([len(set(e) & set(a)) / args.k for e, a in zip(expected, actual)])
+    cosine = np.mean(np.sum(baseline_docs * int8_docs, axis=1))
+    print(f"片段数: {len(texts)}, 查询数: {len(queries)}")
+    print(f"int8 加速比: {int8_speed / baseline_speed:.2f}, recall@{args.k}: {recall:.4f}, 平均余弦相似度: {cosine:.4f}")
+
+
+if __name__ == "__main__":
+    main()
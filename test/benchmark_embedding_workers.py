@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+嵌入工作进程数基准测试
+用同一批文档分别以 1..N 个嵌入工作进程构建向量库，输出吞吐量（文档/秒）和相对单进程的加速比
+
+用法:
+    python test/benchmark_embedding_workers.py --max-workers 8 --limit 5000
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+import etl.vector_builder as vector_builder
+from etl.document_processor import load_and_process_documents
+from constant.constants import DATA_DIR, VECTOR_STORE_BATCH_SIZE
+
+
+def run_benchmark(documents, worker_counts, batch_size):
+    """
+    依次以不同的工作进程数构建向量库
+
+    Args:
+        documents (list): 文档列表
+        worker_counts (list): 要测试的工作进程数
+        batch_size (int): 批大小
+
+    Returns:
+        list: [(工作进程数, 耗时秒数, 文档/秒), ...]
+    """
+    # 关闭片段向量缓存，保证每一轮都真实调用模型
+    vector_builder.EMBEDDING_STORE_ENABLED = False
+    # 主进程先加载模型，不计入各轮耗时
+    vector_builder.init_embedding()
+    results = []
+    for num_workers in worker_counts:
+        persist_directory = tempfile.mkdtemp(prefix="bench_chroma_")
+        try:
+            start_time = time.time()
+            vector_builder.build_vector_store(documents, persist_directory, batch_size, num_workers=num_workers)
+            elapsed = time.time() - start_time
+        finally:
+            shutil.rmtree(persist_directory, ignore_errors=True)
+        results.append((num_workers, elapsed, len(documents) / elapsed))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入工作进程数基准测试")
+    parser.add_argument("--data-path", default=DATA_DIR, help="文档目录")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="最大工作进程数")
+    parser.add_argument("--limit", type=int, default=0, help="最多使用的片段数，0表示全部")
+    parser.add_argument("--batch-size", type=int, default=VECTOR_STORE_BATCH_SIZE, help="批大小")
+    args = parser.parse_args()
+
+    documents = load_and_process_documents(args.data_path)
+    if args.limit:
+        documents = documents[:args.limit]
+    worker_counts = sorted({1, 2, 4, 8, 16, args.max_workers} & set(range(1, args.max_workers + 1)))
+
+    results = run_benchmark(documents, worker_counts, args.batch_size)
+    baseline = results[0][2]
+    print(f"片段数: {len(documents)}, 批大小: {args.batch_size}, CPU核数: {os.cpu_count()}")
+    print(f"{'进程数':>6} {'耗时(秒)':>10} {'文档/秒':>10} {'加速比':>8}")
+    for num_workers, elapsed, docs_per_second in results:
+        print(f"{num_workers:>6} {elapsed:>10.1f} {docs_per_second:>10.1f} {docs_per_second / baseline:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
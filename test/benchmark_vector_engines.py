@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+向量库引擎基准测试
+在不同语料规模下分别用各引擎（VECTOR_ENGINES）构建向量库，输出构建耗时、重新加载耗时（含首次检索）、
+查询延迟（p50/p95）以及相对float32暴力检索的 recall@10；snapshot 为导出的只读快照（构建耗时含导出）
+
+向量按聚类分布随机生成并直接写入集合，不调用嵌入模型，只比较引擎本身
+
+用法:
+    python test/benchmark_vector_engines.py --sizes 1000 10000 100000 --dim 384
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from langchain_core.embeddings import FakeEmbeddings
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.vector_builder import VECTOR_ENGINES, open_vector_store
+from etl.compact_vectors import exact_search
+from etl.index_snapshot import SnapshotVectorStore, export_snapshot
+
+
+def synthetic_vectors(count: int, dim: int, num_clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """生成按簇分布的归一化向量，近似真实句向量的分布"""
+    rng = np.random.RandomState(seed)
+    centers = rng.normal(size=(num_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.randint(num_clusters, size=count)] + rng.normal(scale=0.6, size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def reset_engine_caches():
+    """清除Chroma在进程内缓存的客户端，使重新加载的耗时与新进程一致"""
+    try:
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+    except Exception:
+        pass
+
+
+def benchmark_engine(engine: str, vectors: np.ndarray, queries: np.ndarray, expected: list, k: int = 10,
+                     batch_size: int = 500) -> dict:
+    """
+    用一个引擎构建、加载并检索
+
+    Returns:
+        dict: {build_s, load_ms, p50_ms, p95_ms, recall}
+    """
+    embedding = FakeEmbeddings(size=vectors.shape[1])
+    directory = tempfile.mkdtemp(prefix=f"bench_{engine}_")
+    try:
+        start_time = time.time()
+        store = open_vector_store(directory, embedding, "flat" if engine == "snapshot" else engine)
+        for start in range(0, len(vectors), batch_size):
+            rows = range(start, min(start + batch_size, len(vectors)))
+            store._collection.upsert(ids=[str(row) for row in rows], embeddings=vectors[start:start + batch_size],
+                                     documents=[f"片段{row}" for row in rows], metadatas=[{"row": row} for row in rows])
+        if engine == "snapshot":
+            export_snapshot(store, directory)
+        build_seconds = time.time() - start_time
+        del store
+        reset_engine_caches()
+
+        start_time = time.time()
+        if engine == "snapshot":
+            store = SnapshotVectorStore(directory, embedding)
+        else:
+            store = open_vector_store(directory, embedding, engine)
+        store.similarity_search_by_vector(queries[0].tolist(), k=k)
+        load_ms = (time.time() - start_time) * 1000
+
+        latencies = []
+        hits = 0
+        for query, truth in zip(queries, expected):
+            start_time = time.time()
+            documents = store.similarity_search_by_vector(query.tolist(), k=k)
+            latencies.append((time.time() - start_time) * 1000)
+            hits += len(truth.intersection(doc.metadata["row"] for doc in documents))
+        return {
+            "build_s": build_seconds,
+            "load_ms": load_ms,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "recall": hits / (k * len(queries)),
+        }
+    finally:
+        reset_engine_caches()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量库引擎基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="语料规模（向量数）")
+    parser.add_argument("--dim", type=int, default=384, help="向量维度")
+    parser.add_argument("--queries", type=int, default=100, help="查询数")
+    parser.add_argument("--engines", nargs="+", default=list(VECTOR_ENGINES) + ["snapshot"],
+                        help="参与比较的引擎")
+    args = parser.parse_args()
+
+    print(f"{'引擎':>8} {'向量数':>8} {'构建(秒)':>9} {'加载(ms)':>9} {'p50(ms)':>8} {'p95(ms)':>8} {'recall@10':>10}")
+    for size in args.sizes:
+        vectors = synthetic_vectors(size, args.dim)
+        rng = np.random.RandomState(1)
+        queries = vectors[rng.choice(size, min(args.queries, size), replace=False)]
+        queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+        expected = [set(exact_search(vectors, query, 10)) for query in queries]
+        for engine in args.engines:
+            result = benchmark_engine(engine, vectors, queries, expected)
+            print(f"{engine:>8} {size:>8} {result['build_s']:>9.1f} {result['load_ms']:>9.1f} "
+                  f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['recall']:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
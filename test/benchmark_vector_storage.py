@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+向量存储模式基准测试
+对同一批向量分别构建 float16 / pq 紧凑索引，输出每百万向量的常驻内存、相对float32暴力检索的 recall@10
+和单次查询耗时；向量取自已构建的版本，或按聚类分布随机生成
+
+用法:
+    python test/benchmark_vector_storage.py --version-path vector_store/chroma_v001
+    python test/benchmark_vector_storage.py --synthetic 200000 --dim 384
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.compact_vectors import CompactVectorIndex, exact_search
+from constant.constants import VECTOR_RESCORE_CANDIDATES, VECTOR_PQ_SUBVECTORS
+
+
+def load_version_vectors(version_path: str, batch_size: int = 1000) -> np.ndarray:
+    """读取版本中Chroma集合的全部向量"""
+    import chromadb
+    collection = chromadb.PersistentClient(path=version_path).get_collection("langchain")
+    blocks = []
+    for offset in range(0, collection.count(), batch_size):
+        result = collection.get(limit=batch_size, offset=offset, include=["embeddings"])
+        blocks.append(np.asarray(result["embeddings"], dtype=np.float32))
+    return np.concatenate(blocks)
+
+
+def synthetic_vectors(count: int, dim: int, num_clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """生成按簇分布的归一化向量，近似真实句向量的分布"""
+    rng = np.random.RandomState(seed)
+    centers = rng.normal(size=(num_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.randint(num_clusters, size=count)] + rng.normal(scale=0.6, size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run_benchmark(vectors: np.ndarray, num_queries: int, candidates_list: list, k: int = 10) -> list:
+    """
+    依次构建各模式的紧凑索引并评估
+
+    Returns:
+        list: [(模式, 候选数, 每百万向量MB, recall@k, 查询毫秒, 构建秒数), ...]
+    """
+    rng = np.random.RandomState(1)
+    queries = vectors[rng.choice(len(vectors), num_queries, replace=False)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    expected = [set(exact_search(vectors, query, k)) for query in queries]
+    ids = [str(i) for i in range(len(vectors))]
+
+    float32_mb = vectors.shape[1] * 4 * 1e6 / 1024 / 1024
+    results = [("float32", 0, float32_mb, 1.0, 0.0, 0.0)]
+    for mode in ("float16", "pq"):
+        directory = tempfile.mkdtemp(prefix="bench_compact_")
+        try:
+            start_time = time.time()
+            index = CompactVectorIndex.build(directory, ids, vectors, mode, pq_subvectors=VECTOR_PQ_SUBVECTORS)
+            build_seconds = time.time() - start_time
+            memory_mb = index.bytes_per_vector() * 1e6 / 1024 / 1024
+            for candidates in candidates_list:
+                hits = 0
+                start_time = time.time()
+                for query, truth in zip(queries, expected):
+                    hits += len(truth.intersection(row for row, _ in index.search(query, k, candidates)))
+                query_ms = (time.time() - start_time) * 1000 / len(queries)
+                results.append((mode, candidates, memory_mb, hits / (k * len(queries)), query_ms, build_seconds))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量存储模式基准测试")
+    parser.add_argument("--version-path", help="已构建的版本目录，读取其中的向量")
+    parser.add_argument("--synthetic", type=int, default=100000, help="未指定版本目录时随机生成的向量数")
+    parser.add_argument("--dim", type=int, default=384, help="随机向量维度")
+    parser.add_argument("--queries", type=int, default=200, help="查询数")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[50, VECTOR_RESCORE_CANDIDATES, 200],
+                        help="粗排候选数")
+    args = parser.parse_args()
+
+    vectors = load_version_vectors(args.version_path) if args.version_path \
+        else synthetic_vectors(args.synthetic, args.dim)
+    results = run_benchmark(vectors, min(args.queries, len(vectors)), args.candidates)
+    print(f"向量数: {len(vectors)}, 维度: {vectors.shape[1]}")
+    print(f"{'模式':>8} {'候选数':>6} {'MB/百万向量':>12} {'recall@10':>10} {'查询(ms)':>9} {'构建(秒)':>9}")
+    for mode, candidates, memory_mb, recall, query_ms, build_seconds in results:
+        print(f"{mode:>8} {candidates:>6} {memory_mb:>12.1f} {recall:>10.4f} {query_ms:>9.2f} {build_seconds:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
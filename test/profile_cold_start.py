@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+入口冷启动分析
+在全新的Python进程中用 -X importtime 统计各入口的导入耗时，并列出耗时最多的第三方包；
+可选地在全新进程中走一遍 预热 -> 创建问答链 -> 回答第一个问题，输出首个答案的各阶段耗时
+
+入口:
+    app.py 首屏         app.py 顶层导入（页面渲染前必须完成的部分）
+    app.py 问答初始化   rag.rag_core（页面渲染后初始化问答系统时导入）
+    etl/scheduled_etl.py
+    crawl/baidu_baike_crawler.py
+
+用法:
+    python test/profile_cold_start.py
+    python test/profile_cold_start.py --answer "足三里在哪里"
+"""
+
+import os
+import re
+import ast
+import sys
+import json
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def app_page_imports() -> str:
+    """取出 app.py 的顶层导入语句"""
+    with open(os.path.join(PROJECT_ROOT, "app.py"), "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def profile_imports(code: str, top_n: int = 8) -> dict:
+    """
+    在全新进程中执行导入代码并统计耗时
+
+    Args:
+        code (str): 导入代码
+        top_n (int): 列出耗时最多的包数
+
+    Returns:
+        dict: {total_ms, top_packages: [(包名, 毫秒), ...]}，导入失败时带 error
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=PROJECT_ROOT,
+                             capture_output=True, text=True)
+    by_package = defaultdict(int)
+    total_us = 0
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        by_package[module.split(".")[0]] += int(self_us)
+        # 缩进为1的是代码直接导入的模块，累计耗时之和即总导入耗时
+        if len(indent) == 1:
+            total_us += int(cumulative_us)
+    result = {
+        "total_ms": round(total_us / 1000, 1),
+        "top_packages": [(name, round(us / 1000, 1))
+                         for name, us in sorted(by_package.items(), key=lambda item: -item[1])[:top_n]],
+    }
+    if process.returncode != 0:
+        result["error"] = process.stderr.strip().splitlines()[-1]
+    return result
+
+
+def first_answer_timeline(question: str) -> dict:
+    """在当前进程中从零开始回答第一个问题，记录各阶段耗时（毫秒）"""
+    timings = {}
+    start = time.perf_counter()
+    from dotenv import load_dotenv
+    load_dotenv()
+    from rag.rag_core import warmup, load_vector_store_with_cache, get_qa_chain, get_answer
+    from constant.constants import CHROMA_DB_DIR
+    timings["import"] = (time.perf_counter() - start) * 1000
+    timings["warmup"] = warmup()
+    stage = time.perf_counter()
+    vector_store = load_vector_store_with_cache(None, CHROMA_DB_DIR)
+    qa_chain = get_qa_chain(vector_store)
+    timings["create_chain"] = (time.perf_counter() - stage) * 1000
+    stage = time.perf_counter()
+    get_answer(question, qa_chain)
+    timings["first_answer"] = (time.perf_counter() - stage) * 1000
+    timings["time_to_first_answer"] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入口冷启动分析")
+    parser.add_argument("--answer", help="回答该问题并输出首个答案的各阶段耗时（需要API密钥和已构建的向量库）")
+    parser.add_argument("--timeline", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.timeline:
+        print(json.dumps(first_answer_timeline(args.timeline), ensure_ascii=False))
+        return
+
+    entries = {
+        "app.py 首屏": app_page_imports(),
+        "app.py 问答初始化": "import rag.rag_core",
+        "etl/scheduled_etl.py": "import etl.scheduled_etl",
+        "crawl/baidu_baike_crawler.py": "import crawl.baidu_baike_crawler",
+    }
+    for name, code in entries.items():
+        result = profile_imports(code)
+        print(f"{name}: 导入耗时 {result['total_ms']} ms" + (f"（失败: {result['error']}）" if "error" in result else ""))
+        for package, ms in result["top_packages"]:
+            print(f"    {package:<28} {ms:>8} ms")
+
+    if args.answer:
+        # 在全新进程中测量，避免本进程已导入的模块影响结果
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), "--timeline", args.answer],
+                                 cwd=PROJECT_ROOT, capture_output=True, text=True)
+        if process.returncode != 0:
+            print(f"首个答案测量失败: {process.stderr.strip().splitlines()[-1]}")
+        else:
+            print(f"首个答案各阶段耗时(ms): {process.stdout.strip().splitlines()[-1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+两级答案缓存单元测试
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from cache.answer_cache import AnswerCache
+
+
+class TestAnswerCache(unittest.TestCase):
+    """AnswerCache测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, "answer_cache.db")
+        self.cache = AnswerCache(self.db_path, memory_size=2)
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def test_memory_hit(self):
+        """测试内存层命中"""
+        self.cache.put("经络是什么？", "chroma_v001", "group_0", "答案")
+        value, tier = self.cache.lookup("经络是什么", "chroma_v001", "group_0")
+        self.assertEqual(value, "答案")
+        self.assertEqual(tier, "memory")
+
+    def test_key_includes_version_and_arm(self):
+        """测试不同版本和分组互不命中"""
+        self.cache.put("经络是什么", "chroma_v001", "group_0", "答案")
+        self.assertIsNone(self.cache.get("经络是什么", "chroma_v002", "group_0"))
+        self.assertIsNone(self.cache.get("经络是什么", "chroma_v001", "group_1"))
+
+    def test_key_includes_top_n(self):
+        """测试重排序保留文档数不同的请求互不命中"""
+        self.cache.put("经络是什么", "chroma_v001", "", ["文档1"], kind="retrieval", top_n=1)
+        self.assertIsNone(self.cache.get("经络是什么", "chroma_v001", "", kind="retrieval", top_n=3))
+        self.assertEqual(self.cache.get("经络是什么", "chroma_v001", "", kind="retrieval", top_n=1), ["文档1"])
+
+    def test_disk_tier_shared_across_instances(self):
+        """测试磁盘层在新实例（模拟重启或其他进程）中可命中"""
+        self.cache.put("针灸是什么", "chroma_v001", "group_0", {"result": "答案"})
+        other = AnswerCache(self.db_path)
+        value, tier = other.lookup("针灸是什么", "chroma_v001", "group_0")
+        self.assertEqual(value, {"result": "答案"})
+        self.assertEqual(tier, "disk")
+        # 磁盘命中后提升到内存层
+        self.assertEqual(other.lookup("针灸是什么", "chroma_v001", "group_0")[1], "memory")
+
+    def test_memory_lru_eviction(self):
+        """测试内存层LRU淘汰"""
+        for i in range(3):
+            self.cache.put(f"问题{i}", "v", "g", i)
+        self.assertEqual(self.cache.stats()['memory_size'], 2)
+        self.assertEqual(self.cache.lookup("问题0", "v", "g")[1], "disk")
+
+    def test_disk_eviction(self):
+        """测试磁盘层超出容量时淘汰"""
+        cache = AnswerCache(self.db_path, memory_size=2, max_disk_bytes=1000)
+        for i in range(20):
+            cache.put(f"问题{i}", "v", "g", "x" * 100)
+        evicted = cache.evict_disk()
+        self.assertGreater(evicted, 0)
+        self.assertIsNone(AnswerCache(self.db_path).get("问题0", "v", "g"))
+
+    def test_stats(self):
+        """测试各层命中率统计"""
+        self.cache.put("a", "v", "g", 1)
+        self.cache.get("a", "v", "g")
+        self.cache.get("b", "v", "g")
+        stats = self.cache.stats()
+        self.assertEqual(stats['memory_hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertAlmostEqual(stats['hit_rate'], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
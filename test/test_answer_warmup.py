@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+答案缓存预热单元测试
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+from langchain.retrievers.document_compressors.base import BaseDocumentCompressor
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.flat_vector_store import FlatVectorStore
+from etl.vector_version_manager import VectorVersionManager
+from rag.hot_versions import HotVersionPool, ActiveVectorStore
+from rag.answer_warmup import warm_answer_cache, start_warmup_thread
+
+
+class FirstDocumentsCompressor(BaseDocumentCompressor):
+    """只保留前两个文档的重排序器"""
+
+    def compress_documents(self, documents, query, callbacks=None):
+        return list(documents)[:2]
+
+
+class StubHistoryQuery:
+    """返回固定高频问题的问答历史查询"""
+
+    questions = []
+
+    def top_questions(self, top_n):
+        return [{"sample_question": question} for question in self.questions[:top_n]]
+
+    def close(self):
+        pass
+
+
+class StubAnswerCache:
+    """内存中的答案缓存"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, question, version, arm, kind="answer", top_n=None):
+        return self.entries.get((question, version, arm, kind, top_n))
+
+    def put(self, question, version, arm, value, kind="answer", top_n=None):
+        self.entries[(question, version, arm, kind, top_n)] = value
+
+
+class StubChain:
+    """记录问题的问答链，可指定失败的问题"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.questions = []
+
+    def invoke(self, inputs):
+        self.questions.append(inputs["question"])
+        if inputs["question"] in self.failing:
+            raise RuntimeError("LLM调用失败")
+        return f"答案: {inputs['question']}"
+
+
+class TestAnswerWarmup(unittest.TestCase):
+    """答案缓存预热测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.cache = StubAnswerCache()
+        self.chains = []
+        self.chain_kwargs = []
+        self.failing = set()
+        StubHistoryQuery.questions = ["头痛取什么穴", "失眠怎么办", "胃痛怎么调理"]
+        self.patchers = [
+            mock.patch("rag.answer_warmup.QAHistoryQuery", StubHistoryQuery),
+            mock.patch("rag.answer_warmup.answer_cache", self.cache),
+            mock.patch("etl.vector_version_manager.vector_version_manager.get_active_version",
+                       return_value="chroma_v001"),
+            mock.patch("rag.rag_core.get_qa_chain", side_effect=self._get_qa_chain),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """测试后清理"""
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def _get_qa_chain(self, vector_store, top_k=4, **kwargs):
+        self.chain_kwargs.append(kwargs)
+        chain = StubChain(self.failing)
+        self.chains.append(chain)
+        return chain
+
+    def test_top_questions_answered_per_group(self):
+        """测试每个分组各预热一次出现频次最高的问题"""
+        summary = warm_answer_cache(object(), top_n=2)
+        self.assertEqual(summary, {'version': "chroma_v001", 'questions': 2, 'computed': 4, 'skipped': 0, 'failed': 0})
+        self.assertEqual([chain.questions for chain in self.chains], [["头痛取什么穴", "失眠怎么办"]] * 2)
+        self.assertEqual(self.cache.get("失眠怎么办", "chroma_v001", "group_1", top_n=3), "答案: 失眠怎么办")
+
+    def test_cached_questions_skipped(self):
+        """测试已在缓存中的问题跳过，重复执行不再计算"""
+        self.cache.put("头痛取什么穴", "chroma_v001", "group_0", "已缓存的答案", top_n=3)
+        summary = warm_answer_cache(object())
+        self.assertEqual((summary['computed'], summary['skipped']), (5, 1))
+        self.assertNotIn("头痛取什么穴", self.chains[0].questions)
+
+        summary = warm_answer_cache(object())
+        self.assertEqual((summary['computed'], summary['skipped']), (0, 6))
+
+    def test_failed_question_does_not_stop_warmup(self):
+        """测试单个问题生成答案失败时继续预热其余问题"""
+        self.failing.add("失眠怎么办")
+        summary = warm_answer_cache(object())
+        self.assertEqual((summary['computed'], summary['failed']), (4, 2))
+        self.assertEqual(self.chains[0].questions, StubHistoryQuery.questions)
+        self.assertIsNone(self.cache.get("失眠怎么办", "chroma_v001", "group_0", top_n=3))
+        self.assertIsNotNone(self.cache.get("胃痛怎么调理", "chroma_v001", "group_0", top_n=3))
+
+    def test_no_active_version_or_history(self):
+        """测试没有活动版本或问答历史为空时不创建问答链"""
+        with mock.patch("etl.vector_version_manager.vector_version_manager.get_active_version", return_value=None):
+            self.assertEqual(warm_answer_cache(object())['questions'], 0)
+        StubHistoryQuery.questions = []
+        self.assertEqual(warm_answer_cache(object())['questions'], 0)
+        self.assertEqual(self.chains, [])
+
+    def test_warmup_thread(self):
+        """测试后台线程完成预热，预热出错不向外抛出"""
+        thread = start_warmup_thread(object(), top_n=1)
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(thread.name, "answer-cache-warmup")
+        self.assertEqual([chain.questions for chain in self.chains], [["头痛取什么穴"]] * 2)
+
+        with mock.patch.object(StubHistoryQuery, "top_questions", side_effect=sqlite3.OperationalError("数据库被锁定")):
+            thread = start_warmup_thread(object())
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(self.chains), 2)
+
+    def test_warmup_does_not_mirror_traffic(self):
+        """测试预热创建的问答链不镜像影子流量"""
+        warm_answer_cache(object(), top_n=2)
+        self.assertEqual(len(self.chain_kwargs), 2)
+        self.assertTrue(all(kwargs["mirror_traffic"] is False for kwargs in self.chain_kwargs))
+
+
+class TestQAChainMirror(unittest.TestCase):
+    """问答链影子流量开关测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        manager = VectorVersionManager(self.test_dir)
+        embedding = DeterministicFakeEmbedding(size=16)
+        store = FlatVectorStore(os.path.join(self.test_dir, "chroma_v001"), embedding)
+        store.add_texts([f"穴位说明{i}" for i in range(10)], [{"source": "a.txt"}] * 10)
+        manager._set_current_version("chroma_v001")
+        pool = HotVersionPool(manager, loader=lambda path: FlatVectorStore(path, embedding),
+                              warm_queries=lambda: ["穴位"])
+        self.vector_store = ActiveVectorStore(pool)
+        self.shadow_traffic = mock.Mock()
+        self.patchers = [
+            mock.patch.dict(os.environ, {"DEEPSEEK_API_KEY": "test"}),
+            mock.patch("langchain_openai.ChatOpenAI", lambda **kwargs: FakeListChatModel(responses=["答案"] * 5)),
+            mock.patch("rag.rag_core._create_compressor", return_value=FirstDocumentsCompressor()),
+            mock.patch("rag.rag_core.ANSWER_CACHE_ENABLED", False),
+            mock.patch("rag.rag_core.shadow_traffic", self.shadow_traffic),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """测试后清理"""
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_mirror_traffic_flag(self):
+        """测试线上问答链镜像检索，关闭开关后不镜像"""
+        from rag.rag_core import get_qa_chain
+        self.assertEqual(get_qa_chain(self.vector_store, group_name="group_0").invoke({"question": "穴位"}), "答案")
+        self.assertEqual(self.shadow_traffic.mirror.call_count, 1)
+
+        get_qa_chain(self.vector_store, group_name="group_0", mirror_traffic=False).invoke({"question": "穴位"})
+        self.assertEqual(self.shadow_traffic.mirror.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
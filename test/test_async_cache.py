@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+异步缓存装饰器单元测试
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from cache.cache import async_ttl_cache, ttl_cache
+
+
+class TestAsyncTTLCache(unittest.IsolatedAsyncioTestCase):
+    """async_ttl_cache测试类"""
+
+    async def test_cache_awaited_result(self):
+        """测试缓存的是await后的结果而非协程对象"""
+        calls = []
+
+        @async_ttl_cache(expire_time=60)
+        async def load(x):
+            calls.append(x)
+            return x * 2
+
+        self.assertEqual(await load(2), 4)
+        self.assertEqual(await load(2), 4)
+        self.assertEqual(calls, [2])
+        self.assertEqual(load.cache_info()['hits'], 1)
+        self.assertEqual(load.cache_info()['misses'], 1)
+
+    async def test_concurrent_calls_share_one_load(self):
+        """测试并发调用只加载一次"""
+        calls = []
+
+        @async_ttl_cache(expire_time=60)
+        async def load(x):
+            calls.append(x)
+            await asyncio.sleep(0.05)
+            return x
+
+        results = await asyncio.gather(*(load(1) for _ in range(10)))
+        self.assertEqual(results, [1] * 10)
+        self.assertEqual(len(calls), 1)
+
+    async def test_cancelled_caller_does_not_cancel_waiters(self):
+        """测试第一个调用方被取消时，其他等待者仍得到加载结果"""
+        calls = []
+
+        @async_ttl_cache(expire_time=60)
+        async def load(x):
+            calls.append(x)
+            await asyncio.sleep(0.05)
+            return x * 2
+
+        first = asyncio.ensure_future(load(3))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(load(3))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+        self.assertEqual(await second, 6)
+        self.assertEqual(await load(3), 6)
+        self.assertEqual(calls, [3])
+
+    async def test_expire(self):
+        """测试缓存过期后重新加载"""
+        calls = []
+
+        @async_ttl_cache(expire_time=0)
+        async def load(x):
+            calls.append(x)
+            return x
+
+        await load(1)
+        await load(1)
+        self.assertEqual(len(calls), 2)
+
+    async def test_lru_eviction(self):
+        """测试超过maxsize时淘汰最久未使用的条目"""
+        calls = []
+
+        @async_ttl_cache(expire_time=60, maxsize=2)
+        async def load(x):
+            calls.append(x)
+            return x
+
+        await load(1)
+        await load(2)
+        await load(1)
+        await load(3)  # 淘汰2
+        await load(1)
+        await load(2)
+        self.assertEqual(calls, [1, 2, 3, 2])
+        self.assertEqual(load.cache_info()['currsize'], 2)
+        self.assertGreaterEqual(load.cache_info()['evictions'], 1)
+
+    async def test_stale_value_on_error(self):
+        """测试加载出错时返回过期数据"""
+        state = {'fail': False}
+
+        @async_ttl_cache(expire_time=0)
+        async def load():
+            if state['fail']:
+                raise RuntimeError("加载失败")
+            return "ok"
+
+        self.assertEqual(await load(), "ok")
+        state['fail'] = True
+        self.assertEqual(await load(), "ok")
+        self.assertEqual(load.cache_info()['stale_hits'], 1)
+
+    async def test_error_without_cache_raises(self):
+        """测试没有缓存数据时异常向上抛出"""
+
+        @async_ttl_cache()
+        async def load():
+            raise RuntimeError("加载失败")
+
+        with self.assertRaises(RuntimeError):
+            await load()
+
+    def test_rejects_sync_function(self):
+        """测试用于同步函数时报错"""
+        with self.assertRaises(TypeError):
+            async_ttl_cache()(lambda: None)
+
+    def test_stats_interface_shared_with_sync_cache(self):
+        """测试同步与异步缓存的统计接口一致"""
+
+        @ttl_cache(expire_time=60)
+        def sync_load():
+            return 1
+
+        @async_ttl_cache()
+        async def async_load():
+            return 1
+
+        sync_load()
+        sync_load()
+        asyncio.run(async_load())
+        self.assertEqual(sync_load.cache_info()['hits'], 1)
+        self.assertEqual(set(sync_load.cache_info()), set(async_load.cache_info()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+紧凑向量存储单元测试
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.compact_vectors import CompactVectorIndex, CompactVectorStore, ProductQuantizer, exact_search, evaluate_recall
+
+
+def random_vectors(count, dim=32, seed=0):
+    rng = np.random.RandomState(seed)
+    vectors = rng.normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class TestCompactVectorIndex(unittest.TestCase):
+    """CompactVectorIndex测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        self.vectors = random_vectors(500)
+        self.ids = [f"chunk-{i}" for i in range(len(self.vectors))]
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def test_float16_matches_exact(self):
+        """测试float16粗排加精确重排与暴力检索结果一致"""
+        index = CompactVectorIndex.build(self.test_dir, self.ids, self.vectors, "float16")
+        query = self.vectors[7]
+        rows = [row for row, _ in index.search(query, 5)]
+        self.assertEqual(rows, exact_search(self.vectors, query, 5))
+        self.assertEqual(rows[0], 7)
+        self.assertEqual(index.bytes_per_vector(), 32 * 2 + 4)
+
+    def test_pq_recall_and_reload(self):
+        """测试PQ编码的召回率，以及重新加载后检索结果不变"""
+        index = CompactVectorIndex.build(self.test_dir, self.ids, self.vectors, "pq", pq_subvectors=8)
+        self.assertEqual(index.codes.shape, (500, 8))
+        self.assertEqual(index.codes.dtype, np.uint8)
+        self.assertGreaterEqual(evaluate_recall(index, self.vectors[:20], k=10, candidates=100), 0.9)
+
+        reloaded = CompactVectorIndex(self.test_dir)
+        self.assertEqual(reloaded.ids, self.ids)
+        self.assertEqual(reloaded.search(self.vectors[3], 3), index.search(self.vectors[3], 3))
+
+    def test_reuse_quantizer(self):
+        """测试沿用已有码本编码"""
+        quantizer = ProductQuantizer.train(self.vectors, 8, num_centroids=16)
+        index = CompactVectorIndex.build(self.test_dir, self.ids, self.vectors, "pq", quantizer)
+        np.testing.assert_array_equal(index.quantizer.codebook, quantizer.codebook)
+
+    def test_empty(self):
+        """测试空索引"""
+        index = CompactVectorIndex.build(self.test_dir, [], np.empty((0, 32)), "pq")
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.search(self.vectors[0], 5), [])
+
+    def test_store_read_only(self):
+        """测试紧凑存储版本只读，与快照一致抛出ValueError/TypeError"""
+        index = CompactVectorIndex.build(self.test_dir, self.ids, self.vectors, "float16")
+        store = CompactVectorStore(mock.Mock(), index)
+        with self.assertRaises(ValueError):
+            store.add_texts(["新内容"])
+        with self.assertRaises(TypeError):
+            CompactVectorStore.from_texts(["新内容"], mock.Mock())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+近重复片段去重单元测试
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from langchain_core.documents import Document
+from etl.deduplicator import (
+    MinHasher, DedupIndex, DEDUP_INDEX_FILENAME, estimate_similarity, deduplicate_documents, open_dedup_index
+)
+
+TEXT_A = "足三里是足阳明胃经的合穴，位于小腿前外侧，犊鼻下三寸，主治胃痛、呕吐、腹胀、泄泻等病症。" * 4
+TEXT_B = "合谷穴位于手背第一、二掌骨之间，约平第二掌骨桡侧的中点处，主治头痛、齿痛、咽喉肿痛。" * 4
+
+
+def make_document(chunk_id, text, source):
+    return Document(page_content=text, metadata={"chunk_id": chunk_id, "source": source})
+
+
+class TestMinHasher(unittest.TestCase):
+    """MinHasher测试类"""
+
+    def test_similarity_estimate(self):
+        """测试相同文本签名一致，近似文本相似度高，无关文本相似度低"""
+        hasher = MinHasher()
+        signature = hasher.signature(TEXT_A)
+        self.assertEqual(estimate_similarity(signature, hasher.signature(TEXT_A)), 1.0)
+        self.assertGreater(estimate_similarity(signature, hasher.signature(TEXT_A + "。")), 0.85)
+        self.assertLess(estimate_similarity(signature, hasher.signature(TEXT_B)), 0.2)
+
+    def test_short_and_empty_text(self):
+        """测试短于k-gram和空文本也能生成签名"""
+        hasher = MinHasher()
+        self.assertEqual(len(hasher.signature("穴")), hasher.num_perm)
+        self.assertEqual(len(hasher.signature("")), hasher.num_perm)
+
+
+class TestDeduplicateDocuments(unittest.TestCase):
+    """deduplicate_documents测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        self.index = DedupIndex(os.path.join(self.test_dir, DEDUP_INDEX_FILENAME))
+
+    def tearDown(self):
+        """测试后清理"""
+        self.index.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_merge_near_duplicates(self):
+        """测试近重复片段被合并，代表片段记录来源"""
+        documents = [
+            make_document("a-1", TEXT_A, "a.txt"),
+            make_document("b-1", TEXT_B, "b.txt"),
+            make_document("c-1", TEXT_A + "。", "c.txt"),
+        ]
+        kept, affected = deduplicate_documents(documents, self.index)
+        self.assertEqual([doc.metadata["chunk_id"] for doc in kept], ["a-1", "b-1"])
+        self.assertEqual(kept[0].metadata["duplicate_count"], 1)
+        self.assertEqual(kept[0].metadata["duplicate_sources"], "c.txt")
+        self.assertNotIn("duplicate_count", kept[1].metadata)
+        self.assertEqual(affected, set())
+        self.assertEqual(self.index.count(), (2, 1))
+
+    def test_incremental_batch(self):
+        """测试后续批次与索引中已有的代表片段比较，已有代表片段原样保留"""
+        deduplicate_documents([make_document("a-1", TEXT_A, "a.txt")], self.index)
+        kept, affected = deduplicate_documents([make_document("c-1", TEXT_A, "c.txt")], self.index)
+        self.assertEqual(kept, [])
+        self.assertEqual(affected, {"a-1"})
+
+        kept, _ = deduplicate_documents([make_document("a-1", TEXT_A, "a.txt")], self.index)
+        self.assertEqual(kept[0].metadata["duplicate_sources"], "c.txt")
+
+    def test_remove(self):
+        """测试删除重复片段和代表片段"""
+        deduplicate_documents([
+            make_document("a-1", TEXT_A, "a.txt"),
+            make_document("c-1", TEXT_A, "c.txt"),
+            make_document("d-1", TEXT_A, "d.txt"),
+        ], self.index)
+        self.assertEqual(self.index.remove(["c-1"]), ({"a-1"}, []))
+        affected, orphans = self.index.remove(["a-1"])
+        self.assertEqual(affected, set())
+        self.assertEqual(orphans, ["d-1"])
+        self.assertEqual(self.index.count(), (0, 0))
+
+    def test_open_dedup_index(self):
+        """测试打开版本目录下的去重索引"""
+        self.assertIsNone(open_dedup_index(tempfile.gettempdir() + "/missing_version"))
+        deduplicate_documents([make_document("a-1", TEXT_A, "a.txt")], self.index)
+        index = open_dedup_index(self.test_dir)
+        self.assertTrue(index.contains("a-1"))
+        index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,7 +13,7 @@ import unittest
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 
-from etl.document_processor import load_and_process_documents, extract_and_save_content
+from etl.document_processor import load_and_process_documents, load_and_process_files, extract_and_save_content
 
 
 class TestDocumentProcessor(unittest.TestCase):
@@ -42,6 +42,16 @@ class TestDocumentProcessor(unittest.TestCase):
         self.assertGreater(len(documents), 0, "应该至少加载一个文档")
         self.assertIn("测试文档", documents[0].page_content, "文档内容应该包含测试文本")
     
+    def test_load_and_process_files_reports_failures(self):
+        """测试加载失败的文件被单独返回，不影响其他文件"""
+        bad_file = os.path.join(self.test_dir, "bad.txt")
+        with open(bad_file, "wb") as f:
+            f.write(b"\xff\xfe\xfa invalid utf-8")
+        documents, failed_files = load_and_process_files([self.txt_file, bad_file])
+        self.assertEqual(failed_files, [bad_file])
+        self.assertTrue(documents)
+        self.assertTrue(all(doc.metadata["source"] == self.txt_file for doc in documents))
+    
     def test_extract_and_save_content(self):
         """测试内容提取和存储功能"""
         # 先加载文档
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+片段向量持久化缓存单元测试
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.embedding_store import EmbeddingStore, write_embedding_refs, collect_embedding_refs
+
+
+class TestEmbeddingStore(unittest.TestCase):
+    """EmbeddingStore测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        self.store = EmbeddingStore("test-model", self.test_dir)
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def test_put_and_get(self):
+        """测试写入后按键读取"""
+        keys = [self.store.make_key(text) for text in ["片段1", "片段2"]]
+        self.store.put_many(keys, [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]])
+        found = self.store.get_many(keys + ["missing"])
+        self.assertEqual(set(found), set(keys))
+        self.assertAlmostEqual(found[keys[1]][2], 0.6, places=6)
+
+    def test_persist_across_instances(self):
+        """测试缓存在新实例中可读取"""
+        key = self.store.make_key("片段")
+        self.store.put_many([key], [[1.0, 2.0]])
+        other = EmbeddingStore("test-model", self.test_dir)
+        self.assertEqual(other.get_many([key])[key], [1.0, 2.0])
+        self.assertEqual(other.count(), 1)
+
+    def test_model_id_in_key(self):
+        """测试不同模型的缓存键不同"""
+        other = EmbeddingStore("other-model", self.test_dir)
+        self.assertNotEqual(self.store.make_key("片段"), other.make_key("片段"))
+
+    def test_duplicate_put_skipped(self):
+        """测试重复写入同一键不追加"""
+        key = self.store.make_key("片段")
+        self.store.put_many([key], [[1.0, 2.0]])
+        self.store.put_many([key], [[1.0, 2.0]])
+        self.assertEqual(os.path.getsize(self.store.vectors_path), 8)
+
+    def test_gc(self):
+        """测试垃圾回收只保留被版本引用的向量"""
+        keys = [self.store.make_key(f"片段{i}") for i in range(5)]
+        self.store.put_many(keys, [[float(i), float(i)] for i in range(5)])
+        version_dir = os.path.join(self.test_dir, "chroma_v001")
+        os.makedirs(version_dir)
+        write_embedding_refs(version_dir, keys[3:])
+
+        removed = self.store.gc(collect_embedding_refs([version_dir]))
+        self.assertEqual(removed, 3)
+        self.assertEqual(self.store.count(), 2)
+        self.assertEqual(self.store.get_many(keys[3:])[keys[4]], [4.0, 4.0])
+        self.assertEqual(os.path.getsize(self.store.vectors_path), 16)
+
+        # 回收后可继续写入，新实例能找到当前向量文件
+        self.store.put_many([keys[0]], [[9.0, 9.0]])
+        other = EmbeddingStore("test-model", self.test_dir)
+        self.assertEqual(other.get_many([keys[0], keys[3]]),
+                         {keys[0]: [9.0, 9.0], keys[3]: [3.0, 3.0]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ETL清单单元测试
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.etl_manifest import ETLManifest, file_sha256
+
+
+class TestETLManifest(unittest.TestCase):
+    """ETLManifest测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.test_dir, "data")
+        os.makedirs(self.data_dir)
+        self.files = {}
+        for name in ["a.txt", "b.txt", "c.txt"]:
+            path = os.path.join(self.data_dir, name)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"{name} 的内容")
+            self.files[name] = path
+        diff = ETLManifest().diff(self.data_dir)
+        files = {path: dict(info, chunk_ids=[f"{os.path.basename(path)}-0"]) for path, info in diff.files.items()}
+        self.manifest = ETLManifest(files)
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def test_first_scan_all_added(self):
+        """测试没有清单时所有文件都是新增"""
+        diff = ETLManifest().diff(self.data_dir)
+        self.assertEqual(len(diff.added), 3)
+        self.assertTrue(diff.has_changes())
+
+    def test_no_changes(self):
+        """测试文件未变时没有差异"""
+        diff = self.manifest.diff(self.data_dir)
+        self.assertFalse(diff.has_changes())
+        self.assertEqual(len(diff.unchanged), 3)
+
+    def test_detect_modified_deleted_added(self):
+        """测试识别修改、删除和新增的文件"""
+        with open(self.files["a.txt"], "w", encoding="utf-8") as f:
+            f.write("修改后的内容")
+        os.remove(self.files["b.txt"])
+        new_path = os.path.join(self.data_dir, "d.txt")
+        with open(new_path, "w", encoding="utf-8") as f:
+            f.write("新文件")
+
+        diff = self.manifest.diff(self.data_dir)
+        self.assertEqual(diff.modified, [self.files["a.txt"]])
+        self.assertEqual(diff.deleted, [self.files["b.txt"]])
+        self.assertEqual(diff.added, [new_path])
+        self.assertEqual(diff.unchanged, [self.files["c.txt"]])
+
+    def test_touch_without_content_change(self):
+        """测试仅修改时间变化而内容不变时视为未变"""
+        path = self.files["c.txt"]
+        os.utime(path, (1, 1))
+        diff = self.manifest.diff(self.data_dir)
+        self.assertIn(path, diff.unchanged)
+        self.assertEqual(diff.files[path]["sha256"], file_sha256(path))
+
+    def test_fingerprint(self):
+        """测试数据目录指纹只随文件内容变化"""
+        fingerprint = self.manifest.diff(self.data_dir).fingerprint()
+        self.assertEqual(ETLManifest().diff(self.data_dir).fingerprint(), fingerprint)
+        os.utime(self.files["c.txt"], (1, 1))
+        self.assertEqual(self.manifest.diff(self.data_dir).fingerprint(), fingerprint)
+        with open(self.files["a.txt"], "w", encoding="utf-8") as f:
+            f.write("修改后的内容")
+        self.assertNotEqual(self.manifest.diff(self.data_dir).fingerprint(), fingerprint)
+
+    def test_save_and_load(self):
+        """测试清单保存与加载"""
+        self.manifest.build_stats = {"chunks_reused": 1}
+        self.manifest.save(self.test_dir)
+        loaded = ETLManifest.load(self.test_dir)
+        self.assertEqual(loaded.files, self.manifest.files)
+        self.assertEqual(loaded.chunk_ids([self.files["a.txt"]]), ["a.txt-0"])
+        self.assertEqual(loaded.build_stats, {"chunks_reused": 1})
+        self.assertIsNone(ETLManifest.load(os.path.join(self.test_dir, "missing")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+进程内平面向量库单元测试
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.flat_vector_store import FlatVectorStore
+
+
+class TestFlatVectorStore(unittest.TestCase):
+    """FlatVectorStore测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        self.embedding = DeterministicFakeEmbedding(size=16)
+        self.store = FlatVectorStore(self.test_dir, self.embedding)
+        self.texts = [f"穴位说明{i}" for i in range(20)]
+        self.store.add_texts(self.texts, [{"source": f"s{i % 2}.txt"} for i in range(20)],
+                             ids=[f"id-{i}" for i in range(20)])
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def test_similarity_search(self):
+        """测试检索、过滤和MMR"""
+        results = self.store.similarity_search_with_score("穴位说明3", k=2)
+        self.assertEqual(results[0][0].page_content, "穴位说明3")
+        self.assertAlmostEqual(results[0][1], 0.0, places=4)
+        filtered = self.store.similarity_search("穴位说明3", k=5, filter={"source": "s0.txt"})
+        self.assertTrue(all(doc.metadata["source"] == "s0.txt" for doc in filtered))
+        self.assertEqual(len(self.store.max_marginal_relevance_search("穴位说明3", k=3, fetch_k=10)), 3)
+
+    def test_collection_operations(self):
+        """测试与Chroma一致的集合操作：upsert替换、update合并元数据、delete"""
+        collection = self.store._collection
+        collection.upsert(ids=["id-1"], embeddings=[self.embedding.embed_query("新内容")], documents=["新内容"],
+                          metadatas=[{"source": "n.txt", "extra": 1}])
+        collection.update(ids=["id-1", "missing"], metadatas=[{"extra": None, "tag": "x"}, {}])
+        result = collection.get(ids=["id-1"], include=["documents", "metadatas", "embeddings"])
+        self.assertEqual(result["documents"], ["新内容"])
+        self.assertEqual(result["metadatas"], [{"source": "n.txt", "tag": "x"}])
+        self.assertEqual(result["embeddings"].shape, (1, 16))
+
+        collection.delete(ids=["id-2", "missing"])
+        self.assertEqual(collection.count(), 19)
+        self.assertEqual(len(collection.get(where={"source": "s0.txt"})["ids"]), 9)
+        self.assertEqual(len(collection.get(limit=5, offset=15)["ids"]), 4)
+        self.assertEqual(self.store.similarity_search("新内容", k=1)[0].page_content, "新内容")
+
+    def test_persist_and_compact(self):
+        """测试重新打开后数据一致，压缩后检索不变"""
+        self.store._collection.delete(ids=[f"id-{i}" for i in range(10)])
+        before = [doc.page_content for doc in self.store.similarity_search("穴位说明15", k=3)]
+        self.store._collection.compact()
+        reopened = FlatVectorStore(self.test_dir, self.embedding)
+        self.assertEqual(reopened._collection.count(), 10)
+        self.assertEqual([doc.page_content for doc in reopened.similarity_search("穴位说明15", k=3)], before)
+        self.assertEqual(len(os.listdir(os.path.join(self.test_dir, "flat_index"))), 2)
+        np.testing.assert_allclose(reopened._collection.get(ids=["id-15"], include=["embeddings"])["embeddings"][0],
+                                   self.embedding.embed_query("穴位说明15"), rtol=1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+HNSW参数调优单元测试
+"""
+
+import os
+import sys
+import unittest
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.hnsw_tuner import exact_neighbors, generate_queries, tune_hnsw
+from etl.compact_vectors import exact_search
+
+
+class TestHnswTuner(unittest.TestCase):
+    """HNSW调优测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        rng = np.random.RandomState(0)
+        self.vectors = rng.normal(size=(1000, 16)).astype(np.float32)
+
+    def test_exact_neighbors(self):
+        """测试标准答案与逐条暴力检索一致"""
+        queries = generate_queries(self.vectors, num_queries=20)
+        self.assertEqual(queries.shape, (20, 16))
+        truth = exact_neighbors(self.vectors, queries, 5, block_size=7)
+        self.assertEqual(truth, [set(exact_search(self.vectors, query, 5)) for query in queries])
+
+    def test_tune(self):
+        """测试选出的参数满足目标召回率，并为当前参数组合选出 ef_search"""
+        queries = generate_queries(self.vectors, num_queries=30)
+        report = tune_hnsw(self.vectors, queries, k=5, target_recall=0.9,
+                           grid={"M": (8,), "ef_construction": (32,), "ef_search": (5, 50, 200)},
+                           current={"M": 16, "ef_construction": 100, "ef_search": 100})
+        self.assertTrue(report["target_met"])
+        self.assertGreaterEqual(report["recall"], 0.9)
+        self.assertEqual({(c["M"], c["ef_construction"]) for c in report["candidates"]}, {(8, 32), (16, 100)})
+        self.assertIn(report["current_ef_search"], (5, 50, 200))
+        self.assertEqual(set(report["chosen"]), {"M", "ef_construction", "ef_search"})
+
+
+if __name__ == "__main__":
+    unittest.main()
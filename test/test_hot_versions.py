@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+服务进程向量库版本池单元测试
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.flat_vector_store import FlatVectorStore
+from etl.vector_version_manager import VectorVersionManager
+from rag.hot_versions import HotVersionPool, ActiveVectorStore
+
+
+class TestHotVersionPool(unittest.TestCase):
+    """HotVersionPool测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        self.manager = VectorVersionManager(self.test_dir)
+        self.embedding = DeterministicFakeEmbedding(size=16)
+        for version in ("chroma_v001", "chroma_v002"):
+            store = FlatVectorStore(os.path.join(self.test_dir, version), self.embedding)
+            store.add_texts([f"{version} 穴位说明{i}" for i in range(10)], [{"source": version}] * 10)
+        self.loaded = []
+        self.warmed = []
+
+        def loader(path):
+            self.loaded.append(os.path.basename(path))
+            store = FlatVectorStore(path, self.embedding)
+            search = store.similarity_search
+            store.similarity_search = lambda query, k=4, **kwargs: self.warmed.append(os.path.basename(path)) \
+                or search(query, k=k, **kwargs)
+            return store
+
+        self.pool = HotVersionPool(self.manager, loader=loader, warm_queries=lambda: ["穴位"])
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def test_standby_switch_and_rollback(self):
+        """测试备用版本切换前完成预热，切换和回滚后的检索不再加载版本"""
+        self.manager._set_current_version("chroma_v001")
+        vector_store = ActiveVectorStore(self.pool)
+        self.assertEqual(vector_store.similarity_search("穴位", k=1)[0].metadata["source"], "chroma_v001")
+
+        # 后台线程发现备用版本后加载并预热，在心跳中报告
+        self.manager._write_version_file(self.manager.standby_version_file, "chroma_v002")
+        self.warmed.clear()
+        self.pool.refresh()
+        self.assertEqual(self.warmed, ["chroma_v002"])
+        with open(self.pool.heartbeat_file, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["warm_versions"], ["chroma_v001", "chroma_v002"])
+        self.assertTrue(self.manager._wait_for_standby("chroma_v002", timeout=1))
+
+        self.manager._set_current_version("chroma_v002")
+        self.manager._write_version_file(self.manager.previous_version_file, "chroma_v001")
+        os.remove(self.manager.standby_version_file)
+        self.assertEqual(vector_store.similarity_search("穴位", k=1)[0].metadata["source"], "chroma_v002")
+        retriever = vector_store.as_retriever(search_kwargs={"k": 2}, search_type="mmr")
+        self.assertEqual(len(retriever.invoke("穴位")), 2)
+
+        self.assertTrue(self.manager.rollback())
+        self.assertEqual(vector_store.similarity_search("穴位", k=1)[0].metadata["source"], "chroma_v001")
+        self.assertEqual(self.loaded, ["chroma_v001", "chroma_v002"])
+        self.assertEqual(sorted(self.pool.versions()), ["chroma_v001", "chroma_v002"])
+
+    def test_active_version_cached(self):
+        """测试活动版本指针不变时不再读取指针文件，回滚后立即生效"""
+        self.manager._set_current_version("chroma_v001")
+        self.manager._write_version_file(self.manager.previous_version_file, "chroma_v002")
+        self.assertEqual(self.pool.current()[0], "chroma_v001")
+        with unittest.mock.patch.object(self.manager, "get_active_version") as get_active_version:
+            for _ in range(3):
+                self.assertEqual(self.pool.current()[0], "chroma_v001")
+            get_active_version.assert_not_called()
+        self.assertTrue(self.pool.rollback())
+        self.assertEqual(self.pool.current()[0], "chroma_v002")
+
+    def test_release_old_versions(self):
+        """测试活动版本、回滚目标和备用版本以外的版本被释放"""
+        self.manager._set_current_version("chroma_v001")
+        self.pool.current()
+        self.manager._set_current_version("chroma_v002")
+        self.pool.current()
+        self.pool.refresh()
+        self.assertEqual(self.pool.versions(), ["chroma_v002"])
+
+    def test_no_active_version(self):
+        """测试没有活动版本时加载回退目录"""
+        self.pool.fallback_directory = os.path.join(self.test_dir, "chroma_v001")
+        version, store = self.pool.current()
+        self.assertIsNone(version)
+        self.assertEqual(len(store.similarity_search("穴位", k=3)), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+只读索引快照单元测试
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.flat_vector_store import FlatVectorStore
+from etl.index_snapshot import SNAPSHOT_DIRNAME, SnapshotVectorStore, export_snapshot, snapshot_exists
+
+
+class TestIndexSnapshot(unittest.TestCase):
+    """IndexSnapshot测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        self.embedding = DeterministicFakeEmbedding(size=16)
+        self.store = FlatVectorStore(self.test_dir, self.embedding)
+        self.store.add_texts([f"穴位说明{i}" for i in range(30)], [{"source": f"s{i % 3}.txt"} for i in range(30)],
+                             ids=[f"id-{i}" for i in range(30)])
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def test_export_and_search(self):
+        """测试快照检索结果与原向量库一致，文件只读"""
+        self.assertFalse(snapshot_exists(self.test_dir))
+        meta = export_snapshot(self.store, self.test_dir, batch_size=7)
+        self.assertEqual((meta["count"], meta["dim"]), (30, 16))
+        self.assertTrue(snapshot_exists(self.test_dir))
+        for name in os.listdir(os.path.join(self.test_dir, SNAPSHOT_DIRNAME)):
+            self.assertFalse(os.stat(os.path.join(self.test_dir, SNAPSHOT_DIRNAME, name)).st_mode & 0o222)
+
+        snapshot = SnapshotVectorStore(self.test_dir, self.embedding)
+        for query in ("穴位说明4", "穴位说明17"):
+            expected = [(doc.page_content, doc.metadata) for doc in self.store.similarity_search(query, k=5)]
+            self.assertEqual([(doc.page_content, doc.metadata) for doc in snapshot.similarity_search(query, k=5)],
+                             expected)
+        filtered = snapshot.similarity_search("穴位说明4", k=4, filter={"source": {"$in": ["s1.txt"]}})
+        self.assertEqual(len(filtered), 4)
+        self.assertTrue(all(doc.metadata["source"] == "s1.txt" for doc in filtered))
+        self.assertEqual(len(snapshot.max_marginal_relevance_search("穴位说明4", k=3, fetch_k=10)), 3)
+        with self.assertRaises(ValueError):
+            snapshot.add_texts(["新内容"])
+
+    def test_reexport_replaces_snapshot(self):
+        """测试重新导出时替换旧快照，不留下临时目录"""
+        export_snapshot(self.store, self.test_dir)
+        old_snapshot = SnapshotVectorStore(self.test_dir, self.embedding)
+        self.store._collection.delete(ids=["id-0"])
+        export_snapshot(self.store, self.test_dir)
+        self.assertEqual(SnapshotVectorStore(self.test_dir, self.embedding).snapshot.count, 29)
+        # 已映射旧快照的实例仍可检索
+        self.assertEqual(len(old_snapshot.similarity_search("穴位说明4", k=3)), 3)
+        self.assertEqual(sorted(name for name in os.listdir(self.test_dir) if name.startswith(SNAPSHOT_DIRNAME)),
+                         [SNAPSHOT_DIRNAME])
+
+    def test_collection_get(self):
+        """测试快照集合按ID和分页读取"""
+        self.store._collection.delete(ids=["id-3"])
+        export_snapshot(self.store, self.test_dir)
+        collection = SnapshotVectorStore(self.test_dir, self.embedding)._collection
+        self.assertEqual(collection.count(), 29)
+        result = collection.get(ids=["id-5", "id-3"], include=["documents", "embeddings"])
+        self.assertEqual(result["ids"], ["id-5"])
+        self.assertEqual(result["documents"], ["穴位说明5"])
+        self.assertEqual(result["embeddings"].shape, (1, 16))
+        self.assertEqual(len(collection.get(limit=10, offset=25)["ids"]), 4)
+
+    def test_empty(self):
+        """测试空版本导出的快照"""
+        self.store._collection.delete(ids=[f"id-{i}" for i in range(30)])
+        export_snapshot(self.store, self.test_dir)
+        self.assertEqual(SnapshotVectorStore(self.test_dir, self.embedding).similarity_search("穴位", k=3), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ONNX嵌入模块与版本元数据单元测试
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.onnx_embedding import pool_embeddings
+from etl.version_meta import load_version_meta, update_version_meta
+
+
+class TestPoolEmbeddings(unittest.TestCase):
+    """句向量汇聚测试"""
+
+    def setUp(self):
+        self.hidden = np.array([[[1.0, 0.0], [3.0, 4.0], [100.0, 100.0]]], dtype=np.float32)
+        self.mask = np.array([[1, 1, 0]])
+
+    def test_mean_pooling_ignores_padding(self):
+        """测试均值汇聚不计入填充位置"""
+        pooled = pool_embeddings(self.hidden, self.mask, "mean", normalize=False)
+        np.testing.assert_allclose(pooled, [[2.0, 2.0]])
+
+    def test_cls_pooling_normalized(self):
+        """测试CLS汇聚并归一化"""
+        pooled = pool_embeddings(self.hidden, self.mask, "cls", normalize=True)
+        np.testing.assert_allclose(pooled, [[1.0, 0.0]])
+        pooled = pool_embeddings(self.hidden, self.mask, "mean", normalize=True)
+        self.assertAlmostEqual(float(np.linalg.norm(pooled[0])), 1.0, places=6)
+
+
+class TestVersionMeta(unittest.TestCase):
+    """版本元数据测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_missing_meta(self):
+        """测试没有元数据的旧版本返回空字典"""
+        self.assertEqual(load_version_meta(self.test_dir), {})
+        self.assertEqual(load_version_meta(None), {})
+
+    def test_update_merges(self):
+        """测试更新时合并已有字段"""
+        update_version_meta(self.test_dir, embedding_model="m1", embedding_dim=384)
+        update_version_meta(self.test_dir, embedding_model="m2")
+        self.assertEqual(load_version_meta(self.test_dir), {"embedding_model": "m2", "embedding_dim": 384})
+
+
+if __name__ == "__main__":
+    unittest.main()
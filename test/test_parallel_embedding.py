@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多进程并行嵌入单元测试
+"""
+
+import os
+import sys
+import unittest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+import numpy as np
+from etl.parallel_embedding import EmbeddingWorkerPool, get_default_threads, embed_batch
+
+
+class LengthEmbedding:
+    """以文本长度和工作进程线程数作为向量的假模型"""
+
+    def embed_documents(self, texts):
+        return [[float(len(text)), float(os.environ["OMP_NUM_THREADS"])] for text in texts]
+
+
+class RecordingClient:
+    """记录 encode 参数的假 sentence-transformers 模型"""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append((texts, kwargs))
+        return np.array([[float(len(text))] for text in texts])
+
+
+class HuggingFaceLikeEmbedding:
+    """与 HuggingFaceEmbeddings 属性相同的假模型"""
+
+    def __init__(self):
+        self.client = RecordingClient()
+        self.encode_kwargs = {"normalize_embeddings": True}
+
+
+class BatchSizeEmbedding:
+    """记录 batch_size 参数的假模型（同 OnnxEmbeddings 的接口）"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def embed_documents(self, texts, batch_size=None):
+        self.batch_sizes.append(batch_size)
+        return [[float(len(text))] for text in texts]
+
+
+def create_length_embedding():
+    return LengthEmbedding()
+
+
+class TestEmbeddingWorkerPool(unittest.TestCase):
+    """EmbeddingWorkerPool测试类"""
+
+    def test_embed_documents_keeps_order(self):
+        """测试并行计算结果与输入顺序一致"""
+        texts = ["a" * i for i in range(1, 50)]
+        with EmbeddingWorkerPool(2, 3, create_length_embedding, start_method="fork") as pool:
+            vectors = pool.embed_documents(texts, batch_size=4)
+        self.assertEqual([v[0] for v in vectors], [float(len(t)) for t in texts])
+        # 工作进程内限制了线程数
+        self.assertTrue(all(v[1] == 3.0 for v in vectors))
+
+    def test_imap_skips_empty_batches(self):
+        """测试无需计算的批次返回空结果"""
+        batches = [["x"], [], ["yy", "zzz"]]
+        with EmbeddingWorkerPool(2, 1, create_length_embedding, start_method="fork") as pool:
+            results = list(pool.imap(batches, lambda batch: batch, max_in_flight=1))
+        self.assertEqual([item for item, _ in results], batches)
+        self.assertEqual([len(vectors) for _, vectors in results], [1, 0, 2])
+
+    def test_embed_batch_uses_group_as_batch(self):
+        """测试一组文本作为一个模型批次计算，不按默认批大小重新切分"""
+        texts = ["a\nb"] + ["x" * i for i in range(1, 100)]
+        hf = HuggingFaceLikeEmbedding()
+        vectors = embed_batch(hf, texts)
+        self.assertEqual(len(hf.client.calls), 1)
+        encoded, kwargs = hf.client.calls[0]
+        self.assertEqual(kwargs["batch_size"], len(texts))
+        self.assertTrue(kwargs["normalize_embeddings"])
+        self.assertEqual(encoded[0], "a b")
+        self.assertEqual(len(vectors), len(texts))
+
+        onnx = BatchSizeEmbedding()
+        embed_batch(onnx, texts)
+        self.assertEqual(onnx.batch_sizes, [len(texts)])
+
+        self.assertEqual(embed_batch(LengthEmbedding(), []), [])
+
+    def test_default_threads(self):
+        """测试默认线程数按CPU核数平均分配且至少为1"""
+        self.assertGreaterEqual(get_default_threads(1), 1)
+        self.assertEqual(get_default_threads(10 ** 6), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+问答历史归档模块单元测试
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from rag.qa_history_manager import connect_database, _create_schema
+from rag.qa_history_archiver import QAHistoryArchiver
+
+
+class TestQAHistoryArchiver(unittest.TestCase):
+    """QAHistoryArchiver测试类"""
+
+    def setUp(self):
+        """测试前准备：写入跨多个月份的测试数据"""
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, "qa_history.db")
+        self.archive_dir = os.path.join(self.test_dir, "archive")
+        conn = connect_database(self.db_path)
+        _create_schema(conn)
+        rows = []
+        for month in ["2026-05", "2026-06", "2026-07", "2026-08", "2026-09", "2026-10"]:
+            for i in range(7):
+                rows.append(("group_0", "user", "device", f"问题{i}", "答案", f"{month}-0{i + 1} 08:00:00"))
+        with conn:
+            conn.executemany(
+                "INSERT INTO qa_history (group_name, user_id, device_id, question, answer, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        conn.close()
+        self.archiver = QAHistoryArchiver(self.db_path, self.archive_dir, hot_months=3,
+                                          retention_months=5, batch_size=5)
+        self.now = datetime(2026, 10, 19)
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def _remaining_months(self):
+        conn = sqlite3.connect(self.db_path)
+        months = {row[0][:7] for row in conn.execute("SELECT timestamp FROM qa_history")}
+        conn.close()
+        return months
+
+    def test_archive_moves_old_months(self):
+        """测试超出热库保留期的记录被按月归档"""
+        archived = self.archiver.archive(now=self.now, pause=0)
+        self.assertEqual(archived, 21)
+        self.assertEqual(self._remaining_months(), {"2026-08", "2026-09", "2026-10"})
+        self.assertEqual(self.archiver.list_partitions(), ["2026-05", "2026-06", "2026-07"])
+        records = list(self.archiver.iter_partition("2026-06"))
+        self.assertEqual(len(records), 7)
+        self.assertEqual(records[0]['question'], "问题0")
+
+    def test_archive_incremental(self):
+        """测试分批增量归档"""
+        self.assertEqual(self.archiver.archive(now=self.now, max_batches=1, pause=0), 5)
+        self.assertEqual(self.archiver.archive(now=self.now, pause=0), 16)
+        self.assertEqual(self.archiver.archive(now=self.now, pause=0), 0)
+
+    def test_apply_retention(self):
+        """测试删除过期归档分区"""
+        self.archiver.archive(now=self.now, pause=0)
+        removed = self.archiver.apply_retention(now=self.now)
+        self.assertEqual(removed, ["2026-05"])
+        self.assertEqual(self.archiver.list_partitions(), ["2026-06", "2026-07"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+问答历史批量写入器单元测试
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from rag.qa_history_manager import QAHistoryWriter, connect_database, _create_schema, migrate_database
+
+
+class TestQAHistoryWriter(unittest.TestCase):
+    """QAHistoryWriter测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, "qa_history.db")
+        self.writer = QAHistoryWriter(self.db_path, batch_size=10, flush_interval=0.05)
+
+    def tearDown(self):
+        """测试后清理"""
+        self.writer.close()
+        shutil.rmtree(self.test_dir)
+
+    def _count(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM qa_history").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_batched_write(self):
+        """测试记录按批写入"""
+        for i in range(25):
+            self.assertTrue(self.writer.submit("group_0", "user", "device", f"问题{i}", "答案"))
+        self.assertTrue(self.writer.flush(timeout=5))
+        self.assertEqual(self._count(), 25)
+
+        stats = self.writer.stats()
+        self.assertEqual(stats['written'], 25)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertGreaterEqual(stats['batches'], 3)
+        self.assertLessEqual(stats['last_batch_size'], 10)
+
+    def test_close_flushes_pending_records(self):
+        """测试关闭时写完剩余记录"""
+        for i in range(5):
+            self.writer.submit("group_1", None, "device", f"问题{i}", "答案")
+        self.writer.close()
+        self.assertEqual(self._count(), 5)
+
+    def test_timestamp_set_on_submit(self):
+        """测试时间戳在提交时写入"""
+        self.writer.submit("group_0", "user", None, "问题", "答案")
+        self.writer.flush(timeout=5)
+        conn = sqlite3.connect(self.db_path)
+        timestamp = conn.execute("SELECT timestamp FROM qa_history").fetchone()[0]
+        conn.close()
+        self.assertRegex(timestamp, r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$")
+
+    def test_upgrade_legacy_table(self):
+        """测试旧表结构自动补充指标列并回填频次统计"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE qa_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_name TEXT NOT NULL,
+                user_id TEXT,
+                device_id TEXT,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute("INSERT INTO qa_history (group_name, question, answer) VALUES ('group_0', '问题', '答案')")
+        conn.commit()
+        conn.close()
+
+        self.writer.submit("group_0", "user", None, "问题？", "答案", {"route": "rag", "latency_ms": 12.5})
+        self.writer.flush(timeout=5)
+        conn = sqlite3.connect(self.db_path)
+        route, latency = conn.execute("SELECT route, latency_ms FROM qa_history ORDER BY id DESC").fetchone()
+        count = conn.execute("SELECT count FROM qa_question_stats WHERE question_norm = '问题'").fetchone()[0]
+        conn.close()
+        self.assertEqual(route, "rag")
+        self.assertEqual(latency, 12.5)
+        self.assertEqual(count, 2)
+
+    def test_migration_runs_once(self):
+        """测试多个连接同时初始化时频次统计只回填一次，之后的连接不再执行迁移"""
+        conn = connect_database(self.db_path)
+        _create_schema(conn)
+        conn.execute("INSERT INTO qa_history (group_name, question, answer) VALUES ('group_0', '问题', '答案')")
+        conn.execute("PRAGMA user_version = 0")
+        conn.commit()
+
+        others = [connect_database(self.db_path) for _ in range(3)]
+        try:
+            results = [migrate_database(other) for other in others]
+            self.assertEqual(results, [True, False, False])
+            for other in others:
+                _create_schema(other)
+            count = others[0].execute("SELECT count FROM qa_question_stats WHERE question_norm = '问题'").fetchone()[0]
+            self.assertEqual(count, 1)
+        finally:
+            for other in others + [conn]:
+                other.close()
+
+    def test_schema_initialized_before_writer_starts(self):
+        """测试启动预热时同步建表，写入线程不执行建表与迁移"""
+        self.assertTrue(self.writer.init_schema())
+        self.assertIsNone(self.writer._thread)
+        self.assertEqual(self._count(), 0)
+
+        with mock.patch("rag.qa_history_manager._create_schema") as create_schema:
+            self.writer.submit("group_0", "user", None, "问题", "答案")
+            self.writer.flush(timeout=5)
+        create_schema.assert_not_called()
+        self.assertEqual(self._count(), 1)
+
+    def test_submit_drops_when_queue_full(self):
+        """测试队列已满时提交立即返回并计入丢弃"""
+        writer = QAHistoryWriter(self.db_path, max_queue_size=1)
+        with mock.patch.object(writer, "_ensure_started"):
+            self.assertTrue(writer.submit("group_0", "user", None, "问题1", "答案"))
+            start = time.monotonic()
+            self.assertFalse(writer.submit("group_0", "user", None, "问题2", "答案"))
+            self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(writer.stats()['dropped'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
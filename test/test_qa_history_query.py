@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+问答历史查询模块单元测试
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from rag.qa_history_manager import QAHistoryWriter
+from rag.qa_history_query import QAHistoryQuery
+
+
+class TestQAHistoryQuery(unittest.TestCase):
+    """QAHistoryQuery测试类"""
+
+    def setUp(self):
+        """测试前准备：写入测试数据"""
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, "qa_history.db")
+        writer = QAHistoryWriter(self.db_path, batch_size=50, flush_interval=0.05)
+        for i in range(30):
+            writer.submit(f"group_{i % 2}", "user_a" if i < 25 else "user_b", f"device_{i % 3}",
+                          "经络是什么？" if i % 3 == 0 else f"问题{i}", "答案")
+        writer.submit("group_0", "user_c", None, "经络是什么", "答案",
+                      {"route": "cache", "cache_status": "memory", "latency_ms": 6000,
+                       "prompt_tokens": 10, "completion_tokens": 20})
+        writer.submit("group_1", "user_c", None, "天气", "答案",
+                      {"route": "fallback", "cache_status": "miss", "latency_ms": 100, "retrieval_ms": 40})
+        writer.close()
+        self.query = QAHistoryQuery(self.db_path)
+
+    def tearDown(self):
+        """测试后清理"""
+        self.query.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_user_history_keyset_pagination(self):
+        """测试按用户键集分页覆盖全部记录且不重复"""
+        seen = []
+        cursor = None
+        while True:
+            records, cursor = self.query.get_user_history("user_a", limit=10, cursor=cursor)
+            seen.extend(r['id'] for r in records)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_group_history_time_range(self):
+        """测试按分组和时间范围查询"""
+        records, _ = self.query.get_group_history("group_1", start="2000-01-01 00:00:00", limit=100)
+        self.assertEqual(len(records), 16)
+        self.assertTrue(all(r['group_name'] == "group_1" for r in records))
+        records, _ = self.query.get_group_history("group_1", end="2000-01-01 00:00:00")
+        self.assertEqual(records, [])
+
+    def test_top_questions(self):
+        """测试高频问题按归一化问题合并计数"""
+        top = self.query.top_questions(n=1)
+        self.assertEqual(top[0]['question_norm'], "经络是什么")
+        self.assertEqual(top[0]['count'], 11)
+
+    def test_group_hourly_rollup(self):
+        """测试分组小时汇总表增量维护"""
+        rows = {r['group_name']: r for r in self.query.get_group_hourly()}
+        self.assertEqual(rows['group_0']['requests'], 16)
+        self.assertEqual(rows['group_0']['cache_hits'], 1)
+        self.assertEqual(rows['group_0']['slow_requests'], 1)
+        self.assertEqual(rows['group_0']['max_latency_ms'], 6000)
+        self.assertEqual(rows['group_0']['completion_tokens'], 20)
+        self.assertEqual(rows['group_1']['fallback_requests'], 1)
+        self.assertAlmostEqual(rows['group_1']['fallback_rate'], 1 / 16)
+
+        records, _ = self.query.get_user_history("user_c")
+        self.assertEqual(records[0]['route'], "fallback")
+        self.assertEqual(records[0]['retrieval_ms'], 40)
+
+    def test_queries_use_index(self):
+        """测试分页查询命中索引"""
+        plan = self.query.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM qa_history WHERE user_id = ? "
+            "AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT 10",
+            ("user_a", "2100-01-01 00:00:00", 1)
+        ).fetchall()
+        detail = " ".join(row[3] for row in plan)
+        self.assertIn("idx_qa_history_user_time", detail)
+        self.assertNotIn("TEMP B-TREE", detail)
+
+    def test_top_questions_since(self):
+        """测试指定起始时间时只统计窗口内的提问次数"""
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany("INSERT INTO qa_history (group_name, question, answer, timestamp) VALUES (?, ?, ?, ?)",
+                         [("group_0", "失眠怎么办", "答案", "2000-01-01 00:00:00")] * 20)
+        conn.execute('''INSERT INTO qa_question_stats (question_norm, sample_question, count, first_seen, last_seen)
+                        VALUES ('失眠怎么办', '失眠怎么办', 20, '2000-01-01 00:00:00', '2000-01-01 00:00:00')''')
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(self.query.top_questions(n=1)[0]['question_norm'], "失眠怎么办")
+        top = self.query.top_questions(n=2, since="2001-01-01 00:00:00")
+        self.assertEqual(top[0]['question_norm'], "经络是什么")
+        self.assertEqual(top[0]['count'], 11)
+        self.assertNotIn("失眠怎么办", [row['question_norm'] for row in top])
+        top = self.query.top_questions(n=1, since="2000-01-01 00:00:00")
+        self.assertEqual((top[0]['question_norm'], top[0]['count']), ("失眠怎么办", 20))
+        self.assertEqual(self.query.top_questions(since="2100-01-01 00:00:00"), [])
+
+    def test_reader_has_no_side_effects(self):
+        """测试查询器不创建数据库和表，库或表不存在时返回空结果"""
+        missing_path = os.path.join(self.test_dir, "missing.db")
+        query = QAHistoryQuery(missing_path)
+        try:
+            self.assertEqual(query.top_questions(5), [])
+            self.assertEqual(query.get_user_history("user_a"), ([], None))
+        finally:
+            query.close()
+        self.assertFalse(os.path.exists(missing_path))
+
+        empty_path = os.path.join(self.test_dir, "empty.db")
+        sqlite3.connect(empty_path).close()
+        query = QAHistoryQuery(empty_path)
+        try:
+            self.assertEqual(query.get_group_hourly(), [])
+            with self.assertRaises(sqlite3.OperationalError):
+                query.conn.execute("CREATE TABLE t (x)")
+        finally:
+            query.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+定时ETL构建计划单元测试
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from langchain.docstore.document import Document
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.etl_manifest import ETLManifest
+from etl.deduplicator import DedupIndex, MinHasher, DEDUP_INDEX_FILENAME
+from etl.scheduled_etl import prepare_incremental_build, prepare_delta_build, find_orphaned_duplicate_files
+
+
+class ETLPlanTestCase(unittest.TestCase):
+    """构建计划测试基类：临时数据目录、活动版本清单和文件加载桩"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.test_dir, "data")
+        self.version_path = os.path.join(self.test_dir, "chroma_v001")
+        os.makedirs(self.data_dir)
+        os.makedirs(self.version_path)
+        self.paths = {name: self._write(name, f"{name} 的内容") for name in ["a.txt", "b.txt", "c.txt"]}
+        diff = ETLManifest().diff(self.data_dir)
+        files = {path: dict(info, chunk_ids=[f"{os.path.basename(path)}-old"]) for path, info in diff.files.items()}
+        self.manifest = ETLManifest(files)
+        self.manifest.save(self.version_path)
+
+        self.failing = set()
+        self.loaded = []
+        self.rejected = None
+        manager = mock.Mock()
+        manager.get_active_version_path.return_value = self.version_path
+        manager.is_rejected_build.side_effect = lambda fingerprint: fingerprint == self.rejected
+        self.patchers = [
+            mock.patch("etl.scheduled_etl.vector_version_manager", manager),
+            mock.patch("etl.scheduled_etl.check_embedding_compatible", return_value=True),
+            mock.patch("etl.scheduled_etl.load_and_process_files", side_effect=self._load_files),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """测试后清理"""
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.data_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def _load_files(self, file_paths):
+        """每个文件切分为一个片段，片段ID标记为新切分"""
+        self.loaded.extend(file_paths)
+        documents = [Document(page_content=f"{os.path.basename(path)} 的片段",
+                              metadata={"source": path, "chunk_id": f"{os.path.basename(path)}-new"})
+                     for path in file_paths if path not in self.failing]
+        return documents, [path for path in file_paths if path in self.failing]
+
+
+class TestPrepareDeltaBuild(ETLPlanTestCase):
+    """差量构建计划测试类"""
+
+    def _merge_duplicate(self, representative_id, duplicate_id, source):
+        """在活动版本的去重索引中记录 duplicate_id 被合并到 representative_id"""
+        index = DedupIndex(os.path.join(self.version_path, DEDUP_INDEX_FILENAME))
+        try:
+            index.add(representative_id, MinHasher().signature(representative_id))
+            index.add_duplicate(duplicate_id, representative_id, source)
+            index.commit()
+        finally:
+            index.close()
+
+    def test_no_changes(self):
+        """测试数据目录未变时不写入也不删除"""
+        upserts, delete_ids, manifest = prepare_delta_build(self.data_dir)
+        self.assertEqual((upserts, delete_ids), ([], []))
+        self.assertEqual(self.loaded, [])
+
+    def test_modified_and_deleted_files(self):
+        """测试只加载修改的文件，删除修改和删除文件的旧片段"""
+        self._write("a.txt", "修改后的内容")
+        os.remove(self.paths["c.txt"])
+        upserts, delete_ids, manifest = prepare_delta_build(self.data_dir)
+        self.assertEqual(self.loaded, [self.paths["a.txt"]])
+        self.assertEqual([doc.metadata["chunk_id"] for doc in upserts], ["a.txt-new"])
+        self.assertEqual(sorted(delete_ids), ["a.txt-old", "c.txt-old"])
+        self.assertEqual(manifest.files[self.paths["a.txt"]]["chunk_ids"], ["a.txt-new"])
+        self.assertEqual(manifest.files[self.paths["b.txt"]]["chunk_ids"], ["b.txt-old"])
+        self.assertNotIn(self.paths["c.txt"], manifest.files)
+
+    def test_failed_file_keeps_old_chunks(self):
+        """测试加载失败的文件保留旧片段和旧清单记录"""
+        self._write("a.txt", "修改后的内容")
+        self.failing.add(self.paths["a.txt"])
+        upserts, delete_ids, manifest = prepare_delta_build(self.data_dir)
+        self.assertEqual((upserts, delete_ids), ([], []))
+        self.assertEqual(manifest.files[self.paths["a.txt"]], self.manifest.files[self.paths["a.txt"]])
+        # 清单中的哈希仍是旧内容的，下次运行继续视为修改
+        self.assertEqual(manifest.diff(self.data_dir).modified, [self.paths["a.txt"]])
+
+    def test_orphaned_duplicates_reloaded(self):
+        """测试代表片段被删除时，合并过重复片段的未变文件重新加载"""
+        self._merge_duplicate("a.txt-old", "b.txt-old", self.paths["b.txt"])
+        self.assertEqual(find_orphaned_duplicate_files(self.version_path, ["a.txt-old"], self.manifest,
+                                                       [self.paths["b.txt"], self.paths["c.txt"]]),
+                         [self.paths["b.txt"]])
+        self.assertEqual(find_orphaned_duplicate_files(self.version_path, [], self.manifest,
+                                                       [self.paths["b.txt"]]), [])
+
+        self._write("a.txt", "修改后的内容")
+        upserts, delete_ids, manifest = prepare_delta_build(self.data_dir)
+        self.assertEqual(sorted(self.loaded), [self.paths["a.txt"], self.paths["b.txt"]])
+        self.assertEqual(sorted(doc.metadata["chunk_id"] for doc in upserts), ["a.txt-new", "b.txt-new"])
+        self.assertEqual(manifest.files[self.paths["b.txt"]]["chunk_ids"], ["b.txt-new"])
+        self.assertEqual(manifest.build_stats["files_reloaded_for_duplicates"], 1)
+
+    def test_rejected_build_skipped(self):
+        """测试数据与被门禁拒绝的构建相同时跳过，沿用旧清单"""
+        self._write("a.txt", "修改后的内容")
+        self.rejected = self.manifest.diff(self.data_dir).fingerprint()
+        upserts, delete_ids, manifest = prepare_delta_build(self.data_dir)
+        self.assertEqual((upserts, delete_ids), ([], []))
+        self.assertEqual(manifest.files, self.manifest.files)
+        self.assertEqual(self.loaded, [])
+
+    def test_incompatible_embedding(self):
+        """测试活动版本嵌入模型不兼容时不能差量构建"""
+        with mock.patch("etl.scheduled_etl.check_embedding_compatible", return_value=False):
+            self.assertIsNone(prepare_delta_build(self.data_dir))
+
+
+class TestPrepareIncrementalBuild(ETLPlanTestCase):
+    """增量构建计划测试类"""
+
+    def setUp(self):
+        """测试前准备：活动版本中保存着清单记录的全部片段"""
+        super().setUp()
+        self.active_chunks = {chunk_id: path for path, info in self.manifest.files.items()
+                              for chunk_id in info["chunk_ids"]}
+        self.patchers += [
+            mock.patch("etl.scheduled_etl.load_vector_store", return_value=mock.Mock()),
+            mock.patch("etl.scheduled_etl.get_documents_with_embeddings", side_effect=self._get_documents),
+        ]
+        for patcher in self.patchers[-2:]:
+            patcher.start()
+
+    def _get_documents(self, vector_store, ids):
+        """从活动版本取出片段及其向量，不存在的片段跳过"""
+        found = [chunk_id for chunk_id in ids if chunk_id in self.active_chunks]
+        documents = [Document(page_content=chunk_id, metadata={"source": self.active_chunks[chunk_id],
+                                                               "chunk_id": chunk_id}) for chunk_id in found]
+        return documents, {chunk_id: [0.1, 0.2] for chunk_id in found}
+
+    def test_no_changes(self):
+        """测试数据目录未变时不构建"""
+        self.assertIsNone(prepare_incremental_build(self.data_dir))
+
+    def test_reuse_unchanged_files(self):
+        """测试未变文件复用活动版本的片段和向量，只加载修改的文件"""
+        self._write("a.txt", "修改后的内容")
+        documents, known_embeddings, manifest = prepare_incremental_build(self.data_dir)
+        self.assertEqual(self.loaded, [self.paths["a.txt"]])
+        self.assertEqual(sorted(known_embeddings), ["b.txt-old", "c.txt-old"])
+        self.assertEqual(sorted(doc.metadata["chunk_id"] for doc in documents), ["a.txt-new", "b.txt-old", "c.txt-old"])
+        self.assertEqual(manifest.files[self.paths["b.txt"]]["chunk_ids"], ["b.txt-old"])
+        self.assertEqual(manifest.build_stats["chunks_reused"], 2)
+        self.assertEqual(manifest.build_stats["chunks_embedded"], 1)
+
+    def test_reload_files_missing_from_active_version(self):
+        """测试活动版本中缺少片段的未变文件重新加载，不复用其残留片段"""
+        self._write("a.txt", "修改后的内容")
+        del self.active_chunks["b.txt-old"]
+        documents, known_embeddings, manifest = prepare_incremental_build(self.data_dir)
+        self.assertEqual(sorted(self.loaded), [self.paths["a.txt"], self.paths["b.txt"]])
+        self.assertEqual(sorted(doc.metadata["chunk_id"] for doc in documents), ["a.txt-new", "b.txt-new", "c.txt-old"])
+        self.assertEqual(manifest.files[self.paths["b.txt"]]["chunk_ids"], ["b.txt-new"])
+
+    def test_failed_files_dropped_from_manifest(self):
+        """测试加载失败的文件不写入新清单，下次运行作为新增文件重新加载"""
+        self._write("a.txt", "修改后的内容")
+        self.failing.add(self.paths["a.txt"])
+        documents, known_embeddings, manifest = prepare_incremental_build(self.data_dir)
+        self.assertNotIn(self.paths["a.txt"], manifest.files)
+        self.assertEqual(manifest.build_stats["files_failed"], 1)
+        self.assertEqual(manifest.diff(self.data_dir).added, [self.paths["a.txt"]])
+
+    def test_incompatible_embedding_full_rebuild(self):
+        """测试嵌入模型不兼容时不复用向量，重新加载全部文件"""
+        with mock.patch("etl.scheduled_etl.check_embedding_compatible", return_value=False):
+            documents, known_embeddings, manifest = prepare_incremental_build(self.data_dir)
+        self.assertEqual(known_embeddings, {})
+        self.assertEqual(sorted(self.loaded), sorted(self.paths.values()))
+        self.assertEqual(sorted(doc.metadata["chunk_id"] for doc in documents), ["a.txt-new", "b.txt-new", "c.txt-new"])
+        self.assertEqual(manifest.build_stats["chunks_reused"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
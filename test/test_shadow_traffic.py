@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+影子流量单元测试
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.flat_vector_store import FlatVectorStore
+from etl.vector_version_manager import VectorVersionManager
+from rag.hot_versions import HotVersionPool
+from rag.shadow_traffic import ShadowTraffic, shadow_report
+
+
+class TestShadowTraffic(unittest.TestCase):
+    """ShadowTraffic测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, "shadow_traffic.db")
+        self.manager = VectorVersionManager(self.test_dir)
+        embedding = DeterministicFakeEmbedding(size=16)
+        # 候选版本只保留一半片段
+        for version, count in (("chroma_v001", 20), ("chroma_v002", 10)):
+            store = FlatVectorStore(os.path.join(self.test_dir, version), embedding)
+            store.add_texts([f"穴位说明{i}" for i in range(count)], [{"chunk_id": f"c{i}"} for i in range(count)])
+        self.manager._set_current_version("chroma_v001")
+        self.pool = HotVersionPool(self.manager, loader=lambda path: FlatVectorStore(path, embedding))
+        self.shadow = ShadowTraffic(self.pool, db_path=self.db_path, sample_rate=1.0)
+
+    def tearDown(self):
+        """测试后清理"""
+        self.shadow.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_mirror_and_report(self):
+        """测试镜像到候选版本的检索记录了延迟和与活动版本的差异"""
+        self.assertFalse(self.shadow.mirror("穴位说明3"), "没有候选版本时不镜像")
+        self.assertFalse(self.manager.start_shadow("chroma_v001"), "活动版本不能作为候选版本")
+        self.assertTrue(self.manager.start_shadow("chroma_v002"))
+
+        for i in range(8):
+            self.assertTrue(self.shadow.mirror(f"穴位说明{i * 2}", "mmr", {"k": 4}))
+        self.assertTrue(self.shadow.flush(timeout=10))
+
+        report = shadow_report("chroma_v002", db_path=self.db_path)
+        self.assertEqual((report["requests"], report["errors"]), (8, 0))
+        self.assertEqual(report["active_versions"], ["chroma_v001"])
+        self.assertGreater(report["candidate"]["p95_ms"], 0)
+        self.assertLess(report["overlap"], 1.0)
+        self.assertTrue(report["lowest_overlap_questions"])
+        self.assertEqual(self.shadow.stats()["recorded"], 8)
+
+        # 候选版本上线后不再接收影子流量
+        with patch.object(VectorVersionManager, "_validate_version", return_value=True), \
+                patch.object(VectorVersionManager, "_export_snapshot"):
+            self.assertTrue(self.manager.switch_to_version("chroma_v002", standby_timeout=0))
+        self.assertIsNone(self.manager.get_shadow_version())
+        self.assertFalse(self.shadow.mirror("穴位说明1"))
+
+    def test_errors_never_reach_caller(self):
+        """测试候选版本检索失败时记录错误，镜像调用本身不抛出异常"""
+        self.manager.start_shadow("chroma_v002")
+        self.pool.load("chroma_v001")
+        self.pool.loader = lambda path: (_ for _ in ()).throw(RuntimeError("索引损坏"))
+        self.assertTrue(self.shadow.mirror("穴位说明1"))
+        self.assertTrue(self.shadow.flush(timeout=10))
+        report = shadow_report("chroma_v002", db_path=self.db_path)
+        self.assertEqual((report["requests"], report["errors"]), (1, 1))
+
+        with patch.object(self.shadow, "candidate_version", side_effect=OSError("读取版本指针失败")):
+            self.assertFalse(self.shadow.mirror("穴位说明1"))
+
+    def test_sampling(self):
+        """测试采样比例为0时不镜像"""
+        self.manager.start_shadow("chroma_v002")
+        self.shadow.sample_rate = 0
+        self.assertFalse(self.shadow.mirror("穴位说明1"))
+        self.assertEqual(self.shadow.stats()["mirrored"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,7 +13,15 @@ import unittest
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 
-from etl.vector_builder import init_embedding, build_vector_store, load_vector_store, update_vector_store
+import threading
+import numpy as np
+from functools import partial
+from unittest import mock
+from etl.vector_builder import init_embedding, build_vector_store, load_vector_store, update_vector_store, _prefetch, \
+    _plan_token_batches, init_version_embedding, apply_vector_store_delta, _iter_embedded_batches
+from etl.version_meta import update_version_meta, load_version_meta
+from etl.flat_vector_store import FlatVectorStore
+from langchain_core.embeddings import DeterministicFakeEmbedding
 from langchain.docstore.document import Document
 
 
@@ -103,6 +111,238 @@ class TestVectorBuilder(unittest.TestCase):
         self.assertIsNotNone(updated_vector_store, "向量库应该更新成功")
         self.assertEqual(updated_count, initial_count + 1, "向量库中的文档数量应该增加1")
 
+    def test_update_vector_store_idempotent(self):
+        """测试重复更新同一批文档时片段数不变，来源删除后其片段被删除"""
+        build_vector_store(self.test_documents, self.vector_store_dir)
+        new_documents = lambda: [
+            Document(page_content="这是新增的测试文档3内容。", metadata={"source": "test3"}),
+            Document(page_content="这是新增的测试文档3第二段。", metadata={"source": "test3"})
+        ]
+
+        counts = [update_vector_store(new_documents(), self.vector_store_dir)._collection.count() for _ in range(3)]
+        self.assertEqual(counts, [4, 4, 4], "重复更新不应产生重复向量")
+
+        # 来源内容缩短后多余的旧片段被删除
+        vector_store = update_vector_store(new_documents()[:1], self.vector_store_dir)
+        self.assertEqual(vector_store._collection.count(), 3)
+
+        vector_store = update_vector_store([], self.vector_store_dir, removed_sources=["test1"])
+        self.assertEqual(vector_store._collection.count(), 2)
+
+
+class TestPrefetch(unittest.TestCase):
+    """计算/写入流水线测试"""
+    
+    def test_order_preserved(self):
+        """测试后台线程产出的顺序不变"""
+        for depth in (0, 1, 3):
+            self.assertEqual(list(_prefetch(iter(range(20)), depth)), list(range(20)))
+    
+    def test_producer_runs_ahead(self):
+        """测试调用方处理当前项时后台线程已在生成下一项"""
+        produced = []
+        second_ready = threading.Event()
+        
+        def items():
+            for i in range(3):
+                produced.append(i)
+                if i == 1:
+                    second_ready.set()
+                yield i
+        
+        iterator = _prefetch(items(), 1)
+        self.assertEqual(next(iterator), 0)
+        self.assertTrue(second_ready.wait(5), "处理第一项时应已开始生成第二项")
+        self.assertEqual(list(iterator), [1, 2])
+    
+    def test_producer_error_raised(self):
+        """测试后台线程的异常在调用方抛出"""
+        def items():
+            yield 1
+            raise ValueError("embed failed")
+        
+        with self.assertRaises(ValueError):
+            list(_prefetch(items(), 2))
+    
+    def test_consumer_stop_closes_producer(self):
+        """测试调用方提前退出时后台生成器被关闭"""
+        closed = threading.Event()
+        
+        def items():
+            try:
+                for i in range(1000):
+                    yield i
+            finally:
+                closed.set()
+        
+        iterator = _prefetch(items(), 2)
+        next(iterator)
+        iterator.close()
+        self.assertTrue(closed.is_set())
+
+
+class TestTokenBatching(unittest.TestCase):
+    """按长度分桶组批测试"""
+    
+    def test_budget_respected(self):
+        """测试每批填充后的token数不超过预算"""
+        lengths = [5, 300, 12, 80, 80, 7, 450, 33, 200, 9] * 10
+        plan = _plan_token_batches(lengths, token_budget=1000)
+        self.assertEqual(sorted(i for group in plan for i in group), list(range(len(lengths))))
+        for group in plan:
+            self.assertLessEqual(max(lengths[i] for i in group) * len(group), 1000)
+    
+    def test_similar_lengths_grouped(self):
+        """测试长片段和短片段分在不同批次"""
+        lengths = [10, 500, 10, 500, 10]
+        plan = _plan_token_batches(lengths, token_budget=1000)
+        self.assertEqual([sorted(group) for group in plan], [[1, 3], [0, 2, 4]])
+    
+    def test_oversized_and_max_batch_size(self):
+        """测试超出预算的单个片段独占一批，且每批片段数有上限"""
+        self.assertEqual(_plan_token_batches([5000, 1], token_budget=1000), [[0], [1]])
+        plan = _plan_token_batches([1] * 10, token_budget=1000, max_batch_size=4)
+        self.assertEqual([len(group) for group in plan], [4, 4, 2])
+
+
+class NamedEmbedding:
+    """只有模型名称的假模型"""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.encode_kwargs = {"normalize_embeddings": True}
+
+
+class NamedFakeEmbedding(DeterministicFakeEmbedding):
+    """带模型名称的确定性假模型，不同名称的向量不同"""
+
+    model_name: str = ""
+
+    def _get_embedding(self, seed: int):
+        return super()._get_embedding(seed + len(self.model_name))
+
+
+class TestVersionEmbedding(unittest.TestCase):
+    """按版本记录的嵌入模型加载测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.torch = NamedEmbedding("bge")
+        self.onnx = NamedEmbedding("bge@onnx-int8")
+        factory = lambda backend="torch": self.onnx if backend == "onnx-int8" else self.torch
+        self.patcher = mock.patch("etl.vector_builder.init_embedding", side_effect=factory)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_matching_or_unrecorded_model(self):
+        """测试版本未记录模型或模型一致时使用当前模型"""
+        self.assertIs(init_version_embedding(self.test_dir, self.torch), self.torch)
+        update_version_meta(self.test_dir, embedding_model="bge#normalized")
+        self.assertIs(init_version_embedding(self.test_dir, self.torch), self.torch)
+
+    def test_loads_recorded_backend(self):
+        """测试当前后端不一致时加载版本构建时的后端"""
+        update_version_meta(self.test_dir, embedding_model="bge@onnx-int8#normalized")
+        self.assertIs(init_version_embedding(self.test_dir, self.torch), self.onnx)
+
+    def test_delta_uses_version_backend(self):
+        """测试差量写入使用版本构建时的嵌入后端，而不是当前配置的后端"""
+        torch = NamedFakeEmbedding(size=8, model_name="bge")
+        onnx = NamedFakeEmbedding(size=8, model_name="bge@onnx-int8")
+        self.torch, self.onnx = torch, onnx
+        store = FlatVectorStore(self.test_dir, onnx)
+        store.add_texts(["旧片段"], [{"source": "a.txt", "chunk_id": "old"}], ids=["old"])
+        update_version_meta(self.test_dir, vector_engine="flat", embedding_model="bge@onnx-int8")
+        document = Document(page_content="新片段", metadata={"source": "b.txt", "chunk_id": "new"})
+        with mock.patch("etl.vector_builder.get_embedding_store", return_value=None):
+            vector_store = apply_vector_store_delta(self.test_dir, [document], [], num_workers=1)
+        vector = vector_store._collection.get(ids=["new"], include=["embeddings"])["embeddings"][0]
+        self.assertTrue(np.allclose(vector, onnx.embed_query("新片段")))
+        self.assertFalse(np.allclose(vector, torch.embed_query("新片段")))
+        self.assertEqual(load_version_meta(self.test_dir)["embedding_model"], "bge@onnx-int8")
+
+    def test_refuses_incompatible_model(self):
+        """测试没有匹配的嵌入模型时拒绝加载"""
+        update_version_meta(self.test_dir, embedding_model="other-model#normalized")
+        with self.assertRaises(ValueError):
+            init_version_embedding(self.test_dir, self.torch)
+
+
+class CountingFakeEmbedding(NamedFakeEmbedding):
+    """记录计算过的文本，调用次数达到上限后抛出异常的假模型"""
+
+    fail_after: int = -1
+    embedded: list = []
+
+    def embed_documents(self, texts):
+        if 0 <= self.fail_after <= len(self.embedded):
+            raise RuntimeError("嵌入计算中断")
+        self.embedded.append(list(texts))
+        return super().embed_documents(texts)
+
+
+class TestResumableBuild(unittest.TestCase):
+    """中断后从检查点续建测试"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.documents = [Document(page_content=f"第{i}条经络穴位说明，编号{i * 7919}", metadata={"source": "a.txt"})
+                          for i in range(10)]
+        self.embedding = None
+        # 每个窗口只含一个写入批次，每批对应一次嵌入调用
+        window_iter = partial(_iter_embedded_batches, window_size=2)
+        self.patchers = [
+            mock.patch("etl.vector_builder.init_embedding", side_effect=lambda *args: self.embedding),
+            mock.patch("etl.vector_builder.get_embedding_store", return_value=None),
+            mock.patch("etl.vector_builder.DEDUP_ENABLED", False),
+            mock.patch("etl.vector_builder._iter_embedded_batches", window_iter),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.test_dir)
+
+    def _build(self, documents, fail_after=-1):
+        self.embedding = CountingFakeEmbedding(size=8, model_name="bge", fail_after=fail_after)
+        return build_vector_store(documents, self.test_dir, batch_size=2, num_workers=1, vector_engine="flat")
+
+    def _interrupt(self):
+        with self.assertRaises(RuntimeError):
+            self._build(self.documents, fail_after=3)
+        checkpoint = load_version_meta(self.test_dir)["build_checkpoint"]
+        self.assertEqual(checkpoint["total_batches"], 5)
+        self.assertGreaterEqual(checkpoint["completed_batches"], 1)
+        self.assertLess(checkpoint["completed_batches"], 5)
+        return checkpoint["completed_batches"]
+
+    def test_resume_skips_completed_batches(self):
+        """测试中断后重新构建只计算未完成批次的向量"""
+        completed = self._interrupt()
+        vector_store = self._build(self.documents)
+
+        embedded = [text for texts in self.embedding.embedded for text in texts]
+        expected = [doc.page_content for doc in self.documents[completed * 2:]]
+        self.assertEqual(sorted(embedded), sorted(expected))
+        self.assertEqual(len(vector_store._collection.get(include=[])["ids"]), 10)
+        self.assertIsNone(load_version_meta(self.test_dir).get("build_checkpoint"))
+
+    def test_changed_input_discards_partial_build(self):
+        """测试输入变化后丢弃未完成的构建，从头计算"""
+        self._interrupt()
+        documents = [Document(page_content="修改后的穴位说明", metadata={"source": "a.txt"})] + self.documents[1:]
+        vector_store = self._build(documents)
+
+        embedded = [text for texts in self.embedding.embedded for text in texts]
+        self.assertEqual(sorted(embedded), sorted(doc.page_content for doc in documents))
+        result = vector_store._collection.get(include=["documents"])
+        self.assertEqual(sorted(result["documents"]), sorted(doc.page_content for doc in documents))
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
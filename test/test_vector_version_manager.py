@@ -117,7 +117,7 @@ class TestVectorVersionManager(unittest.TestCase):
         # 验证build_vector_store被调用
         mock_build_vector_store.assert_called_once()
         
-    @patch('etl.vector_version_manager.load_vector_store')
+    @patch('etl.vector_version_manager.load_serving_vector_store')
     def test_validate_version(self, mock_load_vector_store):
         """测试验证版本"""
         # 模拟load_vector_store和相似性搜索
@@ -135,7 +135,7 @@ class TestVectorVersionManager(unittest.TestCase):
         # 验证load_vector_store被调用
         mock_load_vector_store.assert_called_once_with(version_path)
         
-    @patch('etl.vector_version_manager.load_vector_store')
+    @patch('etl.vector_version_manager.load_serving_vector_store')
     def test_validate_version_failure(self, mock_load_vector_store):
         """测试验证版本失败"""
         # 模拟load_vector_store抛出异常
@@ -148,6 +148,41 @@ class TestVectorVersionManager(unittest.TestCase):
         result = self.version_manager._validate_version(version_path)
         self.assertFalse(result)
         
+    @patch('etl.vector_version_manager.run_version_gate')
+    @patch('etl.vector_version_manager.load_golden_queries')
+    @patch('etl.vector_version_manager.load_serving_vector_store')
+    def test_validate_version_gate(self, mock_load_vector_store, mock_load_golden_queries, mock_run_version_gate):
+        """测试黄金查询门禁拒绝退化的版本，报告保存在版本元数据中"""
+        from etl.version_meta import load_version_meta
+        mock_load_vector_store.return_value = Mock()
+        mock_load_golden_queries.return_value = [{"query": "头痛", "expected_sources": []}]
+        mock_run_version_gate.return_value = {"queries": 1, "passed": False, "reasons": ["p95延迟 50.00ms"]}
+        for version in ("chroma_v001", "chroma_v002"):
+            os.makedirs(os.path.join(self.test_dir, version))
+        self.version_manager._set_current_version("chroma_v001")
+        
+        version_path = os.path.join(self.test_dir, "chroma_v002")
+        self.assertFalse(self.version_manager._validate_version(version_path))
+        self.assertEqual(mock_load_vector_store.call_count, 2)
+        report = load_version_meta(version_path)["validation"]
+        self.assertEqual(report["active_version"], "chroma_v001")
+        self.assertFalse(report["passed"])
+        
+        # 被拒绝的新版本保留，活动版本不变
+        from etl.etl_manifest import ETLManifest
+        ETLManifest({}, {"data_fingerprint": "abc"}).save(version_path)
+        self.assertFalse(self.version_manager.is_rejected_build("abc"))
+        with patch.object(VectorVersionManager, '_export_snapshot'):
+            self.assertFalse(self.version_manager._activate_new_version("chroma_v002"))
+        self.assertTrue(os.path.exists(version_path))
+        self.assertEqual(self.version_manager.get_active_version(), "chroma_v001")
+        
+        # 数据和活动版本都没有变化时不再重复构建
+        self.assertTrue(self.version_manager.is_rejected_build("abc"))
+        self.assertFalse(self.version_manager.is_rejected_build("def"))
+        self.version_manager._set_current_version("chroma_v002")
+        self.assertFalse(self.version_manager.is_rejected_build("abc"))
+        
     def test_cleanup_old_versions(self):
         """测试清理旧版本"""
         # 创建6个版本目录
@@ -163,6 +198,18 @@ class TestVectorVersionManager(unittest.TestCase):
         remaining_versions = self.version_manager._get_all_versions()
         self.assertEqual(len(remaining_versions), 5)
         
+    def test_update_refuses_version_path(self):
+        """测试不能原地更新管理中的版本目录"""
+        from etl.vector_builder import update_vector_store
+        version_path = os.path.join(self.test_dir, "chroma_v001")
+        os.makedirs(version_path)
+        self.assertTrue(self.version_manager.is_version_path(version_path))
+        self.assertFalse(self.version_manager.is_version_path(self.test_dir))
+        self.assertFalse(self.version_manager.is_version_path(os.path.join(tempfile.gettempdir(), "chroma_v001")))
+        with patch('etl.vector_version_manager.vector_version_manager', self.version_manager):
+            with self.assertRaises(ValueError):
+                update_vector_store([], version_path)
+        
     def test_list_versions(self):
         """测试列出版本信息"""
         # 创建几个版本目录
@@ -182,6 +229,128 @@ class TestVectorVersionManager(unittest.TestCase):
         self.assertTrue(version_info[0]["is_active"])
         self.assertEqual(version_info[1]["version"], "chroma_v001")
         self.assertFalse(version_info[1]["is_active"])
+    
+    @patch('etl.vector_version_manager.apply_vector_store_delta')
+    def test_create_delta_version(self, mock_apply_delta):
+        """测试基于活动版本增量创建新版本"""
+        base_path = os.path.join(self.test_dir, "chroma_v001")
+        os.makedirs(os.path.join(base_path, "segment"))
+        with open(os.path.join(base_path, "segment", "data.bin"), "wb") as f:
+            f.write(b"base")
+        self.version_manager._set_current_version("chroma_v001")
+        
+        # 模拟在新版本目录中写入变化
+        def apply_delta(version_path, upsert_documents, delete_ids, batch_size):
+            with open(os.path.join(version_path, "segment", "data.bin"), "wb") as f:
+                f.write(b"delta")
+        mock_apply_delta.side_effect = apply_delta
+        
+        new_version = self.version_manager.create_delta_version(["文档"], ["id1"])
+        self.assertEqual(new_version, "chroma_v002")
+        mock_apply_delta.assert_called_once()
+        
+        # 新版本的修改不影响活动版本的文件
+        with open(os.path.join(base_path, "segment", "data.bin"), "rb") as f:
+            self.assertEqual(f.read(), b"base")
+        from etl.version_meta import load_version_meta
+        meta = load_version_meta(os.path.join(self.test_dir, new_version))
+        self.assertEqual(meta["base_version"], "chroma_v001")
+        self.assertEqual(meta["build_mode"], "delta")
+    
+    @patch('etl.vector_version_manager.apply_vector_store_delta')
+    def test_next_version_ignores_ctime(self, mock_apply_delta):
+        """测试回滚后旧版本目录的ctime更新不会让新版本复用回滚目标的版本号"""
+        for version in ("chroma_v001", "chroma_v002"):
+            os.makedirs(os.path.join(self.test_dir, version))
+        self.version_manager._set_current_version("chroma_v002")
+        self.version_manager._write_version_file(self.version_manager.previous_version_file, "chroma_v001")
+        self.assertTrue(self.version_manager.rollback())
+        # 打开目录、写入元数据都会更新ctime
+        from etl.version_meta import update_version_meta
+        update_version_meta(os.path.join(self.test_dir, "chroma_v001"), touched=True)
+        self.assertEqual(self.version_manager._get_next_version(), "chroma_v003")
+        
+        mock_apply_delta.side_effect = RuntimeError("写入失败")
+        with self.assertRaises(RuntimeError):
+            self.version_manager.create_delta_version(["文档"], [])
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "chroma_v002")))
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "chroma_v003")))
+        
+    def test_create_version_directory_exclusive(self):
+        """测试版本目录独占创建，已存在的目录不会被复用"""
+        os.makedirs(os.path.join(self.test_dir, "chroma_v001"))
+        with patch.object(VectorVersionManager, '_get_next_version', side_effect=["chroma_v001", "chroma_v002"]):
+            version, version_path = self.version_manager._create_version_directory()
+        self.assertEqual(version, "chroma_v002")
+        self.assertTrue(os.path.isdir(version_path))
+    
+    @patch('etl.vector_version_manager.apply_vector_store_delta')
+    def test_create_delta_version_failure(self, mock_apply_delta):
+        """测试增量创建失败时清理新版本目录"""
+        os.makedirs(os.path.join(self.test_dir, "chroma_v001"))
+        self.version_manager._set_current_version("chroma_v001")
+        mock_apply_delta.side_effect = RuntimeError("写入失败")
+        
+        with self.assertRaises(RuntimeError):
+            self.version_manager.create_delta_version(["文档"], [])
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "chroma_v002")))
+        self.assertEqual(self.version_manager.get_active_version(), "chroma_v001")
+
+    
+    @patch('etl.vector_version_manager.build_vector_store')
+    def test_create_new_version_resume(self, mock_build_vector_store):
+        """测试构建中断后保留已写入批次的版本目录，下次构建在同一目录上续建"""
+        from etl.version_meta import update_version_meta
+        
+        def interrupted_build(documents, version_path, batch_size, **kwargs):
+            update_version_meta(version_path, build_checkpoint={"completed_batches": 2, "total_batches": 5})
+            raise RuntimeError("构建中断")
+        mock_build_vector_store.side_effect = interrupted_build
+        with self.assertRaises(RuntimeError):
+            self.version_manager.create_new_version(["文档"])
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "chroma_v001")))
+        
+        def resumed_build(documents, version_path, batch_size, **kwargs):
+            update_version_meta(version_path, build_checkpoint=None)
+        mock_build_vector_store.side_effect = resumed_build
+        self.assertEqual(self.version_manager.create_new_version(["文档"]), "chroma_v001")
+        self.assertIsNone(self.version_manager._get_resumable_version())
+        self.assertEqual(self.version_manager._get_next_version(), "chroma_v002")
+
+    
+    @patch.object(VectorVersionManager, '_export_snapshot')
+    @patch.object(VectorVersionManager, '_validate_version', return_value=True)
+    def test_switch_with_standby_and_rollback(self, mock_validate, mock_export_snapshot):
+        """测试切换前等待服务进程预热候选版本，切换后可以回滚到上一个版本"""
+        import json
+        import time
+        for version in ("chroma_v001", "chroma_v002"):
+            os.makedirs(os.path.join(self.test_dir, version))
+        self.assertFalse(self.version_manager.rollback())
+        self.assertTrue(self.version_manager.switch_to_version("chroma_v001"))
+        
+        # 服务进程尚未预热候选版本时等待至超时，仍照常切换
+        os.makedirs(self.version_manager.serving_directory)
+        heartbeat_file = os.path.join(self.version_manager.serving_directory, "host-1.json")
+        with open(heartbeat_file, 'w', encoding='utf-8') as f:
+            json.dump({"process": "host-1", "warm_versions": ["chroma_v001"], "updated": time.time()}, f)
+        self.assertFalse(self.version_manager._wait_for_standby("chroma_v002", timeout=0.1))
+        self.assertEqual(self.version_manager.get_standby_version(), "chroma_v002")
+        
+        with open(heartbeat_file, 'w', encoding='utf-8') as f:
+            json.dump({"process": "host-1", "warm_versions": ["chroma_v001", "chroma_v002"],
+                       "updated": time.time()}, f)
+        self.assertTrue(self.version_manager.switch_to_version("chroma_v002", standby_timeout=0.1))
+        self.assertEqual(self.version_manager.get_active_version(), "chroma_v002")
+        self.assertEqual(self.version_manager.get_previous_version(), "chroma_v001")
+        self.assertIsNone(self.version_manager.get_standby_version())
+        
+        # 回滚只交换版本指针，再次回滚回到回滚前的版本
+        self.assertTrue(self.version_manager.rollback())
+        self.assertEqual(self.version_manager.get_active_version(), "chroma_v001")
+        self.assertEqual(self.version_manager.get_previous_version(), "chroma_v002")
+        self.assertTrue(self.version_manager.rollback())
+        self.assertEqual(self.version_manager.get_active_version(), "chroma_v002")
 
 
 if __name__ == '__main__':
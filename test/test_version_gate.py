@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+版本切换门禁单元测试
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from etl.flat_vector_store import FlatVectorStore
+from etl.version_gate import load_golden_queries, run_version_gate
+
+
+class SlowVectorStore:
+    """每次检索额外等待的向量库"""
+
+    def __init__(self, vector_store, delay: float):
+        self.vector_store = vector_store
+        self.delay = delay
+        self.embeddings = vector_store.embeddings
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        time.sleep(self.delay)
+        return self.vector_store.similarity_search_by_vector(embedding, k=k, **kwargs)
+
+
+class TestVersionGate(unittest.TestCase):
+    """版本门禁测试类"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = tempfile.mkdtemp()
+        self.embedding = DeterministicFakeEmbedding(size=16)
+        self.texts = [f"穴位说明{i}" for i in range(40)]
+        self.golden = [{"query": f"穴位说明{i}", "expected_sources": [f"s{i}.txt"]} for i in range(0, 40, 4)]
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def _store(self, name: str, count: int = 40) -> FlatVectorStore:
+        store = FlatVectorStore(os.path.join(self.test_dir, name), self.embedding)
+        store.add_texts(self.texts[:count], [{"source": f"s{i}.txt", "chunk_id": f"id-{i}"} for i in range(count)],
+                        ids=[f"id-{i}" for i in range(count)])
+        return store
+
+    def test_identical_versions_pass(self):
+        """测试内容相同的版本通过门禁"""
+        report = run_version_gate(self._store("candidate"), self._store("active"), self.golden, k=3)
+        self.assertTrue(report["passed"], report["reasons"])
+        self.assertEqual(report["overlap"], 1.0)
+        self.assertEqual(report["candidate"]["recall"], 1.0)
+        self.assertEqual(report["labelled_queries"], len(self.golden))
+
+    def test_quality_regression_rejected(self):
+        """测试缺少片段的版本因重合率和召回率下降被拒绝"""
+        report = run_version_gate(self._store("candidate", count=20), self._store("active"), self.golden, k=3)
+        self.assertFalse(report["passed"])
+        self.assertLess(report["candidate"]["recall"], report["active"]["recall"])
+        self.assertLess(report["overlap"], 1.0)
+        self.assertTrue(any("召回率" in reason for reason in report["reasons"]))
+
+    def test_unlabelled_overlap_is_warning(self):
+        """测试没有标注查询时重合率低只记为警告，不拒绝切换"""
+        golden = [dict(item, expected_sources=[]) for item in self.golden]
+        report = run_version_gate(self._store("candidate", count=20), self._store("active"), golden, k=3,
+                                  min_overlap=0.9)
+        self.assertLess(report["overlap"], 0.9)
+        self.assertTrue(report["passed"], report["reasons"])
+        self.assertTrue(any("重合率" in warning for warning in report["warnings"]))
+
+    def test_overlap_ignores_chunk_ids(self):
+        """测试没有片段ID的旧版本与新版本比较时，相同的结果视为重合"""
+        legacy = FlatVectorStore(os.path.join(self.test_dir, "legacy"), self.embedding)
+        legacy.add_texts(self.texts, [{"source": f"s{i}.txt"} for i in range(40)])
+        report = run_version_gate(self._store("candidate"), legacy, self.golden, k=3)
+        self.assertEqual(report["overlap"], 1.0)
+        self.assertTrue(report["passed"], report["reasons"])
+
+    def test_latency_regression_rejected(self):
+        """测试检索明显变慢的版本被拒绝，差值在容差以内时不算退化"""
+        active = self._store("active")
+        slow = SlowVectorStore(self._store("candidate"), 0.02)
+        self.assertFalse(run_version_gate(slow, active, self.golden, k=3, latency_slack_ms=5.0)["passed"])
+        self.assertTrue(run_version_gate(slow, active, self.golden, k=3, latency_slack_ms=100.0)["passed"])
+
+    def test_load_golden_queries(self):
+        """测试读取JSONL和纯文本混合的黄金查询文件"""
+        path = os.path.join(self.test_dir, "golden.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"query": "头痛取什么穴", "expected_sources": ["百会.txt"]}, ensure_ascii=False) + "\n")
+            f.write("失眠怎么办\n\n")
+        self.assertEqual(load_golden_queries(path), [
+            {"query": "头痛取什么穴", "expected_sources": ["百会.txt"]},
+            {"query": "失眠怎么办", "expected_sources": []},
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,7 @@
+import re
+import unicodedata
+
+
 class ListUtils:
     """
     列表工具类
@@ -15,4 +19,32 @@ class ListUtils:
             list: 切分后的子列表
         """
         for i in range(0, len(lst), chunk_size):
-            yield lst[i:i + chunk_size]
\ No newline at end of file
+            yield lst[i:i + chunk_size]
+
+
+class TextUtils:
+    """
+    文本工具类
+    """
+    # 问题末尾可忽略的标点
+    _TRAILING_PUNCTUATION = "?？。.!！~～、，, "
+
+    @staticmethod
+    def normalize_question(question):
+        """
+        归一化用户问题，用于缓存键和频次统计
+
+        全角转半角、转小写、合并空白并去掉末尾标点，
+        使"经络是什么？"与"经络是什么 ?"得到相同结果
+
+        Args:
+            question (str): 原始问题
+
+        Returns:
+            str: 归一化后的问题
+        """
+        if not question:
+            return ""
+        text = unicodedata.normalize("NFKC", question).lower()
+        text = re.sub(r"\s+", " ", text).strip()
+        return text.rstrip(TextUtils._TRAILING_PUNCTUATION)